@@ -0,0 +1,99 @@
+# Copyright 2017 Numenta Inc.
+#
+# Copyright may exist in Contributors' modifications
+# and/or contributions to the work.
+#
+# Use of this source code is governed by the MIT
+# license that can be found in the LICENSE file or at
+# https://opensource.org/licenses/MIT.
+
+## run python $NUPIC/scripts/profiling/backtracking_tm_profile.py [nColumns nSequences nEpochs]
+
+"""
+Compare the compute time of BacktrackingTM and BacktrackingTMDense on repeated
+random sequences, and check that both give the same output.
+"""
+
+import sys
+import time
+
+import numpy
+
+from nupic.algorithms.backtracking_tm import BacktrackingTM
+from nupic.algorithms.backtracking_tm_dense import BacktrackingTMDense
+
+SEQUENCE_LENGTH = 10
+NUM_ACTIVE_COLUMNS = 40
+
+TM_PARAMS = dict(cellsPerColumn=32, initialPerm=0.21, connectedPerm=0.5,
+                 minThreshold=12, newSynapseCount=20, permanenceInc=0.1,
+                 permanenceDec=0.1, activationThreshold=16, globalDecay=0.0,
+                 maxAge=0, pamLength=1, maxSegmentsPerCell=128,
+                 maxSynapsesPerSegment=32, seed=1960)
+
+
+
+def profileTM(tmClass, numColumns, sequences, numEpochs):
+  """
+  Train a TM on the sequences, then run inference on them.
+
+  @param tmClass implementation of the backtracking TM
+  @param numColumns number of columns in the TM
+  @param sequences list of sequences of inputs
+  @param numEpochs number of times the sequences are learned
+
+  @return (outputs, learn time in s, infer time in s)
+  """
+  tm = tmClass(numberOfCols=numColumns, **TM_PARAMS)
+  outputs = []
+
+  start = time.time()
+  for _ in xrange(numEpochs):
+    for sequence in sequences:
+      tm.reset()
+      for x in sequence:
+        outputs.append(tm.compute(x, enableLearn=True, enableInference=True))
+  learnTime = time.time() - start
+
+  start = time.time()
+  for sequence in sequences:
+    tm.reset()
+    for x in sequence:
+      outputs.append(tm.compute(x, enableLearn=False, enableInference=True))
+  inferTime = time.time() - start
+
+  return outputs, learnTime, inferTime
+
+
+
+if __name__ == "__main__":
+  numColumns = 2048
+  numSequences = 10
+  numEpochs = 3
+  # read command line params
+  if len(sys.argv) == 4: # 3 args + name
+    numColumns = int(sys.argv[1])
+    numSequences = int(sys.argv[2])
+    numEpochs = int(sys.argv[3])
+
+  rng = numpy.random.RandomState(42)
+  sequences = []
+  for _ in xrange(numSequences):
+    sequence = numpy.zeros((SEQUENCE_LENGTH, numColumns), dtype="float32")
+    for x in sequence:
+      x[rng.choice(numColumns, NUM_ACTIVE_COLUMNS, replace=False)] = 1
+    sequences.append(sequence)
+
+  print "%d columns, %d sequences of %d inputs, %d epochs" % (
+    numColumns, numSequences, SEQUENCE_LENGTH, numEpochs)
+
+  results = []
+  for tmClass in (BacktrackingTM, BacktrackingTMDense):
+    outputs, learnTime, inferTime = profileTM(tmClass, numColumns, sequences,
+                                              numEpochs)
+    results.append(outputs)
+    print "%-20s learn %.2fs  infer %.2fs" % (tmClass.__name__, learnTime,
+                                             inferTime)
+
+  assert all(numpy.array_equal(output1, output2)
+             for output1, output2 in zip(*results))
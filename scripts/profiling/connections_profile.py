@@ -0,0 +1,109 @@
+# Copyright 2017 Numenta Inc.
+#
+# Copyright may exist in Contributors' modifications
+# and/or contributions to the work.
+#
+# Use of this source code is governed by the MIT
+# license that can be found in the LICENSE file or at
+# https://opensource.org/licenses/MIT.
+
+## run python $NUPIC/scripts/profiling/connections_profile.py [nCells nSegmentsPerCell nSynapsesPerSegment nRuns]
+
+"""
+Compare memory use and computeActivity throughput of the Connections
+implementations. Each implementation is measured in a fresh process so that
+the resident set size reflects only its own allocations.
+"""
+
+import gc
+import multiprocessing
+import sys
+import time
+
+import numpy
+import psutil
+
+from nupic.algorithms.connections import Connections
+from nupic.algorithms.flat_connections import FlatConnections
+
+
+
+def profileConnections(connectionsClass, nCells, nSegmentsPerCell,
+                       nSynapsesPerSegment, nRuns, nActiveCells=40 * 32):
+  """
+  Build a randomly connected Connections instance and time computeActivity.
+
+  @param connectionsClass implementation of Connections
+  @param nCells number of cells
+  @param nSegmentsPerCell number of segments created on each cell
+  @param nSynapsesPerSegment number of synapses created on each segment
+  @param nRuns number of computeActivity calls to time
+  @param nActiveCells number of active presynaptic cells per call
+
+  @return (memory in MB, build time in s, computeActivity time in s)
+  """
+  rng = numpy.random.RandomState(42)
+  process = psutil.Process()
+
+  gc.collect()
+  rssBefore = process.memory_info().rss
+
+  start = time.time()
+  connections = connectionsClass(nCells)
+  for cell in xrange(nCells):
+    for _ in xrange(nSegmentsPerCell):
+      segment = connections.createSegment(cell)
+      presynapticCells = rng.randint(0, nCells, nSynapsesPerSegment)
+      permanences = rng.uniform(0.0, 1.0, nSynapsesPerSegment)
+      for presynapticCell, permanence in zip(presynapticCells, permanences):
+        connections.createSynapse(segment, int(presynapticCell),
+                                  float(permanence))
+  buildTime = time.time() - start
+
+  gc.collect()
+  memory = (process.memory_info().rss - rssBefore) / float(2**20)
+
+  inputs = [sorted(rng.choice(nCells, nActiveCells, replace=False))
+            for _ in xrange(nRuns)]
+  start = time.time()
+  for activeCells in inputs:
+    connections.computeActivity(activeCells, 0.5)
+  computeTime = time.time() - start
+
+  return memory, buildTime, computeTime
+
+
+
+def _profileInChild(args):
+  return profileConnections(*args)
+
+
+
+if __name__ == "__main__":
+  cells = 2048 * 32
+  segmentsPerCell = 2
+  synapsesPerSegment = 20
+  runs = 100
+  # read params from command line
+  if len(sys.argv) == 5: # 4 args + name
+    cells = int(sys.argv[1])
+    segmentsPerCell = int(sys.argv[2])
+    synapsesPerSegment = int(sys.argv[3])
+    runs = int(sys.argv[4])
+
+  print "%d cells, %d segments, %d synapses, %d computeActivity calls" % (
+    cells, cells * segmentsPerCell,
+    cells * segmentsPerCell * synapsesPerSegment, runs)
+
+  for connectionsClass in (Connections, FlatConnections):
+    pool = multiprocessing.Pool(1)
+    memory, buildTime, computeTime = pool.map(
+      _profileInChild,
+      [(connectionsClass, cells, segmentsPerCell, synapsesPerSegment,
+        runs)])[0]
+    pool.close()
+    pool.join()
+
+    print "%s: %.1f MB, build %.2fs, computeActivity %.3fs (%.2f ms/call)" % (
+      connectionsClass.__name__, memory, buildTime, computeTime,
+      1000.0 * computeTime / runs)
@@ -9,28 +9,87 @@
 
 ## run python -m cProfile --sort cumtime $NUPIC/scripts/profiling/enc_profile.py [nMaxValue nEpochs]
 
+import copy
+import datetime
 import sys
+import time
+
 import numpy
 # chose desired Encoder implementations to compare:
+from nupic.encoders.base import defaultDtype
+from nupic.encoders.category import CategoryEncoder
+from nupic.encoders.date import DateEncoder
+from nupic.encoders.logarithm import LogEncoder
+from nupic.encoders.multi import MultiEncoder
 from nupic.encoders.scalar import ScalarEncoder
+from nupic.encoders.sdr_category import SDRCategoryEncoder
 from nupic.encoders.random_distributed_scalar import RandomDistributedScalarEncoder as RDSE
 
+CATEGORIES = ["cat%d" % i for i in xrange(20)]
+
+
+
+def timeEncodings(encoder, values):
+  """
+  Encode the values one at a time with the encoder, and with encodeBatch on a
+  copy of it, and check that both give the same encodings.
+
+  @return (per value time in s, encodeBatch time in s)
+  """
+  output = numpy.zeros((len(values), encoder.getWidth()), dtype=defaultDtype)
+  batchOutput = numpy.zeros_like(output)
+
+  batchEncoder = copy.deepcopy(encoder)
+  start = time.time()
+  for i, value in enumerate(values):
+    encoder.encodeIntoArray(value, output[i])
+  sequentialTime = time.time() - start
+
+  start = time.time()
+  batchEncoder.encodeBatch(values, batchOutput)
+  batchTime = time.time() - start
+
+  assert numpy.array_equal(output, batchOutput)
+  return sequentialTime, batchTime
+
+
 
 def profileEnc(maxValue, nRuns):
   minV=0
-  maxV=nRuns
+  maxV=maxValue
   # generate input data
   data=numpy.random.randint(minV, maxV+1, nRuns)
+  dates = [datetime.datetime(2017, 1, 1) + datetime.timedelta(minutes=5 * i)
+           for i in xrange(nRuns)]
+  categories = [CATEGORIES[i] for i in data % len(CATEGORIES)]
+
   # instantiate measured encoders
-  encScalar = ScalarEncoder(w=21, minval=minV, maxval=maxV, resolution=1)
-  encRDSE = RDSE(resolution=1)
-  
-  # profile!  
-  for d in data:
-    encScalar.encode(d)
-    encRDSE.encode(d)
+  encoders = [
+    (ScalarEncoder(w=21, minval=minV, maxval=maxV, resolution=1), data),
+    (RDSE(resolution=1), data),
+    (LogEncoder(w=21, minval=1, maxval=maxV, n=400), data),
+    (CategoryEncoder(w=21, categoryList=CATEGORIES), categories),
+    (SDRCategoryEncoder(n=400, w=21), categories),
+    (DateEncoder(season=21, dayOfWeek=21, weekend=21, timeOfDay=21), dates),
+  ]
+
+  multi = MultiEncoder({
+    "value": dict(fieldname="value", type="RandomDistributedScalarEncoder",
+                  resolution=1),
+    "category": dict(fieldname="category", type="SDRCategoryEncoder", n=400,
+                     w=21),
+    "timestamp": dict(fieldname="timestamp", type="DateEncoder",
+                      timeOfDay=21, weekend=21)})
+  records = [dict(value=v, category=c, timestamp=t)
+             for v, c, t in zip(data, categories, dates)]
+  encoders.append((multi, records))
 
-  print "Scalar n=",encScalar.n," RDSE n=",encRDSE.n
+  # profile!
+  for encoder, values in encoders:
+    sequentialTime, batchTime = timeEncodings(encoder, values)
+    print "%-32s n=%5d  encodeIntoArray %.3fs  encodeBatch %.3fs  (%.1fx)" % (
+      encoder.__class__.__name__, encoder.getWidth(), sequentialTime,
+      batchTime, sequentialTime / batchTime)
 
 
 
@@ -38,7 +97,7 @@ if __name__ == "__main__":
   maxV=500
   epochs=10000
   if len(sys.argv) == 3: # 2 args + name
-    columns=int(sys.argv[1])
+    maxV=int(sys.argv[1])
     epochs=int(sys.argv[2])
 
   profileEnc(maxV, epochs)
@@ -0,0 +1,126 @@
+# Copyright 2017 Numenta Inc.
+#
+# Copyright may exist in Contributors' modifications
+# and/or contributions to the work.
+#
+# Use of this source code is governed by the MIT
+# license that can be found in the LICENSE file or at
+# https://opensource.org/licenses/MIT.
+
+## run python $NUPIC/scripts/profiling/knn_index_profile.py [numPrototypes inputWidth numActiveBits numQueries]
+
+"""
+Compare learning time, inference latency and nearest neighbor recall of the
+KNNClassifier with and without its inverted index, on random sparse binary
+prototypes. The first inference is timed separately, as it merges the
+prototypes learned since the previous inference into the index. Recall is the
+fraction of the k neighbors selected with the index that are among the k
+nearest prototypes according to the distances computed without it.
+"""
+
+import sys
+import time
+
+import numpy
+
+from nupic.algorithms.knn_classifier import KNNClassifier, _nSmallest
+
+K = 10
+NUM_CATEGORIES = 20
+
+
+
+def profileKNN(useInvertedIndex, prototypes, queries, inputWidth,
+               distanceMethod="rawOverlap"):
+  """
+  Train a KNNClassifier on the prototypes and time inference on the queries.
+
+  @param useInvertedIndex whether the classifier keeps an inverted index
+  @param prototypes list of sparse prototypes (sorted active bit indices)
+  @param queries list of dense query patterns
+  @param inputWidth width of the patterns
+  @param distanceMethod distance method of the classifier
+
+  @return (classifier, learn time in s, first infer time in s,
+          infer time in s)
+  """
+  knn = KNNClassifier(k=K, distanceMethod=distanceMethod,
+                      useInvertedIndex=useInvertedIndex)
+
+  start = time.time()
+  for i, activeBits in enumerate(prototypes):
+    knn.learn(activeBits, i % NUM_CATEGORIES, isSparse=inputWidth)
+  learnTime = time.time() - start
+
+  start = time.time()
+  knn.infer(queries[0])
+  firstInferTime = time.time() - start
+
+  start = time.time()
+  for query in queries:
+    knn.infer(query)
+  inferTime = time.time() - start
+
+  return knn, learnTime, firstInferTime, inferTime
+
+
+
+def recall(exactKNN, indexedKNN, queries):
+  """
+  Measure how many of the neighbors selected by the indexed classifier are
+  true k nearest neighbors.
+
+  @param exactKNN classifier without index
+  @param indexedKNN classifier with index, trained on the same prototypes
+  @param queries list of dense query patterns
+
+  @return mean recall over the queries
+  """
+  hits = 0
+  for query in queries:
+    exactDist = exactKNN.getDistances(query)[0]
+    kthDist = numpy.sort(exactDist)[K - 1]
+    neighbors = _nSmallest(indexedKNN.getDistances(query)[0], K)
+    hits += (exactDist[neighbors] <= kthDist).sum()
+  return float(hits) / (K * len(queries))
+
+
+
+if __name__ == "__main__":
+  numPrototypes = 50000
+  inputWidth = 2048
+  numActiveBits = 40
+  numQueries = 200
+  # read params from command line
+  if len(sys.argv) == 5: # 4 args + name
+    numPrototypes = int(sys.argv[1])
+    inputWidth = int(sys.argv[2])
+    numActiveBits = int(sys.argv[3])
+    numQueries = int(sys.argv[4])
+
+  rng = numpy.random.RandomState(42)
+  prototypes = [numpy.sort(rng.choice(inputWidth, numActiveBits,
+                                      replace=False))
+                for _ in xrange(numPrototypes)]
+  queries = []
+  for _ in xrange(numQueries):
+    query = numpy.zeros(inputWidth)
+    query[rng.choice(inputWidth, numActiveBits, replace=False)] = 1
+    queries.append(query)
+
+  print "%d prototypes, %d of %d bits active, %d queries, k=%d" % (
+    numPrototypes, numActiveBits, inputWidth, numQueries, K)
+
+  classifiers = []
+  for useInvertedIndex in (False, True):
+    (knn, learnTime,
+     firstInferTime, inferTime) = profileKNN(useInvertedIndex, prototypes,
+                                             queries, inputWidth)
+    classifiers.append(knn)
+    print ("useInvertedIndex=%s: learn %.2fs, first infer %.2fs, "
+           "infer %.2f ms/query" % (useInvertedIndex, learnTime,
+                                    firstInferTime,
+                                    1000.0 * inferTime / numQueries))
+
+  print "recall@%d: %.4f" % (K, recall(classifiers[0], classifiers[1],
+                                       queries))
@@ -0,0 +1,86 @@
+# Copyright 2017 Numenta Inc.
+#
+# Copyright may exist in Contributors' modifications
+# and/or contributions to the work.
+#
+# Use of this source code is governed by the MIT
+# license that can be found in the LICENSE file or at
+# https://opensource.org/licenses/MIT.
+
+## run python $NUPIC/scripts/profiling/record_stream_profile.py [numRecords]
+
+"""
+Compare the time to read a dataset from a csv file with FileRecordStream and
+from the same dataset converted to the binary columnar format with
+ColumnarRecordStream.
+"""
+
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy
+
+from nupic.data.columnar_record_stream import (ColumnarRecordStream,
+                                               convertFromCsv)
+from nupic.data.field_meta import FieldMetaInfo, FieldMetaType, FieldMetaSpecial
+from nupic.data.file_record_stream import FileRecordStream
+
+FIELDS = [FieldMetaInfo("timestamp", FieldMetaType.datetime,
+                        FieldMetaSpecial.timestamp),
+          FieldMetaInfo("consumption", FieldMetaType.float,
+                        FieldMetaSpecial.none),
+          FieldMetaInfo("count", FieldMetaType.integer,
+                        FieldMetaSpecial.none),
+          FieldMetaInfo("category", FieldMetaType.string,
+                        FieldMetaSpecial.none)]
+
+
+
+def timeRead(stream):
+  """
+  Read all records of the stream.
+
+  @return (time in s, number of records)
+  """
+  start = time.time()
+  numRecords = sum(1 for _ in stream)
+  return time.time() - start, numRecords
+
+
+
+if __name__ == "__main__":
+  numRecords = 200000
+  if len(sys.argv) == 2: # 1 arg + name
+    numRecords = int(sys.argv[1])
+
+  tmpDir = tempfile.mkdtemp()
+  try:
+    csvPath = os.path.join(tmpDir, "data.csv")
+    datasetPath = os.path.join(tmpDir, "data.columns")
+
+    rng = numpy.random.RandomState(42)
+    start = datetime.datetime(2017, 1, 1)
+    with FileRecordStream(csvPath, write=True, fields=FIELDS) as writer:
+      for i in xrange(numRecords):
+        writer.appendRecord([start + datetime.timedelta(minutes=5 * i),
+                             rng.rand() * 100, rng.randint(1000),
+                             "cat%d" % rng.randint(20)])
+
+    conversionStart = time.time()
+    convertFromCsv(csvPath, datasetPath)
+    print "convertFromCsv: %.2fs" % (time.time() - conversionStart)
+
+    with FileRecordStream(csvPath) as stream:
+      csvTime, _ = timeRead(stream)
+    with ColumnarRecordStream(datasetPath) as stream:
+      columnarTime, _ = timeRead(stream)
+
+    print "%d records: FileRecordStream %.2fs, ColumnarRecordStream %.2fs " \
+          "(%.1fx)" % (numRecords, csvTime, columnarTime,
+                       csvTime / columnarTime)
+  finally:
+    shutil.rmtree(tmpDir)
@@ -0,0 +1,133 @@
+# Copyright 2017 Numenta Inc.
+#
+# Copyright may exist in Contributors' modifications
+# and/or contributions to the work.
+#
+# Use of this source code is governed by the MIT
+# license that can be found in the LICENSE file or at
+# https://opensource.org/licenses/MIT.
+
+## run python $NUPIC/scripts/profiling/sdr_classifier_profile.py [steps]
+
+"""
+Compare offline SDRClassifier training and inference on a recorded hotgym
+stream: one compute() call per record versus fitBatch() and inferBatch().
+"""
+
+import csv
+import sys
+import time
+
+import numpy
+from pkg_resources import resource_filename
+
+from nupic.algorithms.sdr_classifier import SDRClassifier, packPatternNZs
+from nupic.bindings.algorithms import TemporalMemory
+from nupic.encoders.random_distributed_scalar import (
+  RandomDistributedScalarEncoder)
+
+HOTGYM_PATH = resource_filename(
+  "nupic.datafiles", "extra/hotgym/rec-center-hourly.csv"
+)
+
+
+
+def recordHotgym():
+  """
+  Run the hotgym consumption through an encoder and a Temporal Memory and
+  record the active cells, bucket index and value of every record.
+
+  @return (list of active cell lists, list of bucket indices, list of values)
+  """
+  encoder = RandomDistributedScalarEncoder(0.88, n=2048, w=41, seed=42)
+  tm = TemporalMemory(columnDimensions=(2048,), cellsPerColumn=32, seed=42)
+
+  patternNZs = []
+  bucketIdxs = []
+  values = []
+  encoded = numpy.zeros(2048, dtype=numpy.uint32)
+  with open(HOTGYM_PATH) as fin:
+    reader = csv.reader(fin)
+    reader.next()
+    reader.next()
+    reader.next()
+    for _, valueStr in reader:
+      value = float(valueStr)
+      encoder.encodeIntoArray(value, output=encoded)
+      tm.compute(encoded.nonzero()[0].astype(numpy.uint32), True)
+      patternNZs.append(list(tm.getActiveCells()))
+      bucketIdxs.append(encoder.getBucketIndices(value)[0])
+      values.append(value)
+
+  return patternNZs, bucketIdxs, values
+
+
+
+def profileClassifier(steps, patternNZs, bucketIdxs, values):
+  """
+  Train and run inference on one classifier per record and another one with
+  the batch methods, and check that they agree.
+
+  @param steps steps of the classifiers
+  @param patternNZs active cells of every record
+  @param bucketIdxs bucket index of every record
+  @param values actual value of every record
+
+  @return (compute learn time, fitBatch time, compute infer time,
+           inferBatch time) in s
+  """
+  recordNums = range(len(patternNZs))
+
+  c1 = SDRClassifier(steps, alpha=0.001, actValueAlpha=0.3)
+  start = time.time()
+  for recordNum, patternNZ, bucketIdx, value in zip(recordNums, patternNZs,
+                                                    bucketIdxs, values):
+    c1.compute(recordNum, patternNZ,
+               {"bucketIdx": bucketIdx, "actValue": value},
+               learn=True, infer=False)
+  computeLearnTime = time.time() - start
+
+  c2 = SDRClassifier(steps, alpha=0.001, actValueAlpha=0.3)
+  start = time.time()
+  packed = packPatternNZs(patternNZs)
+  c2.fitBatch(recordNums, packed, bucketIdxs, values)
+  fitBatchTime = time.time() - start
+
+  for step in steps:
+    assert numpy.array_equal(c1._weightMatrix[step], c2._weightMatrix[step])
+
+  start = time.time()
+  results = [c1.compute(len(patternNZs) + i, patternNZ, None,
+                        learn=False, infer=True)
+             for i, patternNZ in enumerate(patternNZs)]
+  computeInferTime = time.time() - start
+
+  start = time.time()
+  batchResults = c2.inferBatch(packed)
+  inferBatchTime = time.time() - start
+
+  for step in steps:
+    assert numpy.array_equal(numpy.array([r[step] for r in results]),
+                             batchResults[step])
+
+  return computeLearnTime, fitBatchTime, computeInferTime, inferBatchTime
+
+
+
+if __name__ == "__main__":
+  steps = [1, 5]
+  # read params from command line
+  if len(sys.argv) == 2: # 1 arg + name
+    steps = [int(step) for step in sys.argv[1].split(",")]
+
+  patternNZs, bucketIdxs, values = recordHotgym()
+  print "%d records, steps %s" % (len(patternNZs), steps)
+
+  (computeLearnTime, fitBatchTime,
+   computeInferTime, inferBatchTime) = profileClassifier(
+     steps, patternNZs, bucketIdxs, values)
+
+  print "learn: compute %.2fs, fitBatch %.2fs (%.1fx)" % (
+    computeLearnTime, fitBatchTime, computeLearnTime / fitBatchTime)
+  print "infer: compute %.2fs, inferBatch %.2fs (%.1fx)" % (
+    computeInferTime, inferBatchTime, computeInferTime / inferBatchTime)
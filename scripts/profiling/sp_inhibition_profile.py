@@ -0,0 +1,114 @@
+# Copyright 2017 Numenta Inc.
+#
+# Copyright may exist in Contributors' modifications
+# and/or contributions to the work.
+#
+# Use of this source code is governed by the MIT
+# license that can be found in the LICENSE file or at
+# https://opensource.org/licenses/MIT.
+
+## run python $NUPIC/scripts/profiling/sp_inhibition_profile.py [nRuns]
+
+"""
+Time SpatialPooler local inhibition across inhibition radii, in 1D and 2D
+column topologies, and compare it with a column by column reference
+implementation.
+"""
+
+import sys
+import time
+
+import numpy
+
+from nupic.algorithms.spatial_pooler import SpatialPooler, realDType
+
+
+
+def inhibitColumnsLocalReference(sp, overlaps, density):
+  """
+  Column by column local inhibition, one neighborhood lookup per column.
+  """
+  activeArray = numpy.zeros(sp._numColumns, dtype="bool")
+
+  for column, overlap in enumerate(overlaps):
+    if overlap >= sp._stimulusThreshold:
+      neighborhood = sp._getColumnNeighborhood(column)
+      neighborhoodOverlaps = overlaps[neighborhood]
+
+      numBigger = numpy.count_nonzero(neighborhoodOverlaps > overlap)
+
+      ties = numpy.where(neighborhoodOverlaps == overlap)
+      tiedNeighbors = neighborhood[ties]
+      numTiesLost = numpy.count_nonzero(activeArray[tiedNeighbors])
+
+      numActive = int(0.5 + density * len(neighborhood))
+      if numBigger + numTiesLost < numActive:
+        activeArray[column] = True
+
+  return activeArray.nonzero()[0]
+
+
+
+def profileInhibition(columnDimensions, inhibitionRadius, nRuns,
+                      wrapAround=True, density=0.04):
+  """
+  Time local inhibition of random integer overlaps, which contain many ties.
+
+  @param columnDimensions column dimensions of the SpatialPooler
+  @param inhibitionRadius inhibition radius to use
+  @param nRuns number of inhibition calls to time
+  @param wrapAround whether neighborhoods wrap around the edges
+  @param density fraction of columns to survive inhibition
+
+  @return (reference time in s, neighborhood table build time in s,
+          vectorized time in s)
+  """
+  sp = SpatialPooler(inputDimensions=columnDimensions,
+                     columnDimensions=columnDimensions,
+                     potentialRadius=1,
+                     globalInhibition=False,
+                     stimulusThreshold=1,
+                     wrapAround=wrapAround,
+                     seed=42)
+  sp._inhibitionRadius = inhibitionRadius
+
+  rng = numpy.random.RandomState(42)
+  overlaps = [rng.binomial(40, 0.2, sp._numColumns).astype(realDType)
+              for _ in xrange(nRuns)]
+
+  start = time.time()
+  expected = [inhibitColumnsLocalReference(sp, o, density) for o in overlaps]
+  referenceTime = time.time() - start
+
+  # The first call builds and caches the column neighborhood table.
+  start = time.time()
+  sp._inhibitColumnsLocal(overlaps[0], density)
+  buildTime = time.time() - start
+
+  start = time.time()
+  actual = [sp._inhibitColumnsLocal(o, density) for o in overlaps]
+  vectorizedTime = time.time() - start
+
+  for e, a in zip(expected, actual):
+    assert numpy.array_equal(e, a)
+
+  return referenceTime, buildTime, vectorizedTime
+
+
+
+if __name__ == "__main__":
+  runs = 10
+  # read params from command line
+  if len(sys.argv) == 2: # 1 arg + name
+    runs = int(sys.argv[1])
+
+  for columnDimensions, radii in (([2048], [1, 4, 16, 64, 256, 1023]),
+                                  ([64, 64], [1, 2, 4, 8, 16])):
+    for inhibitionRadius in radii:
+      referenceTime, buildTime, vectorizedTime = profileInhibition(
+        columnDimensions, inhibitionRadius, runs)
+      print ("%s radius %4d: reference %.2f ms, vectorized %.2f ms (%.1fx), "
+             "table build %.0f ms" % (
+               "x".join(str(d) for d in columnDimensions), inhibitionRadius,
+               1000.0 * referenceTime / runs, 1000.0 * vectorizedTime / runs,
+               referenceTime / vectorizedTime, 1000.0 * buildTime))
@@ -247,7 +247,7 @@ if __name__ == "__main__":
     description="Run various perf scenarios on the Temporal Memory."
   )
 
-  implNames = ["tm_cpp", "tm_py", "tp_py", "tp_cpp"]
+  implNames = ["tm_cpp", "tm_py", "tm_py_flat", "tp_py", "tp_cpp"]
   testNames = ["simple_sequence", "simple_sequence_no_resets",
                "hotgym", "hotgym_1_cell", "random", "5_random",
                "20_simple_sequence", "20_simple_sequence_no_resets",
@@ -306,6 +306,22 @@ if __name__ == "__main__":
       computeFn=tmComputeFn,
       name="tm_py")
 
+  if "tm_py_flat" in args.implementations:
+    import nupic.algorithms.flat_connections
+    import nupic.algorithms.temporal_memory
+
+    class FlatTemporalMemory(nupic.algorithms.temporal_memory.TemporalMemory):
+      @staticmethod
+      def connectionsFactory(*args, **kwargs):
+        return nupic.algorithms.flat_connections.FlatConnections(*args,
+                                                                 **kwargs)
+
+    benchmark.addContestant(
+      FlatTemporalMemory,
+      paramsFn=tmParamsFn,
+      computeFn=tmComputeFn,
+      name="tm_py_flat")
+
   if "tp_py" in args.implementations:
     import nupic.algorithms.backtracking_tm
     benchmark.addContestant(
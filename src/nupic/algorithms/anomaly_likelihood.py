@@ -67,6 +67,17 @@ Every once in a while update estimator with a lot of recent data.
    likelihoods, avgRecordList, estimatorParams = \\
      estimateAnomalyLikelihoods(lots_of_metric_data)
 
+When the anomaly scores and metric values are already in numpy arrays, e.g.
+when backfilling a long history, the array versions
+:func:`~.anomaly_likelihood.estimateAnomalyLikelihoodsFromArrays` and
+:func:`~.anomaly_likelihood.updateAnomalyLikelihoodsFromArrays` do the same
+without building records:
+
+.. code-block:: python
+
+   likelihoods, averagedScores, estimatorParams = \\
+     estimateAnomalyLikelihoodsFromArrays(scores, metricValues=values)
+
 
 PARAMS
 ++++++
@@ -103,8 +114,11 @@ structure. Note: the client does not need to know the details of this.
 """
 
 import collections
+import copy
 import math
 import numbers
+from itertools import islice
+
 import numpy
 
 from nupic.serializable import Serializable
@@ -117,6 +131,12 @@ except ImportError:
 if capnp:
   from nupic.algorithms.anomaly_likelihood_capnp import AnomalyLikelihoodProto
 
+# Relative rounding error of float arithmetic
+_EPSILON = numpy.finfo(float).eps
+
+# Element-wise math.erfc, since numpy has no complementary error function
+_erfc = numpy.frompyfunc(math.erfc, 1, 1)
+
 class AnomalyLikelihood(Serializable):
   """
   Helper class for running anomaly likelihood computation. To use it simply
@@ -134,6 +154,10 @@ class AnomalyLikelihood(Serializable):
 
   """
 
+  # Number of anomaly scores in the moving average of the anomaly scores, as
+  # used by estimateAnomalyLikelihoods
+  _averagingWindow = 10
+
 
   def __init__(self,
                claLearningPeriod=None,
@@ -189,6 +213,8 @@ class AnomalyLikelihood(Serializable):
     self._probationaryPeriod = self._learningPeriod + estimationSamples
     self._reestimationPeriod = reestimationPeriod
 
+    self._initEstimatorState()
+
 
   def __eq__(self, o):
     # pylint: disable=W0212
@@ -292,6 +318,7 @@ class AnomalyLikelihood(Serializable):
     anomalyLikelihood._probationaryPeriod = proto.probationaryPeriod
     anomalyLikelihood._learningPeriod = proto.learningPeriod
     anomalyLikelihood._reestimationPeriod = proto.reestimationPeriod
+    anomalyLikelihood._initEstimatorState()
     # pylint: enable=W0212
 
     return anomalyLikelihood
@@ -366,15 +393,7 @@ class AnomalyLikelihood(Serializable):
       # On a rolling basis we re-estimate the distribution
       if ( (self._distribution is None) or
            (self._iteration % self._reestimationPeriod == 0) ):
-
-        numSkipRecords = self._calcSkipRecords(
-          numIngested=self._iteration,
-          windowSize=self._historicalScores.maxlen,
-          learningPeriod=self._learningPeriod)
-
-        _, _, self._distribution = estimateAnomalyLikelihoods(
-          self._historicalScores,
-          skipRecords=numSkipRecords)
+        self._distribution = self._estimateDistribution()
 
       likelihoods, _, self._distribution = updateAnomalyLikelihoods(
         [dataPoint],
@@ -383,12 +402,178 @@ class AnomalyLikelihood(Serializable):
       likelihood = 1.0 - likelihoods[0]
 
     # Before we exit update historical scores and iteration
-    self._historicalScores.append(dataPoint)
+    self._appendHistoricalScore(dataPoint)
     self._iteration += 1
 
     return likelihood
 
 
+  def __setstate__(self, state):
+    """
+    Restore pickled state, building the estimator state of instances pickled
+    before it existed.
+    """
+    self.__dict__.update(state)
+    if not hasattr(self, "_averagedScores"):
+      self._initEstimatorState()
+
+
+  def _initEstimatorState(self):
+    """
+    Build the running state used by :meth:`_estimateDistribution` from the
+    historical scores.
+
+    For every historical score we keep its moving average over the last
+    ``_averagingWindow`` scores. The anomaly scores that
+    :func:`estimateAnomalyLikelihoods` estimates the distribution from are
+    the averaged scores of the records at or after ``_learningPeriod``, see
+    :meth:`_calcSkipRecords`. Except for the first ``_averagingWindow``
+    records of the sliding window, whose moving average restarts with the
+    oldest record, these are the averages we keep. Their sums, and the sums
+    of the metric values, are kept up to date as records are added and
+    evicted.
+    """
+    historicalScores = list(self._historicalScores)
+    self._historicalScores.clear()
+    self._scoreMovingAverage = MovingAverage(
+      min(self._averagingWindow, self._historicalScores.maxlen))
+    self._averagedScores = collections.deque(
+      maxlen=self._historicalScores.maxlen)
+    self._averagedScoreMoments = _RunningMoments()
+    self._valueMoments = _RunningMoments()
+    self._numNonNumericValues = 0
+
+    firstRecordIdx = self._iteration - len(historicalScores)
+    for i, dataPoint in enumerate(historicalScores):
+      self._appendHistoricalScore(dataPoint, firstRecordIdx + i)
+
+
+  def _appendHistoricalScore(self, dataPoint, recordIdx=None):
+    """
+    Append a data point to the sliding window of historical scores and update
+    the running sums of the averaged scores and metric values.
+
+    :param dataPoint: (tuple) ``(timestamp, value, anomalyScore)``
+    :param recordIdx: (int) number of records ingested before this one.
+      Default is the current iteration.
+    """
+    if recordIdx is None:
+      recordIdx = self._iteration
+    historicalScores = self._historicalScores
+
+    if len(historicalScores) == historicalScores.maxlen:
+      evictedRecordIdx = recordIdx - len(historicalScores)
+      self._removeValue(historicalScores[0][1], evictedRecordIdx)
+
+      # The record after the first _averagingWindow records becomes one of
+      # them, so its moving average will be recomputed from now on
+      if len(historicalScores) > self._averagingWindow:
+        if evictedRecordIdx + self._averagingWindow >= self._learningPeriod:
+          self._averagedScoreMoments.remove(
+            self._averagedScores[self._averagingWindow])
+
+    _, value, anomalyScore = dataPoint
+    historicalScores.append(dataPoint)
+    averagedScore = self._scoreMovingAverage.next(anomalyScore)
+    self._averagedScores.append(averagedScore)
+
+    self._addValue(value, recordIdx)
+    if (len(historicalScores) > self._averagingWindow and
+        recordIdx >= self._learningPeriod):
+      self._averagedScoreMoments.add(averagedScore)
+
+
+  def _addValue(self, value, recordIdx):
+    if not isinstance(value, numbers.Number):
+      self._numNonNumericValues += 1
+    elif recordIdx >= self._learningPeriod:
+      self._valueMoments.add(value)
+
+
+  def _removeValue(self, value, recordIdx):
+    if not isinstance(value, numbers.Number):
+      self._numNonNumericValues -= 1
+    elif recordIdx >= self._learningPeriod:
+      self._valueMoments.remove(value)
+
+
+  def _estimateDistribution(self):
+    """
+    Estimate the distribution of the averaged anomaly scores of the
+    historical scores. This returns the same parameters as
+
+    .. code-block:: python
+
+       estimateAnomalyLikelihoods(
+         self._historicalScores,
+         skipRecords=self._calcSkipRecords(...))[2]
+
+    but only looks at the first and last ``_averagingWindow`` records of the
+    sliding window, see :meth:`_initEstimatorState`.
+
+    :returns: (dict) estimator params, see
+      :func:`estimateAnomalyLikelihoods`
+    """
+    historicalScores = self._historicalScores
+    numSkipRecords = self._calcSkipRecords(
+      numIngested=self._iteration,
+      windowSize=historicalScores.maxlen,
+      learningPeriod=self._learningPeriod)
+
+    # The moving average of the first records restarts with the oldest
+    # record, as in _anomalyScoreMovingAverage
+    headAveragedScores = []
+    total = 0.0
+    for i, (_, _, anomalyScore) in enumerate(
+        islice(historicalScores, self._averagingWindow)):
+      total += anomalyScore
+      headAveragedScores.append(float(total) / (i + 1))
+
+    averagedScoreMoments = copy.copy(self._averagedScoreMoments)
+    for averagedScore in headAveragedScores[numSkipRecords:]:
+      averagedScoreMoments.add(averagedScore)
+
+    if averagedScoreMoments.count == 0:
+      distributionParams = nullDistribution()
+    else:
+      distributionParams = _normalDistribution(
+        averagedScoreMoments.mean(), averagedScoreMoments.variance())
+
+      # See the constant metric values HACK in estimateAnomalyLikelihoods
+      if self._numNonNumericValues == 0:
+        valueMoments = self._valueMoments
+        if (abs(valueMoments.variance() - 1.5e-5) <=
+            valueMoments.varianceError()):
+          # Too close to the threshold to tell with the rounding errors of the
+          # running sums, so rebuild them from the values
+          valueMoments.reset(value for (_, value, _) in
+                             islice(historicalScores, numSkipRecords, None))
+        if valueMoments.variance() < 1.5e-5:
+          distributionParams = nullDistribution()
+
+    # Likelihoods of the last records, as estimateAnomalyLikelihoods
+    # computes them for updateAnomalyLikelihoods' filtering
+    historicalLikelihoods = []
+    numScores = len(historicalScores)
+    for i in xrange(max(0, numScores - self._averagingWindow), numScores):
+      if i < len(headAveragedScores):
+        averagedScore = headAveragedScores[i]
+      else:
+        averagedScore = self._averagedScores[i]
+      historicalLikelihoods.append(
+        tailProbability(averagedScore, distributionParams))
+
+    return {
+      "distribution": distributionParams,
+      "movingAverage": {
+        "historicalValues": list(self._scoreMovingAverage.slidingWindow),
+        "total": self._scoreMovingAverage.total,
+        "windowSize": self._averagingWindow,
+      },
+      "historicalLikelihoods": historicalLikelihoods,
+    }
+
+
 
 def estimateAnomalyLikelihoods(anomalyScores,
                                averagingWindow=10,
@@ -441,56 +626,106 @@ def estimateAnomalyLikelihoods(anomalyScores,
     print("Skip records=", skipRecords)
     print("First 20:", anomalyScores[0:min(20, len(anomalyScores))])
 
+  records = _wellFormedRecords(anomalyScores, verbosity)
+  if len(records) == 0:
+    raise ValueError("Must have at least one anomalyScore")
+
+  # Only check for a constant metric if the values are numeric
+  if all([isinstance(r[1], numbers.Number) for r in records]):
+    metricValues = numpy.array([r[1] for r in records], dtype=float)
+  else:
+    metricValues = None
+
+  filteredLikelihoods, averagedScores, params = (
+    estimateAnomalyLikelihoodsFromArrays(
+      numpy.array([r[2] for r in records], dtype=float),
+      metricValues=metricValues,
+      averagingWindow=averagingWindow,
+      skipRecords=skipRecords,
+      verbosity=verbosity))
+
+  aggRecordList = [[r[0], r[1], averagedScore]
+                   for r, averagedScore in zip(records,
+                                               averagedScores.tolist())]
+
+  return (filteredLikelihoods, aggRecordList, params)
+
+
+
+def estimateAnomalyLikelihoodsFromArrays(anomalyScores,
+                                         metricValues=None,
+                                         averagingWindow=10,
+                                         skipRecords=0,
+                                         verbosity=0):
+  """
+  Array version of :func:`estimateAnomalyLikelihoods`, for estimating the
+  distribution from a long history of anomaly scores.
+
+  :param anomalyScores: (numpy array) anomaly score of each record
+  :param metricValues: (numpy array) metric value of each record, used to
+                       detect completely flat metrics. None if the metric
+                       values are not numeric.
+  :param averagingWindow: integer number of records to average over
+  :param skipRecords: integer specifying number of records to skip when
+                      estimating distributions, see
+                      :func:`estimateAnomalyLikelihoods`
+  :param verbosity: integer controlling extent of printouts for debugging
+
+  :returns: 3-tuple consisting of:
+
+            - likelihoods
+
+              numpy array of likelihoods, one for each record
+
+            - averagedScores
+
+              numpy array of averaged anomaly scores, one for each record
+
+            - params
+
+              a small JSON dict that contains the state of the estimator
+  """
+  anomalyScores = numpy.asarray(anomalyScores, dtype=float)
   if len(anomalyScores) == 0:
     raise ValueError("Must have at least one anomalyScore")
 
-  # Compute averaged anomaly scores
-  aggRecordList, historicalValues, total =  _anomalyScoreMovingAverage(
-    anomalyScores,
-    windowSize = averagingWindow,
-    verbosity = verbosity)
-  s = [r[2] for r in aggRecordList]
-  dataValues = numpy.array(s)
+  averagedScores = _movingAverages(anomalyScores, averagingWindow)
 
-  # Estimate the distribution of anomaly scores based on aggregated records
-  if len(aggRecordList) <= skipRecords:
+  # Estimate the distribution of anomaly scores based on averaged scores
+  if len(averagedScores) <= skipRecords:
     distributionParams = nullDistribution(verbosity = verbosity)
   else:
-    distributionParams = estimateNormal(dataValues[skipRecords:])
+    distributionParams = estimateNormal(averagedScores[skipRecords:])
 
     # HACK ALERT! The HTMPredictionModel currently does not handle constant
     # metric values very well (time of day encoder changes sometimes lead to
     # unstable SDR's even though the metric is constant). Until this is
     # resolved, we explicitly detect and handle completely flat metric values by
     # reporting them as not anomalous.
-    s = [r[1] for r in aggRecordList]
-    # Only do this if the values are numeric
-    if all([isinstance(r[1], numbers.Number) for r in aggRecordList]):
-      metricValues = numpy.array(s)
-      metricDistribution = estimateNormal(metricValues[skipRecords:],
-                                          performLowerBoundCheck=False)
+    if metricValues is not None:
+      metricDistribution = estimateNormal(
+        numpy.asarray(metricValues)[skipRecords:],
+        performLowerBoundCheck=False)
 
       if metricDistribution["variance"] < 1.5e-5:
         distributionParams = nullDistribution(verbosity = verbosity)
 
   # Estimate likelihoods based on this distribution
-  likelihoods = numpy.array(dataValues, dtype=float)
-  for i, s in enumerate(dataValues):
-    likelihoods[i] = tailProbability(s, distributionParams)
+  likelihoods = tailProbabilities(averagedScores, distributionParams)
 
   # Filter likelihood values
-  filteredLikelihoods = numpy.array(
-    _filterLikelihoods(likelihoods) )
+  filteredLikelihoods = _filterLikelihoods(likelihoods)
 
+  historicalValues = anomalyScores[-averagingWindow:].tolist()
   params = {
     "distribution":       distributionParams,
     "movingAverage": {
       "historicalValues": historicalValues,
-      "total":            total,
+      "total":            sum(historicalValues),
       "windowSize":       averagingWindow,
     },
     "historicalLikelihoods":
-      list(likelihoods[-min(averagingWindow, len(likelihoods)):]),
+      likelihoods[-min(averagingWindow, len(likelihoods)):].tolist(),
   }
 
   if verbosity > 1:
@@ -501,8 +736,7 @@ def estimateAnomalyLikelihoods(anomalyScores,
       filteredLikelihoods[0:min(20, len(filteredLikelihoods))] ))
     print("leaving estimateAnomalyLikelihoods")
 
-
-  return (filteredLikelihoods, aggRecordList, params)
+  return (filteredLikelihoods, averagedScores, params)
 
 
 
@@ -544,6 +778,40 @@ def updateAnomalyLikelihoods(anomalyScores,
     print("First 20:", anomalyScores[0:min(20, len(anomalyScores))])
     print("Params:", params)
 
+  likelihoods, aggRecordList, newParams = updateAnomalyLikelihoodsFromArrays(
+    numpy.array([v[2] for v in anomalyScores], dtype=float), params)
+
+  if verbosity > 3:
+    print("Number of likelihoods:", len(likelihoods))
+    print("First 20 likelihoods:", likelihoods[0:min(20, len(likelihoods))])
+    print("Leaving updateAnomalyLikelihoods.")
+
+  return (likelihoods, aggRecordList, newParams)
+
+
+
+def updateAnomalyLikelihoodsFromArrays(anomalyScores, params):
+  """
+  Array version of :func:`updateAnomalyLikelihoods`.
+
+  :param anomalyScores: (numpy array) anomaly score of each record
+  :param params: the JSON dict returned by estimateAnomalyLikelihoods
+
+  :returns: 3-tuple consisting of:
+
+            - likelihoods
+
+              numpy array of likelihoods, one for each record
+
+            - averagedScores
+
+              numpy array of averaged anomaly scores, one for each record
+
+            - params
+
+              an updated JSON object containing the state of this metric.
+  """
+  anomalyScores = numpy.asarray(anomalyScores, dtype=float)
   if len(anomalyScores) == 0:
     raise ValueError("Must have at least one anomalyScore")
 
@@ -556,46 +824,41 @@ def updateAnomalyLikelihoods(anomalyScores,
 
   # Compute moving averages of these new scores using the previous values
   # as well as likelihood for these scores using the old estimator
-  historicalValues  = params["movingAverage"]["historicalValues"]
-  total             = params["movingAverage"]["total"]
-  windowSize        = params["movingAverage"]["windowSize"]
-
-  aggRecordList = numpy.zeros(len(anomalyScores), dtype=float)
-  likelihoods = numpy.zeros(len(anomalyScores), dtype=float)
-  for i, v in enumerate(anomalyScores):
-    newAverage, historicalValues, total = (
-      MovingAverage.compute(historicalValues, total, v[2], windowSize)
-    )
-    aggRecordList[i] = newAverage
-    likelihoods[i]   = tailProbability(newAverage, params["distribution"])
-
-  # Filter the likelihood values. First we prepend the historical likelihoods
-  # to the current set. Then we filter the values.  We peel off the likelihoods
-  # to return and the last windowSize values to store for later.
-  likelihoods2 = params["historicalLikelihoods"] + list(likelihoods)
-  filteredLikelihoods = _filterLikelihoods(likelihoods2)
-  likelihoods[:] = filteredLikelihoods[-len(likelihoods):]
-  historicalLikelihoods = likelihoods2[-min(windowSize, len(likelihoods2)):]
+  historicalValues = params["movingAverage"]["historicalValues"]
+  windowSize = params["movingAverage"]["windowSize"]
+  numValues = int(windowSize)
+
+  averagedScores = _movingAverages(anomalyScores, numValues, historicalValues)
+  likelihoods = tailProbabilities(averagedScores, params["distribution"])
+
+  # Filter the likelihood values. First we prepend the last historical
+  # likelihood, the only one filtering the new values looks at, to the
+  # current set. Then we filter the values. We peel off the likelihoods to
+  # return and the last windowSize values to store for later.
+  lastHistoricalLikelihood = list(params["historicalLikelihoods"][-1:])
+  filteredLikelihoods = _filterLikelihoods(
+    lastHistoricalLikelihood + likelihoods.tolist()
+  )[len(lastHistoricalLikelihood):]
+  likelihoods2 = (list(params["historicalLikelihoods"]) +
+                  likelihoods[-numValues:].tolist())
+
+  historicalValues = (list(historicalValues) +
+                      anomalyScores[-numValues:].tolist())[-numValues:]
 
   # Update the estimator
   newParams = {
     "distribution": params["distribution"],
     "movingAverage": {
       "historicalValues": historicalValues,
-      "total": total,
+      "total": sum(historicalValues),
       "windowSize": windowSize,
     },
-    "historicalLikelihoods": historicalLikelihoods,
+    "historicalLikelihoods": likelihoods2[-min(numValues, len(likelihoods2)):],
   }
 
   assert len(newParams["historicalLikelihoods"]) <= windowSize
 
-  if verbosity > 3:
-    print("Number of likelihoods:", len(likelihoods))
-    print("First 20 likelihoods:", likelihoods[0:min(20, len(likelihoods))])
-    print("Leaving updateAnomalyLikelihoods.")
-
-  return (likelihoods, aggRecordList, newParams)
+  return (filteredLikelihoods, averagedScores, newParams)
 
 
 
@@ -606,28 +869,18 @@ def _filterLikelihoods(likelihoods,
   sharp increases in likelihood. 'likelihoods' can be a numpy array of floats or
   a list of floats.
 
-  :returns: A new list of floats likelihoods containing the filtered values.
+  :returns: A new numpy array of floats likelihoods containing the filtered
+            values.
   """
   redThreshold    = 1.0 - redThreshold
   yellowThreshold = 1.0 - yellowThreshold
 
-  # The first value is untouched
-  filteredLikelihoods = [likelihoods[0]]
-
-  for i, v in enumerate(likelihoods[1:]):
-
-    if v <= redThreshold:
-      # Value is in the redzone
-
-      if likelihoods[i] > redThreshold:
-        # Previous value is not in redzone, so leave as-is
-        filteredLikelihoods.append(v)
-      else:
-        filteredLikelihoods.append(yellowThreshold)
-
-    else:
-      # Value is below the redzone, so leave as-is
-      filteredLikelihoods.append(v)
+  # The first value is untouched. A value in the redzone is left as-is if the
+  # previous value is not in the redzone, otherwise it is reported as yellow.
+  likelihoods = numpy.array(likelihoods, dtype=float)
+  filteredLikelihoods = likelihoods.copy()
+  inRedZone = likelihoods <= redThreshold
+  filteredLikelihoods[1:][inRedZone[1:] & inRedZone[:-1]] = yellowThreshold
 
   return filteredLikelihoods
 
@@ -647,29 +900,58 @@ def _anomalyScoreMovingAverage(anomalyScores,
 
   *Note:* we only average the anomaly score.
   """
+  records = _wellFormedRecords(anomalyScores, verbosity)
+  scores = numpy.array([r[2] for r in records], dtype=float)
+  averagedScores = _movingAverages(scores, windowSize).tolist()
+
+  averagedRecordList = [[r[0], r[1], avg]
+                        for r, avg in zip(records, averagedScores)]
+  if verbosity > 2:
+    for record, averagedRecord in zip(records, averagedRecordList):
+      print("Aggregating input record:", record)
+      print("Result:", averagedRecord)
+
+  historicalValues = scores[-windowSize:].tolist()
+  return averagedRecordList, historicalValues, sum(historicalValues)
 
-  historicalValues = []
-  total = 0.0
-  averagedRecordList = []    # Aggregated records
-  for record in anomalyScores:
 
-    # Skip (but log) records without correct number of entries
+
+def _wellFormedRecords(anomalyScores, verbosity=0):
+  """
+  :returns: the records of ``anomalyScores`` that have the form
+            ``[timestamp, value, score]``. Others are skipped (but logged).
+  """
+  records = []
+  for record in anomalyScores:
     if not isinstance(record, (list, tuple)) or len(record) != 3:
       if verbosity >= 1:
         print("Malformed record:", record)
       continue
+    records.append(record)
+  return records
 
-    avg, historicalValues, total = (
-      MovingAverage.compute(historicalValues, total, record[2], windowSize)
-      )
 
-    averagedRecordList.append( [record[0], record[1], avg] )
 
-    if verbosity > 2:
-      print("Aggregating input record:", record)
-      print("Result:", [record[0], record[1], avg])
+def _movingAverages(values, windowSize, historicalValues=()):
+  """
+  Moving averages of ``values`` over windows of ``windowSize`` values, as
+  computed by :meth:`nupic.utils.MovingAverage.compute`.
+
+  :param values: (numpy array) values to average
+  :param windowSize: (int) number of values in a window
+  :param historicalValues: (list) the values before ``values``, which the
+                           first windows include
+  :returns: (numpy array) average of the window ending at each value
+  """
+  allValues = numpy.concatenate((numpy.asarray(historicalValues, dtype=float),
+                                 values))
+  cumulativeValues = numpy.zeros(len(allValues) + 1)
+  numpy.cumsum(allValues, out=cumulativeValues[1:])
 
-  return averagedRecordList, historicalValues, total
+  ends = numpy.arange(len(allValues) - len(values) + 1, len(allValues) + 1)
+  starts = numpy.maximum(ends - windowSize, 0)
+  return ((cumulativeValues[ends] - cumulativeValues[starts]) /
+          (ends - starts))
 
 
 
@@ -682,10 +964,20 @@ def estimateNormal(sampleData, performLowerBoundCheck=True):
   :returns: A dict containing the parameters of a normal distribution based on
       the ``sampleData``.
   """
+  return _normalDistribution(numpy.mean(sampleData), numpy.var(sampleData),
+                             performLowerBoundCheck)
+
+
+
+def _normalDistribution(mean, variance, performLowerBoundCheck=True):
+  """
+  :returns: A dict containing the parameters of a normal distribution with the
+      given ``mean`` and ``variance``, see :func:`estimateNormal`.
+  """
   params = {
     "name": "normal",
-    "mean": numpy.mean(sampleData),
-    "variance": numpy.var(sampleData),
+    "mean": mean,
+    "variance": variance,
   }
 
   if performLowerBoundCheck:
@@ -752,6 +1044,28 @@ def tailProbability(x, distributionParams):
 
 
 
+def tailProbabilities(x, distributionParams):
+  """
+  Array version of :func:`tailProbability`.
+
+  :param x: (numpy array) values
+  :param distributionParams: dict with 'mean' and 'stdev' of the distribution
+  :returns: (numpy array) tail probability of each value
+  """
+  if "mean" not in distributionParams or "stdev" not in distributionParams:
+    raise RuntimeError("Insufficient parameters to specify the distribution.")
+
+  x = numpy.asarray(x, dtype=float)
+  mean = distributionParams["mean"]
+
+  # Gaussian is symmetrical around mean, so flip to get the tail probability
+  x = numpy.where(x < mean, 2 * mean - x, x)
+
+  z = (x - mean) / distributionParams["stdev"]
+  return 0.5 * _erfc(z / 1.4142).astype(float)
+
+
+
 def isValidEstimatorParams(p):
   """
   :returns: ``True`` if ``p`` is a valid estimator params as might be returned
@@ -770,3 +1084,81 @@ def isValidEstimatorParams(p):
     return False
 
   return True
+
+
+
+class _RunningMoments(object):
+  """
+  Count, mean and variance of a collection of numbers that values can be
+  added to and removed from in constant time.
+
+  Sums are taken relative to a value of the collection, which keeps the
+  variance of values that are large relative to their spread accurate, and
+  exactly zero for constant values. As values come and go the sums pick up
+  rounding errors; :meth:`varianceError` bounds the resulting error of
+  :meth:`variance` and :meth:`reset` rebuilds the sums when it matters.
+  """
+
+  def __init__(self):
+    self.reset()
+
+
+  def reset(self, values=()):
+    """
+    Rebuild the sums from scratch.
+
+    :param values: (iterable) the numbers in the collection
+    """
+    self.count = 0
+    self.shift = 0.0
+    self.total = 0.0
+    self.totalSquares = 0.0
+    self.totalError = 0.0
+    self.totalSquaresError = 0.0
+    for value in values:
+      self.add(value)
+
+
+  def add(self, value):
+    if self.count == 0:
+      self.shift = float(value)
+      self.total = 0.0
+      self.totalSquares = 0.0
+      self.totalError = 0.0
+      self.totalSquaresError = 0.0
+    self._update(1, value - self.shift)
+
+
+  def remove(self, value):
+    self._update(-1, -(value - self.shift))
+
+
+  def _update(self, count, delta):
+    self.count += count
+    self.total += delta
+    self.totalSquares += count * delta * delta
+    # Each addition is off by at most half an ulp of its result
+    self.totalError += _EPSILON * abs(self.total)
+    self.totalSquaresError += _EPSILON * abs(self.totalSquares)
+
+
+  def mean(self):
+    return self.shift + self.total / self.count
+
+
+  def variance(self):
+    meanDelta = self.total / self.count
+    return max(0.0, self.totalSquares / self.count - meanDelta * meanDelta)
+
+
+  def varianceError(self):
+    """
+    :returns: (float) a bound on the error of :meth:`variance`, with a
+      safety factor of 2
+    """
+    meanDelta = self.total / self.count
+    meanError = self.totalError / self.count
+    return 2 * (self.totalSquaresError / self.count +
+                (2 * abs(meanDelta) + meanError) * meanError +
+                _EPSILON * (self.totalSquares / self.count +
+                            meanDelta * meanDelta))
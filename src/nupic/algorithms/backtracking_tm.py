@@ -43,6 +43,10 @@ TM_VERSION = 1
 # The numpy equivalent to the floating point type used by NTA
 dtype = GetNTAReal()
 
+# The inference backtracking counters kept in the internal stats
+INF_BACKTRACK_STATS = ("nInfBacktracks", "nInfBacktrackSteps",
+                       "nInfBacktrackShortcuts", "nInfBacktrackFailures")
+
 
 
 class BacktrackingTM(ConsolePrinterMixin, Serializable):
@@ -406,6 +410,9 @@ class BacktrackingTM(ConsolePrinterMixin, Serializable):
     version = state.pop('version')
     assert version == TM_VERSION
     self.__dict__.update(state)
+    # States saved before the backtracking counters were added don't have them
+    for name in INF_BACKTRACK_STATS:
+      self._internalStats.setdefault(name, 0)
 
 
   @staticmethod
@@ -843,6 +850,10 @@ class BacktrackingTM(ConsolePrinterMixin, Serializable):
     self._internalStats['totalMissing'] = 0
     self._internalStats['totalExtra'] = 0
 
+    # Inference backtracking counters. These are always collected.
+    for name in INF_BACKTRACK_STATS:
+      self._internalStats[name] = 0
+
     # Sequence signature statistics. Note that we don't reset the sequence
     # signature list itself.
     self._internalStats['prevSequenceSignature'] = None
@@ -878,6 +889,8 @@ class BacktrackingTM(ConsolePrinterMixin, Serializable):
           - ``prevSequenceSignature``: signature for the sequence immediately 
                 preceding the last reset. 'None' if ``collectSequenceStats`` is 
                 False.
+          - the inference backtracking counters returned by
+                :meth:`getInfBacktrackStats`.
     """
     if not self.collectStats:
       return None
@@ -913,9 +926,34 @@ class BacktrackingTM(ConsolePrinterMixin, Serializable):
     self._stats['prevSequenceSignature'] = (
         self._internalStats['prevSequenceSignature'])
 
+    self._stats.update(self.getInfBacktrackStats())
+
     return self._stats
 
 
+  def getInfBacktrackStats(self):
+    """
+    Return the inference backtracking counters collected since the last
+    :meth:`resetStats` call. Unlike :meth:`getStats`, these are available even
+    if ``collectStats`` is False. They can be used to tune
+    ``maxInfBacktrack``. :class:`BacktrackingTMCPP` backtracks in C++ and
+    doesn't update them.
+
+    :returns: (dict) with the following keys:
+
+          - ``nInfBacktracks``: the number of times inference backtracked.
+          - ``nInfBacktrackSteps``: the total number of inputs that were
+                replayed while backtracking, the main cost of backtracking.
+          - ``nInfBacktrackShortcuts``: the number of starting points that were
+                abandoned early because they reached a state that an earlier
+                starting point got lost from.
+          - ``nInfBacktrackFailures``: the number of times backtracking did
+                not lock on to any starting point.
+    """
+    return dict((name, self._internalStats[name])
+                for name in INF_BACKTRACK_STATS)
+
+
   def _updateStatsInferEnd(self, stats, bottomUpNZ, predictedState,
                            colConfidence):
     """
@@ -1657,7 +1695,7 @@ class BacktrackingTM(ConsolePrinterMixin, Serializable):
     return self.avgLearnedSeqLength
 
 
-  def _inferBacktrack(self, activeColumns):
+  def _inferBacktrack(self, activeColumns, inferredPredictions=False):
     """
     This "backtracks" our inference state, trying to see if we can lock onto
     the current set of inputs by assuming the sequence started up to N steps
@@ -1763,6 +1801,9 @@ class BacktrackingTM(ConsolePrinterMixin, Serializable):
     extends sequences.
 
     :param activeColumns: (list) of active column indices
+    :param inferredPredictions: (bool) True if :meth:`_inferPhase2` was already
+           called on ``infActiveState['t']``, in which case its results are
+           reused if we fail to lock on.
 
     """
     # How much input history have we accumulated?
@@ -1781,6 +1822,15 @@ class BacktrackingTM(ConsolePrinterMixin, Serializable):
     # todo: save infActiveState['t-1'], infPredictedState['t-1']?
     self.infActiveState['backup'][:, :] = self.infActiveState['t'][:, :]
 
+    # The results of _inferPhase2() only depend on the active state. The same
+    # active state often comes up more than once while backtracking (e.g. the
+    # start cells of a repeated input, or the state we had on entry when we
+    # fail to lock on), so we cache them by packed active state.
+    phase2Cache = dict()
+    backupState = self._packInfActiveState()
+    if inferredPredictions:
+      self._cacheInferPhase2(phase2Cache, backupState, False)
+
     # Save our t-1 predicted state because we will write over it as as evaluate
     # each potential starting point.
     self.infPredictedState['backup'][:, :] = self.infPredictedState['t-1'][:, :]
@@ -1809,6 +1859,15 @@ class BacktrackingTM(ConsolePrinterMixin, Serializable):
     #
     # So, our strategy will be to pick the "B" point, since choosing the A point
     #  does not impact our confidences going forward at all.
+    #
+    # The replay is deterministic: the outcome of a starting point only depends
+    # on the active state reached after phase 1 at each offset. We remember the
+    # (packed) active states that starting points which got lost went through,
+    # so that a later starting point that falls into one of them can be
+    # abandoned right away instead of being replayed until it gets lost too.
+    failedStates = [set() for _ in xrange(numPrevPatterns)]
+    self._internalStats['nInfBacktracks'] += 1
+
     inSequence = False
     candConfidence = None
     candStartOffset = None
@@ -1827,6 +1886,7 @@ class BacktrackingTM(ConsolePrinterMixin, Serializable):
 
       # Play through starting from starting point 'startOffset'
       inSequence = False
+      visitedStates = []
       for offset in range(startOffset, numPrevPatterns):
         # If we are about to set the active columns for the current time step
         # based on what we predicted, capture and save the total confidence of
@@ -1838,20 +1898,31 @@ class BacktrackingTM(ConsolePrinterMixin, Serializable):
         self.infPredictedState['t-1'][:, :] = self.infPredictedState['t'][:, :]
         inSequence = self._inferPhase1(self._prevInfPatterns[offset],
                                        useStartCells = (offset == startOffset))
+        self._internalStats['nInfBacktrackSteps'] += 1
         if not inSequence:
           break
 
+        # Give up if an earlier starting point already got lost from here
+        state = self._packInfActiveState()
+        if state in failedStates[offset]:
+          self._internalStats['nInfBacktrackShortcuts'] += 1
+          inSequence = False
+          break
+        visitedStates.append((offset, state))
+
         # Compute predictedState['t'] given activeState['t']
         if self.verbosity >= 3:
           print ("  backtrack: computing predictions from ",
                  self._prevInfPatterns[offset])
-        inSequence = self._inferPhase2()
+        inSequence = self._inferPhase2Cached(phase2Cache, state)
         if not inSequence:
           break
 
       # If starting from startOffset got lost along the way, mark it as an
       # invalid start point.
       if not inSequence:
+        for offset, state in visitedStates:
+          failedStates[offset].add(state)
         badPatterns.append(startOffset)
         continue
 
@@ -1878,10 +1949,11 @@ class BacktrackingTM(ConsolePrinterMixin, Serializable):
     # If we failed to lock on at any starting point, fall back to the original
     # active state that we had on entry
     if candStartOffset is None:
+      self._internalStats['nInfBacktrackFailures'] += 1
       if self.verbosity >= 3:
         print "Failed to lock on. Falling back to bursting all unpredicted."
       self.infActiveState['t'][:, :] = self.infActiveState['backup'][:, :]
-      self._inferPhase2()
+      self._inferPhase2Cached(phase2Cache, backupState)
 
     else:
       if self.verbosity >= 3:
@@ -1912,6 +1984,52 @@ class BacktrackingTM(ConsolePrinterMixin, Serializable):
     self.infPredictedState['t-1'][:, :] = self.infPredictedState['backup'][:, :]
 
 
+  def _packInfActiveState(self):
+    """
+    :returns: (str) ``infActiveState['t']`` packed into a string, the key
+              :meth:`_inferBacktrack` identifies active states by
+    """
+    return numpy.packbits(self.infActiveState['t']).tostring()
+
+
+  def _cacheInferPhase2(self, cache, state, inSequence):
+    """
+    Save the results of :meth:`_inferPhase2` for the given active state.
+
+    :param cache: (dict) cache of the :meth:`_inferPhase2` results
+    :param state: (str) packed ``infActiveState['t']``
+    :param inSequence: (bool) value returned by :meth:`_inferPhase2`
+    """
+    cache[state] = (self.infPredictedState['t'].copy(),
+                    self.cellConfidence['t'].copy(),
+                    self.colConfidence['t'].copy(),
+                    inSequence)
+
+
+  def _inferPhase2Cached(self, cache, state):
+    """
+    Same as :meth:`_inferPhase2`, but reuses the cached results if
+    ``infActiveState['t']`` was already seen.
+
+    Skipping :meth:`_inferPhase2` has no side effect: the duty cycles of the
+    segments it visits were already brought up to date for this iteration.
+
+    :param cache: (dict) cache of the :meth:`_inferPhase2` results
+    :param state: (str) packed ``infActiveState['t']``
+    :returns: (bool) same as :meth:`_inferPhase2`
+    """
+    if state in cache:
+      predictedState, cellConfidence, colConfidence, inSequence = cache[state]
+      self.infPredictedState['t'][:, :] = predictedState
+      self.cellConfidence['t'][:, :] = cellConfidence
+      self.colConfidence['t'][:] = colConfidence
+      return inSequence
+
+    inSequence = self._inferPhase2()
+    self._cacheInferPhase2(cache, state, inSequence)
+    return inSequence
+
+
   def _inferPhase1(self, activeColumns, useStartCells):
     """
     Update the inference active state from the last set of predictions
@@ -2074,7 +2192,7 @@ class BacktrackingTM(ConsolePrinterMixin, Serializable):
         print ("Not enough predictions going forward, "
                "re-tracing back to try and lock on at an earlier timestep.")
       # inferBacktrack() will call inferPhase2() for us.
-      self._inferBacktrack(activeColumns)
+      self._inferBacktrack(activeColumns, inferredPredictions=True)
 
 
   def _learnBacktrackFrom(self, startOffset, readOnly=True):
@@ -2610,33 +2728,7 @@ class BacktrackingTM(ConsolePrinterMixin, Serializable):
       # it can be called in adaptSegments, in the case where we
       # do global decay only episodically.
       if self.globalDecay > 0.0 and ((self.lrnIterationIdx % self.maxAge) == 0):
-        for c, i in itertools.product(xrange(self.numberOfCols),
-                                      xrange(self.cellsPerColumn)):
-
-          segsToDel = [] # collect and remove outside the loop
-          for segment in self.cells[c][i]:
-            age = self.lrnIterationIdx - segment.lastActiveIteration
-            if age <= self.maxAge:
-              continue
-
-            synsToDel = [] # collect and remove outside the loop
-            for synapse in segment.syns:
-
-              synapse[2] = synapse[2] - self.globalDecay # decrease permanence
-
-              if synapse[2] <= 0:
-                synsToDel.append(synapse) # add to list to delete
-
-            # 1 for sequenceSegment flag
-            if len(synsToDel) == segment.getNumSynapses():
-              segsToDel.append(segment) # will remove the whole segment
-            elif len(synsToDel) > 0:
-              for syn in synsToDel: # remove some synapses on segment
-                segment.syns.remove(syn)
-
-          for seg in segsToDel: # remove some segments of this cell
-            self._cleanUpdatesList(c, i, seg)
-            self.cells[c][i].remove(seg)
+        self._applyGlobalDecay()
 
     # Update the prediction score stats
     # Learning always includes inference
@@ -2660,6 +2752,42 @@ class BacktrackingTM(ConsolePrinterMixin, Serializable):
     return output
 
 
+  def _applyGlobalDecay(self):
+    """
+    Decrease the permanence of the synapses of all the segments that have not
+    been active for more than ``maxAge`` iterations by ``globalDecay``.
+    Synapses are removed if their permanence value is <= 0, and segments are
+    removed when they don't have synapses anymore.
+    """
+    for c, i in itertools.product(xrange(self.numberOfCols),
+                                  xrange(self.cellsPerColumn)):
+
+      segsToDel = [] # collect and remove outside the loop
+      for segment in self.cells[c][i]:
+        age = self.lrnIterationIdx - segment.lastActiveIteration
+        if age <= self.maxAge:
+          continue
+
+        synsToDel = [] # collect and remove outside the loop
+        for synapse in segment.syns:
+
+          synapse[2] = synapse[2] - self.globalDecay # decrease permanence
+
+          if synapse[2] <= 0:
+            synsToDel.append(synapse) # add to list to delete
+
+        # 1 for sequenceSegment flag
+        if len(synsToDel) == segment.getNumSynapses():
+          segsToDel.append(segment) # will remove the whole segment
+        elif len(synsToDel) > 0:
+          for syn in synsToDel: # remove some synapses on segment
+            segment.syns.remove(syn)
+
+      for seg in segsToDel: # remove some segments of this cell
+        self._cleanUpdatesList(c, i, seg)
+        self.cells[c][i].remove(seg)
+
+
   def infer(self, bottomUpInput):
     """
     TODO: document
@@ -3382,7 +3510,7 @@ class BacktrackingTM(ConsolePrinterMixin, Serializable):
 
       # (segID, sequenceSegment flag, frequency, positiveActivations,
       #          totalActivations, lastActiveIteration)
-      newSegment = Segment(tm=self, isSequenceSeg=segUpdate.sequenceSegment)
+      newSegment = self._createSegment(isSequenceSeg=segUpdate.sequenceSegment)
 
       # numpy.float32 important so that we can match with C++
       for synapse in activeSynapses:
@@ -3397,6 +3525,17 @@ class BacktrackingTM(ConsolePrinterMixin, Serializable):
     return trimSegment
 
 
+  def _createSegment(self, isSequenceSeg):
+    """
+    Create a new segment without any synapses. The segment is not added to a
+    cell yet.
+
+    :param isSequenceSeg: (bool) True if the new segment is a sequence segment
+    :returns: (:class:`Segment`) the new segment
+    """
+    return Segment(tm=self, isSequenceSeg=isSequenceSeg)
+
+
   def getSegmentInfo(self, collectActiveData = False):
     """Returns information about the distribution of segments, synapses and
     permanence values in the current TM. If requested, also returns information
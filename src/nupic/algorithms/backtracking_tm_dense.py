@@ -0,0 +1,855 @@
+# Copyright 2017 Numenta Inc.
+#
+# Copyright may exist in Contributors' modifications
+# and/or contributions to the work.
+#
+# Use of this source code is governed by the MIT
+# license that can be found in the LICENSE file or at
+# https://opensource.org/licenses/MIT.
+
+"""
+Array-backed implementation of
+:class:`~nupic.algorithms.backtracking_tm.BacktrackingTM`.
+
+The synapses of all the segments that are on a cell are stored in a set of
+contiguous NumPy tables (presynaptic cell, permanence and owning segment slot)
+instead of per segment lists of ``[srcCellCol, srcCellIdx, perm]`` lists. This
+lets the TM compute the activity of every segment against an activity state
+with a single gather and ``bincount``, which replaces the per segment loops of
+the inference and learning phase 2 and of the best matching cell / segment
+searches.
+
+Segments are still :class:`DenseSegment` objects, so the segment metadata,
+duty cycles, segment updates and serialization are shared with
+:class:`~nupic.algorithms.backtracking_tm.BacktrackingTM`. The ``syns`` of a
+segment that is on a cell is a list of views onto its rows of the synapse
+tables, so code written against the list layout keeps working. Results are
+identical to :class:`~nupic.algorithms.backtracking_tm.BacktrackingTM`,
+including the rounding of the permanences.
+"""
+
+import itertools
+
+import numpy
+
+from nupic.algorithms.backtracking_tm import BacktrackingTM, Segment
+
+# Initial number of rows allocated in the synapse and segment tables. The
+# tables double in size whenever they fill up.
+INITIAL_SYNAPSE_CAPACITY = 1024
+INITIAL_SEGMENT_CAPACITY = 128
+
+
+
+class BacktrackingTMDense(BacktrackingTM):
+  """
+  :class:`~nupic.algorithms.backtracking_tm.BacktrackingTM` that keeps its
+  synapses in packed arrays. It takes the same parameters and produces the
+  same output and learned segments as
+  :class:`~nupic.algorithms.backtracking_tm.BacktrackingTM`.
+
+  The synapse tables are rebuilt from the segments after deserialization, so
+  pickles and protos contain the same segment data as the base class.
+  """
+
+  def _getEphemeralMembers(self):
+    """
+    List of our member variables that we don't need to be saved.
+    """
+    e = super(BacktrackingTMDense, self)._getEphemeralMembers()
+    return e + ["_synPresyn", "_synPerm", "_synIsFloat32", "_synOwner",
+                "_numSynSlots", "_freeSynSlots", "_segCell", "_segments",
+                "_numSegSlots", "_freeSegSlots", "_stateBuffer"]
+
+
+  def _initEphemerals(self):
+    """
+    Initialize all ephemeral members after being restored to a pickled state.
+    """
+    super(BacktrackingTMDense, self)._initEphemerals()
+    self._initSynapseStore()
+
+
+  def __getstate__(self):
+    """ @internal
+    Return serializable state. The synapse tables are not saved, the segments
+    are saved with their own copy of their synapses.
+    """
+    state = super(BacktrackingTMDense, self).__getstate__()
+    state["cells"] = [[list(cell) for cell in column] for column in self.cells]
+    return state
+
+
+  def __setstate__(self, state):
+    """ @internal
+    Set the state of ourself from a serialized state.
+    """
+    super(BacktrackingTMDense, self).__setstate__(state)
+    self._initSynapseStore()
+
+
+  def _initSynapseStore(self):
+    """
+    Allocate the synapse and segment tables and move the synapses of all the
+    segments in ``self.cells`` into them.
+    """
+    # Presynaptic cell (column * cellsPerColumn + cell) of each synapse row.
+    # Free rows point to an extra cell that is never active.
+    self._synPresyn = numpy.zeros(INITIAL_SYNAPSE_CAPACITY, dtype="int32")
+    # Permanences are kept as float64, and _synIsFloat32 tells whether the
+    # value is a numpy.float32 in BacktrackingTM. Later updates must round the
+    # same way as the scalar arithmetic on the original value.
+    self._synPerm = numpy.zeros(INITIAL_SYNAPSE_CAPACITY, dtype="float64")
+    self._synIsFloat32 = numpy.zeros(INITIAL_SYNAPSE_CAPACITY, dtype="bool")
+    # Segment slot of each synapse row. Free rows belong to slot 0, they don't
+    # contribute to its activity since their presynaptic cell is never active.
+    self._synOwner = numpy.zeros(INITIAL_SYNAPSE_CAPACITY, dtype="int32")
+    self._numSynSlots = 0
+    self._freeSynSlots = []
+
+    # Cell and segment of each segment slot, -1 and None for free slots.
+    self._segCell = numpy.full(INITIAL_SEGMENT_CAPACITY, -1, dtype="int32")
+    self._segments = []
+    self._numSegSlots = 0
+    self._freeSegSlots = []
+
+    self._stateBuffer = numpy.zeros(self._numberOfCells + 1, dtype="int8")
+
+    for c in xrange(self.numberOfCols):
+      for i in xrange(self.cellsPerColumn):
+        segments = self.cells[c][i]
+        self.cells[c][i] = _SegmentList(self, c * self.cellsPerColumn + i)
+        for segment in segments:
+          self.cells[c][i].append(DenseSegment.fromSegment(segment))
+
+
+  def _createSegment(self, isSequenceSeg):
+    """
+    Create a new segment without any synapses. The segment is not added to a
+    cell yet.
+
+    :param isSequenceSeg: (bool) True if the new segment is a sequence segment
+    :returns: (:class:`DenseSegment`) the new segment
+    """
+    return DenseSegment(tm=self, isSequenceSeg=isSequenceSeg)
+
+
+  def _attachSegment(self, segment, cellIdx):
+    """
+    Move the synapses of a segment that is added to a cell into the synapse
+    tables.
+
+    :param segment: (:class:`DenseSegment`) segment to attach
+    :param cellIdx: (int) flat index of the cell the segment is added to
+    """
+    assert segment._synSlots is None, "Segment is already on a cell"
+
+    if self._freeSegSlots:
+      segSlot = self._freeSegSlots.pop()
+    else:
+      segSlot = self._numSegSlots
+      if segSlot == len(self._segCell):
+        self._segCell = numpy.append(
+          self._segCell, numpy.full(len(self._segCell), -1, dtype="int32"))
+      self._segments.append(None)
+      self._numSegSlots += 1
+    self._segCell[segSlot] = cellIdx
+    self._segments[segSlot] = segment
+
+    synapses = segment._detachedSyns
+    segment._segSlot = segSlot
+    segment._synSlots = []
+    segment._detachedSyns = None
+    for srcCellCol, srcCellIdx, perm in synapses:
+      segment._synSlots.append(self._newSynapse(
+        segSlot, srcCellCol * self.cellsPerColumn + srcCellIdx, perm))
+
+
+  def _detachSegment(self, segment):
+    """
+    Move the synapses of a segment that is removed from its cell out of the
+    synapse tables and back into the segment.
+
+    :param segment: (:class:`DenseSegment`) segment to detach
+    """
+    synapses = [list(syn) for syn in self._getSynapses(segment._synSlots)]
+    self._freeSynapses(segment._synSlots)
+    self._segCell[segment._segSlot] = -1
+    self._segments[segment._segSlot] = None
+    self._freeSegSlots.append(segment._segSlot)
+    segment._segSlot = None
+    segment._synSlots = None
+    segment._detachedSyns = synapses
+
+
+  def _newSynapse(self, segSlot, presyn, perm):
+    """
+    Add a row to the synapse tables.
+
+    :param segSlot: (int) slot of the segment that owns the synapse
+    :param presyn: (int) flat index of the presynaptic cell
+    :param perm: permanence, with the type it would have in BacktrackingTM
+
+    :returns: (int) the synapse slot
+    """
+    if self._freeSynSlots:
+      slot = self._freeSynSlots.pop()
+    else:
+      slot = self._numSynSlots
+      if slot == len(self._synPresyn):
+        self._synPresyn = numpy.append(self._synPresyn,
+                                       numpy.zeros_like(self._synPresyn))
+        self._synPerm = numpy.append(self._synPerm,
+                                     numpy.zeros_like(self._synPerm))
+        self._synIsFloat32 = numpy.append(self._synIsFloat32,
+                                          numpy.zeros_like(self._synIsFloat32))
+        self._synOwner = numpy.append(self._synOwner,
+                                      numpy.zeros_like(self._synOwner))
+      self._numSynSlots += 1
+
+    self._synPresyn[slot] = presyn
+    self._synOwner[slot] = segSlot
+    self._setPermanence(slot, perm)
+    return slot
+
+
+  def _freeSynapses(self, slots):
+    """
+    Release rows of the synapse tables.
+
+    :param slots: (list) synapse slots to release
+    """
+    self._synPresyn[slots] = self._numberOfCells
+    self._synOwner[slots] = 0
+    self._freeSynSlots.extend(slots)
+
+
+  def _getSynapses(self, slots):
+    """
+    :param slots: (list) synapse slots
+
+    :returns: (list) ``(srcCellCol, srcCellIdx, perm)`` tuple of each synapse,
+              the permanences have the type they would have in BacktrackingTM
+    """
+    srcCellCols, srcCellIdxs = divmod(self._synPresyn[slots],
+                                      self.cellsPerColumn)
+    return [(srcCellCol, srcCellIdx,
+             numpy.float32(perm) if isFloat32 else numpy.float64(perm))
+            for srcCellCol, srcCellIdx, perm, isFloat32 in itertools.izip(
+              srcCellCols.tolist(), srcCellIdxs.tolist(),
+              self._synPerm[slots].tolist(),
+              self._synIsFloat32[slots].tolist())]
+
+
+  def _setPermanence(self, slot, perm):
+    self._synPerm[slot] = perm
+    self._synIsFloat32[slot] = isinstance(perm, numpy.float32)
+
+
+  def _addToPermanences(self, slots, delta):
+    """
+    Add delta to the permanence of some synapses. The sums are rounded like
+    the scalar sums of BacktrackingTM: float32 + float32 stays float32, any
+    other sum is a float64.
+
+    :param slots: (numpy array) synapse slots
+    :param delta: how much to add to each permanence
+
+    :returns: (numpy array) the new permanences
+    """
+    perms = self._synPerm[slots]
+    newPerms = perms + delta
+    if isinstance(delta, numpy.float32):
+      isFloat32 = self._synIsFloat32[slots]
+      newPerms[isFloat32] = perms[isFloat32].astype("float32") + delta
+    else:
+      self._synIsFloat32[slots] = False
+    self._synPerm[slots] = newPerms
+    return newPerms
+
+
+  def _applyGlobalDecay(self):
+    """
+    Decrease the permanence of the synapses of all the segments that have not
+    been active for more than ``maxAge`` iterations by ``globalDecay``.
+    Synapses are removed if their permanence value is <= 0, and segments are
+    removed when they don't have synapses anymore.
+    """
+    oldSegments = [segment for segment in self._segments
+                   if segment is not None and
+                   self.lrnIterationIdx - segment.lastActiveIteration >
+                   self.maxAge]
+    if not oldSegments:
+      return
+
+    isOld = numpy.zeros(self._numSegSlots, dtype="bool")
+    isOld[[segment._segSlot for segment in oldSegments]] = True
+    numSynSlots = self._numSynSlots
+    slots = numpy.flatnonzero(
+      isOld[self._synOwner[:numSynSlots]] &
+      (self._synPresyn[:numSynSlots] != self._numberOfCells))
+
+    newPerms = self._addToPermanences(slots, -self.globalDecay)
+    deadSlots = slots[newPerms <= 0]
+    numDead = numpy.bincount(self._synOwner[deadSlots],
+                             minlength=self._numSegSlots)
+
+    segsToDel = set()
+    for segment in oldSegments:
+      if numDead[segment._segSlot] == len(segment._synSlots):
+        segsToDel.add(segment) # will remove the whole segment
+      elif numDead[segment._segSlot] > 0:
+        dead = set(slot for slot in segment._synSlots
+                   if self._synPerm[slot] <= 0)
+        segment._synSlots = [slot for slot in segment._synSlots
+                             if slot not in dead]
+        self._freeSynapses(list(dead))
+
+    cellsWithSegsToDel = numpy.unique([self._segCell[segment._segSlot]
+                                       for segment in segsToDel])
+    for cellIdx in cellsWithSegsToDel:
+      c, i = divmod(int(cellIdx), self.cellsPerColumn)
+      for seg in [s for s in self.cells[c][i] if s in segsToDel]:
+        self._cleanUpdatesList(c, i, seg)
+        self.cells[c][i].remove(seg)
+
+
+  def _segmentActivity(self, activeState, connectedSynapsesOnly=False):
+    """
+    Compute the activity level of all the segments at once.
+
+    :param activeState: the active cells
+    :param connectedSynapsesOnly: (bool) only count the connected synapses
+
+    :returns: (numpy array) activity level of each segment slot, see
+              :meth:`_getSegmentActivityLevel`
+    """
+    numSynSlots = self._numSynSlots
+    self._stateBuffer[:-1] = activeState.reshape(-1)
+    weights = self._stateBuffer[self._synPresyn[:numSynSlots]]
+    if connectedSynapsesOnly:
+      weights = weights * self._connectedMask(slice(0, numSynSlots))
+    return numpy.bincount(self._synOwner[:numSynSlots], weights=weights,
+                          minlength=max(self._numSegSlots, 1)).astype("int32")
+
+
+  def _segmentsActivity(self, segments, activeState,
+                        connectedSynapsesOnly=False):
+    """
+    Compute the activity level of a few segments that are on cells.
+
+    :param segments: (list) the segments
+    :param activeState: the active cells
+    :param connectedSynapsesOnly: (bool) only count the connected synapses
+
+    :returns: (list) activity level of each segment
+    """
+    if not segments:
+      return []
+    lengths = [len(segment._synSlots) for segment in segments]
+    slots = numpy.fromiter(
+      itertools.chain.from_iterable(segment._synSlots for segment in segments),
+      dtype="int64", count=sum(lengths))
+    weights = activeState.reshape(-1)[self._synPresyn[slots]]
+    if connectedSynapsesOnly:
+      weights = weights * self._connectedMask(slots)
+    return numpy.bincount(numpy.repeat(numpy.arange(len(segments)), lengths),
+                          weights=weights,
+                          minlength=len(segments)).astype("int32").tolist()
+
+
+  def _connectedMask(self, slots):
+    # The permanences are compared in float32, like the C implementation
+    # used by BacktrackingTM.
+    return (self._synPerm[slots].astype("float32") >=
+            numpy.float32(self.connectedPerm))
+
+
+  def _isSegmentActive(self, seg, activeState):
+    """
+    A segment is active if it has >= activationThreshold connected
+    synapses that are active due to activeState.
+    """
+    if seg._synSlots is None:
+      return super(BacktrackingTMDense, self)._isSegmentActive(seg, activeState)
+    return (self._segmentsActivity([seg], activeState,
+                                   connectedSynapsesOnly=True)[0] >=
+            self.activationThreshold)
+
+
+  def _getSegmentActivityLevel(self, seg, activeState,
+                               connectedSynapsesOnly=False):
+    """
+    This routine computes the activity level of a segment given activeState.
+    It can tally up only connected synapses (permanence >= connectedPerm), or
+    all the synapses of the segment, at either t or t-1.
+    """
+    if seg._synSlots is None:
+      return super(BacktrackingTMDense, self)._getSegmentActivityLevel(
+        seg, activeState, connectedSynapsesOnly)
+    return self._segmentsActivity([seg], activeState, connectedSynapsesOnly)[0]
+
+
+  def _getBestMatchingCell(self, c, activeState, minThreshold):
+    """
+    Find weakly activated cell in column with at least minThreshold active
+    synapses.
+
+    :param c            which column to look at
+    :param activeState  the active cells
+    :param minThreshold minimum number of synapses required
+
+    :returns: tuple (cellIdx, segment, numActiveSynapses)
+    """
+    segments = [s for i in xrange(self.cellsPerColumn) for s in self.cells[c][i]]
+    activity = dict(zip([s._segSlot for s in segments],
+                        self._segmentsActivity(segments, activeState)))
+    return self._selectBestMatchingCell(c, activity, minThreshold)
+
+
+  def _selectBestMatchingCell(self, c, activity, minThreshold):
+    """
+    :meth:`_getBestMatchingCell` with precomputed segment activity levels.
+
+    :param c            which column to look at
+    :param activity     activity level of the segments, by segment slot
+    :param minThreshold minimum number of synapses required
+
+    :returns: tuple (cellIdx, segment, numActiveSynapses)
+    """
+    bestActivityInCol = minThreshold
+    bestSegIdxInCol = -1
+    bestCellInCol = -1
+
+    for i in xrange(self.cellsPerColumn):
+
+      maxSegActivity = 0
+      maxSegIdx = 0
+
+      for j, s in enumerate(self.cells[c][i]):
+        if activity[s._segSlot] > maxSegActivity:
+          maxSegActivity = activity[s._segSlot]
+          maxSegIdx = j
+
+      if maxSegActivity >= bestActivityInCol:
+        bestActivityInCol = maxSegActivity
+        bestSegIdxInCol = maxSegIdx
+        bestCellInCol = i
+
+    if bestCellInCol == -1:
+      return (None, None, None)
+    else:
+      return (bestCellInCol, self.cells[c][bestCellInCol][bestSegIdxInCol],
+              int(bestActivityInCol))
+
+
+  def _getBestMatchingSegment(self, c, i, activeState):
+    """
+    For the given cell, find the segment with the largest number of active
+    synapses, see :meth:`BacktrackingTM._getBestMatchingSegment`.
+    """
+    segments = self.cells[c][i]
+    activity = dict(zip([s._segSlot for s in segments],
+                        self._segmentsActivity(segments, activeState)))
+    return self._selectBestMatchingSegment(c, i, activity)
+
+
+  def _selectBestMatchingSegment(self, c, i, activity):
+    """
+    :meth:`_getBestMatchingSegment` with precomputed segment activity levels.
+    """
+    maxActivity, which = self.minThreshold, -1
+
+    for j, s in enumerate(self.cells[c][i]):
+      if activity[s._segSlot] >= maxActivity:
+        maxActivity, which = activity[s._segSlot], j
+
+    if which == -1:
+      return None
+    else:
+      return self.cells[c][i][which]
+
+
+  def _inferPhase2(self):
+    """
+    Phase 2 for the inference state, see :meth:`BacktrackingTM._inferPhase2`.
+
+    The activity of all the segments is computed at once, and only the cells
+    with a segment above ``activationThreshold`` are visited, in the same order
+    as the base class so that the confidences add up the same way.
+    """
+    if self.activationThreshold <= 0:
+      return super(BacktrackingTMDense, self)._inferPhase2()
+
+    # Init to zeros to start
+    self.infPredictedState['t'].fill(0)
+    self.cellConfidence['t'].fill(0)
+    self.colConfidence['t'].fill(0)
+
+    activity = self._segmentActivity(self.infActiveState['t'])
+    connectedActivity = self._segmentActivity(self.infActiveState['t'],
+                                              connectedSynapsesOnly=True)
+    activeSegSlots = numpy.flatnonzero(activity >= self.activationThreshold)
+
+    # Phase 2 - Compute new predicted state and update cell and column
+    #   confidences
+    for cellIdx in numpy.unique(self._segCell[activeSegSlots]):
+      c, i = divmod(int(cellIdx), self.cellsPerColumn)
+
+      for s in self.cells[c][i]:
+        if activity[s._segSlot] < self.activationThreshold:
+          continue
+
+        # Incorporate the confidence into the owner cell and column
+        if self.verbosity >= 6:
+          print "incorporating DC from cell[%d,%d]:   " % (c, i),
+          s.debugPrint()
+        dc = s.dutyCycle()
+        self.cellConfidence['t'][c, i] += dc
+        self.colConfidence['t'][c] += dc
+
+        # If we reach threshold on the connected synapses, predict it
+        if connectedActivity[s._segSlot] >= self.activationThreshold:
+          self.infPredictedState['t'][c, i] = 1
+
+    # Normalize column and cell confidences
+    sumConfidences = self.colConfidence['t'].sum()
+    if sumConfidences > 0:
+      self.colConfidence['t'] /= sumConfidences
+      self.cellConfidence['t'] /= sumConfidences
+
+    # Are we predicting the required minimum number of columns?
+    numPredictedCols = self.infPredictedState['t'].max(axis=1).sum()
+    if numPredictedCols >= 0.5 * self.avgInputDensity:
+      return True
+    else:
+      return False
+
+
+  def _learnPhase2(self, readOnly=False):
+    """
+    Compute the predicted segments given the current set of active cells, see
+    :meth:`BacktrackingTM._learnPhase2`.
+
+    The activity of all the segments is computed at once, and only the columns
+    with a segment above ``activationThreshold`` are visited.
+    """
+    if self.activationThreshold <= 0:
+      return super(BacktrackingTMDense, self)._learnPhase2(readOnly=readOnly)
+
+    # Clear out predicted state to start with
+    self.lrnPredictedState['t'].fill(0)
+
+    # Phase 2 doesn't change any synapse, so the activity levels stay valid
+    # for the whole loop
+    activity = self._segmentActivity(self.lrnActiveState['t'])
+    if self.doPooling and not readOnly:
+      prevActivity = self._segmentActivity(self.lrnActiveState['t-1'])
+    activeSegSlots = numpy.flatnonzero(activity >= self.activationThreshold)
+
+    # Compute new predicted state. When computing predictions for
+    # phase 2, we predict at  most one cell per column (the one with the best
+    # matching segment).
+    for c in numpy.unique(self._segCell[activeSegSlots] // self.cellsPerColumn):
+      c = int(c)
+
+      # Is there a cell predicted to turn on in this column?
+      i, s, numActive = self._selectBestMatchingCell(
+          c, activity, minThreshold=self.activationThreshold)
+      if i is None:
+        continue
+
+      # Turn on the predicted state for the best matching cell and queue
+      #  the pertinent segment up for an update, which will get processed if
+      #  the cell receives bottom up in the future.
+      self.lrnPredictedState['t'][c, i] = 1
+      if readOnly:
+        continue
+
+      # Queue up this segment for updating
+      segUpdate = self._getSegmentActiveSynapses(
+          c, i, s, activeState=self.lrnActiveState['t'],
+          newSynapses=(numActive < self.newSynapseCount))
+
+      s.totalActivations += 1    # increment totalActivations
+      self._addToSegmentUpdates(c, i, segUpdate)
+
+      if self.doPooling:
+        # creates a new pooling segment if no best matching segment found
+        # sum(all synapses) >= minThreshold, "weak" activation
+        predSegment = self._selectBestMatchingSegment(c, i, prevActivity)
+        segUpdate = self._getSegmentActiveSynapses(c, i, predSegment,
+                                                   self.lrnActiveState['t-1'], newSynapses=True)
+        self._addToSegmentUpdates(c, i, segUpdate)
+
+
+  def _getSegmentActiveSynapses(self, c, i, s, activeState, newSynapses=False):
+    """
+    Return a segmentUpdate data structure containing a list of proposed
+    changes to segment s, see :meth:`BacktrackingTM._getSegmentActiveSynapses`.
+    """
+    if s is None or s._synSlots is None:
+      return super(BacktrackingTMDense, self)._getSegmentActiveSynapses(
+        c, i, s, activeState, newSynapses)
+
+    # Here we add *integers* to activeSynapses
+    activeSynapses = numpy.flatnonzero(
+      activeState.reshape(-1)[self._synPresyn[s._synSlots]]).tolist()
+
+    if newSynapses: # add a few more synapses
+
+      nSynapsesToAdd = self.newSynapseCount - len(activeSynapses)
+
+      # Here we add *pairs* (colIdx, cellIdx) to activeSynapses
+      activeSynapses += self._chooseCellsToLearnFrom(c, i, s, nSynapsesToAdd,
+                                                     activeState)
+
+    return BacktrackingTM._SegmentUpdate(c, i, s, activeSynapses)
+
+
+
+class DenseSegment(Segment):
+  """
+  :class:`~nupic.algorithms.backtracking_tm.Segment` whose synapses are rows of
+  the synapse tables of a :class:`BacktrackingTMDense` while it is on a cell.
+
+  ``syns`` is a list of :class:`DenseSynapse` views onto these rows.
+  Segments that are not on a cell (new segments, and segments removed from
+  their cell) keep a plain list of synapses like
+  :class:`~nupic.algorithms.backtracking_tm.Segment`.
+  """
+
+  def __init__(self, tm, isSequenceSeg):
+    self._segSlot = None
+    self._synSlots = None
+    super(DenseSegment, self).__init__(tm, isSequenceSeg)
+
+
+  @classmethod
+  def fromSegment(cls, segment):
+    """
+    Create a segment that is not on a cell from a
+    :class:`~nupic.algorithms.backtracking_tm.Segment`.
+
+    :param segment: (:class:`~nupic.algorithms.backtracking_tm.Segment`) a
+           segment that is not on a cell
+    :returns: (:class:`DenseSegment`)
+    """
+    if isinstance(segment, cls):
+      return segment
+    obj = object.__new__(cls)
+    state = segment.__dict__.copy()
+    obj.syns = state.pop("syns")
+    obj.__dict__.update(state)
+    return obj
+
+
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    if self._synSlots is not None:
+      state["_detachedSyns"] = [list(syn) for syn in
+                                self.tm._getSynapses(self._synSlots)]
+      state["_segSlot"] = None
+      state["_synSlots"] = None
+    return state
+
+
+  def _getSyns(self):
+    if self._synSlots is None:
+      return self._detachedSyns
+    tm = self.tm
+    return _SynapseList(self, [
+      DenseSynapse(tm, slot, synapse) for slot, synapse in itertools.izip(
+        self._synSlots, tm._getSynapses(self._synSlots))])
+
+
+  def _setSyns(self, syns):
+    if getattr(self, "_synSlots", None) is not None:
+      raise AttributeError("Can't replace the synapses of a segment that is on "
+                           "a cell")
+    self._segSlot = None
+    self._synSlots = None
+    self._detachedSyns = syns
+
+
+  syns = property(_getSyns, _setSyns)
+
+
+  def getNumSynapses(self):
+    if self._synSlots is None:
+      return len(self._detachedSyns)
+    return len(self._synSlots)
+
+
+  def freeNSynapses(self, numToFree, inactiveSynapseIndices, verbosity= 0):
+    """Free up some synapses in this segment. We always free up inactive
+    synapses (lowest permanence freed up first) before we start to free up
+    active ones.
+
+    :param numToFree              number of synapses to free up
+    :param inactiveSynapseIndices list of the inactive synapse indices.
+    """
+    if self._synSlots is None or verbosity >= 4:
+      return super(DenseSegment, self).freeNSynapses(
+        numToFree, inactiveSynapseIndices, verbosity)
+
+    # Make sure numToFree isn't larger than the total number of syns we have
+    assert (numToFree <= len(self._synSlots))
+
+    slots = numpy.array(self._synSlots, dtype="int64")
+
+    def getPerms(indices):
+      # Same dtype as an array of the permanence scalars of BacktrackingTM
+      perms = self.tm._synPerm[slots[indices]]
+      if self.tm._synIsFloat32[slots[indices]].all():
+        return perms.astype("float32")
+      return perms
+
+    # Remove the lowest perm inactive synapses first
+    if len(inactiveSynapseIndices) > 0:
+      perms = getPerms(inactiveSynapseIndices)
+      candidates = numpy.array(inactiveSynapseIndices)[
+          perms.argsort()[0:numToFree]]
+      candidates = list(candidates)
+    else:
+      candidates = []
+
+    # Do we need more? if so, remove the lowest perm active synapses too
+    if len(candidates) < numToFree:
+      inactive = set(inactiveSynapseIndices)
+      activeSynIndices = [i for i in xrange(len(slots)) if i not in inactive]
+      perms = getPerms(activeSynIndices)
+      moreToFree = numToFree - len(candidates)
+      moreCandidates = numpy.array(activeSynIndices)[
+          perms.argsort()[0:moreToFree]]
+      candidates += list(moreCandidates)
+
+    # Free up all the candidates now
+    candidates = set(candidates)
+    self.tm._freeSynapses([self._synSlots[i] for i in candidates])
+    self._synSlots = [slot for i, slot in enumerate(self._synSlots)
+                      if i not in candidates]
+
+
+  def addSynapse(self, srcCellCol, srcCellIdx, perm):
+    """Add a new synapse
+
+    :param srcCellCol source cell column
+    :param srcCellIdx source cell index within the column
+    :param perm       initial permanence
+    """
+    if self._synSlots is None:
+      return super(DenseSegment, self).addSynapse(srcCellCol, srcCellIdx, perm)
+
+    self._synSlots.append(self.tm._newSynapse(
+      self._segSlot, int(srcCellCol) * self.tm.cellsPerColumn + int(srcCellIdx),
+      numpy.float32(perm)))
+
+
+  def updateSynapses(self, synapses, delta):
+    """Update a set of synapses in the segment.
+
+    :param synapses List of synapse indices to update
+    :param delta    How much to add to each permanence
+
+    :returns:   True if synapse reached 0
+    """
+    if self._synSlots is None:
+      return super(DenseSegment, self).updateSynapses(synapses, delta)
+    if len(synapses) == 0:
+      return False
+
+    tm = self.tm
+    slots = numpy.array(self._synSlots, dtype="int64")[synapses]
+    newPerms = tm._addToPermanences(slots, delta)
+
+    if delta > 0:
+      # Cap synapse permanence at permanenceMax
+      capped = slots[newPerms > tm.permanenceMax]
+      tm._synPerm[capped] = tm.permanenceMax
+      tm._synIsFloat32[capped] = isinstance(tm.permanenceMax, numpy.float32)
+      return False
+    else:
+      # Cap min synapse permanence to 0 in case there is no global decay
+      capped = slots[newPerms <= 0]
+      tm._synPerm[capped] = 0
+      tm._synIsFloat32[capped] = False
+      return len(capped) > 0
+
+
+
+class DenseSynapse(list):
+  """
+  ``[srcCellCol, srcCellIdx, perm]`` view onto a row of the synapse tables of
+  a :class:`BacktrackingTMDense`. Setting an item writes it through to the
+  tables.
+  """
+
+  __slots__ = ["_tm", "_slot"]
+
+  def __init__(self, tm, slot, synapse):
+    list.__init__(self, synapse)
+    self._tm = tm
+    self._slot = slot
+
+
+  def __setitem__(self, key, value):
+    super(DenseSynapse, self).__setitem__(key, value)
+    if key in (2, -1):
+      self._tm._setPermanence(self._slot, value)
+    else:
+      self._tm._synPresyn[self._slot] = (self[0] * self._tm.cellsPerColumn +
+                                         self[1])
+
+
+
+class _SynapseList(list):
+  """
+  List of the :class:`DenseSynapse` views of a segment. Removing a synapse
+  removes it from the segment.
+  """
+
+  def __init__(self, segment, synapses):
+    super(_SynapseList, self).__init__(synapses)
+    self._segment = segment
+
+
+  def remove(self, synapse):
+    slot = getattr(synapse, "_slot", None)
+    if slot is None:
+      slot = self[self.index(synapse)]._slot
+    for i, syn in enumerate(self):
+      if syn._slot == slot:
+        super(_SynapseList, self).__delitem__(i)
+        break
+
+    segment = self._segment
+    segment._synSlots.remove(slot)
+    segment.tm._freeSynapses([slot])
+
+
+
+class _SegmentList(list):
+  """
+  List of the segments on a cell. Adding a segment moves its synapses into
+  the synapse tables, removing it moves them out.
+  """
+
+  def __init__(self, tm, cellIdx):
+    super(_SegmentList, self).__init__()
+    self._tm = tm
+    self._cellIdx = cellIdx
+
+
+  def __reduce__(self):
+    return (list, (list(self),))
+
+
+  def append(self, segment):
+    self._tm._attachSegment(segment, self._cellIdx)
+    super(_SegmentList, self).append(segment)
+
+
+  def remove(self, segment):
+    super(_SegmentList, self).remove(segment)
+    self._tm._detachSegment(segment)
@@ -0,0 +1,439 @@
+# Copyright 2017 Numenta Inc.
+#
+# Copyright may exist in Contributors' modifications
+# and/or contributions to the work.
+#
+# Use of this source code is governed by the MIT
+# license that can be found in the LICENSE file or at
+# https://opensource.org/licenses/MIT.
+
+"""
+Temporal Memory that advances many independent streams in one call.
+
+All streams share one :class:`~nupic.algorithms.connections.Connections`
+instance in which stream ``s`` owns the cells
+``[s * numberOfCells(), (s + 1) * numberOfCells())``. The state of every
+stream is stacked into lists of these offset cells, and each step runs as a
+single pass over the active columns of all streams, a single vectorized
+:meth:`~nupic.algorithms.connections.Connections.adaptSegments` call for the
+segment adaptation of all streams, and a single vectorized
+:meth:`~nupic.algorithms.connections.Connections.computeActivity` call for
+dendrite activation. Because streams never synapse onto each other's cells
+and each stream draws from its own random number generator in column order,
+each stream behaves exactly like a standalone
+:class:`~nupic.algorithms.temporal_memory.TemporalMemory`.
+"""
+
+from bisect import bisect_left
+from operator import mul
+
+import numpy
+
+from nupic.algorithms.connections import Connections
+from nupic.algorithms.temporal_memory import TemporalMemory
+from nupic.bindings.math import Random
+from nupic.support.group_by import groupby2
+
+
+
+class BatchTemporalMemory(object):
+  """
+  Holds the state of ``numStreams`` independent Temporal Memories with
+  identical parameters and computes all of them with :meth:`computeBatch`.
+
+  Cell and column indices passed to and returned from the public methods of
+  this class are local to a stream, i.e. they are the indices a standalone
+  :class:`~nupic.algorithms.temporal_memory.TemporalMemory` would use.
+
+  :param numStreams: (int) Number of independent streams.
+
+  :param seed: (int or list) Seed for each stream's random number generator.
+         A single int seeds every stream identically, so that each stream
+         matches a standalone TemporalMemory created with that seed. Default
+         value ``42``.
+
+  See :class:`~nupic.algorithms.temporal_memory.TemporalMemory` for the
+  remaining parameters.
+  """
+
+  def __init__(self,
+               numStreams,
+               columnDimensions=(2048,),
+               cellsPerColumn=32,
+               activationThreshold=13,
+               initialPermanence=0.21,
+               connectedPermanence=0.50,
+               minThreshold=10,
+               maxNewSynapseCount=20,
+               permanenceIncrement=0.10,
+               permanenceDecrement=0.10,
+               predictedSegmentDecrement=0.0,
+               maxSegmentsPerCell=255,
+               maxSynapsesPerSegment=255,
+               seed=42):
+    # Error checking
+    if numStreams <= 0:
+      raise ValueError("Number of streams must be greater than 0")
+
+    if not len(columnDimensions):
+      raise ValueError("Number of column dimensions must be greater than 0")
+
+    if cellsPerColumn <= 0:
+      raise ValueError("Number of cells per column must be greater than 0")
+
+    if minThreshold > activationThreshold:
+      raise ValueError(
+        "The min threshold can't be greater than the activation threshold")
+
+    if isinstance(seed, (int, long)):
+      seeds = [seed] * numStreams
+    else:
+      seeds = list(seed)
+      if len(seeds) != numStreams:
+        raise ValueError("Expected one seed per stream")
+
+    # Save member variables
+    self.numStreams = numStreams
+    self.columnDimensions = columnDimensions
+    self.cellsPerColumn = cellsPerColumn
+    self.activationThreshold = activationThreshold
+    self.initialPermanence = initialPermanence
+    self.connectedPermanence = connectedPermanence
+    self.minThreshold = minThreshold
+    self.maxNewSynapseCount = maxNewSynapseCount
+    self.permanenceIncrement = permanenceIncrement
+    self.permanenceDecrement = permanenceDecrement
+    self.predictedSegmentDecrement = predictedSegmentDecrement
+    self.maxSegmentsPerCell = maxSegmentsPerCell
+    self.maxSynapsesPerSegment = maxSynapsesPerSegment
+
+    # Initialize member variables. Cells and columns are stored with their
+    # stream offset applied, so the state of all streams is sorted by stream.
+    self.connections = self.connectionsFactory(
+      numStreams * self.numberOfCells())
+    self._randoms = [Random(s) for s in seeds]
+    self.activeCells = []
+    self.winnerCells = []
+    self.activeSegments = []
+    self.matchingSegments = []
+
+    # Indexed by segment flatIdx, shared by all streams.
+    self.numActiveConnectedSynapsesForSegment = []
+    self.numActivePotentialSynapsesForSegment = []
+
+    self.iteration = 0
+    self.lastUsedIterationForSegment = []
+
+
+  @staticmethod
+  def connectionsFactory(*args, **kwargs):
+    """
+    Create the :class:`~nupic.algorithms.connections.Connections` instance
+    shared by all streams. See
+    :meth:`~nupic.algorithms.temporal_memory.TemporalMemory.connectionsFactory`.
+
+    :returns: :class:`~nupic.algorithms.connections.Connections` instance
+    """
+    return Connections(*args, **kwargs)
+
+
+  def computeBatch(self, listOfActiveColumns, learn=True):
+    """
+    Perform one time step of the Temporal Memory algorithm on every stream.
+
+    :param listOfActiveColumns: (list) One iterable of active column indices
+           per stream.
+
+    :param learn: (bool) Whether or not learning is enabled.
+    """
+    if len(listOfActiveColumns) != self.numStreams:
+      raise ValueError("Expected active columns for %d streams, got %d" %
+                       (self.numStreams, len(listOfActiveColumns)))
+
+    numColumns = self.numberOfColumns()
+    activeColumns = []
+    for stream, streamActiveColumns in enumerate(listOfActiveColumns):
+      offset = stream * numColumns
+      activeColumns.extend(column + offset
+                           for column in sorted(streamActiveColumns))
+
+    self._activateCells(activeColumns, learn)
+    self._activateDendrites(learn)
+
+
+  def reset(self, stream=None):
+    """
+    Indicates the start of a new sequence on one or all streams.
+
+    :param stream: (int) Stream to reset, or None to reset every stream.
+    """
+    if stream is None:
+      self.activeCells = []
+      self.winnerCells = []
+      self.activeSegments = []
+      self.matchingSegments = []
+      return
+
+    numCells = self.numberOfCells()
+    start = stream * numCells
+    end = start + numCells
+
+    def removeStream(cells):
+      return (cells[:bisect_left(cells, start)] +
+              cells[bisect_left(cells, end):])
+
+    self.activeCells = removeStream(self.activeCells)
+    self.winnerCells = removeStream(self.winnerCells)
+    self.activeSegments = self._removeStreamSegments(self.activeSegments,
+                                                     start, end)
+    self.matchingSegments = self._removeStreamSegments(self.matchingSegments,
+                                                       start, end)
+
+
+  @staticmethod
+  def _removeStreamSegments(segments, start, end):
+    cells = [segment.cell for segment in segments]
+    return (segments[:bisect_left(cells, start)] +
+            segments[bisect_left(cells, end):])
+
+
+  def _activateCells(self, activeColumns, learn):
+    """
+    Calculate the active cells of every stream and learn, as
+    :meth:`~nupic.algorithms.temporal_memory.TemporalMemory.activateCells`
+    does for one stream.
+
+    Learning runs in two passes. The segments of all streams are first adapted
+    with one vectorized call. Synapse growth and segment creation, which draw
+    random numbers, then run in column order with each stream's own random
+    number generator. A segment's growth only depends on its own adaptation,
+    so this matches adapting and growing each segment in turn.
+
+    :param activeColumns: (list) Sorted active columns of all streams, with
+           their stream offset applied.
+
+    :param learn: (bool) If true, reinforce / punish / grow synapses.
+    """
+    # Sorted arrays, so learning can test synapses against them in bulk.
+    prevActiveCells = numpy.array(self.activeCells, dtype=numpy.int64)
+    prevWinnerCells = numpy.array(self.winnerCells, dtype=numpy.int64)
+    self.activeCells = []
+    self.winnerCells = []
+
+    numColumns = self.numberOfColumns()
+    numActivePotential = self.numActivePotentialSynapsesForSegment
+
+    adaptedSegments = []
+    permanenceIncrements = []
+    permanenceDecrements = []
+    # (stream, segment, nGrowDesired) to grow on an existing segment, or
+    # (stream, cellsForColumn, winnerCells index) to pick a bursting column's
+    # winner cell and grow a new segment on it.
+    growths = []
+
+    segToCol = lambda segment: int(segment.cell / self.cellsPerColumn)
+    identity = lambda x: x
+
+    for columnData in groupby2(activeColumns, identity,
+                               self.activeSegments, segToCol,
+                               self.matchingSegments, segToCol):
+      (column,
+       columnActiveColumns,
+       columnActiveSegments,
+       columnMatchingSegments) = columnData
+      stream = column // numColumns
+
+      if columnActiveColumns is not None:
+        if columnActiveSegments is not None:
+          # Predicted column
+          previousCell = None
+          for segment in columnActiveSegments:
+            if segment.cell != previousCell:
+              self.activeCells.append(segment.cell)
+              self.winnerCells.append(segment.cell)
+              previousCell = segment.cell
+
+            if learn:
+              adaptedSegments.append(segment)
+              permanenceIncrements.append(self.permanenceIncrement)
+              permanenceDecrements.append(self.permanenceDecrement)
+              nGrowDesired = (self.maxNewSynapseCount -
+                              numActivePotential[segment.flatIdx])
+              if nGrowDesired > 0:
+                growths.append((stream, segment, nGrowDesired))
+        else:
+          # Bursting column
+          start = self.cellsPerColumn * column
+          cellsForColumn = xrange(start, start + self.cellsPerColumn)
+          self.activeCells.extend(cellsForColumn)
+
+          if columnMatchingSegments is not None:
+            numActive = lambda s: numActivePotential[s.flatIdx]
+            bestMatchingSegment = max(columnMatchingSegments, key=numActive)
+            self.winnerCells.append(bestMatchingSegment.cell)
+
+            if learn:
+              adaptedSegments.append(bestMatchingSegment)
+              permanenceIncrements.append(self.permanenceIncrement)
+              permanenceDecrements.append(self.permanenceDecrement)
+              nGrowDesired = (self.maxNewSynapseCount -
+                              numActive(bestMatchingSegment))
+              if nGrowDesired > 0:
+                growths.append((stream, bestMatchingSegment, nGrowDesired))
+          else:
+            growths.append((stream, cellsForColumn, len(self.winnerCells)))
+            self.winnerCells.append(None)
+      elif (learn and self.predictedSegmentDecrement > 0.0 and
+            columnMatchingSegments is not None):
+        # Punish the segments that incorrectly predicted the column.
+        for segment in columnMatchingSegments:
+          adaptedSegments.append(segment)
+          permanenceIncrements.append(-self.predictedSegmentDecrement)
+          permanenceDecrements.append(0.0)
+
+    if len(adaptedSegments) > 0:
+      TemporalMemory._adaptSegments(self.connections, adaptedSegments,
+                                    prevActiveCells, permanenceIncrements,
+                                    permanenceDecrements)
+
+    numCells = self.numberOfCells()
+    winnerBounds = numpy.searchsorted(
+      prevWinnerCells, numpy.arange(self.numStreams + 1) * numCells).tolist()
+
+    for stream, target, n in growths:
+      random = self._randoms[stream]
+      streamPrevWinnerCells = prevWinnerCells[winnerBounds[stream]:
+                                              winnerBounds[stream + 1]]
+      if isinstance(target, xrange):
+        winnerCell = TemporalMemory._leastUsedCell(random, target,
+                                                   self.connections)
+        self.winnerCells[n] = winnerCell
+
+        if learn:
+          nGrowExact = min(self.maxNewSynapseCount, len(streamPrevWinnerCells))
+          if nGrowExact > 0:
+            segment = TemporalMemory._createSegment(
+              self.connections, self.lastUsedIterationForSegment, winnerCell,
+              self.iteration, self.maxSegmentsPerCell)
+            TemporalMemory._growSynapses(
+              self.connections, random, segment, nGrowExact,
+              streamPrevWinnerCells, self.initialPermanence,
+              self.maxSynapsesPerSegment)
+      else:
+        TemporalMemory._growSynapses(
+          self.connections, random, target, n, streamPrevWinnerCells,
+          self.initialPermanence, self.maxSynapsesPerSegment)
+
+
+  def _activateDendrites(self, learn):
+    """
+    Calculate dendrite segment activity of every stream with a single
+    :meth:`~nupic.algorithms.connections.Connections.computeActivity` call.
+    See :meth:`~nupic.algorithms.temporal_memory.TemporalMemory.activateDendrites`.
+
+    :param learn: (bool) If true, segment activations will be recorded.
+    """
+    (numActiveConnected,
+     numActivePotential) = self.connections.computeActivity(
+       self.activeCells,
+       self.connectedPermanence)
+
+    activeFlatIdxs = self.connections.sortSegmentFlatIdxs(
+      numpy.flatnonzero(numActiveConnected >= self.activationThreshold))
+    matchingFlatIdxs = self.connections.sortSegmentFlatIdxs(
+      numpy.flatnonzero(numActivePotential >= self.minThreshold))
+
+    self.activeSegments = map(self.connections.segmentForFlatIdx,
+                              activeFlatIdxs.tolist())
+    self.matchingSegments = map(self.connections.segmentForFlatIdx,
+                                matchingFlatIdxs.tolist())
+    self.numActiveConnectedSynapsesForSegment = numActiveConnected
+    self.numActivePotentialSynapsesForSegment = numActivePotential
+
+    if learn:
+      for segment in self.activeSegments:
+        self.lastUsedIterationForSegment[segment.flatIdx] = self.iteration
+      self.iteration += 1
+
+
+  def _streamCells(self, stream, cells):
+    """
+    Returns the cells of a stream from a sorted list of the cells of all
+    streams, as indices local to the stream.
+    """
+    numCells = self.numberOfCells()
+    start = stream * numCells
+    return [cell - start
+            for cell in cells[bisect_left(cells, start):
+                              bisect_left(cells, start + numCells)]]
+
+
+  def getActiveCells(self, stream):
+    """
+    Returns the indices of the active cells of a stream.
+
+    :param stream: (int) Stream index
+
+    :returns: (list) Indices of active cells.
+    """
+    return self._streamCells(stream, self.activeCells)
+
+
+  def getPredictiveCells(self, stream):
+    """
+    Returns the indices of the predictive cells of a stream.
+
+    :param stream: (int) Stream index
+
+    :returns: (list) Indices of predictive cells.
+    """
+    previousCell = None
+    predictiveCells = []
+    for segment in self.activeSegments:
+      if segment.cell != previousCell:
+        predictiveCells.append(segment.cell)
+        previousCell = segment.cell
+
+    return self._streamCells(stream, predictiveCells)
+
+
+  def getWinnerCells(self, stream):
+    """
+    Returns the indices of the winner cells of a stream.
+
+    :param stream: (int) Stream index
+
+    :returns: (list) Indices of winner cells.
+    """
+    return self._streamCells(stream, self.winnerCells)
+
+
+  def numSegments(self, stream):
+    """
+    Returns the number of segments of a stream.
+
+    :param stream: (int) Stream index
+
+    :returns: (int) Number of segments
+    """
+    numCells = self.numberOfCells()
+    return sum(self.connections.numSegments(cell)
+               for cell in xrange(stream * numCells, (stream + 1) * numCells))
+
+
+  def numberOfColumns(self):
+    """
+    Returns the number of columns of each stream.
+
+    :returns: (int) Number of columns
+    """
+    return reduce(mul, self.columnDimensions, 1)
+
+
+  def numberOfCells(self):
+    """
+    Returns the number of cells of each stream.
+
+    :returns: (int) Number of cells
+    """
+    return self.numberOfColumns() * self.cellsPerColumn
@@ -7,8 +7,12 @@
 # license that can be found in the LICENSE file or at
 # https://opensource.org/licenses/MIT.
 
+from array import array
 from bisect import bisect_left
 from collections import defaultdict
+from itertools import izip
+
+import numpy
 
 from nupic.serializable import Serializable
 try:
@@ -21,6 +25,11 @@ if capnp:
 EPSILON = 0.00001 # constant error threshold to check equality of permanences to
                   # other floats
 
+# Initial number of rows allocated for the presynaptic index. The index doubles
+# in size whenever it fills up.
+INITIAL_SYNAPSE_CAPACITY = 1024
+INITIAL_SEGMENT_CAPACITY = 1024
+
 
 
 class Segment(object):
@@ -73,13 +82,15 @@ class Synapse(object):
          when finding the min permanence synapse.
   """
 
-  __slots__ = ["segment", "presynapticCell", "permanence", "_ordinal"]
+  __slots__ = ["segment", "presynapticCell", "permanence", "_ordinal", "_row"]
 
   def __init__(self, segment, presynapticCell, permanence, ordinal):
     self.segment = segment
     self.presynapticCell = presynapticCell
     self.permanence = permanence
     self._ordinal = ordinal
+    # Row of this synapse in the Connections' presynaptic index.
+    self._row = None
 
 
   def __eq__(self, other):
@@ -109,6 +120,52 @@ class CellData(object):
 
 
 
+class SegmentPositionIndex(object):
+  """
+  Stores the cell and ordinal of every segment by flatIdx, so that a set of
+  segments can be put in :meth:`Connections.segmentPositionSortKey` order with
+  one vectorized sort of just those segments.
+
+  Entries are written when segments are created. A destroyed segment's entry
+  stays until its flatIdx is reused, since destroyed segments are never
+  sorted.
+  """
+
+  def __init__(self):
+    self._cells = numpy.zeros(INITIAL_SEGMENT_CAPACITY, dtype=numpy.int32)
+    self._ordinals = numpy.zeros(INITIAL_SEGMENT_CAPACITY, dtype=numpy.int64)
+
+
+  def add(self, flatIdx, cell, ordinal):
+    """
+    Records the position of a new segment.
+
+    :param flatIdx: (int) The segment's flattened list index.
+    :param cell: (int) Cell index
+    :param ordinal: (int) The segment's ordinal
+    """
+    if flatIdx >= len(self._cells):
+      newCapacity = max(2 * len(self._cells), flatIdx + 1)
+      self._cells = numpy.resize(self._cells, newCapacity)
+      self._ordinals = numpy.resize(self._ordinals, newCapacity)
+
+    self._cells[flatIdx] = cell
+    self._ordinals[flatIdx] = ordinal
+
+
+  def sort(self, flatIdxs):
+    """
+    Sorts segments by cell, and by creation order within a cell.
+
+    :param flatIdxs: (numpy array) flatIdxs of existing segments
+
+    :returns: (numpy array) The sorted flatIdxs
+    """
+    order = numpy.lexsort((self._ordinals[flatIdxs], self._cells[flatIdxs]))
+    return flatIdxs[order]
+
+
+
 def binSearch(arr, val):
   """ 
   Function for running binary search on a sorted list.
@@ -124,6 +181,51 @@ def binSearch(arr, val):
 
 
 
+def isInSorted(values, sortedValues):
+  """
+  Vectorized membership test using binary search, like ``numpy.in1d`` but
+  without sorting the inputs.
+
+  :param values: (numpy array) Values to look for.
+  :param sortedValues: (numpy array) A sorted array to search.
+  :returns: (numpy array) A boolean mask, true where the value was found.
+  """
+  if len(sortedValues) == 0:
+    return numpy.zeros(len(values), dtype=bool)
+
+  positions = numpy.searchsorted(sortedValues, values)
+  numpy.minimum(positions, len(sortedValues) - 1, out=positions)
+  return sortedValues[positions] == values
+
+
+
+def adaptPermanences(presynapticCells, permanences, activePresynapticCells,
+                     permanenceIncrement, permanenceDecrement):
+  """
+  Hebbian update of the synapses of one segment. Synapses to active cells are
+  strengthened and the rest are weakened, then permanences are clipped to
+  [0.0, 1.0].
+
+  :param presynapticCells: (numpy array) Presynaptic cell of each synapse.
+  :param permanences: (numpy array) Permanence of each synapse.
+  :param activePresynapticCells: (numpy array) Sorted active cells.
+  :param permanenceIncrement: (float or numpy array) Amount to increment
+         active synapses, for all synapses or per synapse.
+  :param permanenceDecrement: (float or numpy array) Amount to decrement
+         inactive synapses, for all synapses or per synapse.
+
+  :returns: (numpy array) The new permanences, as float64.
+  """
+  permanences = numpy.asarray(permanences, dtype=numpy.float64)
+  isActive = isInSorted(presynapticCells, activePresynapticCells)
+
+  permanences = numpy.where(isActive,
+                            permanences + permanenceIncrement,
+                            permanences - permanenceDecrement)
+  return numpy.clip(permanences, 0.0, 1.0, out=permanences)
+
+
+
 class Connections(Serializable):
   """ 
   Class to hold data representing the connectivity of a collection of cells. 
@@ -149,6 +251,98 @@ class Connections(Serializable):
     self._nextSynapseOrdinal = long(0)
     self._nextSegmentOrdinal = long(0)
 
+    self._initPresynapticIndex()
+    self._segmentPositionIndex = SegmentPositionIndex()
+
+
+  def _initPresynapticIndex(self):
+    """
+    Creates an empty presynaptic index.
+
+    The index mirrors every synapse as a row of flat arrays so that
+    :meth:`computeActivity` can process all synapses of the active cells with
+    a few vectorized operations. For each presynaptic cell, it keeps an
+    ``int32`` array of the rows of its synapses.
+    """
+    self._rowsForPresynapticCell = {}
+    self._rowSegment = numpy.zeros(INITIAL_SYNAPSE_CAPACITY, dtype=numpy.int32)
+    self._rowPermanence = numpy.zeros(INITIAL_SYNAPSE_CAPACITY,
+                                      dtype=numpy.float64)
+    self._freeRows = array("i")
+    self._nextRow = 0
+
+
+  def _rebuildPresynapticIndex(self):
+    """
+    Rebuilds the presynaptic index from the synapses.
+    """
+    self._initPresynapticIndex()
+    for segment in self._segmentForFlatIdx:
+      if segment is not None:
+        for synapse in segment._synapses:
+          self._addSynapseToPresynapticIndex(synapse)
+
+
+  def _addSynapseToPresynapticIndex(self, synapse):
+    if len(self._freeRows) > 0:
+      row = self._freeRows.pop()
+    else:
+      if self._nextRow == len(self._rowSegment):
+        self._growPresynapticIndex()
+      row = self._nextRow
+      self._nextRow += 1
+
+    self._rowSegment[row] = synapse.segment.flatIdx
+    self._rowPermanence[row] = synapse.permanence
+    synapse._row = row
+
+    rows = self._rowsForPresynapticCell.get(synapse.presynapticCell)
+    if rows is None:
+      rows = array("i")
+      self._rowsForPresynapticCell[synapse.presynapticCell] = rows
+    rows.append(row)
+
+
+  def _removeSynapseFromPresynapticIndex(self, synapse):
+    rows = self._rowsForPresynapticCell[synapse.presynapticCell]
+    rows.remove(synapse._row)
+    if len(rows) == 0:
+      del self._rowsForPresynapticCell[synapse.presynapticCell]
+
+    self._freeRows.append(synapse._row)
+    synapse._row = None
+
+
+  def _growPresynapticIndex(self):
+    """
+    Doubles the capacity of the presynaptic index.
+    """
+    capacity = len(self._rowSegment)
+    newCapacity = max(2 * capacity, INITIAL_SYNAPSE_CAPACITY)
+
+    rowSegment = numpy.zeros(newCapacity, dtype=numpy.int32)
+    rowSegment[:capacity] = self._rowSegment
+    self._rowSegment = rowSegment
+
+    rowPermanence = numpy.zeros(newCapacity, dtype=numpy.float64)
+    rowPermanence[:capacity] = self._rowPermanence
+    self._rowPermanence = rowPermanence
+
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+
+    # Instances pickled before the presynaptic index existed need it rebuilt.
+    if not hasattr(self, "_rowsForPresynapticCell"):
+      self._rebuildPresynapticIndex()
+
+    if not hasattr(self, "_segmentPositionIndex"):
+      self._segmentPositionIndex = SegmentPositionIndex()
+      for cellData in self._cells:
+        for segment in cellData._segments:
+          self._segmentPositionIndex.add(segment.flatIdx, segment.cell,
+                                         segment._ordinal)
+
 
   def segmentsForCell(self, cell):
     """ 
@@ -267,6 +461,7 @@ class Connections(Serializable):
     segment = Segment(cell, flatIdx, ordinal)
     cellData._segments.append(segment)
     self._segmentForFlatIdx[flatIdx] = segment
+    self._segmentPositionIndex.add(flatIdx, cell, ordinal)
 
     return segment
 
@@ -310,6 +505,7 @@ class Connections(Serializable):
     segment._synapses.add(synapse)
 
     self._synapsesForPresynapticCell[presynapticCell].add(synapse)
+    self._addSynapseToPresynapticIndex(synapse)
 
     self._numSynapses += 1
 
@@ -324,6 +520,8 @@ class Connections(Serializable):
     if len(inputSynapses) == 0:
       del self._synapsesForPresynapticCell[synapse.presynapticCell]
 
+    self._removeSynapseFromPresynapticIndex(synapse)
+
 
   def destroySynapse(self, synapse):
     """
@@ -339,6 +537,79 @@ class Connections(Serializable):
     synapse.segment._synapses.remove(synapse)
 
 
+  def presynapticCellsForSegment(self, segment):
+    """
+    Returns the presynaptic cells of a segment's synapses.
+
+    :param segment: (:class:`Segment`) Segment to inspect.
+    :returns: (numpy array) Presynaptic cell indices, in no particular order.
+    """
+    return numpy.array([synapse.presynapticCell
+                        for synapse in segment._synapses], dtype=numpy.int64)
+
+
+  def adaptSegment(self, segment, activePresynapticCells, permanenceIncrement,
+                   permanenceDecrement):
+    """
+    Strengthens the segment's synapses to active cells and weakens the others,
+    as one vectorized update. Synapses whose permanence reaches zero are
+    destroyed. The segment is kept even if it loses all of its synapses.
+
+    :param segment: (:class:`Segment`) Segment to adapt.
+    :param activePresynapticCells: (numpy array) Sorted active cells.
+    :param permanenceIncrement: (float) Amount to increment active synapses
+    :param permanenceDecrement: (float) Amount to decrement inactive synapses
+    """
+    self.adaptSegments([segment], activePresynapticCells,
+                       [permanenceIncrement], [permanenceDecrement])
+
+
+  def adaptSegments(self, segments, activePresynapticCells,
+                    permanenceIncrements, permanenceDecrements):
+    """
+    Adapts several segments with one vectorized update. Each segment is
+    adapted exactly as by :meth:`adaptSegment`, with its own increment and
+    decrement.
+
+    :param segments: (list) :class:`Segment` objects to adapt.
+    :param activePresynapticCells: (numpy array) Sorted active cells.
+    :param permanenceIncrements: (list) Amount to increment the active
+           synapses of each segment
+    :param permanenceDecrements: (list) Amount to decrement the inactive
+           synapses of each segment
+    """
+    synapses = []
+    numSynapses = []
+    for segment in segments:
+      synapses.extend(segment._synapses)
+      numSynapses.append(len(segment._synapses))
+
+    if len(synapses) == 0:
+      return
+
+    presynapticCells = numpy.array([synapse.presynapticCell
+                                    for synapse in synapses],
+                                   dtype=numpy.int64)
+    rows = numpy.array([synapse._row for synapse in synapses],
+                       dtype=numpy.int32)
+    permanences = adaptPermanences(
+      presynapticCells, self._rowPermanence[rows],
+      numpy.asarray(activePresynapticCells),
+      numpy.repeat(numpy.asarray(permanenceIncrements, dtype=numpy.float64),
+                   numSynapses),
+      numpy.repeat(numpy.asarray(permanenceDecrements, dtype=numpy.float64),
+                   numSynapses))
+
+    self._rowPermanence[rows] = permanences
+    for synapse, permanence in izip(synapses, permanences.tolist()):
+      synapse.permanence = permanence
+
+    destroy = permanences < EPSILON
+    if destroy.any():
+      for i in numpy.flatnonzero(destroy).tolist():
+        self.destroySynapse(synapses[i])
+
+
   def updateSynapsePermanence(self, synapse, permanence):
     """ 
     Updates the permanence for a synapse.
@@ -348,33 +619,43 @@ class Connections(Serializable):
     """
 
     synapse.permanence = permanence
+    self._rowPermanence[synapse._row] = permanence
 
 
   def computeActivity(self, activePresynapticCells, connectedPermanence):
     """ 
     Compute each segment's number of active synapses for a given input.
-    In the returned lists, a segment's active synapse count is stored at index
+    In the returned arrays, a segment's active synapse count is stored at index
     ``segment.flatIdx``.
 
+    All synapses of the active cells are gathered from the presynaptic index
+    and counted per segment with ``numpy.bincount``.
+
     :param activePresynapticCells: (iter) Active cells.
     :param connectedPermanence: (float) Permanence threshold for a synapse to be 
            considered connected
 
-    :returns: (tuple) (``numActiveConnectedSynapsesForSegment`` [list],
-                      ``numActivePotentialSynapsesForSegment`` [list])
+    :returns: (tuple) (``numActiveConnectedSynapsesForSegment`` [numpy array],
+                      ``numActivePotentialSynapsesForSegment`` [numpy array])
     """
+    activeRows = array("i")
+    for cell in activePresynapticCells:
+      rows = self._rowsForPresynapticCell.get(cell)
+      if rows is not None:
+        activeRows.extend(rows)
 
-    numActiveConnectedSynapsesForSegment = [0] * self._nextFlatIdx
-    numActivePotentialSynapsesForSegment = [0] * self._nextFlatIdx
+    if len(activeRows) == 0 or self._nextFlatIdx == 0:
+      return (numpy.zeros(self._nextFlatIdx, dtype=numpy.int64),
+              numpy.zeros(self._nextFlatIdx, dtype=numpy.int64))
 
-    threshold = connectedPermanence - EPSILON
+    activeRows = numpy.frombuffer(activeRows, dtype=numpy.int32)
+    segments = self._rowSegment[activeRows]
+    connected = self._rowPermanence[activeRows] > connectedPermanence - EPSILON
 
-    for cell in activePresynapticCells:
-      for synapse in self._synapsesForPresynapticCell[cell]:
-        flatIdx = synapse.segment.flatIdx
-        numActivePotentialSynapsesForSegment[flatIdx] += 1
-        if synapse.permanence > threshold:
-          numActiveConnectedSynapsesForSegment[flatIdx] += 1
+    numActivePotentialSynapsesForSegment = numpy.bincount(
+      segments, minlength=self._nextFlatIdx)
+    numActiveConnectedSynapsesForSegment = numpy.bincount(
+      segments[connected], minlength=self._nextFlatIdx)
 
     return (numActiveConnectedSynapsesForSegment,
             numActivePotentialSynapsesForSegment)
@@ -422,6 +703,18 @@ class Connections(Serializable):
     return segment.cell + (segment._ordinal / float(self._nextSegmentOrdinal))
 
 
+  def sortSegmentFlatIdxs(self, flatIdxs):
+    """
+    Sorts segments by :meth:`segmentPositionSortKey` without creating the
+    Segment objects. Useful with the output of :meth:`computeActivity`.
+
+    :param flatIdxs: (numpy array) flatIdxs of existing segments
+
+    :returns: (numpy array) The sorted flatIdxs
+    """
+    return self._segmentPositionIndex.sort(flatIdxs)
+
+
   def write(self, proto):
     """ 
     Writes serialized data to proto object.
@@ -473,6 +766,8 @@ class Connections(Serializable):
 
         segments.append(segment)
         connections._segmentForFlatIdx.append(segment)
+        connections._segmentPositionIndex.add(segment.flatIdx, cellIdx,
+                                              segment._ordinal)
         connections._nextFlatIdx += 1
         connections._nextSegmentOrdinal += 1
 
@@ -486,6 +781,7 @@ class Connections(Serializable):
           connections._nextSynapseOrdinal += 1
           synapses.add(synapse)
           connections._synapsesForPresynapticCell[presynapticCell].add(synapse)
+          connections._addSynapseToPresynapticIndex(synapse)
 
           connections._numSynapses += 1
 
@@ -0,0 +1,705 @@
+# Copyright 2017 Numenta Inc.
+#
+# Copyright may exist in Contributors' modifications
+# and/or contributions to the work.
+#
+# Use of this source code is governed by the MIT
+# license that can be found in the LICENSE file or at
+# https://opensource.org/licenses/MIT.
+
+"""
+Array-backed implementation of
+:class:`~nupic.algorithms.connections.Connections`.
+
+Synapses are not stored as Python objects. Instead, every synapse is a row in a
+set of contiguous NumPy tables (presynaptic cell, owning segment, permanence
+and ordinal), and each segment / presynaptic cell keeps a compact ``int32``
+array of the synapse rows that belong to it. Destroyed rows are recycled
+through free lists. :class:`FlatSynapse` objects are lightweight views onto a
+row and are only created when a caller asks for them.
+"""
+
+from array import array
+from itertools import imap, repeat
+
+import numpy
+
+from nupic.algorithms.connections import (EPSILON, SegmentPositionIndex,
+                                         adaptPermanences)
+from nupic.serializable import Serializable
+try:
+  import capnp
+except ImportError:
+  capnp = None
+if capnp:
+  from nupic.proto.ConnectionsProto_capnp import ConnectionsProto
+
+# Initial number of rows allocated in the synapse tables. The tables double in
+# size whenever they fill up.
+INITIAL_SYNAPSE_CAPACITY = 1024
+
+# Type codes used for the per-segment and per-presynaptic-cell synapse lists.
+SYNAPSE_IDX_TYPECODE = "i"
+SYNAPSE_IDX_DTYPE = numpy.int32
+
+# Permanences are stored with the precision of Connections, so that both
+# implementations round permanence updates the same way
+PERMANENCE_DTYPE = numpy.float64
+
+
+
+class FlatSegment(object):
+  """
+  Handle identifying a unique segment of a :class:`FlatConnections`.
+
+  :param cell: (int) Index of the cell that this segment is on.
+
+  :param flatIdx: (int) The segment's flattened list index.
+
+  :param ordinal: (long) Used to sort segments. The sort order needs to be
+         consistent between implementations so that tie-breaking is consistent
+         when finding the best matching segment.
+  """
+
+  __slots__ = ["cell", "flatIdx", "_ordinal", "_connections"]
+
+  def __init__(self, connections, cell, flatIdx, ordinal):
+    self.cell = cell
+    self.flatIdx = flatIdx
+    self._ordinal = ordinal
+    self._connections = connections
+
+
+  def __eq__(self, other):
+    """ Explicitly implement this for unit testing. The flatIdx is not designed
+    to be consistent after serialize / deserialize, and the synapses might not
+    enumerate in the same order.
+    """
+    if not isinstance(other, FlatSegment):
+      return False
+
+    if self.cell != other.cell:
+      return False
+
+    #pylint: disable=W0212
+    synapseData = self._connections._synapseDataForSegment(self)
+    otherSynapseData = other._connections._synapseDataForSegment(other)
+    #pylint: enable=W0212
+
+    if len(synapseData) != len(otherSynapseData):
+      return False
+
+    for (presynapticCell, permanence), (otherPresynapticCell,
+                                        otherPermanence) in zip(
+                                          synapseData, otherSynapseData):
+      if (presynapticCell != otherPresynapticCell or
+          abs(permanence - otherPermanence) >= EPSILON):
+        return False
+
+    return True
+
+
+  def __ne__(self, other):
+    return not self.__eq__(other)
+
+
+
+class FlatSynapse(object):
+  """
+  View onto a single row of the :class:`FlatConnections` synapse tables.
+
+  The view remains valid until the synapse is destroyed. After that, the row
+  may be recycled for a new synapse.
+
+  :param connections: (:class:`FlatConnections`) owner of the synapse tables.
+
+  :param idx: (int) Row of the synapse in the synapse tables.
+
+  :param ordinal: (long) Used to sort synapses. The sort order needs to be
+         consistent between implementations so that tie-breaking is consistent
+         when finding the min permanence synapse.
+  """
+
+  __slots__ = ["_connections", "_idx", "_ordinal"]
+
+  def __init__(self, connections, idx, ordinal):
+    self._connections = connections
+    self._idx = idx
+    self._ordinal = ordinal
+
+
+  @property
+  def segment(self):
+    #pylint: disable=W0212
+    return self._connections._segmentForFlatIdx[
+      self._connections._synapseSegment.item(self._idx)]
+
+
+  @property
+  def presynapticCell(self):
+    #pylint: disable=W0212
+    return self._connections._synapsePresynapticCell.item(self._idx)
+
+
+  @property
+  def permanence(self):
+    #pylint: disable=W0212
+    return self._connections._synapsePermanence.item(self._idx)
+
+
+  def __hash__(self):
+    return hash(self._ordinal)
+
+
+  def __eq__(self, other):
+    """ Explicitly implement this for unit testing. Allow floating point
+    differences for synapse permanence.
+    """
+    return (self.segment.cell == other.segment.cell and
+            self.presynapticCell == other.presynapticCell and
+            abs(self.permanence - other.permanence) < EPSILON)
+
+
+  def __ne__(self, other):
+    return not self.__eq__(other)
+
+
+
+class FlatConnections(Serializable):
+  """
+  Class to hold data representing the connectivity of a collection of cells,
+  backed by flat NumPy arrays. This has the same interface as
+  :class:`~nupic.algorithms.connections.Connections` and can be selected by
+  setting
+  :attr:`~nupic.algorithms.temporal_memory.TemporalMemory.connectionsClass`
+  in a subclass.
+
+  :param numCells: (int) Number of cells in collection.
+  """
+
+  def __init__(self, numCells):
+
+    # Save member variables
+    self.numCells = numCells
+
+    self._segmentsForCell = [[] for _ in xrange(numCells)]
+    self._segmentForFlatIdx = []
+    self._synapsesForSegment = []
+    self._synapsesForPresynapticCell = {}
+
+    self._freeFlatIdxs = []
+    self._nextFlatIdx = 0
+    self._segmentPositionIndex = SegmentPositionIndex()
+
+    # Synapse tables, indexed by synapse row.
+    self._synapsePresynapticCell = numpy.zeros(INITIAL_SYNAPSE_CAPACITY,
+                                               dtype=numpy.int32)
+    self._synapseSegment = numpy.full(INITIAL_SYNAPSE_CAPACITY, -1,
+                                      dtype=numpy.int32)
+    self._synapsePermanence = numpy.zeros(INITIAL_SYNAPSE_CAPACITY,
+                                          dtype=PERMANENCE_DTYPE)
+    self._synapseOrdinal = numpy.zeros(INITIAL_SYNAPSE_CAPACITY,
+                                       dtype=numpy.int64)
+
+    self._numSynapses = 0
+    self._freeSynapseIdxs = array(SYNAPSE_IDX_TYPECODE)
+    self._nextSynapseIdx = 0
+
+    # Whenever creating a new Synapse or Segment, give it a unique ordinal.
+    # These can be used to sort synapses or segments by age.
+    self._nextSynapseOrdinal = long(0)
+    self._nextSegmentOrdinal = long(0)
+
+
+  def segmentsForCell(self, cell):
+    """
+    Returns the segments that belong to a cell.
+
+    :param cell: (int) Cell index
+    :returns: (list) Segment objects representing segments on the given cell.
+    """
+
+    return self._segmentsForCell[cell]
+
+
+  def synapsesForSegment(self, segment):
+    """
+    Returns the synapses on a segment.
+
+    :param segment: (:class:`FlatSegment`) Segment
+    :returns: (set) :class:`FlatSynapse` objects representing synapses on the
+              given segment.
+    """
+    return self._synapsesForIdxs(self._synapsesForSegment[segment.flatIdx])
+
+
+  def dataForSynapse(self, synapse):
+    """
+    Returns the data for a synapse.
+
+    :param synapse: (:class:`FlatSynapse`)
+    :returns: Synapse data
+    """
+    return synapse
+
+
+  def dataForSegment(self, segment):
+    """
+    Returns the data for a segment.
+
+    :param segment: (:class:`FlatSegment`)
+    :returns: segment data
+    """
+    return segment
+
+
+  def getSegment(self, cell, idx):
+    """
+    Returns a :class:`FlatSegment` object of the specified segment.
+
+    :param cell: (int) cell index
+    :param idx:  (int) segment index on a cell
+    :returns: (:class:`FlatSegment`) Segment object with index idx on the
+              specified cell
+    """
+
+    return self._segmentsForCell[cell][idx]
+
+
+  def segmentForFlatIdx(self, flatIdx):
+    """
+    Get the segment with the specified flatIdx.
+
+    :param flatIdx: (int) The segment's flattened list index.
+
+    :returns: (:class:`FlatSegment`)
+    """
+    return self._segmentForFlatIdx[flatIdx]
+
+
+  def segmentFlatListLength(self):
+    """
+    Get the needed length for a list to hold a value for every segment's
+    flatIdx.
+
+    :returns: (int) Required list length
+    """
+    return self._nextFlatIdx
+
+
+  def synapsesForPresynapticCell(self, presynapticCell):
+    """
+    Returns the synapses for the source cell that they synapse on.
+
+    :param presynapticCell: (int) Source cell index
+
+    :returns: (set) :class:`FlatSynapse` objects
+    """
+    idxs = self._synapsesForPresynapticCell.get(presynapticCell)
+    if idxs is None:
+      return set()
+
+    return self._synapsesForIdxs(idxs)
+
+
+  def _synapsesForIdxs(self, idxs):
+    """
+    Returns a set of :class:`FlatSynapse` views onto the given synapse rows.
+
+    :param idxs: (array) Synapse rows
+    """
+    ordinals = self._synapseOrdinal[
+      numpy.frombuffer(idxs, dtype=SYNAPSE_IDX_DTYPE)].tolist()
+    return set(imap(FlatSynapse, repeat(self, len(idxs)), idxs, ordinals))
+
+
+  def createSegment(self, cell):
+    """
+    Adds a new segment on a cell.
+
+    :param cell: (int) Cell index
+    :returns: (:class:`FlatSegment`) New segment
+    """
+    if len(self._freeFlatIdxs) > 0:
+      flatIdx = self._freeFlatIdxs.pop()
+    else:
+      flatIdx = self._nextFlatIdx
+      self._segmentForFlatIdx.append(None)
+      self._synapsesForSegment.append(array(SYNAPSE_IDX_TYPECODE))
+      self._nextFlatIdx += 1
+
+    ordinal = self._nextSegmentOrdinal
+    self._nextSegmentOrdinal += 1
+
+    segment = FlatSegment(self, cell, flatIdx, ordinal)
+    self._segmentsForCell[cell].append(segment)
+    self._segmentForFlatIdx[flatIdx] = segment
+    self._segmentPositionIndex.add(flatIdx, cell, ordinal)
+
+    return segment
+
+
+  def destroySegment(self, segment):
+    """
+    Destroys a segment.
+
+    :param segment: (:class:`FlatSegment`) representing the segment to be
+           destroyed.
+    """
+    flatIdx = segment.flatIdx
+
+    # Remove the synapses from all data structures outside this Segment.
+    synapseIdxs = self._synapsesForSegment[flatIdx]
+    for idx in synapseIdxs:
+      self._releaseSynapse(idx)
+    self._numSynapses -= len(synapseIdxs)
+    self._synapsesForSegment[flatIdx] = array(SYNAPSE_IDX_TYPECODE)
+
+    # Remove the segment from the cell's list.
+    segments = self._segmentsForCell[segment.cell]
+    for i, candidate in enumerate(segments):
+      if candidate is segment:
+        del segments[i]
+        break
+
+    # Free the flatIdx and remove the final reference so the segment can be
+    # garbage-collected.
+    self._freeFlatIdxs.append(flatIdx)
+    self._segmentForFlatIdx[flatIdx] = None
+
+
+  def createSynapse(self, segment, presynapticCell, permanence):
+    """
+    Creates a new synapse on a segment.
+
+    :param segment: (:class:`FlatSegment`) Segment object for synapse to be
+           synapsed to.
+    :param presynapticCell: (int) Source cell index.
+    :param permanence: (float) Initial permanence of synapse.
+    :returns: (:class:`FlatSynapse`) created synapse
+    """
+    if len(self._freeSynapseIdxs) > 0:
+      idx = self._freeSynapseIdxs.pop()
+    else:
+      if self._nextSynapseIdx == len(self._synapseSegment):
+        self._growSynapseTables()
+      idx = self._nextSynapseIdx
+      self._nextSynapseIdx += 1
+
+    ordinal = self._nextSynapseOrdinal
+    self._nextSynapseOrdinal += 1
+
+    self._synapsePresynapticCell[idx] = presynapticCell
+    self._synapseSegment[idx] = segment.flatIdx
+    self._synapsePermanence[idx] = permanence
+    self._synapseOrdinal[idx] = ordinal
+
+    self._synapsesForSegment[segment.flatIdx].append(idx)
+
+    presynapticIdxs = self._synapsesForPresynapticCell.get(presynapticCell)
+    if presynapticIdxs is None:
+      presynapticIdxs = array(SYNAPSE_IDX_TYPECODE)
+      self._synapsesForPresynapticCell[presynapticCell] = presynapticIdxs
+    presynapticIdxs.append(idx)
+
+    self._numSynapses += 1
+
+    return FlatSynapse(self, idx, ordinal)
+
+
+  def destroySynapse(self, synapse):
+    """
+    Destroys a synapse.
+
+    :param synapse: (:class:`FlatSynapse`) synapse to destroy
+    """
+    idx = synapse._idx #pylint: disable=W0212
+
+    self._numSynapses -= 1
+
+    self._synapsesForSegment[self._synapseSegment[idx]].remove(idx)
+    self._releaseSynapse(idx)
+
+
+  def presynapticCellsForSegment(self, segment):
+    """
+    Returns the presynaptic cells of a segment's synapses.
+
+    :param segment: (:class:`FlatSegment`) Segment to inspect.
+    :returns: (numpy array) Presynaptic cell indices, ordered by synapse age.
+    """
+    idxs = numpy.frombuffer(self._synapsesForSegment[segment.flatIdx],
+                            dtype=SYNAPSE_IDX_DTYPE)
+    return self._synapsePresynapticCell[idxs].astype(numpy.int64)
+
+
+  def adaptSegment(self, segment, activePresynapticCells, permanenceIncrement,
+                   permanenceDecrement):
+    """
+    Strengthens the segment's synapses to active cells and weakens the others,
+    as one vectorized update. Synapses whose permanence reaches zero are
+    destroyed. The segment is kept even if it loses all of its synapses.
+
+    :param segment: (:class:`FlatSegment`) Segment to adapt.
+    :param activePresynapticCells: (numpy array) Sorted active cells.
+    :param permanenceIncrement: (float) Amount to increment active synapses
+    :param permanenceDecrement: (float) Amount to decrement inactive synapses
+    """
+    flatIdx = segment.flatIdx
+
+    # Copy the rows, since the segment's synapse list may be replaced below.
+    idxs = numpy.frombuffer(self._synapsesForSegment[flatIdx],
+                            dtype=SYNAPSE_IDX_DTYPE).copy()
+    if len(idxs) == 0:
+      return
+
+    permanences = adaptPermanences(
+      self._synapsePresynapticCell[idxs], self._synapsePermanence[idxs],
+      numpy.asarray(activePresynapticCells), permanenceIncrement,
+      permanenceDecrement)
+
+    self._synapsePermanence[idxs] = permanences
+
+    destroy = permanences < EPSILON
+    if destroy.any():
+      self._synapsesForSegment[flatIdx] = array(SYNAPSE_IDX_TYPECODE,
+                                                idxs[~destroy].tostring())
+      destroyIdxs = idxs[destroy].tolist()
+      for idx in destroyIdxs:
+        self._releaseSynapse(idx)
+      self._numSynapses -= len(destroyIdxs)
+
+
+  def _releaseSynapse(self, idx):
+    """
+    Removes a synapse row from the presynaptic index and recycles it. The
+    caller is responsible for the segment's synapse list and synapse count.
+    """
+    presynapticCell = self._synapsePresynapticCell.item(idx)
+    presynapticIdxs = self._synapsesForPresynapticCell[presynapticCell]
+    presynapticIdxs.remove(idx)
+    if len(presynapticIdxs) == 0:
+      del self._synapsesForPresynapticCell[presynapticCell]
+
+    self._synapseSegment[idx] = -1
+    self._freeSynapseIdxs.append(idx)
+
+
+  def _growSynapseTables(self):
+    """
+    Doubles the capacity of the synapse tables.
+    """
+    capacity = len(self._synapseSegment)
+    newCapacity = max(2 * capacity, INITIAL_SYNAPSE_CAPACITY)
+
+    def grow(table, fill):
+      grown = numpy.full(newCapacity, fill, dtype=table.dtype)
+      grown[:capacity] = table
+      return grown
+
+    self._synapsePresynapticCell = grow(self._synapsePresynapticCell, 0)
+    self._synapseSegment = grow(self._synapseSegment, -1)
+    self._synapsePermanence = grow(self._synapsePermanence, 0)
+    self._synapseOrdinal = grow(self._synapseOrdinal, 0)
+
+
+  def updateSynapsePermanence(self, synapse, permanence):
+    """
+    Updates the permanence for a synapse.
+
+    :param synapse: (:class:`FlatSynapse`) to be updated.
+    :param permanence: (float) New permanence.
+    """
+
+    self._synapsePermanence[synapse._idx] = permanence #pylint: disable=W0212
+
+
+  def computeActivity(self, activePresynapticCells, connectedPermanence):
+    """
+    Compute each segment's number of active synapses for a given input.
+    In the returned arrays, a segment's active synapse count is stored at index
+    ``segment.flatIdx``.
+
+    :param activePresynapticCells: (iter) Active cells.
+    :param connectedPermanence: (float) Permanence threshold for a synapse to be
+           considered connected
+
+    :returns: (tuple) (``numActiveConnectedSynapsesForSegment`` [numpy array],
+                      ``numActivePotentialSynapsesForSegment`` [numpy array])
+    """
+    activeSynapses = array(SYNAPSE_IDX_TYPECODE)
+    for cell in activePresynapticCells:
+      presynapticIdxs = self._synapsesForPresynapticCell.get(cell)
+      if presynapticIdxs is not None:
+        activeSynapses.extend(presynapticIdxs)
+
+    if len(activeSynapses) == 0 or self._nextFlatIdx == 0:
+      return (numpy.zeros(self._nextFlatIdx, dtype=numpy.int64),
+              numpy.zeros(self._nextFlatIdx, dtype=numpy.int64))
+
+    activeSynapses = numpy.frombuffer(activeSynapses, dtype=SYNAPSE_IDX_DTYPE)
+    segments = self._synapseSegment[activeSynapses]
+    connected = (self._synapsePermanence[activeSynapses] >
+                 connectedPermanence - EPSILON)
+
+    numActivePotentialSynapsesForSegment = numpy.bincount(
+      segments, minlength=self._nextFlatIdx)
+    numActiveConnectedSynapsesForSegment = numpy.bincount(
+      segments[connected], minlength=self._nextFlatIdx)
+
+    return (numActiveConnectedSynapsesForSegment,
+            numActivePotentialSynapsesForSegment)
+
+
+  def numSegments(self, cell=None):
+    """
+    Returns the number of segments.
+
+    :param cell: (int) Optional parameter to get the number of segments on a
+           cell.
+    :returns: (int) Number of segments on all cells if cell is not specified, or
+              on a specific specified cell
+    """
+    if cell is not None:
+      return len(self._segmentsForCell[cell])
+
+    return self._nextFlatIdx - len(self._freeFlatIdxs)
+
+
+  def numSynapses(self, segment=None):
+    """
+    Returns the number of Synapses.
+
+    :param segment: (:class:`FlatSegment`) Optional parameter to get the number
+           of synapses on a segment.
+
+    :returns: (int) Number of synapses on all segments if segment is not
+              specified, or on a specified segment.
+    """
+    if segment is not None:
+      return len(self._synapsesForSegment[segment.flatIdx])
+    return self._numSynapses
+
+
+  def segmentPositionSortKey(self, segment):
+    """
+    Return a numeric key for sorting this segment. This can be used with the
+    python built-in ``sorted()`` function.
+
+    :param segment: (:class:`FlatSegment`) within this :class:`FlatConnections`
+           instance.
+    :returns: (float) A numeric key for sorting.
+    """
+    return segment.cell + (segment._ordinal / float(self._nextSegmentOrdinal))
+
+
+  def sortSegmentFlatIdxs(self, flatIdxs):
+    """
+    Sorts segments by :meth:`segmentPositionSortKey` without creating the
+    Segment objects. Useful with the output of :meth:`computeActivity`.
+
+    :param flatIdxs: (numpy array) flatIdxs of existing segments
+
+    :returns: (numpy array) The sorted flatIdxs
+    """
+    return self._segmentPositionIndex.sort(flatIdxs)
+
+
+  def _synapseDataForSegment(self, segment):
+    """
+    Returns the (presynapticCell, permanence) pairs of a segment's synapses,
+    ordered by synapse age.
+    """
+    # Synapses are appended in ordinal order and removals preserve the order,
+    # so each segment's synapse list is already sorted by age.
+    idxs = numpy.frombuffer(self._synapsesForSegment[segment.flatIdx],
+                            dtype=SYNAPSE_IDX_DTYPE)
+    return [(int(presynapticCell), float(permanence))
+            for presynapticCell, permanence
+            in zip(self._synapsePresynapticCell[idxs],
+                   self._synapsePermanence[idxs])]
+
+
+  def write(self, proto):
+    """
+    Writes serialized data to proto object.
+
+    :param proto: (DynamicStructBuilder) Proto object
+    """
+    protoCells = proto.init('cells', self.numCells)
+
+    for i in xrange(self.numCells):
+      segments = self._segmentsForCell[i]
+      protoSegments = protoCells[i].init('segments', len(segments))
+
+      for j, segment in enumerate(segments):
+        synapseData = self._synapseDataForSegment(segment)
+        protoSynapses = protoSegments[j].init('synapses', len(synapseData))
+
+        for k, (presynapticCell, permanence) in enumerate(synapseData):
+          protoSynapses[k].presynapticCell = presynapticCell
+          protoSynapses[k].permanence = permanence
+
+
+  @classmethod
+  def getSchema(cls):
+    return ConnectionsProto
+
+
+  @classmethod
+  def read(cls, proto):
+    """
+    Reads deserialized data from proto object
+
+    :param proto: (DynamicStructBuilder) Proto object
+
+    :returns: (:class:`FlatConnections`) instance
+    """
+    protoCells = proto.cells
+    connections = cls(len(protoCells))
+
+    for cellIdx, protoCell in enumerate(protoCells):
+      for protoSegment in protoCell.segments:
+        segment = connections.createSegment(cellIdx)
+
+        for protoSynapse in protoSegment.synapses:
+          connections.createSynapse(segment, protoSynapse.presynapticCell,
+                                    protoSynapse.permanence)
+
+    return connections
+
+
+  def __eq__(self, other):
+    """ Equality operator for FlatConnections instances.
+    Checks if two instances are functionally identical
+
+    :param other: (:class:`FlatConnections`) instance to compare to
+    """
+    if self.numCells != other.numCells:
+      return False
+
+    if self._numSynapses != other._numSynapses:
+      return False
+
+    for i in xrange(self.numCells):
+      segments = self._segmentsForCell[i]
+      otherSegments = other._segmentsForCell[i]
+
+      if len(segments) != len(otherSegments):
+        return False
+
+      for segment, otherSegment in zip(segments, otherSegments):
+        if segment != otherSegment:
+          return False
+
+    return True
+
+
+  def __ne__(self, other):
+    """
+    Non-equality operator for FlatConnections instances.
+    Checks if two instances are not functionally identical
+
+    :param other: (:class:`FlatConnections`) instance to compare to
+    """
+    return not self.__eq__(other)
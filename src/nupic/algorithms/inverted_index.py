@@ -0,0 +1,175 @@
+# Copyright 2017 Numenta Inc.
+#
+# Copyright may exist in Contributors' modifications
+# and/or contributions to the work.
+#
+# Use of this source code is governed by the MIT
+# license that can be found in the LICENSE file or at
+# https://opensource.org/licenses/MIT.
+
+"""
+Inverted index from input bits to the stored prototypes that contain them.
+
+Used by :class:`~nupic.algorithms.knn_classifier.KNNClassifier` to compute the
+overlap of an input with every prototype by visiting only the prototypes that
+share at least one active bit with the input, instead of scanning the whole
+prototype matrix.
+
+Each prototype is assigned a permanent slot when it is added. The posting list
+of a bit holds the slots of the prototypes in which the bit is on, and a
+separate table maps the prototypes, in row order, to their slots. Removing
+prototypes therefore only updates that table; the posting lists keep the
+removed slots until they make up half of all slots, at which point the index
+is compacted. Added prototypes are buffered and merged into the posting lists
+in one pass when the index is next queried, which keeps training cheap.
+"""
+
+from array import array
+from itertools import chain
+
+import numpy
+
+
+# Type code of the slot lists. "l" matches numpy.intp, so the lists can be
+# viewed as NumPy arrays without a copy and passed straight to bincount.
+SLOT_TYPECODE = "l"
+SLOT_DTYPE = numpy.dtype(SLOT_TYPECODE)
+
+
+
+class InvertedIndex(object):
+  """
+  Maps each input bit to the prototypes in which it is on.
+
+  Prototypes are identified by their row, i.e. their position among the
+  prototypes that were added and not removed, in the order they were added.
+  """
+
+  def __init__(self):
+    self.clear()
+
+
+  def clear(self):
+    """Removes all prototypes from the index."""
+    self._postings = {}
+    self._pending = []
+    self._slots = array(SLOT_TYPECODE)
+    self._numSlots = 0
+
+
+  def __len__(self):
+    return len(self._slots)
+
+
+  def add(self, activeBits):
+    """
+    Appends a prototype as the last row of the index.
+
+    :param activeBits: (iterable) Indices of the prototype's non-zero bits.
+    """
+    self._slots.append(self._numSlots)
+    self._numSlots += 1
+    self._pending.append(activeBits)
+
+
+  def remove(self, rows):
+    """
+    Removes prototypes from the index. The rows of the remaining prototypes
+    shift down to stay contiguous, matching
+    :meth:`~nupic.bindings.math.NearestNeighbor.deleteRow`.
+
+    :param rows: (iterable) Rows of the prototypes to remove.
+    """
+    self._flush()
+    slots = numpy.delete(self._viewSlots(), list(rows))
+    self._slots = array(SLOT_TYPECODE, slots.tostring())
+
+    if 2 * len(self._slots) < self._numSlots:
+      self._compact()
+
+
+  def overlaps(self, activeBits, weights=None):
+    """
+    Computes the overlap of an input with every prototype, i.e. the sum of the
+    input's values at each prototype's non-zero bits.
+
+    :param activeBits: (numpy array) Indices of the input's non-zero bits.
+
+    :param weights: (numpy array) Input values at ``activeBits``, or None if
+        they are all 1.
+
+    :returns: (numpy array) Overlap of each prototype, in row order.
+    """
+    self._flush()
+    hits = [(i, self._postings[bit])
+            for i, bit in enumerate(activeBits.tolist())
+            if bit in self._postings]
+
+    if not hits:
+      return numpy.zeros(len(self._slots))
+
+    slots = array(SLOT_TYPECODE)
+    for _, postings in hits:
+      slots.extend(postings)
+    slots = numpy.frombuffer(slots, dtype=SLOT_DTYPE)
+    if weights is not None:
+      weights = numpy.repeat(weights[[i for i, _ in hits]],
+                             [len(postings) for _, postings in hits])
+
+    slotOverlaps = numpy.bincount(slots, weights, minlength=self._numSlots)
+    if self._numSlots == len(self._slots):
+      # Nothing was removed since the last compaction, so slots equal rows.
+      return slotOverlaps
+    return slotOverlaps[self._viewSlots()]
+
+
+  def _viewSlots(self):
+    return numpy.frombuffer(self._slots, dtype=SLOT_DTYPE)
+
+
+  def _flush(self):
+    """Appends the slots of the pending prototypes to the posting lists."""
+    if not self._pending:
+      return
+
+    lengths = [len(activeBits) for activeBits in self._pending]
+    bits = numpy.fromiter(chain.from_iterable(self._pending), dtype=SLOT_DTYPE,
+                          count=sum(lengths))
+    firstSlot = self._numSlots - len(self._pending)
+    slots = numpy.repeat(numpy.arange(firstSlot, self._numSlots,
+                                      dtype=SLOT_DTYPE),
+                         lengths)
+    self._pending = []
+
+    # Group the slots by bit, keeping each group in slot order.
+    order = numpy.argsort(bits * self._numSlots + slots)
+    bits = bits[order]
+    slots = slots[order]
+    starts = numpy.flatnonzero(numpy.diff(bits)) + 1
+
+    for bit, bitSlots in zip(bits[numpy.r_[0, starts]].tolist(),
+                             numpy.split(slots, starts)):
+      if bit in self._postings:
+        self._postings[bit].fromstring(bitSlots.tostring())
+      else:
+        self._postings[bit] = array(SLOT_TYPECODE, bitSlots.tostring())
+
+
+  def _compact(self):
+    """
+    Drops the slots of removed prototypes from the posting lists and numbers
+    the remaining slots ``0 .. len(self) - 1`` in row order.
+    """
+    newSlots = numpy.full(self._numSlots, -1, dtype=SLOT_DTYPE)
+    newSlots[self._viewSlots()] = numpy.arange(len(self._slots))
+
+    postings = {}
+    for bit, bitPostings in self._postings.iteritems():
+      slots = newSlots[numpy.frombuffer(bitPostings, dtype=SLOT_DTYPE)]
+      slots = slots[slots >= 0]
+      if len(slots):
+        postings[bit] = array(SLOT_TYPECODE, slots.tostring())
+
+    self._postings = postings
+    self._slots = array(SLOT_TYPECODE, xrange(len(self._slots)))
+    self._numSlots = len(self._slots)
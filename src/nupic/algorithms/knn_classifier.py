@@ -11,6 +11,7 @@
 
 import numpy
 
+from nupic.algorithms.inverted_index import InvertedIndex
 from nupic.bindings.math import (NearestNeighbor, min_score_per_category)
 
 from nupic.serializable import Serializable
@@ -61,6 +62,23 @@ def _labeledInput(activeInputs, cellsPerCol=32):
 
 
 
+def _nSmallest(values, n):
+  """Returns the indices of the n smallest values, in increasing order of
+  value and, among equal values, in increasing order of index. Only the values
+  up to the nth smallest are sorted.
+  """
+  if n <= 0:
+    return numpy.zeros(0, dtype=int)
+  if n < len(values):
+    nth = numpy.partition(values, n - 1)[n - 1]
+    indices = numpy.flatnonzero(values <= nth)
+  else:
+    indices = numpy.arange(len(values))
+  order = numpy.argsort(values[indices], kind="mergesort")
+  return indices[order[:n]]
+
+
+
 class KNNClassifier(Serializable):
   """
   This class implements NuPIC's k Nearest Neighbor Classifier. KNN is very
@@ -159,6 +177,15 @@ class KNNClassifier(Serializable):
       implies all vectors will be stored. A value of 0.1 implies only vectors
       with at least 10% sparsity will be stored
 
+  :param useInvertedIndex: (bool) If True, the classifier keeps an
+      :class:`~nupic.algorithms.inverted_index.InvertedIndex` from input bits
+      to the prototypes containing them, so that overlap distances are
+      computed only for prototypes sharing at least one bit with the input,
+      and inference selects the k nearest prototypes without sorting all of
+      them. Distances are the same as without the index; nearest neighbors at
+      equal distance are taken in the order they were learned. Requires
+      useSparseMemory, an overlap distanceMethod and no SVD.
+
   """
 
   def __init__(self, k=1,
@@ -179,7 +206,8 @@ class KNNClassifier(Serializable):
                      maxStoredPatterns=-1,
                      replaceDuplicates=False,
                      cellsPerCol=0,
-                     minSparsity=0.0):
+                     minSparsity=0.0,
+                     useInvertedIndex=False):
 
     self.version = KNNCLASSIFIER_VERSION
 
@@ -208,6 +236,14 @@ class KNNClassifier(Serializable):
     self.cellsPerCol = cellsPerCol
     self.maxStoredPatterns = maxStoredPatterns
     self.minSparsity = minSparsity
+    if useInvertedIndex:
+      assert self.useSparseMemory, ("The inverted index is implemented only "
+                                    "in the sparse memory mode")
+      assert self.distanceMethod != "norm", ("The inverted index only "
+                                             "supports overlap distances")
+      assert self.numSVDDims is None, ("The inverted index does not support "
+                                       "SVD")
+    self.useInvertedIndex = useInvertedIndex
     self.clear()
 
 
@@ -234,6 +270,12 @@ class KNNClassifier(Serializable):
     # Cached value of the store prototype sizes
     self._protoSizes = None
 
+    # Index of the stored prototypes by their non-zero bits
+    if self.useInvertedIndex:
+      self._invertedIndex = InvertedIndex()
+    else:
+      self._invertedIndex = None
+
     # Used by PCA
     self._s = None
     self._vt = None
@@ -255,12 +297,14 @@ class KNNClassifier(Serializable):
 
   def _sparsifyVector(self, inputPattern, doWinners=False):
 
-    # Do sparsification, using a relative or absolute threshold
+    # Do sparsification, using a relative or absolute threshold. Without
+    # doWinners, each row of a 2D array is sparsified like a single vector.
     if not self.relativeThreshold:
       inputPattern = inputPattern*(abs(inputPattern) > self.sparseThreshold)
     elif self.sparseThreshold > 0:
       inputPattern = inputPattern * \
-        (abs(inputPattern) > (self.sparseThreshold * abs(inputPattern).max()))
+        (abs(inputPattern) > (self.sparseThreshold *
+                              abs(inputPattern).max(axis=-1, keepdims=True)))
 
     # Do winner-take-all
     if doWinners:
@@ -359,10 +403,13 @@ class KNNClassifier(Serializable):
 
 
     # Remove actual patterns
+    self._protoSizes = None
     if self.useSparseMemory:
       # Delete backwards
       for rowIndex in rowsToRemove[::-1]:
         self._Memory.deleteRow(rowIndex)
+      if self._invertedIndex is not None:
+        self._invertedIndex.remove(rowsToRemove)
     else:
       self._M = numpy.delete(self._M, removalArray, 0)
 
@@ -590,6 +637,9 @@ class KNNClassifier(Serializable):
           self._Memory.addRow(thresholdedInput)
         else:
           self._Memory.addRowNZ(inputPattern, [1]*len(inputPattern))
+        if self._invertedIndex is not None:
+          self._invertedIndex.add(
+            self._Memory.rowNonZeros(self._Memory.nRows() - 1)[0])
         self._numPatterns += 1
         self._categoryList.append(int(inputCategory))
         self._addPartitionId(self._numPatterns-1, partitionId)
@@ -599,6 +649,8 @@ class KNNClassifier(Serializable):
             self.maxStoredPatterns > 0:
             leastRecentlyUsedPattern = numpy.argmin(self._categoryRecencyList)
             self._Memory.deleteRow(leastRecentlyUsedPattern)
+            if self._invertedIndex is not None:
+              self._invertedIndex.remove([leastRecentlyUsedPattern])
             self._categoryList.pop(leastRecentlyUsedPattern)
             self._categoryRecencyList.pop(leastRecentlyUsedPattern)
             self._numPatterns -= 1
@@ -714,6 +766,9 @@ class KNNClassifier(Serializable):
         if len(exactMatches) > 0:
           for i in exactMatches[:min(self.k, validVectorCount)]:
             inferenceResult[self._categoryList[i]] += 1.0
+      elif self.useInvertedIndex:
+        for j in _nSmallest(dist, min(self.k, validVectorCount)):
+          inferenceResult[self._categoryList[j]] += 1.0
       else:
         sorted = dist.argsort()
         for j in sorted[:min(self.k, validVectorCount)]:
@@ -742,6 +797,199 @@ class KNNClassifier(Serializable):
     return result
 
 
+  def inferBatch(self, patternMatrix, partitionIds=None):
+    """Classifies many patterns at once. The results are the same as calling
+    :meth:`infer` on each pattern, but the distances to all prototypes are
+    computed with one sparse matrix product and the partition masks,
+    per-category distances and nearest neighbors are found for all patterns
+    together. With SVD, the patterns are projected with one matrix product,
+    so distances only match up to rounding. The "norm" distance method still
+    computes the distances of each pattern on its own.
+
+    :param patternMatrix: (2D numpy array) Dense patterns to classify, one per
+        row.
+
+    :param partitionIds: (list) Partition id of each pattern, or None for all
+        of them. Training vectors with the same partition id as a pattern are
+        ignored when classifying it, see :meth:`infer`. Individual ids may
+        also be None.
+
+    :returns: 4-tuple of numpy arrays with one row per pattern:
+
+      - ``winners``: The winning category of each pattern, or -1 where
+          :meth:`infer` returns None.
+      - ``inferenceResult``: Fraction of the k nearest neighbors in each
+          category.
+      - ``dist``: Distance from each pattern to each prototype.
+      - ``categoryDist``: Distance from each pattern to the nearest prototype
+          of each category.
+
+      Patterns that do not meet minSparsity get no neighbors and distances of
+      1.0.
+    """
+    patternMatrix = numpy.asarray(patternMatrix)
+    numPatterns = len(patternMatrix)
+    if partitionIds is not None and len(partitionIds) != numPatterns:
+      raise ValueError("Expected one partition id per pattern, got %d for %d "
+                       "patterns" % (len(partitionIds), numPatterns))
+
+    if len(self._categoryList) == 0 or numPatterns == 0:
+      return (numpy.full(numPatterns, -1, dtype=int),
+              numpy.zeros((numPatterns, 1)),
+              numpy.ones((numPatterns, 1)),
+              numpy.ones((numPatterns, 1)))
+
+    categories = numpy.array(self._categoryList)
+    maxCategoryIdx = categories.max()
+    validVectorCount = len(categories) - numpy.count_nonzero(categories == -1)
+    numNeighbors = min(self.k, validVectorCount)
+
+    dist = self._getDistanceMatrix(patternMatrix, partitionIds)
+
+    if self.exact:
+      isNeighbor = dist < 0.00001
+      isNeighbor &= numpy.cumsum(isNeighbor, axis=1) <= numNeighbors
+    else:
+      isNeighbor = self._kNearestMask(dist, numNeighbors)
+    # As in infer, neighbors in category -1 count for the last category.
+    numCategories = maxCategoryIdx + 1
+    neighborRows, neighbors = isNeighbor.nonzero()
+    inferenceResult = numpy.bincount(
+      neighborRows * numCategories + categories[neighbors] % numCategories,
+      minlength=numPatterns * numCategories).reshape(
+        numPatterns, numCategories).astype(float)
+
+    categoryDist = self._minDistancePerCategory(dist, categories)
+
+    if self.minSparsity > 0.0:
+      sparsity = ((patternMatrix != 0).sum(axis=1) /
+                  float(patternMatrix.shape[1]))
+      sparse = sparsity < self.minSparsity
+      inferenceResult[sparse] = 0.0
+      dist[sparse] = 1.0
+      categoryDist[sparse] = 1.0
+
+    hasNeighbors = inferenceResult.any(axis=1)
+    winners = numpy.where(hasNeighbors, inferenceResult.argmax(axis=1), -1)
+    inferenceResult[hasNeighbors] /= inferenceResult[hasNeighbors].sum(
+      axis=1)[:, numpy.newaxis]
+
+    return winners, inferenceResult, dist, categoryDist
+
+
+  def getNearestPrototypes(self, patterns, eligible, isSparse=0):
+    """Finds the nearest prototype of each pattern among the prototypes it may
+    be matched with. Distances are those :meth:`infer` computes, and ties go
+    to the prototype stored first. As in :meth:`inferBatch`, the distances to
+    all prototypes are computed for all patterns together.
+
+    :param patterns: If isSparse is 0, a 2D numpy array of dense patterns, one
+        per row. Otherwise, a list of binary patterns, each given by the
+        sorted indices of its non-zero bits.
+
+    :param eligible: (2D numpy array) True where the prototype (column) may be
+        matched with the pattern (row).
+
+    :param isSparse: (int) 0 if the patterns are dense, otherwise the total
+        number of bits of each pattern, see :meth:`learn`.
+
+    :returns: 2-tuple of numpy arrays with one entry per pattern:
+
+      - ``rows``: Row of the nearest eligible prototype, or -1 if no prototype
+          is eligible.
+      - ``distances``: Distance to that prototype, or inf.
+    """
+    numPatterns = len(patterns)
+    rows = numpy.full(numPatterns, -1, dtype=int)
+    distances = numpy.full(numPatterns, numpy.inf)
+    if len(self._categoryList) == 0 or numPatterns == 0:
+      return rows, distances
+
+    if isSparse > 0:
+      dist = self._getSparseDistanceMatrix(patterns, isSparse)
+      sparsity = (numpy.array([len(bits) for bits in patterns]) /
+                  float(isSparse))
+    else:
+      patterns = numpy.asarray(patterns)
+      dist = self._getDistanceMatrix(patterns)
+      sparsity = (patterns != 0).sum(axis=1) / float(patterns.shape[1])
+    if self.minSparsity > 0.0:
+      dist[sparsity < self.minSparsity] = 1.0
+
+    dist = numpy.where(eligible, dist, numpy.inf)
+    nearest = dist.argmin(axis=1)
+    found = numpy.flatnonzero(eligible[numpy.arange(numPatterns), nearest])
+    rows[found] = nearest[found]
+    distances[found] = dist[found, nearest[found]]
+    return rows, distances
+
+
+  def _kNearestMask(self, dist, n):
+    """Marks the n nearest prototypes of each row of dist. These are the
+    prototypes infer takes its nearest neighbors from.
+
+    :param dist: (2D numpy array) Distances, one row per pattern.
+
+    :param n: (int) Number of neighbors.
+
+    :returns: (2D numpy array) True for the nearest prototypes of each row.
+    """
+    if n <= 0:
+      return numpy.zeros(dist.shape, dtype=bool)
+    if n >= dist.shape[1]:
+      return numpy.ones(dist.shape, dtype=bool)
+
+    nthDist = numpy.partition(dist, n - 1, axis=1)[:, n - 1:n]
+    isNeighbor = dist < nthDist
+    isTied = dist == nthDist
+    numTiedNeighbors = n - isNeighbor.sum(axis=1)
+
+    if self.useInvertedIndex:
+      # Like _nSmallest, take the prototypes tied with the nth nearest one in
+      # index order. nonzero lists them row by row, in index order.
+      tiedRows, tiedCols = isTied.nonzero()
+      rank = (numpy.arange(len(tiedRows)) -
+              numpy.searchsorted(tiedRows, tiedRows))
+      taken = rank < numTiedNeighbors[tiedRows]
+      isNeighbor[tiedRows[taken], tiedCols[taken]] = True
+    else:
+      # Ties are broken by the order of argsort, so rows with more tied
+      # prototypes than needed are sorted like infer sorts them
+      isNeighbor |= isTied
+      for i in numpy.flatnonzero(isTied.sum(axis=1) > numTiedNeighbors):
+        isNeighbor[i] = False
+        isNeighbor[i, dist[i].argsort()[:n]] = True
+
+    return isNeighbor
+
+
+  @staticmethod
+  def _minDistancePerCategory(dist, categories):
+    """Computes what min_score_per_category computes for each row of dist.
+
+    :param dist: (2D numpy array) Distances, one row per pattern.
+
+    :param categories: (numpy array) Category of each prototype.
+
+    :returns: (2D numpy array) Distance to the nearest prototype of each
+        category, clipped to [0, 1].
+    """
+    order = numpy.argsort(categories, kind="mergesort")
+    sortedCategories = categories[order]
+    starts = numpy.flatnonzero(numpy.diff(sortedCategories)) + 1
+    starts = numpy.r_[0, starts]
+    minDist = numpy.minimum.reduceat(dist[:, order], starts, axis=1)
+
+    present = sortedCategories[starts]
+    valid = present >= 0
+    categoryDist = numpy.empty((len(dist), categories.max() + 1),
+                               dtype=numpy.float32)
+    categoryDist.fill(numpy.finfo(numpy.float32).max)
+    categoryDist[:, present[valid]] = minDist[:, valid]
+    categoryDist.clip(0, 1.0, categoryDist)
+    return categoryDist
+
+
   def getClosest(self, inputPattern, topKCategories=3):
     """Returns the index of the pattern that is closest to inputPattern,
     the distances of all patterns to inputPattern, and the indices of the k
@@ -944,7 +1192,10 @@ class KNNClassifier(Serializable):
     if self.useSparseMemory:
       if self._protoSizes is None:
         self._protoSizes = self._Memory.rowSums()
-      overlapsWithProtos = self._Memory.rightVecSumAtNZ(inputPattern)
+      if self._invertedIndex is not None:
+        overlapsWithProtos = self._indexedOverlaps(inputPattern)
+      else:
+        overlapsWithProtos = self._Memory.rightVecSumAtNZ(inputPattern)
       inputPatternSum = inputPattern.sum()
 
       if self.distanceMethod == "rawOverlap":
@@ -983,6 +1234,32 @@ class KNNClassifier(Serializable):
     return dist
 
 
+  def _rebuildInvertedIndex(self):
+    """Rebuilds the inverted index from the stored prototypes."""
+    if not self.useInvertedIndex:
+      self._invertedIndex = None
+      return
+
+    self._invertedIndex = InvertedIndex()
+    if self._Memory is not None:
+      for row in xrange(self._Memory.nRows()):
+        self._invertedIndex.add(self._Memory.rowNonZeros(row)[0])
+
+
+  def _indexedOverlaps(self, inputPattern):
+    """Computes the same overlaps as ``rightVecSumAtNZ`` using the inverted
+    index.
+
+    :param inputPattern The dense pattern to compute the overlaps of
+    """
+    activeBits = inputPattern.nonzero()[0]
+    weights = inputPattern[activeBits]
+    if (weights == 1).all():
+      weights = None
+    overlaps = self._invertedIndex.overlaps(activeBits, weights)
+    return overlaps.astype(numpy.float32)
+
+
   def _getDistances(self, inputPattern, partitionId=None):
     """Return the distances from inputPattern to all stored patterns.
 
@@ -1014,6 +1291,158 @@ class KNNClassifier(Serializable):
     return dist
 
 
+  def _getSparseDistanceMatrix(self, patterns, numBits):
+    """Return the distances from binary patterns, given by their non-zero
+    bits, to all stored patterns, as _getDistanceMatrix does for the dense
+    patterns. Overlap distances of patterns that sparsification leaves
+    unchanged are computed from the non-zero bits; other patterns are made
+    dense.
+
+    :param patterns The non-zero bits of each pattern
+
+    :param numBits The total number of bits of each pattern
+    """
+    if not self._finishedLearning:
+      self.finishLearning()
+      self._finishedLearning = True
+
+    if (not self.useSparseMemory or self.distanceMethod == "norm" or
+        (self._vt is not None and len(self._vt) > 0) or
+        self._sparsifyVector(numpy.ones(1))[0] != 1 or
+        self._sparsifyVector(numpy.zeros(1)).any()):
+      patternMatrix = numpy.zeros((len(patterns), numBits))
+      for i, bits in enumerate(patterns):
+        patternMatrix[i, bits] = 1
+      return self._getDistanceMatrix(patternMatrix)
+
+    if self._protoSizes is None:
+      self._protoSizes = self._Memory.rowSums()
+    if self._invertedIndex is not None:
+      overlapsWithProtos = numpy.array(
+        [self._invertedIndex.overlaps(numpy.asarray(bits, dtype=int))
+         for bits in patterns], dtype=numpy.float32)
+    else:
+      patternMatrix = numpy.zeros((len(patterns), numBits),
+                                  dtype=numpy.float32)
+      for i, bits in enumerate(patterns):
+        patternMatrix[i, bits] = 1
+      overlapsWithProtos = self._Memory.rightDenseMatSumAtNZ(patternMatrix)
+
+    dist = self._overlapDistanceMatrix(
+      overlapsWithProtos,
+      numpy.array([len(bits) for bits in patterns], dtype=float),
+      self._protoSizes)
+    # Invalidate results where category is -1
+    if self._specificIndexTraining:
+      dist[:, numpy.array(self._categoryList) == -1] = numpy.inf
+
+    return dist
+
+
+  def _calcDistanceMatrix(self, patternMatrix):
+    """Calculate the distances from each row of patternMatrix to all stored
+    patterns, as _calcDistance does for a single pattern.
+
+    :param patternMatrix The patterns from which distances to all other
+        patterns are calculated, one per row
+    """
+    if not self.useSparseMemory or self.distanceMethod == "norm":
+      return numpy.array([self._calcDistance(inputPattern)
+                          for inputPattern in patternMatrix])
+
+    if self._protoSizes is None:
+      self._protoSizes = self._Memory.rowSums()
+    if self._invertedIndex is not None:
+      # Each pattern's overlaps are already a single bincount over its
+      # postings. One bincount over the postings of all patterns was measured
+      # twice as slow, as its temporaries don't fit in the CPU cache.
+      overlapsWithProtos = numpy.array([self._indexedOverlaps(inputPattern)
+                                        for inputPattern in patternMatrix])
+    else:
+      overlapsWithProtos = self._Memory.rightDenseMatSumAtNZ(
+        patternMatrix.astype(numpy.float32))
+
+    return self._overlapDistanceMatrix(overlapsWithProtos,
+                                       patternMatrix.sum(axis=1),
+                                       self._protoSizes)
+
+
+  def _overlapDistanceMatrix(self, overlapsWithProtos, inputPatternSums,
+                             protoSizes):
+    """Calculate the overlap based distances of some input patterns to some
+    prototypes from their overlaps.
+
+    :param overlapsWithProtos The overlap of each input pattern (row) with
+        each prototype (column). Modified in place.
+
+    :param inputPatternSums The sum of each input pattern
+
+    :param protoSizes The sum of each prototype
+    """
+    # Like the scalar input sums in _calcDistance, the sums take the dtype of
+    # the overlaps.
+    inputPatternSums = inputPatternSums.astype(
+      overlapsWithProtos.dtype)[:, numpy.newaxis]
+
+    if self.distanceMethod == "rawOverlap":
+      dist = inputPatternSums - overlapsWithProtos
+    elif self.distanceMethod == "pctOverlapOfInput":
+      dist = inputPatternSums - overlapsWithProtos
+      dist /= numpy.where(inputPatternSums > 0, inputPatternSums, 1)
+    elif self.distanceMethod == "pctOverlapOfProto":
+      overlapsWithProtos /= protoSizes
+      dist = 1.0 - overlapsWithProtos
+    elif self.distanceMethod == "pctOverlapOfLarger":
+      maxVal = numpy.maximum(protoSizes, inputPatternSums)
+      normalize = maxVal.all(axis=1)
+      overlapsWithProtos[normalize] /= maxVal[normalize]
+      dist = 1.0 - overlapsWithProtos
+    else:
+      raise RuntimeError("Unimplemented distance method %s" %
+        self.distanceMethod)
+
+    return dist
+
+
+  def _getDistanceMatrix(self, patternMatrix, partitionIds=None):
+    """Return the distances from each row of patternMatrix to all stored
+    patterns, as _getDistances does for a single pattern.
+
+    :param patternMatrix The patterns from which distances to all other
+        patterns are returned, one per row
+
+    :param partitionIds If provided, ignore the training vectors with the
+        partitionId of each pattern.
+    """
+    if not self._finishedLearning:
+      self.finishLearning()
+      self._finishedLearning = True
+
+    if self._vt is not None and len(self._vt) > 0:
+      patternMatrix = numpy.dot(patternMatrix - self._mean, self._vt.T)
+
+    sparseInputs = self._sparsifyVector(patternMatrix)
+
+    # Compute distances
+    dist = self._calcDistanceMatrix(sparseInputs)
+    # Invalidate results where category is -1
+    if self._specificIndexTraining:
+      dist[:, numpy.array(self._categoryList) == -1] = numpy.inf
+
+    # Ignore vectors with the partition id of each pattern
+    if partitionIds is not None:
+      patternsByPartition = {}
+      for i, partitionId in enumerate(partitionIds):
+        if partitionId is not None:
+          patternsByPartition.setdefault(partitionId, []).append(i)
+      for partitionId, patterns in patternsByPartition.iteritems():
+        indices = self._partitionIdMap.get(partitionId, [])
+        if indices:
+          dist[numpy.ix_(patterns, indices)] = numpy.inf
+
+    return dist
+
+
   def finishLearning(self):
     """
     Used for batch scenarios.  This method needs to be called between learning
@@ -1216,6 +1645,7 @@ class KNNClassifier(Serializable):
     knn.replaceDuplicates = proto.replaceDuplicates
     knn.cellsPerCol = proto.cellsPerCol
     knn.minSparsity = proto.minSparsity
+    knn.useInvertedIndex = proto.useInvertedIndex
 
     if knn.numSVDDims == "adaptive":
       knn._adaptiveSVDDims = True
@@ -1234,6 +1664,7 @@ class KNNClassifier(Serializable):
       knn._Memory = None
 
     knn._numPatterns = proto.numPatterns
+    knn._rebuildInvertedIndex()
 
     if len(proto.m) > 0:
       knn._M = numpy.array(proto.m, dtype=numpy.float64)
@@ -1289,6 +1720,7 @@ class KNNClassifier(Serializable):
     proto.replaceDuplicates = bool(self.replaceDuplicates)
     proto.cellsPerCol = self.cellsPerCol
     proto.minSparsity = self.minSparsity
+    proto.useInvertedIndex = bool(self.useInvertedIndex)
 
     # Write private state
     if self._Memory is  None:
@@ -1326,9 +1758,11 @@ class KNNClassifier(Serializable):
   def __getstate__(self):
     """Return serializable state.
 
-    This function will return a version of the __dict__.
+    This function will return a version of the __dict__. The inverted index
+    is left out and rebuilt from the prototypes when unpickling.
     """
     state = self.__dict__.copy()
+    state.pop("_invertedIndex", None)
     return state
 
 
@@ -1349,7 +1783,11 @@ class KNNClassifier(Serializable):
     if "minSparsity" not in state:
       state["minSparsity"] = 0.0
 
+    if "useInvertedIndex" not in state:
+      state["useInvertedIndex"] = False
+
     self.__dict__.update(state)
+    self._rebuildInvertedIndex()
 
     # Backward compatibility
     if "_partitionIdMap" not in state:
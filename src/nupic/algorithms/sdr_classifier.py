@@ -15,6 +15,7 @@ that takes SDRs as input and outputs a predicted distribution of classes.
 """
 
 from collections import deque
+from itertools import chain
 
 import numpy
 
@@ -27,6 +28,12 @@ except ImportError:
 if capnp:
   from nupic.proto.SdrClassifier_capnp import SdrClassifierProto
 
+# Number of patterns whose weight rows are gathered at once by inferBatch.
+# Gathering the rows of a whole batch takes more memory and is slower than
+# small chunks that stay in the CPU cache.
+_PATTERNS_PER_CHUNK = 64
+
+
 class SDRClassifier(Serializable):
   """
   The SDR Classifier accepts a binary input pattern from the
@@ -83,6 +90,12 @@ class SDRClassifier(Serializable):
   :param actValueAlpha: (float) Used to track the actual value within each
     bucket. A lower actValueAlpha results in longer term memory
   :param verbosity: (int) verbosity level, can be 0, 1, or 2
+  :param inputWidth: (int) Expected number of input bits, if known. Only used
+    to preallocate the weight matrices, which still grow to fit larger input
+    indices.
+  :param numBuckets: (int) Expected number of buckets, if known. Only used to
+    preallocate the weight matrices, which still grow to fit larger bucket
+    indices.
 
   :raises: (ValueError) when record number does not increase monotonically.
   """
@@ -94,7 +107,9 @@ class SDRClassifier(Serializable):
                steps=[1],
                alpha=0.001,
                actValueAlpha=0.3,
-               verbosity=0):
+               verbosity=0,
+               inputWidth=None,
+               numBuckets=None):
 
     if len(steps) == 0:
       raise TypeError("steps cannot be empty")
@@ -131,11 +146,17 @@ class SDRClassifier(Serializable):
     # each bucket index during inference
     self._maxBucketIdx = 0
 
-    # The connection weight matrix
-    self._weightMatrix = dict()
-    for step in self.steps:
-      self._weightMatrix[step] = numpy.zeros(shape=(self._maxInputIdx+1,
-                                                    self._maxBucketIdx+1))
+    # The connection weight matrices of all steps, stacked along the first
+    # axis in the order of self.steps. The array has spare capacity for new
+    # input and bucket indices and doubles along an axis when it runs out, so
+    # that growing it doesn't copy the weights on every new index.
+    self._weights = numpy.zeros(shape=(len(self.steps),
+                                       max(inputWidth or 1, 1),
+                                       max(numBuckets or 1, 1)))
+
+    # The connection weight matrix of each step, i.e. the in-use part of
+    # self._weights
+    self._updateWeightMatrixViews()
 
     # This keeps track of the actual value to use for each bucket index. We
     # start with 1 bucket, no actual value so that the first infer has something
@@ -214,13 +235,7 @@ class SDRClassifier(Serializable):
 
     # Update maxInputIdx and augment weight matrix with zero padding
     if max(patternNZ) > self._maxInputIdx:
-      newMaxInputIdx = max(patternNZ)
-      for nSteps in self.steps:
-        self._weightMatrix[nSteps] = numpy.concatenate((
-          self._weightMatrix[nSteps],
-          numpy.zeros(shape=(newMaxInputIdx-self._maxInputIdx,
-                             self._maxBucketIdx+1))), axis=0)
-      self._maxInputIdx = int(newMaxInputIdx)
+      self._growWeights(maxInputIdx=int(max(patternNZ)))
 
     # Get classification info
     if classification is not None:
@@ -252,38 +267,29 @@ class SDRClassifier(Serializable):
 
         # Update maxBucketIndex and augment weight matrix with zero padding
         if bucketIdx > self._maxBucketIdx:
-          for nSteps in self.steps:
-            self._weightMatrix[nSteps] = numpy.concatenate((
-              self._weightMatrix[nSteps],
-              numpy.zeros(shape=(self._maxInputIdx+1,
-                                 bucketIdx-self._maxBucketIdx))), axis=1)
-
-          self._maxBucketIdx = int(bucketIdx)
-
-        # Update rolling average of actual values if it's a scalar. If it's
-        # not, it must be a category, in which case each bucket only ever
-        # sees one category so we don't need a running average.
-        while self._maxBucketIdx > len(self._actualValues) - 1:
-          self._actualValues.append(None)
-        if self._actualValues[bucketIdx] is None:
-          self._actualValues[bucketIdx] = actValue
-        else:
-          if (isinstance(actValue, int) or
-                isinstance(actValue, float) or
-                isinstance(actValue, long)):
-            self._actualValues[bucketIdx] = ((1.0 - self.actValueAlpha)
-                                             * self._actualValues[bucketIdx]
-                                             + self.actValueAlpha * actValue)
-          else:
-            self._actualValues[bucketIdx] = actValue
+          self._growWeights(maxBucketIdx=int(bucketIdx))
 
-      for (learnRecordNum, learnPatternNZ) in self._patternNZHistory:
-        error = self._calculateError(recordNum, bucketIdxList)
+        self._updateActualValue(bucketIdx, actValue)
+
+      # Each step's weights are only learned from the pattern that many
+      # records back, so the errors of all steps can be computed up front and
+      # applied with a single update of the rows of all the active bits.
+      error = self._calculateError(recordNum, bucketIdxList)
 
+      numInputs = self._weights.shape[1]
+      rows = []
+      deltas = []
+      for (learnRecordNum, learnPatternNZ) in self._patternNZHistory:
         nSteps = recordNum - learnRecordNum
         if nSteps in self.steps:
-          for bit in learnPatternNZ:
-            self._weightMatrix[nSteps][bit, :] += self.alpha * error[nSteps]
+          rows.append(numpy.asarray(learnPatternNZ, dtype="int64") +
+                      self.steps.index(nSteps) * numInputs)
+          deltas.append(numpy.tile(self.alpha * error[nSteps],
+                                   (len(learnPatternNZ), 1)))
+
+      if len(rows) > 0:
+        self._addToWeights(numpy.concatenate(rows),
+                           numpy.concatenate(deltas))
 
     # ------------------------------------------------------------------------
     # Verbose print
@@ -304,6 +310,140 @@ class SDRClassifier(Serializable):
 
 
 
+  def fitBatch(self, recordNums, patternNZs, bucketIdxs, actValues):
+    """
+    Learn a whole recorded stream. This gives the same weights (up to
+    floating point rounding), actual values and history as calling
+    :meth:`compute` with ``learn=True`` and ``infer=False`` on each record in
+    turn, without the per-record dict handling.
+
+    :param recordNums: (list) Record number of each record. Record numbers
+      have to increase monotonically, also with respect to the records seen
+      before this call.
+    :param patternNZs: (tuple) ``(indices, offsets)``, where the active
+      indices of record ``i`` are ``indices[offsets[i]:offsets[i + 1]]``. See
+      :func:`packPatternNZs`.
+    :param bucketIdxs: (list) Encoder bucket of each record, or None for
+      records that should not be learned.
+    :param actValues: (list) Actual value going into the encoder for each
+      record.
+    """
+    indices, offsets = _unpackPatternNZs(patternNZs, len(recordNums))
+    if len(bucketIdxs) != len(recordNums) or len(actValues) != len(recordNums):
+      raise ValueError("expected one bucket index and one actual value per "
+                       "record")
+    if len(recordNums) == 0:
+      return
+
+    # Check the record numbers up front, so that a bad stream is rejected
+    # without learning any of it
+    previousRecordNums = numpy.asarray(recordNums[:-1])
+    if (numpy.any(numpy.asarray(recordNums[1:]) < previousRecordNums) or
+        (len(self._patternNZHistory) > 0 and
+         recordNums[0] < self._patternNZHistory[-1][0])):
+      raise ValueError("the record number has to increase monotonically")
+
+    learnedBucketIdxs = [b for b in bucketIdxs if b is not None]
+    self._reserveWeights(int(indices.max()),
+                         max([self._maxBucketIdx] + learnedBucketIdxs))
+    stepIdxForSteps = dict((step, self.steps.index(step))
+                           for step in self.steps)
+
+    history = deque([(recordNum, numpy.asarray(patternNZ, dtype="int64"))
+                     for (recordNum, patternNZ) in self._patternNZHistory],
+                    maxlen=self._maxSteps)
+    # Patterns rarely repeat an index, so check them all up front rather than
+    # on every update
+    mayRepeat = (_hasRepeatedIndices(indices, offsets) or
+                 any(len(set(patternNZ)) < len(patternNZ)
+                     for (_, patternNZ) in history))
+    numInputs = self._weights.shape[1]
+
+    for i, recordNum in enumerate(recordNums):
+      if len(history) == 0 or recordNum > history[-1][0]:
+        history.append((recordNum, indices[offsets[i]:offsets[i + 1]]))
+
+      bucketIdx = bucketIdxs[i]
+      if bucketIdx is None:
+        continue
+
+      if bucketIdx > self._maxBucketIdx:
+        self._maxBucketIdx = int(bucketIdx)
+      self._updateActualValue(bucketIdx, actValues[i])
+
+      # Gather the rows of the patterns of all steps at once, compute the
+      # errors of all steps from them, and apply the updates with a single
+      # scatter-add. This is the same update compute makes.
+      learnRows = []
+      starts = []
+      lengths = []
+      start = 0
+      for (learnRecordNum, learnPatternNZ) in history:
+        nSteps = recordNum - learnRecordNum
+        if nSteps in stepIdxForSteps:
+          learnRows.append(learnPatternNZ + stepIdxForSteps[nSteps] * numInputs)
+          starts.append(start)
+          lengths.append(len(learnPatternNZ))
+          start += len(learnPatternNZ)
+      if len(learnRows) == 0:
+        continue
+
+      learnRows = numpy.concatenate(learnRows)
+      error = -_softmax(numpy.add.reduceat(
+        self._weightRows()[learnRows, :self._maxBucketIdx + 1], starts,
+        axis=0))
+      error[:, bucketIdx] += 1.0
+
+      self._addToWeights(learnRows,
+                         numpy.repeat(self.alpha * error, lengths, axis=0),
+                         mayRepeat)
+
+    self._patternNZHistory = deque(
+      [(recordNum, list(patternNZ)) for (recordNum, patternNZ) in history],
+      maxlen=self._maxSteps)
+    self._growWeights(maxInputIdx=max(self._maxInputIdx, int(indices.max())))
+
+
+  def inferBatch(self, patternNZs):
+    """
+    Return the inference values of many input samples at once. Each row of
+    the results is what :meth:`compute` returns for that sample with
+    ``classification=None``, ``learn=False`` and ``infer=True``, up to
+    floating point rounding.
+
+    :param patternNZs: (tuple) ``(indices, offsets)``, where the active
+      indices of sample ``i`` are ``indices[offsets[i]:offsets[i + 1]]``. See
+      :func:`packPatternNZs`. An empty pattern gets equal likelihoods.
+
+    :return: dict containing inference results, one entry for each step in
+             self.steps. The key is the number of steps, the value is a
+             numpy array with one row per sample containing the relative
+             likelihood for each bucketIdx. There is also an entry with the
+             actual value of each bucket, with key 'actualValues'.
+    """
+    indices, offsets = _unpackPatternNZs(patternNZs, allowEmpty=True)
+    numSamples = len(offsets) - 1
+
+    if len(indices) > 0 and indices.max() > self._maxInputIdx:
+      self._growWeights(maxInputIdx=int(indices.max()))
+
+    retval = {"actualValues": [x if x is not None else 0
+                               for x in self._actualValues]}
+
+    for nSteps in self.steps:
+      weightMatrix = self._weightMatrix[nSteps]
+      outputActivation = numpy.zeros(shape=(numSamples,
+                                            self._maxBucketIdx + 1))
+      for start in xrange(0, numSamples, _PATTERNS_PER_CHUNK):
+        end = min(start + _PATTERNS_PER_CHUNK, numSamples)
+        outputActivation[start:end] = _sumRows(
+          weightMatrix[indices[offsets[start]:offsets[end]]],
+          offsets[start:end + 1] - offsets[start])
+      retval[nSteps] = _softmax(outputActivation)
+
+    return retval
+
+
   def infer(self, patternNZ, actValueList):
     """
     Return the inference value from one input sample. The actual
@@ -368,6 +508,142 @@ class SDRClassifier(Serializable):
     return predictDist
 
 
+  def _updateActualValue(self, bucketIdx, actValue):
+    """
+    Update the actual value tracked for a bucket.
+
+    :param bucketIdx: (int) index of the encoder bucket
+    :param actValue: actual value going into the encoder
+    """
+    # Update rolling average of actual values if it's a scalar. If it's
+    # not, it must be a category, in which case each bucket only ever
+    # sees one category so we don't need a running average.
+    while self._maxBucketIdx > len(self._actualValues) - 1:
+      self._actualValues.append(None)
+    if self._actualValues[bucketIdx] is None:
+      self._actualValues[bucketIdx] = actValue
+    else:
+      if (isinstance(actValue, int) or
+            isinstance(actValue, float) or
+            isinstance(actValue, long)):
+        self._actualValues[bucketIdx] = ((1.0 - self.actValueAlpha)
+                                         * self._actualValues[bucketIdx]
+                                         + self.actValueAlpha * actValue)
+      else:
+        self._actualValues[bucketIdx] = actValue
+
+
+  def _growWeights(self, maxInputIdx=None, maxBucketIdx=None):
+    """
+    Grow the weight matrices so that they cover a larger input index and/or
+    bucket index. New weights are zero.
+
+    :param maxInputIdx: (int) new highest input index, or None to keep it
+    :param maxBucketIdx: (int) new highest bucket index, or None to keep it
+    """
+    if maxInputIdx is not None:
+      self._maxInputIdx = maxInputIdx
+    if maxBucketIdx is not None:
+      self._maxBucketIdx = maxBucketIdx
+
+    self._reserveWeights(self._maxInputIdx, self._maxBucketIdx)
+    self._updateWeightMatrixViews()
+
+
+  def _reserveWeights(self, maxInputIdx, maxBucketIdx):
+    """
+    Make sure the underlying weight array has room for an input index and a
+    bucket index, without changing the in-use size of the weight matrices.
+    The array at least doubles along an axis whenever it runs out of
+    capacity.
+
+    :param maxInputIdx: (int) highest input index to make room for
+    :param maxBucketIdx: (int) highest bucket index to make room for
+    """
+    numSteps, numInputs, numBuckets = self._weights.shape
+    if maxInputIdx >= numInputs or maxBucketIdx >= numBuckets:
+      if maxInputIdx >= numInputs:
+        numInputs = max(maxInputIdx + 1, 2 * numInputs)
+      if maxBucketIdx >= numBuckets:
+        numBuckets = max(maxBucketIdx + 1, 2 * numBuckets)
+
+      weights = numpy.zeros(shape=(numSteps, numInputs, numBuckets))
+      oldNumInputs, oldNumBuckets = self._weights.shape[1:]
+      weights[:, :oldNumInputs, :oldNumBuckets] = self._weights
+      self._weights = weights
+
+
+  def _weightRows(self):
+    """
+    :returns: (numpy array) view of the weights of all steps as one matrix,
+              in which the weights of input ``bit`` for ``self.steps[i]`` are
+              row ``i * numInputs + bit``, ``numInputs`` being the capacity of
+              the weights
+    """
+    weightRows = self._weights.view()
+    # Raises rather than copying if the weights are not contiguous
+    weightRows.shape = (-1, self._weights.shape[2])
+    return weightRows
+
+
+  def _addToWeights(self, rows, deltas, mayRepeat=True):
+    """
+    Add one row of deltas to each row of :meth:`_weightRows`. A row that is
+    repeated gets each of its deltas.
+
+    :param rows: (numpy array) indices of the rows
+    :param deltas: (numpy array) deltas of the in-use buckets of each row
+    :param mayRepeat: (bool) False if the caller knows that no row is
+      repeated
+    """
+    weightRows = self._weightRows()
+    columns = slice(None, deltas.shape[1])
+    # A fancy-indexed += only applies the delta of a repeated row once, so
+    # repeated rows go through the slower numpy.add.at
+    if mayRepeat:
+      mayRepeat = len(numpy.unique(rows)) < len(rows)
+    if mayRepeat:
+      numpy.add.at(weightRows, (rows, columns), deltas)
+    else:
+      weightRows[rows, columns] += deltas
+
+
+  def _updateWeightMatrixViews(self):
+    """
+    Point self._weightMatrix at the in-use part of each step's weights.
+    """
+    self._weightMatrix = dict(
+      (step, self._weights[self.steps.index(step),
+                           :self._maxInputIdx + 1,
+                           :self._maxBucketIdx + 1])
+      for step in self.steps)
+
+
+  def __getstate__(self):
+    """
+    Return serializable state. The weight matrix views are left out, since
+    they would be pickled as copies of self._weights.
+    """
+    state = self.__dict__.copy()
+    del state["_weightMatrix"]
+    return state
+
+
+  def __setstate__(self, state):
+    """
+    Set the state of this object from a serialized state.
+    """
+    self.__dict__.update(state)
+
+    if not hasattr(self, "_weights"):
+      # Before the weights were stacked, each step's matrix was stored on its
+      # own
+      self._weights = numpy.array([self._weightMatrix[step]
+                                   for step in self.steps])
+
+    self._updateWeightMatrixViews()
+
+
   @classmethod
   def getSchema(cls):
     return SdrClassifierProto
@@ -394,12 +670,16 @@ class SDRClassifier(Serializable):
     classifier._maxBucketIdx = proto.maxBucketIdx
     classifier._maxInputIdx = proto.maxInputIdx
 
-    classifier._weightMatrix = {}
+    classifier._weights = numpy.zeros(shape=(len(classifier.steps),
+                                             classifier._maxInputIdx+1,
+                                             classifier._maxBucketIdx+1))
     weightMatrixProto = proto.weightMatrix
     for i in xrange(len(weightMatrixProto)):
-      classifier._weightMatrix[weightMatrixProto[i].steps] = numpy.reshape(
+      stepIdx = classifier.steps.index(weightMatrixProto[i].steps)
+      classifier._weights[stepIdx] = numpy.reshape(
         weightMatrixProto[i].weight, newshape=(classifier._maxInputIdx+1,
                                                classifier._maxBucketIdx+1))
+    classifier._updateWeightMatrixViews()
 
     classifier._actualValues = []
     for actValue in proto.actualValues:
@@ -488,6 +768,90 @@ class SDRClassifier(Serializable):
     return error
 
 
+def packPatternNZs(patternNZs):
+  """
+  Pack a list of active index lists into the ``(indices, offsets)`` form
+  taken by :meth:`SDRClassifier.fitBatch` and
+  :meth:`SDRClassifier.inferBatch`.
+
+  :param patternNZs: (list) one list of active indices per record
+  :return: (tuple) ``(indices, offsets)`` numpy arrays, where the active
+           indices of record ``i`` are ``indices[offsets[i]:offsets[i + 1]]``
+  """
+  offsets = numpy.zeros(len(patternNZs) + 1, dtype="int64")
+  offsets[1:] = numpy.cumsum([len(patternNZ) for patternNZ in patternNZs])
+  indices = numpy.fromiter(chain.from_iterable(patternNZs), dtype="int64",
+                           count=offsets[-1])
+  return indices, offsets
+
+
+def _unpackPatternNZs(patternNZs, numRecords=None, allowEmpty=False):
+  """
+  Validate packed patterns, see :func:`packPatternNZs`.
+
+  :param numRecords: (int) expected number of patterns, or None
+  :param allowEmpty: (bool) whether patterns without active indices are valid
+
+  :return: (tuple) ``(indices, offsets)`` as int64 numpy arrays
+  """
+  indices, offsets = patternNZs
+  indices = numpy.asarray(indices, dtype="int64")
+  offsets = numpy.asarray(offsets, dtype="int64")
+  if len(offsets) == 0 or offsets[0] != 0 or offsets[-1] != len(indices):
+    raise ValueError("offsets must start at 0 and end at the number of "
+                     "indices")
+  if numRecords is not None and len(offsets) != numRecords + 1:
+    raise ValueError("expected one pattern per record")
+  if numpy.any(offsets[1:] < offsets[:-1]):
+    raise ValueError("offsets must not decrease")
+  if not allowEmpty and numpy.any(offsets[1:] == offsets[:-1]):
+    raise ValueError("patterns cannot be empty")
+  return indices, offsets
+
+
+def _hasRepeatedIndices(indices, offsets):
+  """
+  :return: (bool) whether any packed pattern contains an index twice, see
+           :func:`packPatternNZs`
+  """
+  patternIds = numpy.repeat(numpy.arange(len(offsets) - 1),
+                            numpy.diff(offsets))
+  # Sorted by pattern, then by index
+  order = numpy.lexsort((indices, patternIds))
+  sortedIndices = indices[order]
+  return bool(numpy.any((sortedIndices[1:] == sortedIndices[:-1]) &
+                        (patternIds[1:] == patternIds[:-1])))
+
+
+def _sumRows(rows, offsets):
+  """
+  Sum consecutive groups of rows.
+
+  :param rows: (numpy array) rows of all groups
+  :param offsets: (numpy array) group ``i`` is
+    ``rows[offsets[i]:offsets[i + 1]]``
+  :return: (numpy array) the sum of each group, zeros for empty groups
+  """
+  if len(rows) == 0:
+    return numpy.zeros(shape=(len(offsets) - 1, rows.shape[1]))
+
+  # reduceat returns the row at the start of an empty group instead of zeros,
+  # and doesn't accept a start past the last row
+  sums = numpy.add.reduceat(rows, numpy.minimum(offsets[:-1], len(rows) - 1),
+                            axis=0)
+  sums[offsets[1:] == offsets[:-1]] = 0
+  return sums
+
+
+def _softmax(outputActivation):
+  """
+  Row-wise softmax, computed like :meth:`SDRClassifier.inferSingleStep`.
+  """
+  outputActivation = outputActivation - outputActivation.max(axis=1)[:, None]
+  expOutputActivation = numpy.exp(outputActivation)
+  return expOutputActivation / expOutputActivation.sum(axis=1)[:, None]
+
+
 def _pFormatArray(array_, fmt="%.2f"):
   """Return a string with pretty-print of a numpy array using the given format
   for each element"""
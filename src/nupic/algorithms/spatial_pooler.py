@@ -29,6 +29,11 @@ uintType = "uint32"
 VERSION = 3
 PERMANENCE_EPSILON = 0.000001
 EPSILON_ROUND = 5
+# Largest number of (column, neighbor) pairs kept in the cached column
+# neighborhood table used by local inhibition. Each pair takes 5 bytes, so the
+# table stays under about 5MB. Beyond this the table is rebuilt in blocks on
+# every call instead of being cached.
+MAX_NEIGHBORHOOD_TABLE_SIZE = 2**20
 
 
 class InvalidSPParamValueError(ValueError):
@@ -347,6 +352,13 @@ class SpatialPooler(Serializable):
     # stored separately for efficiency purposes.
     self._connectedCounts = numpy.zeros(numColumns, dtype=realDType)
 
+    # Scratch vectors for computeSparse, so that it doesn't allocate dense
+    # input-sized arrays on every call.
+    self._initScratchVectors()
+
+    # Neighborhoods of all columns, built lazily by local inhibition.
+    self._columnNeighborhoodTable = None
+
     # Initialize the set of permanence values for each column. Ensure that
     # each column is connected to enough input bits to allow it to be
     # activated.
@@ -922,6 +934,52 @@ class SpatialPooler(Serializable):
     activeArray[activeColumns] = 1
 
 
+  def computeSparse(self, activeInputIndices, learn):
+    """
+    Same as :meth:`compute`, but takes the indices of the active input bits and
+    returns the indices of the active columns. Overlap and learning work
+    directly on the indices, so no dense input vector is built. Given the same
+    input, both methods produce the same columns and the same learning.
+
+    :param activeInputIndices: An array or list with the index of every input
+        bit that is on. The order does not matter.
+    :param learn: A boolean value indicating whether learning should be
+        performed. See :meth:`compute`.
+    :returns: A numpy array with the sorted indices of the active columns.
+    """
+    activeInputIndices = numpy.unique(
+      numpy.asarray(activeInputIndices, dtype=uintType))
+
+    if activeInputIndices.size > 0 and (activeInputIndices[-1] >=
+                                        self._numInputs):
+      raise ValueError(
+          "Input index %d is out of range. Expecting fewer than %d inputs" % (
+              activeInputIndices[-1], self._numInputs))
+
+    self._updateBookeepingVars(learn)
+    self._overlaps = self._calculateOverlapSparse(activeInputIndices)
+
+    # Apply boosting when learning is on
+    if learn:
+      self._boostedOverlaps = self._boostFactors * self._overlaps
+    else:
+      self._boostedOverlaps = self._overlaps
+
+    # Apply inhibition to determine the winning columns
+    activeColumns = self._inhibitColumns(self._boostedOverlaps)
+
+    if learn:
+      self._adaptSynapsesSparse(activeInputIndices, activeColumns)
+      self._updateDutyCycles(self._overlaps, activeColumns)
+      self._bumpUpWeakColumns()
+      self._updateBoostFactors()
+      if self._isUpdateRound():
+        self._updateInhibitionRadius()
+        self._updateMinDutyCycles()
+
+    return numpy.sort(activeColumns)
+
+
   def stripUnlearnedColumns(self, activeArray):
     """
     Removes the set of columns who have never been active from the set of
@@ -1152,14 +1210,68 @@ class SpatialPooler(Serializable):
                     survived inhibition.
     """
     inputIndices = numpy.where(inputVector > 0)[0]
-    permChanges = numpy.zeros(self._numInputs, dtype=realDType)
+    self._adaptSynapsesSparse(inputIndices, activeColumns)
+
+
+  def _adaptSynapsesSparse(self, inputIndices, activeColumns):
+    """
+    Implements :meth:`_adaptSynapses` given the indices of the active input
+    bits. The permanence changes are written into a preallocated vector.
+
+    Parameters:
+    ----------------------------
+    :param inputIndices:
+                    An array of the indices of the input bits that are turned
+                    on.
+    :param activeColumns:
+                    An array containing the indices of the columns that
+                    survived inhibition.
+    """
+    permChanges = self._permChangesScratch
     permChanges.fill(-1 * self._synPermInactiveDec)
     permChanges[inputIndices] = self._synPermActiveInc
-    for columnIndex in activeColumns:
-      perm = self._permanences[columnIndex]
-      maskPotential = numpy.where(self._potentialPools[columnIndex] > 0)[0]
-      perm[maskPotential] += permChanges[maskPotential]
-      self._updatePermanencesForColumn(perm, columnIndex, raisePerm=True)
+    self._adaptPermanencesForColumns(activeColumns, permChanges)
+
+
+  def _adaptPermanencesForColumns(self, columns, permChanges):
+    """
+    Adds 'permChanges' to the permanences of the potential synapses of several
+    columns at once. This is equivalent to calling
+    :meth:`_updatePermanencesForColumn` with ``raisePerm=True`` on each
+    column, but clipping, trimming and the connected counts are computed on a
+    dense block holding the rows of all the columns.
+
+    Parameters:
+    ----------------------------
+    :param columns: An array containing the indices of the columns to adapt.
+    :param permChanges:
+                    An array with the permanence change for every input bit.
+    """
+    if len(columns) == 0:
+      return
+
+    perm = numpy.array([self._permanences[c] for c in columns],
+                       dtype=realDType)
+    potential = numpy.array([self._potentialPools[c] for c in columns]) > 0
+    perm += potential * permChanges
+
+    # Raise the permanences of columns with too few connected synapses, see
+    # _raisePermanenceToThreshold.
+    numpy.clip(perm, self._synPermMin, self._synPermMax, out=perm)
+    numConnected = numpy.count_nonzero(
+      perm > self._synPermConnected - PERMANENCE_EPSILON, axis=1)
+    for i in numpy.flatnonzero(numConnected < self._stimulusThreshold):
+      self._raisePermanenceToThreshold(perm[i], numpy.flatnonzero(potential[i]))
+
+    perm[perm < self._synPermTrimThreshold] = 0
+    numpy.clip(perm, self._synPermMin, self._synPermMax, out=perm)
+
+    isConnected = perm >= self._synPermConnected - PERMANENCE_EPSILON
+    self._connectedCounts[columns] = numpy.count_nonzero(isConnected, axis=1)
+    for i, columnIndex in enumerate(columns):
+      self._permanences.update(columnIndex, perm[i])
+      self._connectedSynapses.replace(columnIndex,
+                                      numpy.flatnonzero(isConnected[i]))
 
 
   def _bumpUpWeakColumns(self):
@@ -1533,6 +1645,32 @@ class SpatialPooler(Serializable):
     return overlaps
 
 
+  def _calculateOverlapSparse(self, inputIndices):
+    """
+    Same as :meth:`_calculateOverlap`, given the indices of the input bits that
+    are turned on. The input is written into a preallocated scratch vector,
+    which is cleared again afterwards.
+
+    Parameters:
+    ----------------------------
+    :param inputIndices: a numpy array of the indices of the input bits that
+                    are turned on.
+    """
+    overlaps = numpy.zeros(self._numColumns, dtype=realDType)
+    self._inputScratch[inputIndices] = 1
+    self._connectedSynapses.rightVecSumAtNZ_fast(self._inputScratch, overlaps)
+    self._inputScratch[inputIndices] = 0
+    return overlaps
+
+
+  def _initScratchVectors(self):
+    """
+    Allocates the input-sized vectors reused by :meth:`computeSparse`.
+    """
+    self._inputScratch = numpy.zeros(self._numInputs, dtype=realDType)
+    self._permChangesScratch = numpy.zeros(self._numInputs, dtype=realDType)
+
+
   def _calculateOverlapPct(self, overlaps):
     return overlaps.astype(realDType) / self._connectedCounts
 
@@ -1625,24 +1763,84 @@ class SpatialPooler(Serializable):
 
     activeArray = numpy.zeros(self._numColumns, dtype="bool")
 
-    for column, overlap in enumerate(overlaps):
-      if overlap >= self._stimulusThreshold:
-        neighborhood = self._getColumnNeighborhood(column)
-        neighborhoodOverlaps = overlaps[neighborhood]
+    for (columns, neighbors, offsets,
+         isEarlier) in self._columnNeighborhoodBlocks():
+      starts = offsets[:-1]
+      neighborOverlaps = overlaps[neighbors]
+      centerOverlaps = numpy.repeat(overlaps[columns], numpy.diff(offsets))
+
+      numBigger = numpy.add.reduceat(neighborOverlaps > centerOverlaps,
+                                     starts, dtype="int32")
+      numActive = (0.5 + density * numpy.diff(offsets)).astype("int32")
+
+      # When there is a tie, favor neighbors that are already selected as
+      # active. Columns are selected in index order, so only ties with
+      # lower-indexed neighbors can be lost.
+      earlierTies = (neighborOverlaps == centerOverlaps) & isEarlier
+      numEarlierTies = numpy.add.reduceat(earlierTies, starts, dtype="int32")
+
+      slack = numActive - numBigger
+      candidates = ((overlaps[columns] >= self._stimulusThreshold) &
+                    (slack > 0))
+
+      # Columns that win even if every earlier tied neighbor won are decided
+      # at once. The rest depend on which earlier neighbors won, so they are
+      # resolved in index order.
+      winners = candidates & (numEarlierTies < slack)
+      activeArray[columns[winners]] = True
+
+      for i in numpy.flatnonzero(candidates & ~winners):
+        tiedNeighbors = neighbors[offsets[i]:offsets[i + 1]][
+          earlierTies[offsets[i]:offsets[i + 1]]]
+        if numpy.count_nonzero(activeArray[tiedNeighbors]) < slack[i]:
+          activeArray[columns[i]] = True
 
-        numBigger = numpy.count_nonzero(neighborhoodOverlaps > overlap)
+    return activeArray.nonzero()[0]
 
-        # When there is a tie, favor neighbors that are already selected as
-        # active.
-        ties = numpy.where(neighborhoodOverlaps == overlap)
-        tiedNeighbors = neighborhood[ties]
-        numTiesLost = numpy.count_nonzero(activeArray[tiedNeighbors])
 
-        numActive = int(0.5 + density * len(neighborhood))
-        if numBigger + numTiesLost < numActive:
-          activeArray[column] = True
+  def _columnNeighborhoodBlocks(self):
+    """
+    Generates the neighborhoods of all columns as flat index tables, in blocks
+    of consecutive columns. The tables are built from
+    :meth:`_getColumnNeighborhood`. A table that covers every column is cached
+    until the inhibition radius changes; when that would take more than
+    ``MAX_NEIGHBORHOOD_TABLE_SIZE`` entries, smaller blocks are rebuilt on
+    every call instead.
 
-    return activeArray.nonzero()[0]
+    @returns (generator of tuples) ``(columns, neighbors, offsets,
+    isEarlier)`` of int32 index arrays, where the neighborhood of
+    ``columns[i]`` is ``neighbors[offsets[i]:offsets[i + 1]]`` and
+    ``isEarlier`` marks the neighbors with a lower index than the column whose
+    neighborhood they belong to.
+    """
+    key = (self._numColumns, tuple(self._columnDimensions),
+           self._inhibitionRadius, self._wrapAround)
+    if (self._columnNeighborhoodTable is not None and
+        self._columnNeighborhoodTable[0] == key):
+      yield self._columnNeighborhoodTable[1]
+      return
+
+    maxNeighborhoodSize = min(
+      self._numColumns,
+      (2 * self._inhibitionRadius + 1) ** len(self._columnDimensions))
+    blockSize = max(1, MAX_NEIGHBORHOOD_TABLE_SIZE // maxNeighborhoodSize)
+
+    for start in xrange(0, self._numColumns, blockSize):
+      columns = numpy.arange(start, min(start + blockSize, self._numColumns),
+                             dtype="int32")
+      neighborhoods = [numpy.asarray(self._getColumnNeighborhood(column),
+                                     dtype="int32")
+                       for column in columns]
+      offsets = numpy.zeros(len(columns) + 1, dtype="int32")
+      offsets[1:] = numpy.cumsum([len(n) for n in neighborhoods])
+      neighbors = numpy.concatenate(neighborhoods)
+      isEarlier = neighbors < numpy.repeat(columns, numpy.diff(offsets))
+      block = (columns, neighbors, offsets, isEarlier)
+
+      if blockSize >= self._numColumns:
+        self._columnNeighborhoodTable = (key, block)
+
+      yield block
 
 
   def _isUpdateRound(self):
@@ -1713,6 +1911,15 @@ class SpatialPooler(Serializable):
       self._random = NupicRandom()
 
 
+  def __getstate__(self):
+    """
+    Return serializable state, without the cached column neighborhood table.
+    """
+    state = self.__dict__.copy()
+    state["_columnNeighborhoodTable"] = None
+    return state
+
+
   def __setstate__(self, state):
     """
     Initialize class properties from stored values.
@@ -1731,6 +1938,11 @@ class SpatialPooler(Serializable):
     state['_version'] = VERSION
     self.__dict__.update(state)
 
+    if not hasattr(self, "_inputScratch"):
+      self._initScratchVectors()
+    if not hasattr(self, "_columnNeighborhoodTable"):
+      self._columnNeighborhoodTable = None
+
 
   @classmethod
   def getSchema(cls):
@@ -1858,6 +2070,8 @@ class SpatialPooler(Serializable):
     instance._permanences.read(proto.permanences)
     # Initialize ephemerals and make sure they get updated
     instance._connectedCounts = numpy.zeros(numColumns, dtype=realDType)
+    instance._initScratchVectors()
+    instance._columnNeighborhoodTable = None
     instance._connectedSynapses = BinaryCorticalColumns(numInputs)
     instance._connectedSynapses.resize(numColumns, numInputs)
     for columnIndex in xrange(proto.numColumns):
@@ -16,7 +16,9 @@ from collections import defaultdict
 from nupic.bindings.math import Random
 from operator import mul
 
-from nupic.algorithms.connections import Connections, binSearch
+import numpy
+
+from nupic.algorithms.connections import Connections, isInSorted
 from nupic.serializable import Serializable
 from nupic.support.group_by import groupby2
 
@@ -144,21 +146,29 @@ class TemporalMemory(Serializable):
 
 
 
-  @staticmethod
-  def connectionsFactory(*args, **kwargs):
+  # Connections implementation created by connectionsFactory, and used to read
+  # serialized connections. Subclasses may set it to another implementation,
+  # e.g. FlatConnections.
+  connectionsClass = Connections
+
+
+  @classmethod
+  def connectionsFactory(cls, *args, **kwargs):
     """
     Create a :class:`~nupic.algorithms.connections.Connections` instance.  
-    :class:`TemporalMemory` subclasses may override this method to choose a 
-    different :class:`~nupic.algorithms.connections.Connections` implementation, 
-    or to augment the instance otherwise returned by the default 
-    :class:`~nupic.algorithms.connections.Connections` implementation.
+    :class:`TemporalMemory` subclasses may set :attr:`connectionsClass` to
+    choose a different :class:`~nupic.algorithms.connections.Connections`
+    implementation, or override this method to augment the instance otherwise
+    returned. For large models,
+    :class:`~nupic.algorithms.flat_connections.FlatConnections` stores synapses
+    in flat arrays instead of one Python object per synapse.
 
     See :class:`~nupic.algorithms.connections.Connections` for constructor 
     signature and usage.
 
     :returns: :class:`~nupic.algorithms.connections.Connections` instance
     """
-    return Connections(*args, **kwargs)
+    return cls.connectionsClass(*args, **kwargs)
 
 
   # ==============================
@@ -204,8 +214,9 @@ class TemporalMemory(Serializable):
           if column is inactive and has matching distal dendrite segments
             call punishPredictedColumn
     """
-    prevActiveCells = self.activeCells
-    prevWinnerCells = self.winnerCells
+    # Sorted arrays, so learning can test synapses against them in bulk.
+    prevActiveCells = numpy.array(self.activeCells, dtype=numpy.int64)
+    prevWinnerCells = numpy.array(self.winnerCells, dtype=numpy.int64)
     self.activeCells = []
     self.winnerCells = []
 
@@ -270,22 +281,17 @@ class TemporalMemory(Serializable):
        self.activeCells,
        self.connectedPermanence)
 
-    activeSegments = (
-      self.connections.segmentForFlatIdx(i)
-      for i in xrange(len(numActiveConnected))
-      if numActiveConnected[i] >= self.activationThreshold
-    )
-
-    matchingSegments = (
-      self.connections.segmentForFlatIdx(i)
-      for i in xrange(len(numActivePotential))
-      if numActivePotential[i] >= self.minThreshold
-    )
-
-    self.activeSegments = sorted(activeSegments,
-                                 key=self.connections.segmentPositionSortKey)
-    self.matchingSegments = sorted(matchingSegments,
-                                   key=self.connections.segmentPositionSortKey)
+    # Sort the flatIdxs before creating Segment objects, so no Python-level
+    # sort key is evaluated.
+    activeFlatIdxs = self.connections.sortSegmentFlatIdxs(
+      numpy.flatnonzero(numActiveConnected >= self.activationThreshold))
+    matchingFlatIdxs = self.connections.sortSegmentFlatIdxs(
+      numpy.flatnonzero(numActivePotential >= self.minThreshold))
+
+    self.activeSegments = map(self.connections.segmentForFlatIdx,
+                              activeFlatIdxs.tolist())
+    self.matchingSegments = map(self.connections.segmentForFlatIdx,
+                                matchingFlatIdxs.tolist())
     self.numActiveConnectedSynapsesForSegment = numActiveConnected
     self.numActivePotentialSynapsesForSegment = numActivePotential
 
@@ -760,12 +766,12 @@ class TemporalMemory(Serializable):
     :param initialPermanence:  (float)  Initial permanence of a new synapse.
 
     """
-    candidates = list(prevWinnerCells)
+    candidates = numpy.asarray(prevWinnerCells, dtype=numpy.int64)
 
-    for synapse in connections.synapsesForSegment(segment):
-      i = binSearch(candidates, synapse.presynapticCell)
-      if i != -1:
-        del candidates[i]
+    presynapticCells = connections.presynapticCellsForSegment(segment)
+    if len(presynapticCells) > 0:
+      candidates = candidates[
+        ~isInSorted(candidates, numpy.sort(presynapticCells))]
 
     nActual = min(nDesiredNewSynapes, len(candidates))
 
@@ -779,10 +785,12 @@ class TemporalMemory(Serializable):
     nActual = min(nActual,
                   maxSynapsesPerSegment - connections.numSynapses(segment))
 
-    for _ in range(nActual):
-      i = random.getUInt32(len(candidates))
-      connections.createSynapse(segment, candidates[i], initialPermanence)
-      del candidates[i]
+    # Draw every index up front. The i-th draw picks from the candidates left
+    # after the previous picks, exactly as when picking one at a time.
+    candidates = candidates.tolist()
+    draws = [random.getUInt32(len(candidates) - i) for i in xrange(nActual)]
+    for i in draws:
+      connections.createSynapse(segment, candidates.pop(i), initialPermanence)
 
 
   @classmethod
@@ -798,31 +806,35 @@ class TemporalMemory(Serializable):
     :param permanenceIncrement:  (float)  Amount to increment active synapses
     :param permanenceDecrement:  (float)  Amount to decrement inactive synapses
     """
+    connections.adaptSegment(segment, prevActiveCells, permanenceIncrement,
+                             permanenceDecrement)
 
-    # Destroying a synapse modifies the set that we're iterating through.
-    synapsesToDestroy = []
-
-    for synapse in connections.synapsesForSegment(segment):
-      permanence = synapse.permanence
-
-      if binSearch(prevActiveCells, synapse.presynapticCell) != -1:
-        permanence += permanenceIncrement
-      else:
-        permanence -= permanenceDecrement
+    if connections.numSynapses(segment) == 0:
+      connections.destroySegment(segment)
 
-      # Keep permanence within min/max bounds
-      permanence = max(0.0, min(1.0, permanence))
 
-      if permanence < EPSILON:
-        synapsesToDestroy.append(synapse)
-      else:
-        connections.updateSynapsePermanence(synapse, permanence)
+  @classmethod
+  def _adaptSegments(cls, connections, segments, prevActiveCells,
+                     permanenceIncrements, permanenceDecrements):
+    """
+    Updates synapses on several segments with one vectorized
+    :meth:`~nupic.algorithms.connections.Connections.adaptSegments` call.
+    Each segment is updated as by :meth:`_adaptSegment`.
 
-    for synapse in synapsesToDestroy:
-      connections.destroySynapse(synapse)
+    :param connections:          (Object) Connections instance for the tm
+    :param segments:             (list)   Segments to adapt
+    :param prevActiveCells:      (list)   Active cells in `t-1`
+    :param permanenceIncrements: (list)   Amount to increment active synapses,
+                                          per segment
+    :param permanenceDecrements: (list)   Amount to decrement inactive
+                                          synapses, per segment
+    """
+    connections.adaptSegments(segments, prevActiveCells, permanenceIncrements,
+                              permanenceDecrements)
 
-    if connections.numSynapses(segment) == 0:
-      connections.destroySegment(segment)
+    for segment in segments:
+      if connections.numSynapses(segment) == 0:
+        connections.destroySegment(segment)
 
 
   def columnForCell(self, cell):
@@ -1169,7 +1181,7 @@ class TemporalMemory(Serializable):
         protoNumActivePotential[i].cell = segment.cell
         idx = self.connections.segmentsForCell(segment.cell).index(segment)
         protoNumActivePotential[i].idxOnCell = idx
-        protoNumActivePotential[i].number = numActivePotentialSynapses
+        protoNumActivePotential[i].number = int(numActivePotentialSynapses)
 
     proto.iteration = self.iteration
 
@@ -1219,7 +1231,8 @@ class TemporalMemory(Serializable):
     tm.maxSegmentsPerCell = int(proto.maxSegmentsPerCell)
     tm.maxSynapsesPerSegment = int(proto.maxSynapsesPerSegment)
 
-    tm.connections = Connections.read(proto.connections)
+    # Read the connections with the implementation chosen by the subclass
+    tm.connections = cls.connectionsClass.read(proto.connections)
     #pylint: disable=W0212
     tm._random = Random()
     tm._random.read(proto.random)
@@ -1229,8 +1242,10 @@ class TemporalMemory(Serializable):
     tm.winnerCells = [int(x) for x in proto.winnerCells]
 
     flatListLength = tm.connections.segmentFlatListLength()
-    tm.numActiveConnectedSynapsesForSegment = [0] * flatListLength
-    tm.numActivePotentialSynapsesForSegment = [0] * flatListLength
+    tm.numActiveConnectedSynapsesForSegment = numpy.zeros(flatListLength,
+                                                          dtype=numpy.int64)
+    tm.numActivePotentialSynapsesForSegment = numpy.zeros(flatListLength,
+                                                          dtype=numpy.int64)
     tm.lastUsedIterationForSegment = [0] * flatListLength
 
     tm.activeSegments = []
@@ -0,0 +1,731 @@
+# Copyright 2017 Numenta Inc.
+#
+# Copyright may exist in Contributors' modifications
+# and/or contributions to the work.
+#
+# Use of this source code is governed by the MIT
+# license that can be found in the LICENSE file or at
+# https://opensource.org/licenses/MIT.
+
+"""
+Binary columnar implementation of a record stream
+
+:class:`~.columnar_record_stream.ColumnarRecordStream` reads and writes
+datasets stored as one typed binary column per field, which are memory-mapped
+when read. Reading records does not parse any text, which makes it much faster
+than reading the same records from a ``.csv`` file with
+:class:`~.file_record_stream.FileRecordStream`.
+
+A dataset is a directory holding a ``header.json`` file, with the fields
+(name, type and special of each, as in the header rows of a ``.csv`` file) and
+the number of records, and the following files for the field at index ``i``:
+
+- ``i.values``: the values of the field. Scalar fields hold one value per
+  record: ``int`` fields as 64 bit integers, ``float`` fields as doubles,
+  ``bool`` fields as bytes and ``datetime`` fields as microseconds since the
+  epoch. ``string``, ``list`` and ``sdr`` fields hold the concatenated
+  characters, integers or bits of all records.
+- ``i.offsets``: for ``string``, ``list`` and ``sdr`` fields, the 64 bit
+  position in ``i.values`` at which the value of each record starts, followed
+  by the position after the last value.
+- ``i.missing``: if some records miss a value for the field, one byte per
+  record that is 1 if the value is missing.
+
+Use :func:`~.columnar_record_stream.convertFromCsv` to convert a ``.csv`` file
+readable by :class:`~.file_record_stream.FileRecordStream` to this format:
+
+.. code-block:: python
+
+    convertFromCsv("data.csv", "data.columns")
+
+    with ColumnarRecordStream("data.columns") as f:
+      for r in f:
+        print r
+
+:class:`~.stream_reader.StreamReader` opens a dataset in this format when the
+``source`` of its stream definition is the dataset directory.
+"""
+
+import copy
+import json
+import os
+
+import numpy
+
+from nupic.data.field_meta import FieldMetaInfo, FieldMetaType, FieldMetaSpecial
+from nupic.data import SENTINEL_VALUE_FOR_MISSING_DATA
+from nupic.data.file_record_stream import FileRecordStream
+from nupic.data.record_stream import RecordStreamIface
+
+
+# Name of the header file of a dataset
+HEADER_FILENAME = "header.json"
+
+# Version of the dataset format, stored in the header
+FORMAT_VERSION = 1
+
+# Data type of the values of each field type
+_VALUE_DTYPES = {FieldMetaType.integer: numpy.dtype("<i8"),
+                 FieldMetaType.float: numpy.dtype("<f8"),
+                 FieldMetaType.boolean: numpy.dtype("|b1"),
+                 FieldMetaType.datetime: numpy.dtype("<M8[us]"),
+                 FieldMetaType.string: numpy.dtype("|u1"),
+                 FieldMetaType.list: numpy.dtype("<i8"),
+                 FieldMetaType.sdr: numpy.dtype("|u1")}
+
+# Field types with a variable number of values per record
+_VARIABLE_LENGTH_TYPES = (FieldMetaType.string, FieldMetaType.list,
+                          FieldMetaType.sdr)
+
+# Value stored for missing values in each scalar field type
+_MISSING_FILL_VALUES = {FieldMetaType.integer: 0,
+                        FieldMetaType.float: numpy.nan,
+                        FieldMetaType.boolean: False,
+                        FieldMetaType.datetime: numpy.datetime64("NaT")}
+
+_OFFSET_DTYPE = numpy.dtype("<i8")
+_MISSING_DTYPE = numpy.dtype("|b1")
+
+
+
+def _isMissing(value):
+  """ Values written as missing, i.e. read back as
+  SENTINEL_VALUE_FOR_MISSING_DATA. An empty string is missing as well, as
+  FileRecordStream reads it back as missing.
+  """
+  return value is SENTINEL_VALUE_FOR_MISSING_DATA or (
+    isinstance(value, basestring) and value == "")
+
+
+
+def _readArray(path, dtype, count):
+  """ Memory-maps ``count`` values from the given column file. """
+  if count == 0:
+    # numpy cannot memory-map empty files
+    return numpy.zeros(0, dtype=dtype)
+  return numpy.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+
+
+class _Column(object):
+  """
+  Reads and writes the values of a single field.
+
+  :param path: (string) path of the field's files, without the extension
+  :param fieldType: (string) one of the :class:`~.field_meta.FieldMetaType`
+         values
+  """
+
+  def __init__(self, path, fieldType):
+    self._path = path
+    self._fieldType = fieldType
+    self._dtype = _VALUE_DTYPES[fieldType]
+    self._isVariableLength = fieldType in _VARIABLE_LENGTH_TYPES
+
+    self._values = None
+    self._offsets = None
+    self._missing = None
+
+    # Open files when writing
+    self._files = None
+    self._numValues = 0
+    self.hasMissing = False
+
+
+  def openForRead(self, numRecords, hasMissing):
+    """ Memory-maps the files of a column holding ``numRecords`` records. """
+    self.hasMissing = hasMissing
+    if self._isVariableLength:
+      self._offsets = _readArray(self._path + ".offsets", _OFFSET_DTYPE,
+                                 numRecords + 1)
+      numValues = int(self._offsets[-1])
+    else:
+      numValues = numRecords
+    self._values = _readArray(self._path + ".values", self._dtype, numValues)
+    if hasMissing:
+      self._missing = _readArray(self._path + ".missing", _MISSING_DTYPE,
+                                 numRecords)
+
+
+  def openForWrite(self):
+    """ Creates the files of an empty column. """
+    self._files = {"values": open(self._path + ".values", "wb"),
+                   "missing": open(self._path + ".missing", "wb")}
+    if self._isVariableLength:
+      self._files["offsets"] = open(self._path + ".offsets", "wb")
+      numpy.zeros(1, dtype=_OFFSET_DTYPE).tofile(self._files["offsets"])
+
+
+  def close(self):
+    """ Releases the memory-mapped arrays or closes the written files. """
+    self._values = None
+    self._offsets = None
+    self._missing = None
+
+    if self._files is not None:
+      for f in self._files.itervalues():
+        f.close()
+      self._files = None
+      if not self.hasMissing:
+        os.remove(self._path + ".missing")
+
+
+  def flush(self):
+    if self._files is not None:
+      for f in self._files.itervalues():
+        f.flush()
+
+
+  def read(self, start, end):
+    """
+    :returns: (list) values of the records ``start`` to ``end`` (excluded),
+              with SENTINEL_VALUE_FOR_MISSING_DATA for missing values
+    """
+    if self._isVariableLength:
+      offsets = self._offsets[start:end+1]
+      values = self._values[offsets[0]:offsets[-1]]
+      if self._fieldType == FieldMetaType.string:
+        values = values.tostring()
+      else:
+        values = values.tolist()
+      bounds = (offsets - offsets[0]).tolist()
+      column = [values[bounds[i]:bounds[i+1]] for i in xrange(end - start)]
+    else:
+      column = self._values[start:end].tolist()
+
+    if self.hasMissing:
+      for i in numpy.flatnonzero(self._missing[start:end]).tolist():
+        column[i] = SENTINEL_VALUE_FOR_MISSING_DATA
+
+    return column
+
+
+  def write(self, column):
+    """ Appends the values of the given records to the files. """
+    missing = numpy.fromiter((_isMissing(value) for value in column),
+                             dtype=_MISSING_DTYPE, count=len(column))
+    if missing.any():
+      self.hasMissing = True
+      column = list(column)
+      fillValue = ("" if self._isVariableLength else
+                   _MISSING_FILL_VALUES[self._fieldType])
+      for i in numpy.flatnonzero(missing).tolist():
+        column[i] = fillValue
+
+    if self._fieldType == FieldMetaType.string:
+      column = [value.encode("utf-8") if isinstance(value, unicode) else value
+                for value in column]
+      lengths = [len(value) for value in column]
+      values = numpy.fromstring("".join(column), dtype=self._dtype)
+    elif self._isVariableLength:
+      lengths = [len(value) for value in column]
+      values = numpy.fromiter((v for value in column for v in value),
+                              dtype=self._dtype, count=sum(lengths))
+    else:
+      values = numpy.array(column, dtype=self._dtype)
+
+    if self._isVariableLength:
+      offsets = self._numValues + numpy.cumsum(lengths, dtype=_OFFSET_DTYPE)
+      offsets.tofile(self._files["offsets"])
+      self._numValues += len(values)
+
+    values.tofile(self._files["values"])
+    missing.tofile(self._files["missing"])
+
+
+  def getMinMax(self, numRecords):
+    """
+    :returns: (tuple) min and max of the values of a numeric column, None for
+              other columns or when all values are missing.
+    """
+    if self._fieldType not in (FieldMetaType.integer, FieldMetaType.float):
+      return None, None
+
+    values = self._values[:numRecords]
+    if self.hasMissing:
+      values = values[~self._missing[:numRecords]]
+    if self._fieldType == FieldMetaType.float:
+      values = values[~numpy.isnan(values)]
+    if not len(values):
+      return None, None
+    return values.min().item(), values.max().item()
+
+
+
+class ColumnarRecordStream(RecordStreamIface):
+  """
+  Binary columnar RecordStream implementation
+
+  Fields are described as for
+  :class:`~.file_record_stream.FileRecordStream`, by a sequence of
+  :class:`~.field_meta.FieldMetaInfo` (``name``, ``type``, ``special``)
+  tuples, and records read from a dataset are equal to those read from the
+  ``.csv`` file it was converted from.
+
+  Records are written in chunks, and the header is written when the stream is
+  flushed or closed; records appended after the last flush are not visible to
+  readers.
+
+  :param streamID:
+      dataset directory, input or output
+  :param write:
+      True or False, open for writing if True
+  :param fields:
+      a list of nupic.data.fieldmeta.FieldMetaInfo field descriptors, only
+      applicable when write==True
+  :param bookmark:
+      a reference to the previous reader, if passed in, the records will be
+      returned starting from the point where bookmark was requested. Either
+      bookmark or firstRecord can be specified, not both. If bookmark is used,
+      then firstRecord MUST be None.
+  :param firstRecord:
+      0-based index of the first record to start reading from. Either bookmark
+      or firstRecord can be specified, not both. If bookmark is used, then
+      firstRecord MUST be None.
+  :param chunkSize:
+      number of records decoded from the columns at once when reading, or
+      buffered before they are appended to the columns when writing
+  """
+
+
+  def __init__(self, streamID, write=False, fields=None, bookmark=None,
+               firstRecord=None, chunkSize=10000):
+    super(ColumnarRecordStream, self).__init__()
+
+    # Only bookmark or firstRow can be specified, not both
+    if bookmark is not None and firstRecord is not None:
+      raise RuntimeError(
+          "Only bookmark or firstRecord can be specified, not both")
+
+    self._path = streamID
+    self._write = write
+    self._chunkSize = chunkSize
+    self.rewindAtEOF = False
+
+    if write:
+      assert fields is not None
+      assert isinstance(fields, (tuple, list))
+      # Verify all fields are 3-tuple
+      assert all(isinstance(f, (tuple, FieldMetaInfo)) and len(f) == 3
+                 for f in fields)
+      for _, fieldType, special in fields:
+        if not FieldMetaType.isValid(fieldType):
+          raise ValueError("Field type \"%s\" not a valid FieldMetaType"
+                           % fieldType)
+        if not FieldMetaSpecial.isValid(special):
+          raise ValueError("'%s' is not a valid special flag" % special)
+
+      if not os.path.isdir(self._path):
+        os.makedirs(self._path)
+      self._fields = [FieldMetaInfo(*f) for f in fields]
+      self._numRecords = 0
+    else:
+      header = self._readHeader(self._path)
+      self._fields = [FieldMetaInfo(*f) for f in header["fields"]]
+      self._numRecords = header["numRecords"]
+      hasMissing = header["missing"]
+
+    self._columns = [_Column(os.path.join(self._path, str(i)), f.type)
+                     for i, f in enumerate(self._fields)]
+    if write:
+      for column in self._columns:
+        column.openForWrite()
+    else:
+      for column, missing in zip(self._columns, hasMissing):
+        column.openForRead(self._numRecords, missing)
+
+    # Records decoded or buffered for writing, and the index of the first
+    self._chunk = []
+    self._chunkStart = 0
+
+    # Keep track on how many records have been read/written
+    self._recordCount = 0
+
+    if bookmark is not None:
+      self._recordCount = self._getStartRow(bookmark)
+    elif firstRecord is not None:
+      self._recordCount = min(firstRecord, self._numRecords)
+
+    # Dictionary to store record statistics (min and max of scalars for now)
+    self._stats = None
+
+
+  @staticmethod
+  def isColumnarDataset(path):
+    """
+    :param path: (string) path of a dataset
+    :returns: (bool) whether the path is a dataset in this format
+    """
+    return os.path.isfile(os.path.join(path, HEADER_FILENAME))
+
+
+  @staticmethod
+  def _readHeader(path):
+    with open(os.path.join(path, HEADER_FILENAME)) as f:
+      header = json.load(f)
+
+    if header["version"] > FORMAT_VERSION:
+      raise ValueError("Dataset %s has format version %d, but only versions "
+                       "up to %d are supported" % (path, header["version"],
+                                                   FORMAT_VERSION))
+    return header
+
+
+  def _writeHeader(self):
+    header = {"version": FORMAT_VERSION,
+              "numRecords": self._numRecords,
+              "fields": [list(f) for f in self._fields],
+              "missing": [column.hasMissing for column in self._columns]}
+    with open(os.path.join(self._path, HEADER_FILENAME), "w") as f:
+      json.dump(header, f, indent=2)
+
+
+  def __getstate__(self):
+    d = dict()
+    d.update(self.__dict__)
+    del d['_columns']
+    del d['_chunk']
+    return d
+
+
+  def __setstate__(self, state):
+    self.__dict__ = state
+    assert not self._write, "Only streams opened for reading can be restored"
+    hasMissing = self._readHeader(self._path)["missing"]
+    self._columns = [_Column(os.path.join(self._path, str(i)), f.type)
+                     for i, f in enumerate(self._fields)]
+    for column, missing in zip(self._columns, hasMissing):
+      column.openForRead(self._numRecords, missing)
+    self.rewind()
+
+
+  def close(self):
+    """
+    Closes the stream.
+    """
+    if self._columns is None:
+      return
+
+    if self._write:
+      self.flush()
+    for column in self._columns:
+      column.close()
+    self._columns = None
+
+
+  def rewind(self):
+    """
+    Put us back at the beginning of the dataset again.
+    """
+
+    # Superclass rewind
+    super(ColumnarRecordStream, self).rewind()
+
+    self._chunk = []
+    self._chunkStart = 0
+    self._recordCount = 0
+
+
+  def getNextRecord(self, useCache=True):
+    """ Returns next available data record from the dataset.
+
+    :returns: a data row (a list) if available; None, if no more records in
+              the dataset (End of Stream - EOS).
+    """
+    assert self._columns is not None
+    assert not self._write
+
+    if self._recordCount >= self._numRecords:
+      if not self.rewindAtEOF:
+        return None
+      if self._numRecords == 0:
+        raise Exception("The source configured to reset at EOF but "
+                        "'%s' appears to be empty" % self._path)
+      self.rewind()
+
+    i = self._recordCount - self._chunkStart
+    if not 0 <= i < len(self._chunk):
+      self._readChunk(self._recordCount)
+      i = 0
+
+    # Keep score of how many records were read
+    self._recordCount += 1
+
+    return list(self._chunk[i])
+
+
+  def _readChunk(self, start):
+    """ Decodes the records from ``start`` on, up to a chunk of them. """
+    end = min(start + self._chunkSize, self._numRecords)
+    self._chunk = zip(*[column.read(start, end) for column in self._columns])
+    self._chunkStart = start
+
+
+  def appendRecord(self, record):
+    """
+    Saves the record in the dataset.
+
+    :param record: a list of Python objects, one per field
+    """
+    assert self._columns is not None
+    assert self._write
+    assert isinstance(record, (list, tuple)), \
+      "unexpected record type: " + repr(type(record))
+
+    assert len(record) == len(self._fields), \
+      "len(record): %s, fieldCount: %s" % (len(record), len(self._fields))
+
+    self._chunk.append(record)
+    self._recordCount += 1
+    if len(self._chunk) >= self._chunkSize:
+      self._writeChunk()
+
+
+  def appendRecords(self, records, progressCB=None):
+    """
+    Saves multiple records in the dataset.
+
+    :param records: array of records as in
+                    :meth:`~.ColumnarRecordStream.appendRecord`
+    :param progressCB: (function) callback to report progress
+    """
+
+    for record in records:
+      self.appendRecord(record)
+      if progressCB is not None:
+        progressCB()
+
+
+  def _writeChunk(self):
+    """ Appends the buffered records to the columns. """
+    if not self._chunk:
+      return
+
+    for column, values in zip(self._columns, zip(*self._chunk)):
+      column.write(values)
+    self._numRecords += len(self._chunk)
+    self._chunk = []
+
+
+  def getBookmark(self):
+    """
+    Gets a bookmark or anchor to the current position.
+
+    :returns: an anchor to the current position in the data. Passing this
+              anchor to a constructor makes the current position to be the first
+              returned record.
+    """
+
+    if self._write and self._recordCount==0:
+      return None
+
+    rowDict = dict(filepath=os.path.realpath(self._path),
+                   currentRow=self._recordCount)
+    return json.dumps(rowDict)
+
+
+  def recordsExistAfter(self, bookmark):
+    """
+    Returns whether there are more records from current position. ``bookmark``
+    is not used in this implementation.
+
+    :return: True if there are records left after current position.
+    """
+    return (self.getDataRowCount() - self.getNextRecordIdx()) > 0
+
+
+  def seekFromEnd(self, numRecords):
+    """
+    Seeks to ``numRecords`` from the end and returns a bookmark to the new
+    position.
+
+    :param numRecords: how far to seek from end of the dataset.
+    :return: bookmark to desired location.
+    """
+    self._recordCount = max(self._numRecords - numRecords, 0)
+    return self.getBookmark()
+
+
+  def setAutoRewind(self, autoRewind):
+    """
+    Controls whether :meth:`~.ColumnarRecordStream.getNextRecord` should
+    automatically rewind the source when EOF is reached.
+
+    :param autoRewind: (bool)
+
+        - if True, :meth:`~.ColumnarRecordStream.getNextRecord` will
+          automatically rewind the source on EOF.
+        - if False, :meth:`~.ColumnarRecordStream.getNextRecord` will not
+          automatically rewind the source on EOF.
+    """
+    self.rewindAtEOF = autoRewind
+
+
+  def getStats(self):
+    """
+    Computes the min and max of the numeric fields from their columns. See
+    :meth:`~.file_record_stream.FileRecordStream.getStats` for the format of
+    the returned dictionary.
+    """
+    if self._stats is None:
+      # Stats are only available when reading
+      assert not self._write
+
+      minMax = [column.getMinMax(self._numRecords) for column in self._columns]
+      self._stats = dict(min=[m[0] for m in minMax],
+                         max=[m[1] for m in minMax])
+
+    return self._stats
+
+
+  def clearStats(self):
+    """ Resets stats collected so far.
+    """
+    self._stats = None
+
+
+  def getError(self):
+    """
+    Not implemented. The columnar format does not provide storage for the
+    error information
+    """
+    return None
+
+
+  def setError(self, error):
+    """
+    Not implemented. The columnar format does not provide storage for the
+    error information
+    """
+    return
+
+
+  def isCompleted(self):
+    """ Not implemented. A dataset is always considered completed."""
+    return True
+
+
+  def setCompleted(self, completed=True):
+    """ Not implemented: a dataset is always considered completed, nothing to
+    do.
+    """
+    return
+
+
+  def getFieldNames(self):
+    """
+    :returns: (list) field names associated with the data.
+    """
+    return [f.name for f in self._fields]
+
+
+  def getFields(self):
+    """
+    :returns: a sequence of :class:`~.FieldMetaInfo`
+              ``name``/``type``/``special`` tuples for each field in the stream.
+    """
+    return copy.copy(self._fields)
+
+
+  def _getStartRow(self, bookmark):
+    """ Extracts start row from the bookmark information
+    """
+    bookMarkDict = json.loads(bookmark)
+
+    realpath = os.path.realpath(self._path)
+
+    bookMarkFile = bookMarkDict.get('filepath', None)
+
+    if bookMarkFile != realpath:
+      print ("Ignoring bookmark due to mismatch between dataset's "
+             "realpath vs. bookmark; realpath: %r; bookmark: %r") % (
+        realpath, bookMarkDict)
+      return 0
+    else:
+      return bookMarkDict['currentRow']
+
+
+  def getNextRecordIdx(self):
+    """
+    :returns: (int) the index of the record that will be read next from
+              :meth:`~.ColumnarRecordStream.getNextRecord`.
+    """
+    return self._recordCount
+
+
+  def getDataRowCount(self):
+    """
+    :returns: (int) count of records in the dataset, including the records
+              appended but not flushed yet when writing
+    """
+    if self._write:
+      return self._numRecords + len(self._chunk)
+    return self._numRecords
+
+
+  def setTimeout(self, timeout):
+    pass
+
+
+  def flush(self):
+    """
+    Appends the buffered records to the columns and writes the header.
+    """
+    if self._write and self._columns is not None:
+      self._writeChunk()
+      for column in self._columns:
+        column.flush()
+      self._writeHeader()
+
+
+  def __enter__(self):
+    """Context guard - enter
+
+    Just return the object
+    """
+    return self
+
+
+  def __exit__(self, yupe, value, traceback):
+    """Context guard - exit
+
+    Ensures that the dataset is always closed at the end of the 'with' block.
+    Lets exceptions propagate.
+    """
+    self.close()
+
+
+  def __iter__(self):
+    """Support for the iterator protocol. Return itself"""
+    return self
+
+
+  def next(self):
+    """Implement the iterator protocol """
+    record = self.getNextRecord()
+    if record is None:
+      raise StopIteration
+
+    return record
+
+
+
+def convertFromCsv(csvPath, datasetPath, missingValues=None, chunkSize=10000):
+  """
+  Converts a ``.csv`` file readable by
+  :class:`~.file_record_stream.FileRecordStream` to a columnar dataset with the
+  same fields and records.
+
+  :param csvPath: (string) path of the ``.csv`` file
+  :param datasetPath: (string) directory of the dataset to write
+  :param missingValues: values of the ``.csv`` file read as missing, see
+         :class:`~.file_record_stream.FileRecordStream`
+  :param chunkSize: (int) number of records converted at once
+  :returns: (int) number of records converted
+  """
+  with FileRecordStream(csvPath, missingValues=missingValues) as reader:
+    with ColumnarRecordStream(datasetPath, write=True,
+                              fields=reader.getFields(),
+                              chunkSize=chunkSize) as writer:
+      writer.appendRecords(reader)
+      return writer.getDataRowCount()
@@ -14,6 +14,7 @@ import tempfile
 import pkg_resources
 
 from nupic.data.aggregator import Aggregator
+from nupic.data.columnar_record_stream import ColumnarRecordStream
 from nupic.data.field_meta import FieldMetaInfo, FieldMetaType, FieldMetaSpecial
 from nupic.data.file_record_stream import FileRecordStream
 from nupic.data import json_helpers
@@ -272,14 +273,19 @@ class StreamReader(RecordStreamIface):
                   bookmark,
                   firstRecordIdx):
     """Open the underlying file stream
-    This only supports 'file://' prefixed paths.
+    This only supports 'file://' prefixed paths, of either a csv file or a
+    columnar dataset directory.
 
     :returns: record stream instance
-    :rtype: FileRecordStream
+    :rtype: FileRecordStream or ColumnarRecordStream
     """
     filePath = dataUrl[len(FILE_PREF):]
     if not os.path.isabs(filePath):
       filePath = os.path.join(os.getcwd(), filePath)
+    if ColumnarRecordStream.isColumnarDataset(filePath):
+      return ColumnarRecordStream(streamID=filePath,
+                                  bookmark=bookmark,
+                                  firstRecord=firstRecordIdx)
     return FileRecordStream(streamID=filePath,
                             write=False,
                             bookmark=bookmark,
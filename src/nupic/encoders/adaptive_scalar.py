@@ -169,6 +169,16 @@ class AdaptiveScalarEncoder(ScalarEncoder):
 
     super(AdaptiveScalarEncoder, self).encodeIntoArray(input, output)
 
+
+  def encodeBatch(self, values, output, learn=None):
+    """
+    [overrides nupic.encoders.scalar.ScalarEncoder.encodeBatch]
+
+    The range adapts to every input, so the values are encoded one at a time.
+    """
+    for i, value in enumerate(values):
+      self.encodeIntoArray(value, output[i], learn)
+
   def getBucketInfo(self, buckets):
     """
     [overrides nupic.encoders.scalar.ScalarEncoder.getBucketInfo]
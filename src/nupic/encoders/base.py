@@ -99,6 +99,23 @@ class Encoder(Serializable):
     raise NotImplementedError()
 
 
+  def encodeBatch(self, values, output):
+    """
+    Encodes a sequence of values into the rows of the numpy output array. Row
+    ``i`` receives the same encoding that :meth:`.encodeIntoArray` would give
+    ``values[i]``, with any encoder state updated in the same order.
+
+    This implementation encodes one value at a time. Encoders that can encode
+    a whole column with array operations override it.
+
+    :param values: sequence of the values to encode
+    :param output: numpy 2-D array with one row per value and at least
+           :meth:`.getWidth` columns.
+    """
+    for i, value in enumerate(values):
+      self.encodeIntoArray(value, output[i])
+
+
   def setLearning(self, learningEnabled):
     """Set whether learning is enabled.
 
@@ -122,6 +122,16 @@ class CategoryEncoder(Encoder):
       print "decoded:", self.decodedToStr(self.decode(output))
 
 
+  def encodeBatch(self, values, output):
+    """ See method description in base.py """
+    # if not found, we encode category 0; missing values become NaN, which the
+    # scalar encoder encodes as all 0's
+    indices = [numpy.nan if value == SENTINEL_VALUE_FOR_MISSING_DATA
+               else self.categoryToIndex.get(value, 0)
+               for value in values]
+    self.encoder.encodeBatch(indices, output)
+
+
   def decode(self, encoded, parentFieldName=''):
     """ See the function description in base.py
     """
@@ -23,6 +23,12 @@ if capnp:
   from nupic.encoders.coordinate_capnp import CoordinateEncoderProto
 
 
+# Constants of the vectorized coordinate hash (golden ratio increment of
+# SplitMix64, and an arbitrary seed).
+_HASH_INCREMENT = numpy.uint64(0x9e3779b97f4a7c15)
+_HASH_SEED = numpy.uint64(0x6a09e667f3bcc909)
+
+
 class CoordinateEncoder(Encoder):
   """
   Given a coordinate in an N-dimensional space, and a radius around
@@ -48,9 +54,20 @@ class CoordinateEncoder(Encoder):
   5. This results in a final SDR with exactly W bits active (barring chance hash
      collisions).
 
+  By default the order and bit of a coordinate are derived from the MD5 hash
+  of its string representation. Computing them is expensive, so they are kept
+  in a least recently used cache of up to `cacheSize` coordinates; encodings of
+  nearby coordinates, e.g. consecutive GPS readings, share most of their
+  neighbors and mostly hit the cache. Setting `cacheSize` to 0 disables it.
+
+  With `vectorizedHash`, the order and bit of all the neighbors are instead
+  computed at once with an integer hash of the coordinate arrays. The
+  encodings have the same properties but differ from the default ones, so an
+  encoder must not change hashing once a model has learned its encodings.
   """
 
-  def __init__(self, w=21, n=1000, name=None, verbosity=0):
+  def __init__(self, w=21, n=1000, name=None, verbosity=0, cacheSize=32768,
+               vectorizedHash=False):
     # Validate inputs
     if (w <= 0) or (w % 2 == 0):
       raise ValueError("w must be an odd positive integer")
@@ -60,10 +77,16 @@ class CoordinateEncoder(Encoder):
                        "good results we recommend n be strictly greater "
                        "than 11*w")
 
+    if cacheSize < 0:
+      raise ValueError("cacheSize must be a non-negative integer")
+
     self.w = w
     self.n = n
     self.verbosity = verbosity
+    self.cacheSize = cacheSize
+    self.vectorizedHash = vectorizedHash
     self.encoders = None
+    self._initCache()
 
     if name is None:
       name = "[%s:%s]" % (self.n, self.w)
@@ -99,10 +122,20 @@ class CoordinateEncoder(Encoder):
                                      .format(radius, type(radius)))
 
     neighbors = self._neighbors(coordinate, radius)
-    winners = self._topWCoordinates(neighbors, self.w)
 
-    bitFn = lambda coordinate: self._bitForCoordinate(coordinate, self.n)
-    indices = numpy.array([bitFn(w) for w in winners])
+    if self.vectorizedHash:
+      hashes = self._hashCoordinates(neighbors)
+      winners = numpy.argsort(self._ordersForHashes(hashes))[-self.w:]
+      indices = self._bitsForHashes(hashes[winners], self.n)
+    elif self.cacheSize:
+      entries = self._cachedOrdersAndBits(neighbors)
+      orders = numpy.array([entry[0] for entry in entries])
+      winners = numpy.argsort(orders)[-self.w:]
+      indices = numpy.array([entries[i][1] for i in winners.tolist()])
+    else:
+      winners = self._topWCoordinates(neighbors, self.w)
+      bitFn = lambda coordinate: self._bitForCoordinate(coordinate, self.n)
+      indices = numpy.array([bitFn(w) for w in winners])
 
     output[:] = 0
     output[indices] = 1
@@ -117,10 +150,127 @@ class CoordinateEncoder(Encoder):
     @param coordinate (numpy.array) N-dimensional integer coordinate
     @param radius (int) Radius around `coordinate`
 
-    @return (numpy.array) List of coordinates
+    @return (numpy.array) List of coordinates, in lexicographic order
+    """
+    coordinate = numpy.asarray(coordinate, dtype=numpy.int64)
+    offsets = numpy.indices((2 * radius + 1,) * len(coordinate))
+    offsets = offsets.reshape(len(coordinate), -1).T
+    return offsets + (coordinate - radius)
+
+
+  def _initCache(self):
+    self._cache = {}
+    self._cacheStamp = 0
+
+
+  def _cachedOrdersAndBits(self, coordinates):
+    """
+    Returns the order and bit of each coordinate, computing only those that
+    are not in the cache.
+
+    @param coordinates (numpy.array) A 2D numpy array, where each element
+                                     is a coordinate
+    @return (list) [order, bit, last use] cache entry of each coordinate
+    """
+    cache = self._cache
+    self._cacheStamp += 1
+    stamp = self._cacheStamp
+
+    entries = []
+    for key in itertools.imap(tuple, coordinates.tolist()):
+      entry = cache.get(key)
+      if entry is None:
+        seed = self._hashCoordinate(key)
+        entry = [Random(seed).getReal64(), Random(seed).getUInt32(self.n),
+                 stamp]
+        cache[key] = entry
+      else:
+        entry[2] = stamp
+      entries.append(entry)
+
+    if len(cache) > self.cacheSize:
+      self._evictLeastRecentlyUsed()
+
+    return entries
+
+
+  def _evictLeastRecentlyUsed(self):
+    """
+    Shrinks the cache to half its capacity, keeping the most recently used
+    coordinates. Evicting in bulk keeps the cost of tracking recency down to
+    one stamp per lookup.
+    """
+    keep = self.cacheSize // 2
+    if keep == 0:
+      self._cache.clear()
+      return
+
+    stamps = sorted(entry[2] for entry in self._cache.itervalues())
+    oldestKept = stamps[-keep]
+    stale = [key for key, entry in self._cache.iteritems()
+             if entry[2] < oldestKept]
+    for key in stale:
+      del self._cache[key]
+
+
+  @staticmethod
+  def _mixHashes(hashes):
+    """
+    Scrambles 64 bit integers in place with the SplitMix64 finalizer.
+
+    @param hashes (numpy.array) uint64 values
+    @return (numpy.array) `hashes`
     """
-    ranges = (xrange(n-radius, n+radius+1) for n in coordinate.tolist())
-    return numpy.array(list(itertools.product(*ranges)))
+    hashes ^= hashes >> numpy.uint64(30)
+    hashes *= numpy.uint64(0xbf58476d1ce4e5b9)
+    hashes ^= hashes >> numpy.uint64(27)
+    hashes *= numpy.uint64(0x94d049bb133111eb)
+    hashes ^= hashes >> numpy.uint64(31)
+    return hashes
+
+
+  @classmethod
+  def _hashCoordinates(cls, coordinates):
+    """
+    Hashes many coordinates to 64 bit integers at once.
+
+    @param coordinates (numpy.array) A 2D numpy array, where each element
+                                     is a coordinate
+    @return (numpy.array) uint64 hash of each coordinate
+    """
+    coordinates = coordinates.astype(numpy.int64).view(numpy.uint64)
+    hashes = numpy.full(len(coordinates), _HASH_SEED, dtype=numpy.uint64)
+    for dimension in xrange(coordinates.shape[1]):
+      hashes += _HASH_INCREMENT
+      hashes ^= coordinates[:, dimension]
+      cls._mixHashes(hashes)
+    return hashes
+
+
+  @staticmethod
+  def _ordersForHashes(hashes):
+    """
+    Returns the order of coordinates from their `_hashCoordinates` hashes.
+
+    @param hashes (numpy.array) uint64 hashes
+    @return (numpy.array) Values in the interval [0, 1)
+    """
+    return (hashes >> numpy.uint64(11)) * (1.0 / (1 << 53))
+
+
+  @classmethod
+  def _bitsForHashes(cls, hashes, n):
+    """
+    Maps coordinates to bits in the SDR from their `_hashCoordinates` hashes.
+    The bits are drawn from a second round of mixing, so that they are
+    independent of the orders.
+
+    @param hashes (numpy.array) uint64 hashes
+    @param n (int) The number of available bits in the SDR
+    @return (numpy.array) The index to a bit in the SDR for each hash
+    """
+    bits = cls._mixHashes(hashes + _HASH_INCREMENT)
+    return (bits % numpy.uint64(n)).astype(numpy.int64)
 
 
   @classmethod
@@ -183,6 +333,23 @@ class CoordinateEncoder(Encoder):
     string += "\n  n:   {n}".format(n=self.n)
     return string
 
+
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    del state["_cache"]
+    del state["_cacheStamp"]
+    return state
+
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    # Encoders pickled before the cache existed
+    if "cacheSize" not in state:
+      self.cacheSize = 0
+      self.vectorizedHash = False
+    self._initCache()
+
+
   @classmethod
   def getSchema(cls):
     return CoordinateEncoderProto
@@ -195,7 +362,10 @@ class CoordinateEncoder(Encoder):
     encoder.n = proto.n
     encoder.verbosity = proto.verbosity
     encoder.name = proto.name
+    encoder.cacheSize = proto.cacheSize
+    encoder.vectorizedHash = proto.vectorizedHash
     encoder.encoders = None
+    encoder._initCache()
     return encoder
 
 
@@ -204,3 +374,5 @@ class CoordinateEncoder(Encoder):
     proto.n = self.n
     proto.verbosity = self.verbosity
     proto.name = self.name
+    proto.cacheSize = self.cacheSize
+    proto.vectorizedHash = self.vectorizedHash
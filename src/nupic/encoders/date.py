@@ -71,15 +71,22 @@ class DateEncoder(Encoder):
       - Each holiday is either (month, day) or (year, month, day).
         The former will use the same month day every year eg: (12, 25) for Christmas.
         The latter will be a one off holiday eg: (2018, 4, 1) for Easter Sunday 2018
+
+  :param useLookupTables: (bool) if True, the holiday dates of each year are
+         computed once, and the active bits of each sub-field are cached by
+         bucket, so that repeated sub-encodings, e.g. the season of hourly
+         records, are looked up instead of recomputed. The encodings are
+         identical either way.
   """
 
 
   def __init__(self, season=0, dayOfWeek=0, weekend=0, holiday=0, timeOfDay=0, customDays=0,
-                name='', forced=True, holidays=()):
+                name='', forced=True, holidays=(), useLookupTables=False):
 
     self.width = 0
     self.description = []
     self.name = name
+    self.useLookupTables = useLookupTables
 
     # This will contain a list of (name, encoder, offset) tuples for use by
     #  the decode() method
@@ -218,6 +225,23 @@ class DateEncoder(Encoder):
       self.description.append(("time of day", self.timeOfDayOffset))
       self.encoders.append(("time of day", self.timeOfDayEncoder, self.timeOfDayOffset))
 
+    self._initLookupTables()
+
+
+  def _initLookupTables(self):
+    # Holiday dates by year, and active bits by first on bit for each
+    # sub-encoder, filled as they are needed.
+    self._holidayDatesByYear = {}
+    self._bucketBits = [{} for _ in self.encoders]
+
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    # Encoders pickled before the lookup tables existed
+    if "useLookupTables" not in state:
+      self.useLookupTables = False
+      self._initLookupTables()
+
 
   def getWidth(self):
     return self.width
@@ -300,19 +324,13 @@ class DateEncoder(Encoder):
     if self.holidayEncoder is not None:
       # A "continuous" binary value. = 1 on the holiday itself and smooth ramp
       #  0->1 on the day before the holiday and 1->0 on the day after the holiday.
-      # Currently the only holiday we know about is December 25
-      # holidays is a list of holidays that occur on a fixed date every year
-      if len(self.holidays) == 0:
-        holidays = [(12, 25)]
+      if self.useLookupTables:
+        hdates = self._holidayDates(timetuple.tm_year)
       else:
-        holidays = self.holidays
+        hdates = (self._holidayDate(h, timetuple.tm_year)
+                  for h in self._getHolidays())
       val = 0
-      for h in holidays:
-        # hdate is midnight on the holiday
-        if len(h) == 3:
-          hdate = datetime.datetime(h[0], h[1], h[2], 0, 0, 0)
-        else:
-          hdate = datetime.datetime(timetuple.tm_year, h[0], h[1], 0, 0, 0)
+      for hdate in hdates:
         if input > hdate:
           diff = input - hdate
           if diff.days == 0:
@@ -337,6 +355,180 @@ class DateEncoder(Encoder):
     return values
 
 
+  def _getHolidays(self):
+    """
+    Returns the holidays as (month, day) or (year, month, day) tuples.
+    """
+    # Currently the only holiday we know about is December 25
+    # holidays is a list of holidays that occur on a fixed date every year
+    if len(self.holidays) == 0:
+      return [(12, 25)]
+    return self.holidays
+
+
+  @staticmethod
+  def _holidayDate(holiday, year):
+    """
+    Returns midnight on a holiday.
+
+    :param holiday: (tuple) (month, day) or (year, month, day)
+    :param year: (int) year of the holidays given as (month, day)
+    :returns: (datetime)
+    """
+    if len(holiday) == 3:
+      return datetime.datetime(holiday[0], holiday[1], holiday[2], 0, 0, 0)
+    return datetime.datetime(year, holiday[0], holiday[1], 0, 0, 0)
+
+
+  def _holidayDates(self, year):
+    """
+    Returns midnight on each holiday of a year, in the order of the holidays,
+    computing them the first time the year is seen.
+
+    :param year: (int) year
+    :returns: (list) of datetime
+    """
+    hdates = self._holidayDatesByYear.get(year)
+    if hdates is None:
+      hdates = [self._holidayDate(h, year) for h in self._getHolidays()]
+      self._holidayDatesByYear[year] = hdates
+    return hdates
+
+
+  def _getBucketBits(self, i, scalar):
+    """
+    Returns the indices of the bits that sub-encoder ``i`` sets for a value,
+    relative to the start of this encoder's output.
+
+    The output of a :class:`~.nupic.encoders.scalar.ScalarEncoder` is fully
+    determined by its first on bit, so the indices are cached by that bit.
+
+    :param i: (int) position of the sub-encoder in ``self.encoders``
+    :param scalar: (float) value of the sub-field
+    :returns: (numpy.array) bit indices
+    """
+    (_, encoder, offset) = self.encoders[i]
+    firstOnBit = encoder._getFirstOnBit(scalar)[0]
+    bits = self._bucketBits[i].get(firstOnBit)
+    if bits is None:
+      bits = firstOnBit + numpy.arange(2 * encoder.halfwidth + 1)
+      if encoder.periodic:
+        bits %= encoder.n
+      bits += offset
+      self._bucketBits[i][firstOnBit] = bits
+    return bits
+
+
+  def _getColumnScalars(self, values):
+    """
+    Computes the scalar values of the sub-fields of many dates at once. The
+    values are the same as those returned by :meth:`getScalars`.
+
+    :param values: (numpy.array) datetime64 dates, none of which are NaT
+    :returns: (numpy.array) 2D array with the scalars of each date in a row
+    """
+    microseconds = values.astype("M8[us]")
+    days = microseconds.astype("M8[D]")
+    years = days.astype("M8[Y]")
+    minutesOfDay = (microseconds.astype("M8[m]") - days).astype(numpy.int64)
+    # 1970-01-01 was a Thursday, and Monday = 0 as in datetime.timetuple()
+    weekdays = (days.astype(numpy.int64) + 3) % 7
+    timeOfDay = minutesOfDay // 60 + (minutesOfDay % 60) / 60.0
+
+    columns = []
+    if self.seasonEncoder is not None:
+      columns.append((days - years.astype("M8[D]")).astype(numpy.int64))
+
+    if self.dayOfWeekEncoder is not None:
+      columns.append(weekdays + timeOfDay / 24.0)
+
+    if self.weekendEncoder is not None:
+      # saturday, sunday or friday evening
+      columns.append((weekdays == 6) | (weekdays == 5) |
+                     ((weekdays == 4) & (timeOfDay > 18)))
+
+    if self.customDaysEncoder is not None:
+      columns.append(numpy.in1d(weekdays, self.customDays))
+
+    if self.holidayEncoder is not None:
+      columns.append(self._getColumnHolidays(microseconds, years))
+
+    if self.timeOfDayEncoder is not None:
+      columns.append(timeOfDay)
+
+    return numpy.column_stack(columns).astype(numpy.float64)
+
+
+  def _getColumnHolidays(self, microseconds, years):
+    """
+    Computes the holiday sub-field of many dates at once, following the same
+    steps as :meth:`getEncodedValues`.
+
+    :param microseconds: (numpy.array) datetime64[us] dates
+    :param years: (numpy.array) datetime64[Y] years of the dates
+    :returns: (numpy.array) holiday values
+    """
+    uniqueYears, yearIndices = numpy.unique(years, return_inverse=True)
+    hdatesByYear = numpy.array(
+      [self._holidayDates(year.item().year) for year in uniqueYears],
+      dtype="M8[us]").reshape(len(uniqueYears), -1)
+
+    usPerDay = 86400 * 10 ** 6
+    val = numpy.zeros(len(microseconds))
+    done = numpy.zeros(len(microseconds), dtype=bool)
+    for hdates in hdatesByYear.T:
+      delta = (microseconds - hdates[yearIndices]).astype(numpy.int64)
+      after = delta > 0
+      diff = numpy.abs(delta)
+      diffDays = diff // usPerDay
+      diffSeconds = (diff % usPerDay) // 10 ** 6
+      ramp = 1.0 - (diffSeconds / 86400.0)
+
+      # 1 on the holiday itself
+      onHoliday = ~done & after & (diffDays == 0)
+      val[onHoliday] = 1
+      # ramp smoothly from 1 -> 0 on the next day
+      nextDay = ~done & after & (diffDays == 1)
+      val[nextDay] = ramp[nextDay]
+      # ramp smoothly from 0 -> 1 on the previous day
+      previousDay = ~done & ~after & (diffDays == 0)
+      val[previousDay] = ramp[previousDay]
+      done |= onHoliday | nextDay
+
+    return val
+
+
+  def encodeColumn(self, values, output):
+    """
+    Encodes many dates at once into the rows of ``output``. The rows are
+    identical to the output of :meth:`encodeIntoArray` for each date.
+
+    The sub-field scalars are computed with array operations, and the active
+    bits of each distinct sub-field bucket are computed once.
+
+    :param values: (numpy.array) datetime64 dates, or an iterable of datetime.
+           NaT is encoded as missing data.
+    :param output: (numpy.array) 2D array with one row of width
+           :meth:`getWidth` per date
+    """
+    values = numpy.asarray(values, dtype="M8[us]")
+    output[:len(values), :self.width] = 0
+
+    # NaT is stored as the smallest int64
+    rows = numpy.flatnonzero(values.view(numpy.int64) !=
+                             numpy.iinfo(numpy.int64).min)
+    if not len(rows):
+      return
+
+    scalars = self._getColumnScalars(values[rows])
+    for i in xrange(len(self.encoders)):
+      uniqueScalars, inverse = numpy.unique(scalars[:, i],
+                                            return_inverse=True)
+      bits = numpy.array([self._getBucketBits(i, scalar)
+                          for scalar in uniqueScalars])
+      output[rows[:, numpy.newaxis], bits[inverse]] = 1
+
+
   def getScalars(self, input):
     """
     See method description in :meth:`~.nupic.encoders.base.Encoder.getScalars`.
@@ -384,12 +576,24 @@ class DateEncoder(Encoder):
 
       # Get the scalar values for each sub-field
       scalars = self.getScalars(input)
+
+      if self.useLookupTables:
+        output[:self.width] = 0
+        for i in xrange(len(self.encoders)):
+          output[self._getBucketBits(i, scalars[i])] = 1
+        return
+
       # Encoder each sub-field
       for i in xrange(len(self.encoders)):
         (name, encoder, offset) = self.encoders[i]
         encoder.encodeIntoArray(scalars[i], output[offset:])
 
 
+  def encodeBatch(self, values, output):
+    """ See method description in base.py """
+    self.encodeColumn(values, output)
+
+
   def getDescription(self):
     return self.description
 
@@ -404,6 +608,7 @@ class DateEncoder(Encoder):
     encoder.description = []
     encoder.width = 0
     encoder.name = proto.name
+    encoder.useLookupTables = proto.useLookupTables
 
     def addEncoder(encoderAttr, offsetAttr):
       protoVal = getattr(proto, encoderAttr)
@@ -425,10 +630,12 @@ class DateEncoder(Encoder):
     addEncoder("holidayEncoder", "holidayOffset")
     addEncoder("timeOfDayEncoder", "timeOfDayOffset")
 
+    encoder._initLookupTables()
     return encoder
 
 
   def write(self, proto):
+    proto.useLookupTables = self.useLookupTables
     for name in ("seasonEncoder",
                  "dayOfWeekEncoder",
                  "weekendEncoder",
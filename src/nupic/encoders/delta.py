@@ -9,9 +9,12 @@
 
 import numbers
 
+import numpy
+
 from nupic.data import SENTINEL_VALUE_FOR_MISSING_DATA
 from nupic.encoders.adaptive_scalar import AdaptiveScalarEncoder
 from nupic.encoders.base import EncoderResult
+from nupic.encoders.utils import scalarsToArray
 
 try:
   import capnp
@@ -71,6 +74,39 @@ class DeltaEncoder(AdaptiveScalarEncoder):
       return output
 
 
+  def encodeBatch(self, values, output, learn=None):
+    """
+    [overrides nupic.encoders.adaptive_scalar.AdaptiveScalarEncoder.encodeBatch]
+
+    The deltas of the whole column are computed at once. They are then encoded
+    one at a time, as the range of the adaptive encoder depends on every
+    previous delta.
+    """
+    values = scalarsToArray(values, allowMissing=False)
+    if not len(values):
+      return
+
+    if learn is None:
+      learn = self._learningEnabled
+
+    #make the first delta zero so that the delta ranges are not messed up.
+    if self._prevAbsolute is None:
+      self._prevAbsolute = values[0].item()
+
+    if self._stateLock:
+      previous = self._prevAbsolute
+    else:
+      previous = numpy.concatenate(([self._prevAbsolute], values[:-1]))
+    deltas = values - previous
+
+    for i, delta in enumerate(deltas.tolist()):
+      self._adaptiveScalarEnc.encodeIntoArray(delta, output[i], learn)
+
+    if not self._stateLock:
+      self._prevAbsolute = values[-1].item()
+      self._prevDelta = deltas[-1].item()
+
+
   def setStateLock(self, lock):
     self._stateLock = lock
 
@@ -39,6 +39,9 @@ class GeospatialCoordinateEncoder(CoordinateEncoder):
   :param: scale (int) Scale of the map, as measured by distance between two
           coordinates (in meters per dimensional unit)
   :param: timestep (int) Time between readings (in seconds)
+
+  See `nupic.encoders.coordinate.CoordinateEncoder` for `cacheSize` and
+  `vectorizedHash`.
   """
 
   def __init__(self,
@@ -47,11 +50,16 @@ class GeospatialCoordinateEncoder(CoordinateEncoder):
                w=21,
                n=1000,
                name=None,
-               verbosity=0):
-    super(GeospatialCoordinateEncoder, self).__init__(w=w,
-                                                      n=n,
-                                                      name=name,
-                                                      verbosity=verbosity)
+               verbosity=0,
+               cacheSize=32768,
+               vectorizedHash=False):
+    super(GeospatialCoordinateEncoder, self).__init__(
+      w=w,
+      n=n,
+      name=name,
+      verbosity=verbosity,
+      cacheSize=cacheSize,
+      vectorizedHash=vectorizedHash)
 
     self.scale = scale
     self.timestep = timestep
@@ -7,6 +7,7 @@
 # license that can be found in the LICENSE file or at
 # https://opensource.org/licenses/MIT.
 
+import itertools
 import math
 
 import numpy
@@ -14,6 +15,7 @@ from nupic.data import SENTINEL_VALUE_FOR_MISSING_DATA
 from nupic.data.field_meta import FieldMetaType
 from nupic.encoders.base import Encoder, EncoderResult
 from nupic.encoders import ScalarEncoder
+from nupic.encoders.utils import scalarsToArray
 try:
   import capnp
 except ImportError:
@@ -165,6 +167,20 @@ class LogEncoder(Encoder):
         print "decoded:", self.decodedToStr(self.decode(output))
 
 
+  def encodeBatch(self, inpts, output):
+    """
+    See the function description in base.py
+    """
+    # Missing values are NaN, which stay NaN and are encoded as all 0's
+    values = numpy.clip(scalarsToArray(inpts), self.minval, self.maxval)
+
+    # math.log10, as in _getScaledValue, keeps the scaled values bit-identical
+    # to those of encodeIntoArray.
+    scaledValues = numpy.fromiter(itertools.imap(math.log10, values.tolist()),
+                                  dtype=numpy.float64, count=len(values))
+    self.encoder.encodeBatch(scaledValues, output)
+
+
   def decode(self, encoded, parentFieldName=''):
     """
     See the function description in base.py
@@ -94,6 +94,22 @@ class MultiEncoder(Encoder):
         encoder.encodeIntoArray(self._getInputValue(obj, name), output[offset:])
 
 
+  def encodeBatch(self, records, output):
+    """
+    Encodes a block of records column-wise: the values of each field are
+    gathered from all the records and encoded by a single
+    :meth:`~.nupic.encoders.base.Encoder.encodeBatch` call of its encoder.
+
+    :param records: sequence of records, each a dict or an object with the
+           field names as attributes
+    :param output: numpy 2-D array with one row per record and at least
+           :meth:`.getWidth` columns
+    """
+    for name, encoder, offset in self.encoders:
+      column = [self._getInputValue(record, name) for record in records]
+      encoder.encodeBatch(column, output[:, offset:offset + encoder.getWidth()])
+
+
   def getDescription(self):
     return self.description
 
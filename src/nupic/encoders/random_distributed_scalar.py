@@ -16,6 +16,7 @@ import numpy
 from nupic.data import SENTINEL_VALUE_FOR_MISSING_DATA
 from nupic.data.field_meta import FieldMetaType
 from nupic.encoders.base import Encoder
+from nupic.encoders.utils import scalarsToArray
 from nupic.bindings.math import Random as NupicRandom
 
 try:
@@ -106,11 +107,19 @@ class RandomDistributedScalarEncoder(Encoder):
                   encode operation. verbosity>2 may lead to significantly
                   more output.
 
+  :param prebuildBuckets: If True, the representations of all buckets are
+                  created at construction instead of when a value first
+                  falls into them, so that encoding never pays for bucket
+                  creation. Buckets are then created from the middle bucket
+                  up to the highest index and from there down to 0, so the
+                  representations differ from those of an encoder that
+                  creates them on demand with the same seed.
+
   """
 
 
   def __init__(self, resolution, w=21, n=400, name=None, offset=None,
-               seed=42, verbosity=0):
+               seed=42, verbosity=0, prebuildBuckets=False):
     # Validate inputs
     if (w <= 0) or (w%2 == 0):
       raise ValueError("w must be an odd positive integer")
@@ -140,6 +149,9 @@ class RandomDistributedScalarEncoder(Encoder):
     self.maxIndex = None
     self._offset = None
     self._initializeBucketMap(INITIAL_BUCKETS, offset)
+    if prebuildBuckets:
+      self._createBucket(self._maxBuckets - 1)
+      self._createBucket(0)
 
     # A name used for debug printouts
     if name is not None:
@@ -160,6 +172,9 @@ class RandomDistributedScalarEncoder(Encoder):
     if isinstance(randomState, numpy.random.mtrand.RandomState):
       self.random = NupicRandom(randomState.randint(sys.maxint))
 
+    if "_bucketBits" not in state:
+      self._initializeBucketBits()
+
 
   def _seed(self, seed=-1):
     """
@@ -245,33 +260,72 @@ class RandomDistributedScalarEncoder(Encoder):
       output[self.mapBucketIndexToNonZeroBits(bucketIdx)] = 1
 
 
+  def encodeBatch(self, values, output):
+    """ See method description in base.py """
+
+    values = scalarsToArray(values)
+    output[:len(values), 0:self.n] = 0
+
+    # None and NaN are missing values, which are encoded as all 0's
+    rows = numpy.flatnonzero(~numpy.isnan(values))
+    if not len(rows):
+      return
+    values = values[rows]
+
+    if self._offset is None:
+      self._offset = values[0].item()
+
+    # Same as int(round(x)) in getBucketIndices: round() rounds halfway cases
+    # away from zero, whereas numpy.round rounds them to even.
+    scaled = (values - self._offset) / self.resolution
+    magnitude = numpy.abs(scaled)
+    rounded = numpy.floor(magnitude)
+    rounded += (magnitude - rounded) >= 0.5
+    bucketIndices = ((self._maxBuckets/2) +
+                     numpy.copysign(rounded, scaled).astype(numpy.int64))
+    numpy.clip(bucketIndices, 0, self._maxBuckets-1, out=bucketIndices)
+
+    # Only values beyond the range of buckets seen so far create buckets, so
+    # visiting the rows where the running min or max moves creates them in the
+    # same order as sequential encoding.
+    lowest = numpy.minimum.accumulate(bucketIndices)
+    highest = numpy.maximum.accumulate(bucketIndices)
+    extends = numpy.r_[True, (lowest[1:] < lowest[:-1]) |
+                             (highest[1:] > highest[:-1])]
+    for index in bucketIndices[extends].tolist():
+      self.mapBucketIndexToNonZeroBits(index)
+
+    output[rows[:, numpy.newaxis], self._bucketBits[bucketIndices]] = 1
+
+
   def _createBucket(self, index):
     """
-    Create the given bucket index. Recursively create as many in-between
-    bucket indices as necessary.
+    Create the given bucket index, and all the bucket indices between it and
+    the existing ones, each from the one next to it.
     """
-    if index < self.minIndex:
-      if index == self.minIndex - 1:
-        # Create a new representation that has exactly w-1 overlapping bits
-        # as the min representation
-        self.bucketMap[index] = self._newRepresentation(self.minIndex,
-                                                        index)
-        self.minIndex = index
-      else:
-        # Recursively create all the indices above and then this index
-        self._createBucket(index+1)
-        self._createBucket(index)
-    else:
-      if index == self.maxIndex + 1:
-        # Create a new representation that has exactly w-1 overlapping bits
-        # as the max representation
-        self.bucketMap[index] = self._newRepresentation(self.maxIndex,
-                                                        index)
-        self.maxIndex = index
-      else:
-        # Recursively create all the indices below and then this index
-        self._createBucket(index-1)
-        self._createBucket(index)
+    while index < self.minIndex:
+      # Create a new representation that has exactly w-1 overlapping bits
+      # as the min representation
+      self._addBucket(self.minIndex - 1,
+                      self._newRepresentation(self.minIndex,
+                                              self.minIndex - 1))
+      self.minIndex -= 1
+
+    while index > self.maxIndex:
+      # Create a new representation that has exactly w-1 overlapping bits
+      # as the max representation
+      self._addBucket(self.maxIndex + 1,
+                      self._newRepresentation(self.maxIndex,
+                                              self.maxIndex + 1))
+      self.maxIndex += 1
+
+
+  def _addBucket(self, index, representation):
+    """
+    Store the representation of a new bucket index.
+    """
+    self.bucketMap[index] = representation
+    self._bucketBits[index] = representation
 
 
   def _newRepresentation(self, index, newIndex):
@@ -288,72 +342,54 @@ class RandomDistributedScalarEncoder(Encoder):
     ri = newIndex % self.w
 
     # Now we choose a bit such that the overlap rules are satisfied.
+    allowedBits = self._allowedNewBits(newRepresentation, ri, newIndex)
     newBit = self.random.getUInt32(self.n)
-    newRepresentation[ri] = newBit
-    while newBit in self.bucketMap[index] or \
-          not self._newRepresentationOK(newRepresentation, newIndex):
+    while not allowedBits[newBit]:
       self.numTries += 1
       newBit = self.random.getUInt32(self.n)
-      newRepresentation[ri] = newBit
+    newRepresentation[ri] = newBit
 
     return newRepresentation
 
 
-  def _newRepresentationOK(self, newRep, newIndex):
+  def _allowedNewBits(self, representation, ri, newIndex):
     """
-    Return True if this new candidate representation satisfies all our overlap
-    rules. Since we know that neighboring representations differ by at most
-    one bit, we compute running overlaps.
+    Return a boolean array of the bits that can replace bit ri of
+    representation such that the result is a valid representation for newIndex,
+    i.e. it is not already in representation and all our overlap rules are
+    satisfied. Since all existing buckets have w bits, each rule either
+    requires the new bit to be in a bucket, forbids it, or holds regardless.
     """
-    if newRep.size != self.w:
-      return False
     if (newIndex < self.minIndex-1) or (newIndex > self.maxIndex+1):
       raise ValueError("newIndex must be within one of existing indices")
 
-    # A binary representation of newRep. We will use this to test containment
-    newRepBinary = numpy.array([False]*self.n)
-    newRepBinary[newRep] = True
-
-    # Midpoint
-    midIdx = self._maxBuckets/2
-
-    # Start by checking the overlap at minIndex
-    runningOverlap = self._countOverlap(self.bucketMap[self.minIndex], newRep)
-    if not self._overlapOK(self.minIndex, newIndex, overlap=runningOverlap):
-      return False
-
-    # Compute running overlaps all the way to the midpoint
-    for i in range(self.minIndex+1, midIdx+1):
-      # This is the bit that is going to change
-      newBit = (i-1)%self.w
-
-      # Update our running overlap
-      if newRepBinary[self.bucketMap[i-1][newBit]]:
-        runningOverlap -= 1
-      if newRepBinary[self.bucketMap[i][newBit]]:
-        runningOverlap += 1
-
-      # Verify our rules
-      if not self._overlapOK(i, newIndex, overlap=runningOverlap):
-        return False
-
-    # At this point, runningOverlap contains the overlap for midIdx
-    # Compute running overlaps all the way to maxIndex
-    for i in range(midIdx+1, self.maxIndex+1):
-      # This is the bit that is going to change
-      newBit = i%self.w
-
-      # Update our running overlap
-      if newRepBinary[self.bucketMap[i-1][newBit]]:
-        runningOverlap -= 1
-      if newRepBinary[self.bucketMap[i][newBit]]:
-        runningOverlap += 1
-
-      # Verify our rules
-      if not self._overlapOK(i, newIndex, overlap=runningOverlap):
-        return False
+    allowedBits = numpy.ones(self.n, dtype=bool)
+    allowedBits[representation] = False
+
+    # Overlaps of the existing buckets with the representation without bit ri
+    otherBits = numpy.delete(representation, ri)
+    inOtherBits = numpy.zeros(self.n, dtype=bool)
+    inOtherBits[otherBits] = True
+    indices = numpy.arange(self.minIndex, self.maxIndex+1)
+    bucketBits = self._bucketBits[self.minIndex:self.maxIndex+1]
+    overlaps = inOtherBits[bucketBits].sum(axis=1)
+
+    # The number of overlapping bits the new bit must add to satisfy the rule
+    # of each bucket: exactly this many for the buckets within w indices of
+    # newIndex, at most this many for the others.
+    distances = numpy.abs(indices - newIndex)
+    near = distances < self.w
+    missing = numpy.where(near, self.w - distances, self._maxOverlap) - overlaps
+
+    if (missing < 0).any() or (missing[near] > 1).any():
+      allowedBits[:] = False
+    else:
+      required = near & (missing == 1)
+      allowedBits &= (numpy.bincount(bucketBits[required].ravel(),
+                                     minlength=self.n) == required.sum())
+      allowedBits[bucketBits[missing == 0]] = False
 
-    return True
+    return allowedBits
 
 
   def _countOverlapIndices(self, i, j):
@@ -434,6 +470,20 @@ class RandomDistributedScalarEncoder(Encoder):
     # How often we need to retry when generating valid encodings
     self.numTries = 0
 
+    self._initializeBucketBits()
+
+
+  def _initializeBucketBits(self):
+    """
+    Initialize the array of non-zero bits of every bucket index from the
+    bucket map, used to check the overlap rules and to encode batches of
+    values. Rows of the bucket indices that do not exist yet are unused.
+    """
+    self._bucketBits = numpy.zeros((self._maxBuckets, self.w),
+                                   dtype=numpy.uint32)
+    for index, representation in self.bucketMap.iteritems():
+      self._bucketBits[index] = representation
+
 
   def __str__(self):
     string =  "RandomDistributedScalarEncoder:"
@@ -478,6 +528,7 @@ class RandomDistributedScalarEncoder(Encoder):
     encoder.numTries = proto.numTries or 0
     encoder.bucketMap = {x.key: numpy.array(x.value, dtype=numpy.uint32)
                          for x in proto.bucketMap}
+    encoder._initializeBucketBits()
 
     return encoder
 
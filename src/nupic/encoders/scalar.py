@@ -16,6 +16,7 @@ from nupic.data import SENTINEL_VALUE_FOR_MISSING_DATA
 from nupic.data.field_meta import FieldMetaType
 from nupic.bindings.math import SM32, GetNTAReal
 from nupic.encoders.base import Encoder, EncoderResult
+from nupic.encoders.utils import scalarsToArray
 
 try:
   import capnp
@@ -382,6 +383,32 @@ class ScalarEncoder(Encoder):
       return [minbin]
 
 
+  def _getFirstOnBits(self, values):
+    """ Vectorized version of _getFirstOnBit, for a float array without
+    missing values. Out-of-range values are clipped or rejected exactly as
+    _getFirstOnBit does. """
+
+    if self.clipInput and not self.periodic:
+      values = numpy.clip(values, self.minval, self.maxval)
+    else:
+      if self.periodic:
+        outOfRange = (values < self.minval) | (values >= self.maxval)
+      else:
+        outOfRange = (values < self.minval) | (values > self.maxval)
+      if outOfRange.any():
+        # Report the first offending value, like a sequential encoding would
+        self._getFirstOnBit(values[numpy.flatnonzero(outOfRange)[0]])
+
+    if self.periodic:
+      centerbins = ((values - self.minval) * self.nInternal / self.range)
+    else:
+      centerbins = ((values - self.minval) + self.resolution/2) \
+                     / self.resolution
+    centerbins = centerbins.astype(numpy.int64) + self.padding
+
+    return centerbins - self.halfwidth
+
+
   def getBucketIndices(self, input):
     """ See method description in base.py """
 
@@ -456,6 +483,28 @@ class ScalarEncoder(Encoder):
       print "input desc:", self.decodedToStr(self.decode(output))
 
 
+  def encodeBatch(self, values, output):
+    """ See method description in base.py """
+
+    values = scalarsToArray(values)
+    output[:len(values), :self.n] = 0
+
+    # None and NaN are missing values, which are encoded as all 0's
+    rows = numpy.flatnonzero(~numpy.isnan(values))
+    if not len(rows):
+      return
+
+    # Each row's bits start at its first on bit, and wrap around if periodic
+    bits = (self._getFirstOnBits(values[rows])[:, numpy.newaxis] +
+            numpy.arange(2*self.halfwidth + 1))
+    if self.periodic:
+      bits %= self.n
+
+    assert bits.min() >= 0
+    assert bits.max() < self.n
+    output[rows[:, numpy.newaxis], bits] = 1
+
+
   def decode(self, encoded, parentFieldName=''):
     """ See the function description in base.py
     """
@@ -239,6 +239,26 @@ class SDRCategoryEncoder(Encoder):
       print "decoded:", self.decodedToStr(self.decode(output))
 
 
+  def encodeBatch(self, values, output):
+    """ See method description in base.py """
+    indices = numpy.zeros(len(values), dtype=numpy.int64)
+    missingRows = []
+    for i, value in enumerate(values):
+      if value == SENTINEL_VALUE_FOR_MISSING_DATA:
+        missingRows.append(i)
+        continue
+      index = self.categoryToIndex.get(value)
+      if index is None:
+        # Adds the category if learning is enabled
+        index = self.getBucketIndices(value)[0]
+      indices[i] = index
+
+    # Rows of self.sdrs are kept when new categories make it grow, so it can be
+    # indexed once all the categories have been added.
+    output[:len(values), 0:self.n] = self.sdrs[indices]
+    output[missingRows, 0:self.n] = 0
+
+
   def decode(self, encoded, parentFieldName=''):
     """ See the function description in base.py
     """
@@ -8,6 +8,9 @@
 # https://opensource.org/licenses/MIT.
 
 from array import array
+import numbers
+
+import numpy
 
 
 
@@ -19,3 +22,23 @@ def bitsToString(arr):
       s[i]='*'
   return s
 
+
+
+def scalarsToArray(values, allowMissing=True):
+  """
+  Converts a sequence of scalar encoder inputs to a float64 numpy array, in
+  which missing values (None or NaN) are NaN.
+
+  :param values: sequence of numbers
+  :param allowMissing: if False, None is rejected like any other non-number
+  :raises: TypeError if a value is not a number
+  :returns: (numpy.array) the values as floats
+  """
+  column = numpy.asarray(values)
+  if column.dtype.kind not in "biuf":
+    for value in column.tolist():
+      if not (isinstance(value, numbers.Number) or
+              (allowMissing and value is None)):
+        raise TypeError(
+          "Expected a scalar input but got input of type %s" % type(value))
+  return column.astype(numpy.float64)
@@ -30,6 +30,7 @@ from nupic.data import SENTINEL_VALUE_FOR_MISSING_DATA
 from nupic.data.field_meta import FieldMetaSpecial, FieldMetaInfo
 from nupic.encoders import MultiEncoder, DeltaEncoder
 from nupic.engine import Network
+from nupic.support.array_checkpoint import writeNetworkArrayCheckpoint
 from nupic.support.fs_helpers import makeDirectoryFromAbsolutePath
 from nupic.frameworks.opf.opf_utils import (InferenceType,
                                             InferenceElement,
@@ -1421,6 +1422,35 @@ class HTMPredictionModel(Model):
     return
 
 
+  def _serializeExtraDataArrays(self, extraDataDir, baseExtraDataDir=None,
+                                indexBlocks=False):
+    """ [virtual method override] Same as :meth:`_serializeExtraData`, but the
+    regions of the network are saved as array checkpoints. The network is
+    loaded by :meth:`_deSerializeExtraData` as usual.
+
+    extraDataDir:
+                  Model's extra data directory path
+    baseExtraDataDir:
+                  Extra data directory path of the checkpoint of which this
+                  one is a delta, or None
+    indexBlocks:
+                  Whether the network can be the base of delta checkpoints
+    """
+    makeDirectoryFromAbsolutePath(extraDataDir)
+
+    outputDir = self.__getNetworkStateDirectory(extraDataDir=extraDataDir)
+    baseDir = None
+    if baseExtraDataDir is not None:
+      baseDir = self.__getNetworkStateDirectory(extraDataDir=baseExtraDataDir)
+
+    self.__logger.debug("Serializing network with array checkpoints...")
+
+    writeNetworkArrayCheckpoint(self._netInfo.net, outputDir, base=baseDir,
+                                indexBlocks=indexBlocks)
+
+    self.__logger.debug("Finished serializing network")
+
+
   def _deSerializeExtraData(self, extraDataDir):
     """ [virtual method override] This method is called during deserialization
     (after __setstate__) with an external directory path that can be used to
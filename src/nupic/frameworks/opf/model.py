@@ -13,15 +13,32 @@ import cPickle as pickle
 import json
 import os
 import shutil
+import tempfile
 from abc import ABCMeta, abstractmethod
 
 from nupic.frameworks.opf.opf_utils import InferenceType
 import nupic.frameworks.opf.opf_utils as opf_utils
+from nupic.frameworks.opf.model_snapshot import ModelSnapshot
 from nupic.serializable import Serializable
+from nupic.support.array_checkpoint import (isArrayCheckpoint,
+                                            readArrayCheckpoint,
+                                            writeArrayCheckpoint)
 
 # Capnp reader traveral limit (see capnp::ReaderOptions)
 _TRAVERSAL_LIMIT_IN_WORDS = 1 << 63
 
+# Suffixes of the names of the full and delta checkpoints of a delta
+# checkpoint log
+_DELTA_LOG_BASE_SUFFIX = "-base"
+_DELTA_LOG_DELTA_SUFFIX = "-delta"
+
+# Name of the directory in which a delta checkpoint log writes its next
+# checkpoint
+_DELTA_LOG_TMP_DIR_NAME = ".tmp"
+
+# Methods that can save a snapshot of a model
+_SNAPSHOT_METHODS = ("save", "saveDelta", "writeToCheckpoint")
+
 class Model(Serializable):
   """ This is the base class that all OPF Model implementations should
   subclass.
@@ -302,7 +319,7 @@ class Model(Serializable):
   # Implementation of common save/load functionality
   ###############################################################################
 
-  def save(self, saveModelDir):
+  def save(self, saveModelDir, arrayCheckpoint=False):
     """ Save the model in the given directory.
 
     :param saveModelDir: (string)
@@ -312,45 +329,211 @@ class Model(Serializable):
          pre-existing directory will only be accepted if it contains previously
          saved model data. If such a directory is given, the full contents of
          the directory will be deleted and replaced with current model data.
+         The model data is first written in a temporary directory next to it,
+         so the directory is only replaced once saving succeeded.
+    :param arrayCheckpoint: (bool)
+         If True, the large arrays of the model and of its algorithms are
+         saved as separate ``.npy`` files next to a small pickled manifest (see
+         :mod:`nupic.support.array_checkpoint`). :meth:`load` memory-maps them
+         instead of unpickling them, except on Windows. Saving and loading
+         are faster and use much less transient memory for large models.
     """
     logger = self._getLogger()
     logger.debug("(%s) Creating local checkpoint in %r...",
                        self, saveModelDir)
 
     modelPickleFilePath = self._getModelPickleFilePath(saveModelDir)
+    modelArraysDir = self._getModelArraysDir(saveModelDir)
 
-    # Clean up old saved state, if any
+    # Check the old saved state, if any
     if os.path.exists(saveModelDir):
       if not os.path.isdir(saveModelDir):
         raise Exception(("Existing filesystem entry <%s> is not a model"
                          " checkpoint -- refusing to delete (not a directory)") \
                           % saveModelDir)
-      if not os.path.isfile(modelPickleFilePath):
+      if not (os.path.isfile(modelPickleFilePath) or
+              isArrayCheckpoint(modelArraysDir)):
         raise Exception(("Existing filesystem entry <%s> is not a model"
                          " checkpoint -- refusing to delete"\
                          " (%s missing or not a file)") % \
                           (saveModelDir, modelPickleFilePath))
 
-      shutil.rmtree(saveModelDir)
+    # Save in a new directory next to the old saved state, and swap it in when
+    # it is complete. The old files are never overwritten in place, because
+    # the arrays of a model loaded from them may be memory-mapped.
+    parentDir = os.path.dirname(os.path.abspath(saveModelDir))
+    self.__makeDirectoryFromAbsolutePath(parentDir)
+    tmpDir = tempfile.mkdtemp(dir=parentDir, prefix=".tmp-")
+    oldModelDir = os.path.join(tmpDir, "old")
+    try:
+      newModelDir = os.path.join(tmpDir, "new")
+      self.__makeDirectoryFromAbsolutePath(newModelDir)
 
-    # Create a new directory for saving state
-    self.__makeDirectoryFromAbsolutePath(saveModelDir)
+      if arrayCheckpoint:
+        self.__writeArrayCheckpoint(newModelDir)
 
-    with open(modelPickleFilePath, 'wb') as modelPickleFile:
-      logger.debug("(%s) Pickling Model instance...", self)
+      else:
+        with open(self._getModelPickleFilePath(newModelDir),
+                  'wb') as modelPickleFile:
+          logger.debug("(%s) Pickling Model instance...", self)
 
-      pickle.dump(self, modelPickleFile, protocol=pickle.HIGHEST_PROTOCOL)
+          pickle.dump(self, modelPickleFile, protocol=pickle.HIGHEST_PROTOCOL)
 
-      logger.debug("(%s) Finished pickling Model instance", self)
+          logger.debug("(%s) Finished pickling Model instance", self)
 
 
-    # Tell the model to save extra data, if any, that's too big for pickling
-    self._serializeExtraData(extraDataDir=self._getModelExtraDataDir(saveModelDir))
+        # Tell the model to save extra data, if any, that's too big for
+        # pickling
+        self._serializeExtraData(
+            extraDataDir=self._getModelExtraDataDir(newModelDir))
+
+      if os.path.exists(saveModelDir):
+        os.rename(saveModelDir, oldModelDir)
+      try:
+        os.rename(newModelDir, saveModelDir)
+      except:
+        # Put the old saved state back
+        if os.path.exists(oldModelDir):
+          os.rename(oldModelDir, saveModelDir)
+        raise
+    finally:
+      # The old saved state is only left in the temporary directory if it
+      # could not be put back
+      if os.path.exists(saveModelDir) or not os.path.exists(oldModelDir):
+        shutil.rmtree(tmpDir)
+      else:
+        logger.error("(%s) Failed to restore the previous checkpoint, it was "
+                     "left in %r", self, oldModelDir)
 
     logger.debug("(%s) Finished creating local checkpoint", self)
 
     return
 
+  def saveDelta(self, saveModelDir, maxDeltas=16):
+    """ Save the model in a delta checkpoint log in the given directory.
+
+    The log holds a full array checkpoint of the model (see :meth:`save`)
+    followed by delta checkpoints, in which only the blocks of rows of the
+    arrays that changed since the previous checkpoint are written (see
+    :mod:`nupic.support.array_checkpoint`). When the log has ``maxDeltas``
+    deltas, it is compacted: a new full checkpoint is written and the older
+    checkpoints are deleted. :meth:`load` loads the last checkpoint of the log
+    by replaying its deltas on the full checkpoint.
+
+    Each checkpoint is written in a temporary directory and renamed when it is
+    complete, so the log can always be loaded if saving fails.
+
+    :param saveModelDir: (string)
+         Absolute directory path of the log. If the directory does not exist,
+         it will be created automatically. A pre-existing directory will only
+         be accepted if it is empty or contains a delta checkpoint log.
+    :param maxDeltas: (int) maximum number of delta checkpoints in the log
+    """
+    logger = self._getLogger()
+    logger.debug("(%s) Creating delta checkpoint in %r...",
+                 self, saveModelDir)
+
+    saveModelDir = os.path.abspath(saveModelDir)
+    checkpoints = self._getDeltaLogCheckpoints(saveModelDir)
+    tmpDir = os.path.join(saveModelDir, _DELTA_LOG_TMP_DIR_NAME)
+
+    if os.path.exists(saveModelDir):
+      if (not os.path.isdir(saveModelDir) or
+          (not checkpoints and
+           set(os.listdir(saveModelDir)) - set([_DELTA_LOG_TMP_DIR_NAME]))):
+        raise Exception(("Existing filesystem entry <%s> is not a delta"
+                         " checkpoint log -- refusing to write to it")
+                        % saveModelDir)
+      # Left by a failed save
+      if os.path.exists(tmpDir):
+        shutil.rmtree(tmpDir)
+
+    numDeltas = 0
+    for name in reversed(checkpoints):
+      if name.endswith(_DELTA_LOG_BASE_SUFFIX):
+        break
+      numDeltas += 1
+
+    if checkpoints and numDeltas < maxDeltas:
+      baseModelDir = os.path.join(saveModelDir, checkpoints[-1])
+      suffix = _DELTA_LOG_DELTA_SUFFIX
+    else:
+      baseModelDir = None
+      suffix = _DELTA_LOG_BASE_SUFFIX
+
+    self.__makeDirectoryFromAbsolutePath(tmpDir)
+    self.__writeArrayCheckpoint(tmpDir, baseModelDir=baseModelDir,
+                                indexBlocks=True)
+
+    number = int(checkpoints[-1].split("-")[0]) + 1 if checkpoints else 0
+    os.rename(tmpDir, os.path.join(saveModelDir, "%06d%s" % (number, suffix)))
+
+    if baseModelDir is None:
+      logger.debug("(%s) Compacting delta checkpoint log...", self)
+      for name in checkpoints:
+        shutil.rmtree(os.path.join(saveModelDir, name))
+
+    logger.debug("(%s) Finished creating delta checkpoint", self)
+
+  def snapshot(self, saveModelDir, method="save", **kwargs):
+    """ Save the model in the background, without blocking :meth:`run`.
+
+    The process is forked: the child process gets a copy-on-write copy of the
+    model, the state of the C++ algorithms included, and saves it with the
+    given method while this process goes on (see
+    :mod:`nupic.frameworks.opf.model_snapshot`). The snapshot is the state of
+    the model when this method is called, so it must be called between two
+    records, not while :meth:`run` runs in another thread.
+
+    Two snapshots must not be written in the same directory at the same time.
+
+    :param saveModelDir: (string) directory passed to the save method
+    :param method: (string) name of the save method: "save", "saveDelta" or
+           "writeToCheckpoint"
+    :param kwargs: other arguments of the save method
+    :returns: (:class:`~nupic.frameworks.opf.model_snapshot.ModelSnapshot`)
+              future-like handle of the snapshot
+    :raises: (NotImplementedError) if ``os.fork`` is not available, e.g. on
+             Windows
+    """
+    if method not in _SNAPSHOT_METHODS:
+      raise ValueError("Invalid snapshot method %r. Legal values are: %s"
+                       % (method, ", ".join(_SNAPSHOT_METHODS)))
+
+    saveMethod = getattr(self, method)
+    self._getLogger().debug("(%s) Starting %s snapshot in %r...",
+                            self, method, saveModelDir)
+    return ModelSnapshot(lambda: saveMethod(saveModelDir, **kwargs))
+
+  def __writeArrayCheckpoint(self, saveModelDir, baseModelDir=None,
+                             indexBlocks=False):
+    """ Write the model as an array checkpoint in a new model directory.
+
+    :param saveModelDir: (string) model directory
+    :param baseModelDir: (string) directory of an indexed array checkpoint of
+           the model of which this checkpoint is a delta, or None
+    :param indexBlocks: (bool) whether the checkpoint can be the base of other
+           checkpoints
+    """
+    logger = self._getLogger()
+    logger.debug("(%s) Writing Model instance array checkpoint...", self)
+
+    baseArraysDir = None
+    baseExtraDataDir = None
+    if baseModelDir is not None:
+      baseArraysDir = self._getModelArraysDir(baseModelDir)
+      baseExtraDataDir = self._getModelExtraDataDir(baseModelDir)
+
+    writeArrayCheckpoint(self, self._getModelArraysDir(saveModelDir),
+                         base=baseArraysDir, indexBlocks=indexBlocks)
+
+    logger.debug("(%s) Finished writing Model instance array checkpoint",
+                 self)
+
+    self._serializeExtraDataArrays(
+        extraDataDir=self._getModelExtraDataDir(saveModelDir),
+        baseExtraDataDir=baseExtraDataDir, indexBlocks=indexBlocks)
+
   def _serializeExtraData(self, extraDataDir):
     """ Protected method that is called during serialization with an external
     directory path. It can be overridden by subclasses to bypass pickle for
@@ -361,6 +544,23 @@ class Model(Serializable):
     """
     pass
 
+  def _serializeExtraDataArrays(self, extraDataDir, baseExtraDataDir=None,
+                                indexBlocks=False):
+    """ Protected method that is called instead of :meth:`_serializeExtraData`
+    when the model is saved with ``arrayCheckpoint`` or in a delta checkpoint
+    log. It can be overridden by subclasses to save their extra data as array
+    checkpoints too. The extra data must be loaded by
+    :meth:`_deSerializeExtraData`.
+    This is called by ModelBase only.
+
+    :param extraDataDir: (string) Model's extra data directory path
+    :param baseExtraDataDir: (string) extra data directory path of the
+           checkpoint of which this one is a delta, or None
+    :param indexBlocks: (bool) whether the extra data can be the base of
+           delta checkpoints
+    """
+    self._serializeExtraData(extraDataDir=extraDataDir)
+
   @classmethod
   def load(cls, savedModelDir):
     """ Load saved model.
@@ -372,15 +572,29 @@ class Model(Serializable):
     logger = opf_utils.initLogger(cls)
     logger.debug("Loading model from local checkpoint at %r...", savedModelDir)
 
+    checkpoints = Model._getDeltaLogCheckpoints(savedModelDir)
+    if checkpoints:
+      logger.debug("Loading last checkpoint of delta checkpoint log...")
+      savedModelDir = os.path.join(savedModelDir, checkpoints[-1])
+
     # Load the model
     modelPickleFilePath = Model._getModelPickleFilePath(savedModelDir)
+    modelArraysDir = Model._getModelArraysDir(savedModelDir)
 
-    with open(modelPickleFilePath, 'rb') as modelPickleFile:
-      logger.debug("Unpickling Model instance...")
+    if isArrayCheckpoint(modelArraysDir):
+      logger.debug("Reading Model instance array checkpoint...")
 
-      model = pickle.load(modelPickleFile)
+      model = readArrayCheckpoint(modelArraysDir)
 
-      logger.debug("Finished unpickling Model instance")
+      logger.debug("Finished reading Model instance array checkpoint")
+
+    else:
+      with open(modelPickleFilePath, 'rb') as modelPickleFile:
+        logger.debug("Unpickling Model instance...")
+
+        model = pickle.load(modelPickleFile)
+
+        logger.debug("Finished unpickling Model instance")
 
     # Tell the model to load extra data, if any, that was too big for pickling
     model._deSerializeExtraData(
@@ -413,6 +627,35 @@ class Model(Serializable):
     path = os.path.abspath(path)
     return path
 
+  @staticmethod
+  def _getModelArraysDir(saveModelDir):
+    """ Return the absolute path of the model's array checkpoint directory,
+    used instead of the pickle file when the model is saved with
+    ``arrayCheckpoint``.
+
+    :param saveModelDir: (string)
+           Directory of where the experiment is to be or was saved
+    :returns: (string) An absolute path.
+    """
+    path = os.path.join(saveModelDir, "modelarrays")
+    path = os.path.abspath(path)
+    return path
+
+  @staticmethod
+  def _getDeltaLogCheckpoints(saveModelDir):
+    """ Return the names of the checkpoints of a delta checkpoint log.
+
+    :param saveModelDir: (string)
+           Directory of the delta checkpoint log
+    :returns: (list) names of the checkpoint directories, oldest first. Empty
+              if the directory is not a delta checkpoint log.
+    """
+    if not os.path.isdir(saveModelDir):
+      return []
+    return sorted(name for name in os.listdir(saveModelDir)
+                  if name.endswith(_DELTA_LOG_BASE_SUFFIX) or
+                     name.endswith(_DELTA_LOG_DELTA_SUFFIX))
+
   @staticmethod
   def _getModelExtraDataDir(saveModelDir):
     """ Return the absolute path to the directory where the model's own
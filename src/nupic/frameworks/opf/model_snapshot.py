@@ -0,0 +1,322 @@
+# Copyright 2017 Numenta Inc.
+#
+# Copyright may exist in Contributors' modifications
+# and/or contributions to the work.
+#
+# Use of this source code is governed by the MIT
+# license that can be found in the LICENSE file or at
+# https://opensource.org/licenses/MIT.
+
+"""
+Background snapshots of running models.
+
+A snapshot forks the process: the child process gets a copy-on-write copy of
+the whole model, the state of the C++ algorithms included, and saves it with
+one of the model's save methods while the parent process keeps running
+records. Taking the copy only costs the fork, and the OS then copies the pages
+of memory the parent changes while the snapshot is written.
+
+Snapshots need ``os.fork``, so they are not available on Windows.
+
+Only the thread taking the snapshot exists in the child process. A lock held
+by another thread when the process forks stays held in the child, so the
+saving must not need such locks. The locks of the :mod:`logging` module and
+of its handlers are created again in the child process, so logging while
+saving doesn't deadlock.
+"""
+
+import errno
+import logging
+import os
+import select
+import threading
+import time
+import traceback
+
+try:
+  import fcntl
+except ImportError:
+  # Not available on Windows, where snapshots aren't either
+  fcntl = None
+
+# Logger whose messages are the progress of the snapshot process
+_PROGRESS_LOGGER_NAME = "com.numenta"
+
+# Niceness added to the snapshot process, so that it doesn't slow down the
+# model when they compete for the CPU
+DEFAULT_SNAPSHOT_NICENESS = 10
+
+# Maximum length of the progress messages. Escaped, they are at most 4 times
+# longer, and must fit in PIPE_BUF to be written to the pipe at once.
+_MAX_PROGRESS_LENGTH = (getattr(select, "PIPE_BUF", 512) -
+                        len("progress \n")) // 4
+
+# Snapshot processes whose handle was deleted before they were reaped
+_abandonedPids = []
+
+
+
+class SnapshotError(Exception):
+  """ Raised by :meth:`ModelSnapshot.result` when the snapshot failed. """
+  pass
+
+
+
+class ModelSnapshot(object):
+  """
+  Future-like handle of a snapshot written by a child process, returned by
+  :meth:`~nupic.frameworks.opf.model.Model.snapshot`.
+
+  The child process is reaped by :meth:`wait`, :meth:`result` or
+  :meth:`exception`. If the handle is deleted before that, the snapshot goes
+  on without reporting its progress, and the child process is reaped when the
+  next snapshot is taken.
+
+  :param saveFunction: (callable) function saving the model, called without
+         arguments in the child process
+  :param niceness: (int) niceness added to the child process
+  :raises: (NotImplementedError) if ``os.fork`` is not available
+  """
+
+
+  def __init__(self, saveFunction, niceness=DEFAULT_SNAPSHOT_NICENESS):
+    if not hasattr(os, "fork"):
+      raise NotImplementedError("Model snapshots need os.fork, which is not "
+                                "available on this platform")
+
+    _reapAbandonedSnapshots()
+    readFd, writeFd = os.pipe()
+    pid = os.fork()
+
+    if pid == 0:
+      os.close(readFd)
+      _runSnapshot(saveFunction, writeFd, niceness)
+
+    os.close(writeFd)
+    self._pid = pid
+    self._fd = readFd
+    self._buffer = ""
+    self._progress = None
+    self._error = None
+    self._done = False
+    self.startTime = time.time()
+    self.endTime = None
+
+
+  def __del__(self):
+    if not getattr(self, "_done", True):
+      # The snapshot process gets an error if it writes to the closed pipe,
+      # and goes on without reporting its progress
+      os.close(self._fd)
+      _abandonedPids.append(self._pid)
+      _reapAbandonedSnapshots()
+
+
+  def done(self):
+    """
+    :returns: (bool) True if the snapshot is written or failed
+    """
+    self._poll(0)
+    return self._done
+
+
+  def running(self):
+    """
+    :returns: (bool) True if the snapshot is being written
+    """
+    return not self.done()
+
+
+  def progress(self):
+    """
+    :returns: (string) the last step logged by the snapshot process, None if
+              there is none yet
+    """
+    self._poll(0)
+    return self._progress
+
+
+  def wait(self, timeout=None):
+    """
+    Wait for the snapshot to be written or to fail.
+
+    :param timeout: (float) maximum time to wait in seconds, None to wait until
+           it is done
+    :returns: (bool) True if the snapshot is done
+    """
+    self._poll(timeout)
+    return self._done
+
+
+  def exception(self, timeout=None):
+    """
+    Wait for the snapshot, like :meth:`wait`.
+
+    :returns: (:class:`SnapshotError`) the error of the snapshot if it failed,
+              None if it succeeded
+    :raises: (RuntimeError) if the snapshot is not done after ``timeout``
+    """
+    if not self.wait(timeout):
+      raise RuntimeError("Snapshot not done after %s seconds" % timeout)
+    return self._error
+
+
+  def result(self, timeout=None):
+    """
+    Wait for the snapshot, like :meth:`wait`.
+
+    :raises: (:class:`SnapshotError`) if the snapshot failed, (RuntimeError)
+             if it is not done after ``timeout``
+    """
+    error = self.exception(timeout)
+    if error is not None:
+      raise error
+
+
+  def _poll(self, timeout):
+    """
+    Read the messages of the snapshot process, and reap it when it is done.
+
+    :param timeout: (float) maximum time to wait for the end of the snapshot
+           in seconds, None to wait until it is done
+    """
+    if timeout is not None:
+      deadline = time.time() + timeout
+
+    while not self._done:
+      remaining = None
+      if timeout is not None:
+        remaining = max(0, deadline - time.time())
+      ready, _, _ = select.select([self._fd], [], [], remaining)
+      if not ready:
+        return
+
+      data = os.read(self._fd, 1 << 16)
+      if data:
+        self._buffer += data
+        lines = self._buffer.split("\n")
+        self._buffer = lines.pop()
+        for line in lines:
+          self._handleMessage(line)
+      else:
+        # The snapshot process has exited
+        os.close(self._fd)
+        _, status = os.waitpid(self._pid, 0)
+        if status != 0 and self._error is None:
+          if os.WIFSIGNALED(status):
+            reason = "was killed by signal %d" % os.WTERMSIG(status)
+          else:
+            reason = "exited with status %d" % os.WEXITSTATUS(status)
+          self._error = SnapshotError("Snapshot process %d %s" %
+                                      (self._pid, reason))
+        self._done = True
+        self.endTime = time.time()
+
+
+  def _handleMessage(self, line):
+    kind, _, text = line.partition(" ")
+    text = text.decode("string_escape")
+    if kind == "progress":
+      self._progress = text
+    elif kind == "error":
+      self._error = SnapshotError("Snapshot failed:\n%s" % text)
+
+
+
+class _ProgressHandler(logging.Handler):
+  """ Sends the log messages of the snapshot process to its parent. """
+
+
+  def __init__(self, fd):
+    logging.Handler.__init__(self, level=logging.DEBUG)
+    self.fd = fd
+
+
+  def emit(self, record):
+    try:
+      _sendMessage(self.fd, "progress",
+                   self.format(record)[:_MAX_PROGRESS_LENGTH], block=False)
+    except Exception:
+      self.handleError(record)
+
+
+
+def _sendMessage(fd, kind, text, block=True):
+  """
+  Send a message to the parent process.
+
+  :param block: (bool) if False, the pipe must be non-blocking and the message
+         must fit in ``select.PIPE_BUF``. The message is then dropped if the
+         pipe is full, instead of waiting for the parent process to read it.
+  """
+  message = "%s %s\n" % (kind, text.encode("string_escape"))
+  try:
+    while message:
+      message = message[os.write(fd, message):]
+  except OSError as e:
+    if block or e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EPIPE):
+      raise
+
+
+
+def _reapAbandonedSnapshots():
+  """
+  Reap the abandoned snapshot processes that have exited.
+  """
+  for pid in list(_abandonedPids):
+    try:
+      reapedPid, _ = os.waitpid(pid, os.WNOHANG)
+    except OSError as e:
+      if e.errno != errno.ECHILD:
+        raise
+      reapedPid = pid
+    if reapedPid == pid:
+      _abandonedPids.remove(pid)
+
+
+
+def _reinitLoggingLocks():
+  """
+  Create the locks of the logging module and of its handlers again. Another
+  thread of the parent process may have held them when it forked.
+  """
+  logging._lock = threading.RLock()
+  for handlerRef in logging._handlerList:
+    handler = handlerRef()
+    if handler is not None:
+      handler.createLock()
+
+
+
+def _runSnapshot(saveFunction, fd, niceness):
+  """
+  Run the snapshot in the child process, and exit it.
+  """
+  status = 1
+  try:
+    _reinitLoggingLocks()
+
+    if niceness:
+      os.nice(niceness)
+
+    # Progress messages are dropped rather than blocking the snapshot when the
+    # parent process doesn't read them
+    fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) |
+                os.O_NONBLOCK)
+    logger = logging.getLogger(_PROGRESS_LOGGER_NAME)
+    logger.handlers = [_ProgressHandler(fd)]
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+
+    saveFunction()
+    status = 0
+  except BaseException:
+    try:
+      fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) &
+                  ~os.O_NONBLOCK)
+      _sendMessage(fd, "error", traceback.format_exc())
+    except BaseException:
+      pass
+  finally:
+    # Exit without running the cleanup of the parent process
+    os._exit(status)
@@ -13,9 +13,11 @@ from nupic.algorithms.anomaly_likelihood import AnomalyLikelihood
 from nupic.bindings.regions.PyRegion import PyRegion
 
 from nupic.serializable import Serializable
+from nupic.support.array_checkpoint import ArrayCheckpointRegionMixin
 
 
-class AnomalyLikelihoodRegion(PyRegion, Serializable):
+class AnomalyLikelihoodRegion(ArrayCheckpointRegionMixin, PyRegion,
+                              Serializable):
   """Region for computing the anomaly likelihoods."""
 
 
@@ -12,6 +12,7 @@
 This file defines the k Nearest Neighbor classifier region.
 """
 import copy
+from array import array
 
 import numpy
 
@@ -19,6 +20,7 @@ from nupic.algorithms import anomaly
 from nupic.bindings.regions.PyRegion import PyRegion
 from knn_classifier_region import KNNClassifierRegion
 from nupic.bindings.math import Random
+from nupic.support.array_checkpoint import ArrayCheckpointRegionMixin
 from nupic.frameworks.opf.exceptions import (HTMPredictionModelInvalidRangeError,
                                              HTMPredictionModelInvalidArgument)
 
@@ -31,8 +33,13 @@ if capnp:
     KNNAnomalyClassifierRegionProto
 
 
+# Maximum number of elements of the pattern and distance matrices built at once
+# when reclassifying records.
+_DISTANCE_BATCH_ELEMENTS = 1 << 22
 
-class KNNAnomalyClassifierRegion(PyRegion):
+
+
+class KNNAnomalyClassifierRegion(ArrayCheckpointRegionMixin, PyRegion):
   """
   Wraps the :class:`~nupic.regions.knn_classifier_region.KNNClassifierRegion` to 
   classify :class:`~nupic.frameworks.opf.htm_prediction_model.HTMPredictionModel`
@@ -236,7 +243,7 @@ class KNNAnomalyClassifierRegion(PyRegion):
     self._knnclassifier = KNNClassifierRegion(**self._knnclassifierArgs)
     self.labelResults = []
     self.saved_categories = []
-    self._recordsCache = []
+    self._recordsCache = _RecordsCache()
 
     self._version = KNNAnomalyClassifierRegion.__VERSION__
 
@@ -314,6 +321,10 @@ class KNNAnomalyClassifierRegion(PyRegion):
       self._classifyState(record)
 
     #Save new classification record and keep history as moving window
+    if not isinstance(self._recordsCache, _RecordsCache):
+      # Records may be handed over as a plain list, as HTMPredictionModel
+      # does when it replaces its classifier helper
+      self._recordsCache = _RecordsCache(self._recordsCache)
     self._recordsCache.append(record)
     while len(self._recordsCache) > self.cacheSize:
       self._recordsCache.pop(0)
@@ -332,12 +343,190 @@ class KNNAnomalyClassifierRegion(PyRegion):
     return self.labelResults
 
 
-  def _classifyStates(self):
+  def _classifyStates(self, start=0):
+    """
+    Reclassifies the cached records from index ``start`` on. The result is the
+    same as calling :meth:`_classifyState` on each record in turn, but nearest
+    prototypes are only recomputed for the records whose nearest prototype
+    could have changed.
+
+    The nearest eligible prototype of every record is first found with
+    batched :meth:`~nupic.algorithms.knn_classifier.KNNClassifier.getNearestPrototypes`
+    queries. While the records are relabeled, the prototypes removed from and
+    added to the classifier are tracked: a record is compared again with all
+    prototypes only if its nearest prototype was removed, and otherwise only
+    with the prototypes added before it. Removals are applied in batches,
+    before the next prototype is learned and at the end.
+    """
+    records = self._recordsCache[start:]
+    if not records:
+      return
+
+    trainRecords = self.getParameter('trainRecords')
+    knn = self._knnclassifier._knn
+    # Unless distances are normalized over all prototypes, the distance to a
+    # prototype does not depend on the others, so nearest prototypes stay
+    # valid while other prototypes are added and removed.
+    changes = _PrototypeChanges(
+      tracked=knn.distanceMethod != "norm" and knn.numSVDDims is None)
+    if changes.tracked:
+      classified = [state for state in records if state.ROWID >= trainRecords]
+      nearest = dict(zip([state.ROWID for state in classified],
+                         self._nearestPrototypes(classified, changes)))
+
+    for state in records:
+      # Record is before wait period do not classifiy
+      if state.ROWID < trainRecords:
+        if not state.setByUser:
+          state.anomalyLabel = []
+          self._removeRecordFromKNN(state, changes)
+        continue
+
+      if changes.tracked:
+        rowID, distance = nearest[state.ROWID]
+        if rowID in changes.removed or len(state.anomalyVector) == 0:
+          # Distances of an empty pattern may be normalized over all
+          # prototypes, including the ones whose removal is pending.
+          self._flushRemovals(changes)
+          ((rowID, distance),) = self._nearestPrototypes([state], changes)
+        elif changes.added:
+          ((addedRowID, addedDistance),) = self._nearestPrototypes(
+            [state], changes, addedOnly=True)
+          # Added prototypes come last in the classifier, so they lose ties.
+          if addedDistance < distance:
+            rowID, distance = addedRowID, addedDistance
+
+        newCategory = None
+        if rowID is not None and distance <= self._classificationMaxDist:
+          categoryRecencyList = self._knnclassifier.getParameter(
+            'categoryRecencyList')
+          newCategory = self._knnclassifier.getCategoryList()[
+            categoryRecencyList.index(rowID)]
+      else:
+        newCategory = self._recomputeRecordFromKNN(state)
+
+      labelList = self._computeLabels(state, newCategory)
+
+      if state.anomalyLabel == labelList:
+        continue
+
+      # Update state's labeling
+      state.anomalyLabel = labelList
+
+      # Update KNN Classifier with new labeling
+      if state.anomalyLabel == []:
+        self._removeRecordFromKNN(state, changes)
+      else:
+        self._learnRecord(state, changes)
+
+    self._flushRemovals(changes)
+
+
+  def _nearestPrototypes(self, records, changes, addedOnly=False):
+    """
+    Finds the nearest prototype of each record among the prototypes
+    :meth:`_recomputeRecordFromKNN` classifies it with, leaving out the
+    prototypes whose removal is pending.
+
+    records - records after the wait period
+    changes - the _PrototypeChanges of the reclassification
+    addedOnly - if true, only the prototypes added during the
+      reclassification are considered
+
+    returns list of (ROWID, distance) of the nearest prototype of each
+      record, or (None, inf) if no prototype is eligible
+    """
+    rowIDs = numpy.array(
+      self._knnclassifier.getParameter('categoryRecencyList'), dtype=int)
+    candidates = rowIDs >= self.getParameter('trainRecords')
+    if changes.pendingRemovals:
+      candidates &= ~numpy.in1d(rowIDs, changes.pendingRemovals)
+    if addedOnly:
+      candidates &= numpy.in1d(rowIDs, changes.added)
+    if not candidates.any():
+      return [(None, numpy.inf)] * len(records)
+
+    knn = self._knnclassifier._knn
+    width = self._anomalyVectorLength
+    batchSize = max(1, _DISTANCE_BATCH_ELEMENTS // max(width, len(rowIDs)))
+    nearest = []
+    for begin in xrange(0, len(records), batchSize):
+      batch = records[begin:begin + batchSize]
+      eligible = candidates & (rowIDs < numpy.array([[state.ROWID]
+                                                     for state in batch]))
+      if self._knnclassifier._doSphering:
+        # Classified inputs are normalized as in KNNClassifierRegion.compute
+        patterns = numpy.array([self._getStateAnomalyVector(state)
+                                for state in batch])
+        patterns = ((patterns + self._knnclassifier._normOffset) *
+                    self._knnclassifier._normScale)
+        rows, distances = knn.getNearestPrototypes(patterns, eligible)
+      else:
+        rows, distances = knn.getNearestPrototypes(
+          [state.anomalyVector for state in batch], eligible,
+          isSparse=width)
+      for row, distance in zip(rows.tolist(), distances.tolist()):
+        if row < 0:
+          nearest.append((None, numpy.inf))
+        else:
+          nearest.append((int(rowIDs[row]), distance))
+
+    return nearest
+
+
+  def _removeRecordFromKNN(self, record, changes):
+    """
+    Removes the record from the KNN classifier during :meth:`_classifyStates`.
+    While prototypes are tracked the removal is deferred.
+    """
+    prototype_idx = self._knnclassifier.getParameter('categoryRecencyList')
+    if (not record.setByUser and record.ROWID in prototype_idx and
+        record.ROWID not in changes.removed):
+      changes.removed.add(record.ROWID)
+      changes.pendingRemovals.append(record.ROWID)
+      if not changes.tracked:
+        self._flushRemovals(changes)
+
+
+  def _flushRemovals(self, changes):
+    """
+    Removes the prototypes whose removal was deferred from the KNN classifier.
+    """
+    if not changes.pendingRemovals:
+      return
+
+    knn = self._knnclassifier._knn
+    nProtos = knn._numPatterns
+    knn.removeIds(set(changes.pendingRemovals))
+    assert knn._numPatterns == nProtos - len(changes.pendingRemovals)
+    changes.pendingRemovals = []
+
+
+  def _learnRecord(self, record, changes):
     """
-    Reclassifies all internal state
+    Adds the record to the KNN classifier during :meth:`_classifyStates`,
+    recording the prototypes this adds and evicts.
     """
-    for state in self._recordsCache:
-      self._classifyState(state)
+    prototype_idx = self._knnclassifier.getParameter('categoryRecencyList')
+    if record.ROWID in prototype_idx:
+      self._addRecordToKNN(record)
+      return
+
+    # Learning may evict prototypes, so deferred removals must be applied
+    # first to evict the same prototypes as one by one reclassification.
+    self._flushRemovals(changes)
+    previousIDs = list(prototype_idx)
+    self._addRecordToKNN(record)
+    prototype_idx = self._knnclassifier.getParameter('categoryRecencyList')
+
+    droppedIDs = set(previousIDs).difference(prototype_idx)
+    changes.removed.update(droppedIDs)
+    if (not prototype_idx or prototype_idx[-1] != record.ROWID or
+        len(prototype_idx) != len(previousIDs) + 1 - len(droppedIDs)):
+      # The record was merged into an existing prototype.
+      changes.tracked = False
+    else:
+      changes.added.append(record.ROWID)
 
 
   def _classifyState(self, state):
@@ -351,11 +540,31 @@ class KNNAnomalyClassifierRegion(PyRegion):
         self._deleteRecordsFromKNN([state])
       return
 
+    # Update the label based on classifications
+    newCategory = self._recomputeRecordFromKNN(state)
+    labelList = self._computeLabels(state, newCategory)
+
+    if state.anomalyLabel == labelList:
+      return
+
+    # Update state's labeling
+    state.anomalyLabel = labelList
+
+    # Update KNN Classifier with new labeling
+    if state.anomalyLabel == []:
+      self._deleteRecordsFromKNN([state])
+    else:
+      self._addRecordToKNN(state)
+
+
+  def _computeLabels(self, state, newCategory):
+    """
+    Returns the labels of a state after the wait period, given the category
+    of its nearest prototype.
+    """
     label = KNNAnomalyClassifierRegion.AUTO_THRESHOLD_CLASSIFIED_LABEL
     autoLabel = label + KNNAnomalyClassifierRegion.AUTO_TAG
 
-    # Update the label based on classifications
-    newCategory = self._recomputeRecordFromKNN(state)
     labelList = self._categoryToLabelList(newCategory)
 
     if state.setByUser:
@@ -380,17 +589,7 @@ class KNNAnomalyClassifierRegion(PyRegion):
     if label in labelList and autoLabel in labelList:
       labelList.remove(autoLabel)
 
-    if state.anomalyLabel == labelList:
-      return
-
-    # Update state's labeling
-    state.anomalyLabel = labelList
-
-    # Update KNN Classifier with new labeling
-    if state.anomalyLabel == []:
-      self._deleteRecordsFromKNN([state])
-    else:
-      self._addRecordToKNN(state)
+    return labelList
 
 
   def _constructClassificationRecord(self, inputs):
@@ -741,8 +940,7 @@ class KNNAnomalyClassifierRegion(PyRegion):
     assert len(self.saved_categories) > 0
 
     # Recompute [end, ...)
-    for state in self._recordsCache[clippedEnd:]:
-      self._classifyState(state)
+    self._classifyStates(clippedEnd)
 
 
   def removeLabels(self, start=None, end=None, labelFilter=None):
@@ -813,8 +1011,7 @@ class KNNAnomalyClassifierRegion(PyRegion):
     self._deleteRangeFromKNN(start, end)
 
     # Recompute [clippedEnd, ...)
-    for state in self._recordsCache[clippedEnd:]:
-      self._classifyState(state)
+    self._classifyStates(clippedEnd)
 
 
   #############################################################################
@@ -926,7 +1123,7 @@ class KNNAnomalyClassifierRegion(PyRegion):
     instance.labelResults = list(proto.labelResults)
     instance.saved_categories = list(proto.savedCategories)
 
-    instance._recordsCache = []
+    instance._recordsCache = _RecordsCache()
     for item in proto.recordsCache:
       instance._recordsCache.append(_CLAClassificationRecord(
         ROWID=item.rowid,
@@ -968,6 +1165,8 @@ class KNNAnomalyClassifierRegion(PyRegion):
       knnclassifierProps = state.pop('_knnclassifierProps')
 
       self.__dict__.update(state)
+      if isinstance(self._recordsCache, list):
+        self._recordsCache = _RecordsCache(self._recordsCache)
       self._knnclassifier = KNNClassifierRegion(**self._knnclassifierArgs)
       self._knnclassifier.__setstate__(knnclassifierProps)
 
@@ -1090,3 +1289,186 @@ class _CLAClassificationRecord(object):
             self.setByUser == other.setByUser and
             numpy.array_equal(self.anomalyVector, other.anomalyVector))
 
+
+
+class _RecordsCache(object):
+  """
+  The classification records of the region, oldest first, stored column by
+  column: ROWIDs, anomaly scores and user flags in typed arrays, and the
+  anomaly vectors of all records concatenated in a single array.
+
+  Supports the list operations the region uses. Indexing returns
+  _CachedRecord views that read and write the columns; records can only be
+  appended at the end and popped from the front. Popping only moves the
+  start of the cache forward, and the popped records are dropped from the
+  columns once they make up more than half of them.
+  """
+
+  def __init__(self, records=()):
+    self._rowIDs = array("l")
+    self._anomalyScores = array("d")
+    self._setByUser = array("b")
+    self._anomalyLabels = []
+    self._vectorStarts = array("l")
+    self._vectorBits = array("l")
+    # Index of the oldest record in the columns
+    self._first = 0
+    # Number of records and of vector bits dropped from the columns so far,
+    # which views and vector starts are offset by.
+    self._offset = 0
+    self._bitsOffset = 0
+
+    for record in records:
+      self.append(record)
+
+
+  def __len__(self):
+    return len(self._rowIDs) - self._first
+
+
+  def __getitem__(self, index):
+    start = self._offset + self._first
+    if isinstance(index, slice):
+      return [_CachedRecord(self, start + i)
+              for i in xrange(*index.indices(len(self)))]
+
+    if index < 0:
+      index += len(self)
+    if not 0 <= index < len(self):
+      raise IndexError("record index out of range")
+    return _CachedRecord(self, start + index)
+
+
+  def __iter__(self):
+    start = self._offset + self._first
+    for i in xrange(len(self)):
+      yield _CachedRecord(self, start + i)
+
+
+  def append(self, record):
+    """
+    Stores a copy of the record after the current records. The record's label
+    list itself is stored, so later changes to it show in the cache.
+    """
+    self._rowIDs.append(record.ROWID)
+    self._anomalyScores.append(record.anomalyScore)
+    self._setByUser.append(bool(record.setByUser))
+    self._anomalyLabels.append(record.anomalyLabel)
+    self._vectorStarts.append(self._bitsOffset + len(self._vectorBits))
+    self._vectorBits.extend(record.anomalyVector)
+
+
+  def pop(self, index):
+    """
+    Removes and returns the oldest record. Only ``index`` 0 is supported.
+    """
+    if index != 0:
+      raise IndexError("Only the oldest record can be popped")
+
+    record = self[0]
+    record = _CLAClassificationRecord(
+      ROWID=record.ROWID,
+      anomalyScore=record.anomalyScore,
+      anomalyVector=record.anomalyVector,
+      anomalyLabel=record.anomalyLabel,
+      setByUser=record.setByUser)
+
+    self._anomalyLabels[self._first] = None
+    self._first += 1
+    if 2 * self._first > len(self._rowIDs):
+      self._compact()
+    return record
+
+
+  def _compact(self):
+    """
+    Drops the popped records from the columns.
+    """
+    numRecords = self._first
+    if numRecords < len(self._rowIDs):
+      numBits = self._vectorStarts[numRecords] - self._bitsOffset
+    else:
+      numBits = len(self._vectorBits)
+
+    for column in (self._rowIDs, self._anomalyScores, self._setByUser,
+                   self._anomalyLabels, self._vectorStarts):
+      del column[:numRecords]
+    del self._vectorBits[:numBits]
+    self._first = 0
+    self._offset += numRecords
+    self._bitsOffset += numBits
+
+
+  def _vector(self, index):
+    start = self._vectorStarts[index] - self._bitsOffset
+    end = (self._vectorStarts[index + 1] - self._bitsOffset
+           if index + 1 < len(self._rowIDs) else len(self._vectorBits))
+    return self._vectorBits[start:end].tolist()
+
+
+
+def _cachedColumn(name, convert):
+  """
+  Property reading and writing one column of a _CachedRecord's cache.
+  """
+  def getColumn(self):
+    return convert(getattr(self._cache, name)[self._index()])
+
+  def setColumn(self, value):
+    getattr(self._cache, name)[self._index()] = value
+
+  return property(getColumn, setColumn)
+
+
+
+class _CachedRecord(_CLAClassificationRecord):
+  """
+  View of a record stored in a _RecordsCache. The anomaly vector is read
+  only.
+  """
+  __slots__ = ["_cache", "_position"]
+
+  def __init__(self, cache, position):
+    self._cache = cache
+    self._position = position
+
+
+  def _index(self):
+    return self._position - self._cache._offset
+
+
+  ROWID = _cachedColumn("_rowIDs", int)
+  anomalyScore = _cachedColumn("_anomalyScores", float)
+  setByUser = _cachedColumn("_setByUser", bool)
+  anomalyLabel = _cachedColumn("_anomalyLabels", lambda labels: labels)
+
+
+  @property
+  def anomalyVector(self):
+    return self._cache._vector(self._index())
+
+
+  def __getstate__(self):
+    return dict((k, getattr(self, k))
+                for k in _CLAClassificationRecord.__slots__)
+
+
+
+class _PrototypeChanges(object):
+  """
+  Changes to the prototypes of the KNN classifier while
+  KNNAnomalyClassifierRegion._classifyStates reclassifies records.
+
+  tracked - whether nearest prototypes found before a change stay valid; false
+    if distances depend on all prototypes, or once the classifier changed in a
+    way that is not tracked
+  removed - ROWIDs of the removed prototypes
+  pendingRemovals - ROWIDs of removed prototypes still in the classifier
+  added - ROWIDs of the prototypes learned
+  """
+
+  def __init__(self, tracked):
+    self.tracked = tracked
+    self.removed = set()
+    self.pendingRemovals = []
+    self.added = []
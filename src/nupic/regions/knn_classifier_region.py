@@ -15,6 +15,7 @@ import numpy
 from nupic.bindings.regions.PyRegion import PyRegion
 from nupic.algorithms import knn_classifier
 from nupic.bindings.math import Random
+from nupic.support.array_checkpoint import ArrayCheckpointRegionMixin
 
 try:
   import capnp
@@ -25,7 +26,7 @@ if capnp:
 
 
 
-class KNNClassifierRegion(PyRegion):
+class KNNClassifierRegion(ArrayCheckpointRegionMixin, PyRegion):
   """
   KNNClassifierRegion implements the k Nearest Neighbor classification 
   algorithm. By default it will implement vanilla 1-nearest neighbor using the 
@@ -16,6 +16,7 @@ import warnings
 
 from nupic.bindings.regions.PyRegion import PyRegion
 from nupic.algorithms.sdr_classifier_factory import SDRClassifierFactory
+from nupic.support.array_checkpoint import ArrayCheckpointRegionMixin
 from nupic.support.configuration import Configuration
 
 try:
@@ -27,7 +28,7 @@ if capnp:
 
 
 
-class SDRClassifierRegion(PyRegion):
+class SDRClassifierRegion(ArrayCheckpointRegionMixin, PyRegion):
   """
   SDRClassifierRegion implements a SDR classifier that accepts a binary
   input from the level below (the "activationPattern") and information from the
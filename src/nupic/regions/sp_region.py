@@ -16,6 +16,7 @@ from nupic.bindings.regions.PyRegion import PyRegion
 import nupic.algorithms.fdrutilities as fdru
 from nupic.algorithms.spatial_pooler import SpatialPooler as PYSpatialPooler
 from nupic.support import getArgumentDescriptions
+from nupic.support.array_checkpoint import ArrayCheckpointRegionMixin
 
 try:
   import capnp
@@ -287,7 +288,7 @@ def _getAdditionalSpecs(spatialImp, kwargs={}):
 
 
 
-class SPRegion(PyRegion):
+class SPRegion(ArrayCheckpointRegionMixin, PyRegion):
   """
   SPRegion is designed to implement the spatial pooler compute for a given
   HTM level.
@@ -18,11 +18,12 @@ except ImportError:
 from nupic.bindings.regions.PyRegion import PyRegion
 
 from nupic.algorithms import (anomaly, backtracking_tm, backtracking_tm_cpp,
-                              backtracking_tm_shim)
+                              backtracking_tm_dense, backtracking_tm_shim)
 if capnp:
   from nupic.regions.tm_region_capnp import TMRegionProto
 
 from nupic.support import getArgumentDescriptions
+from nupic.support.array_checkpoint import ArrayCheckpointRegionMixin
 
 
 
@@ -36,6 +37,8 @@ def _getTPClass(temporalImp):
 
   if temporalImp == 'py':
     return backtracking_tm.BacktrackingTM
+  elif temporalImp == 'py_dense':
+    return backtracking_tm_dense.BacktrackingTMDense
   elif temporalImp == 'cpp':
     return backtracking_tm_cpp.BacktrackingTMCPP
   elif temporalImp == 'tm_py':
@@ -46,7 +49,8 @@ def _getTPClass(temporalImp):
     return backtracking_tm_shim.MonitoredTMShim
   else:
     raise RuntimeError("Invalid temporalImp '%s'. Legal values are: 'py', "
-              "'cpp', 'tm_py', 'monitored_tm_py'" % (temporalImp))
+              "'py_dense', 'cpp', 'tm_py', 'tm_cpp', 'monitored_tm_py'"
+              % (temporalImp))
 
 
 
@@ -196,11 +200,13 @@ def _getAdditionalSpecs(temporalImp, kwargs={}):
 
     temporalImp=dict(
       description="""Which temporal memory implementation to use. Set to either
-       'py' or 'cpp'. The 'cpp' implementation is optimized for speed in C++.""",
+       'py', 'py_dense' or 'cpp'. The 'cpp' implementation is optimized for
+       speed in C++. The 'py_dense' implementation computes the same results
+       as 'py' with dense numpy arrays, which is faster in Python.""",
       accessMode='ReadWrite',
       dataType='Byte',
       count=0,
-      constraints='enum: py, cpp'),
+      constraints='enum: py, py_dense, cpp'),
 
   ))
 
@@ -276,7 +282,7 @@ def _getAdditionalSpecs(temporalImp, kwargs={}):
 
 
 
-class TMRegion(PyRegion):
+class TMRegion(ArrayCheckpointRegionMixin, PyRegion):
 
   """
   TMRegion is designed to implement the temporal memory compute for a given
@@ -404,7 +410,7 @@ class TMRegion(PyRegion):
     if self._tfdr is None:
       tpClass = _getTPClass(self.temporalImp)
 
-      if self.temporalImp in ['py', 'cpp', 'r',
+      if self.temporalImp in ['py', 'py_dense', 'cpp', 'r',
                               'tm_py', 'tm_cpp',
                               'monitored_tm_py',]:
         self._tfdr = tpClass(
@@ -793,7 +799,7 @@ class TMRegion(PyRegion):
       self.computePredictedActiveCellIndices)
     proto.orColumnOutputs = self.orColumnOutputs
 
-    if self.temporalImp == "py":
+    if self.temporalImp in ("py", "py_dense"):
       tmProto = proto.init("backtrackingTM")
     elif self.temporalImp == "cpp":
       tmProto = proto.init("backtrackingTMCpp")
@@ -829,7 +835,7 @@ class TMRegion(PyRegion):
       proto.computePredictedActiveCellIndices)
     instance.orColumnOutputs = proto.orColumnOutputs
 
-    if instance.temporalImp == "py":
+    if instance.temporalImp in ("py", "py_dense"):
       tmProto = proto.backtrackingTM
     elif instance.temporalImp == "cpp":
       tmProto = proto.backtrackingTMCpp
@@ -864,7 +870,9 @@ class TMRegion(PyRegion):
     """
     Overrides :meth:`~nupic.bindings.regions.PyRegion.PyRegion.serializeExtraData`.
     """
-    if self._tfdr is not None:
+    if self._usesArrayCheckpoint():
+      super(TMRegion, self).serializeExtraData(filePath)
+    elif self._tfdr is not None:
       self._tfdr.saveToFile(filePath)
 
   def deSerializeExtraData(self, filePath):
@@ -876,7 +884,9 @@ class TMRegion(PyRegion):
 
     :param filePath: (string) absolute file path
     """
-    if self._tfdr is not None:
+    if self._usesArrayCheckpoint():
+      super(TMRegion, self).deSerializeExtraData(filePath)
+    elif self._tfdr is not None:
       self._tfdr.loadFromFile(filePath)
 
 
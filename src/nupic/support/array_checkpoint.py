@@ -0,0 +1,621 @@
+# Copyright 2017 Numenta Inc.
+#
+# Copyright may exist in Contributors' modifications
+# and/or contributions to the work.
+#
+# Use of this source code is governed by the MIT
+# license that can be found in the LICENSE file or at
+# https://opensource.org/licenses/MIT.
+
+"""
+Array checkpoints: pickles in which the large arrays are saved as separate raw
+``.npy`` files.
+
+An array checkpoint is a directory holding a small pickled manifest and one
+file per large array. When it is read, the arrays are memory-mapped
+copy-on-write (except on Windows), so they are only loaded from the disk when
+they are used, and modifying them never changes the checkpoint. The following are saved as
+separate files:
+
+- numpy arrays
+- the sparse matrices used by the spatial pooler (as their non-zeros)
+- large byte strings, e.g. the serialized state of C++ algorithms
+
+An array checkpoint can also be written as a delta of a previous one (its
+base): the digests of the blocks of rows of its arrays are saved in an index,
+and only the blocks that changed since the base are written. Reading the
+checkpoint reads the base arrays and replays the changed blocks on them.
+
+Python regions that inherit :class:`ArrayCheckpointRegionMixin` are saved as
+array checkpoints by :func:`writeNetworkArrayCheckpoint`. The network can be
+loaded back with ``Network(path)`` as usual.
+"""
+
+import cPickle as pickle
+import hashlib
+import os
+
+import numpy
+
+from nupic.bindings.math import SM32, SM_01_32_32
+from nupic.support.fs_helpers import makeDirectoryFromAbsolutePath
+
+# Version of the array checkpoint layout
+ARRAY_CHECKPOINT_VERSION = 1
+
+# Name of the pickled manifest in the checkpoint directory
+MANIFEST_FILE_NAME = "manifest.pkl"
+
+# Name of the pickled index of the saved arrays, written if the checkpoint can
+# be the base of other checkpoints
+INDEX_FILE_NAME = "index.pkl"
+
+# Arrays, sparse matrices and strings smaller than this (in bytes) are
+# pickled in the manifest
+DEFAULT_MIN_SIZE = 1 << 16
+
+# Size in bytes of the blocks of rows compared with the base checkpoint. The
+# blocks hold at least one row.
+DEFAULT_BLOCK_SIZE = 1 << 12
+
+# Whether the arrays are memory-mapped when reading a checkpoint. Memory-mapped
+# files can't be deleted or replaced on Windows, so there a checkpoint
+# couldn't be overwritten while the model read from it is in use.
+DEFAULT_MMAP = os.name != "nt"
+
+# Region attribute marking regions whose state is in an array checkpoint
+_ARRAY_CHECKPOINT_ATTR = "_arrayCheckpoint"
+
+# Region attribute holding the arguments of writeArrayCheckpoint while the
+# region is saved
+_ARRAY_CHECKPOINT_ARGS_ATTR = "_arrayCheckpointArgs"
+
+
+
+def isArrayCheckpoint(path):
+  """
+  :param path: (string) path of a file or directory
+  :returns: (bool) True if ``path`` is an array checkpoint directory
+  """
+  return os.path.isfile(os.path.join(path, MANIFEST_FILE_NAME))
+
+
+
+def writeArrayCheckpoint(obj, path, minSize=DEFAULT_MIN_SIZE, base=None,
+                         indexBlocks=False, blockSize=DEFAULT_BLOCK_SIZE):
+  """
+  Pickle an object in the directory ``path``, saving its large arrays as
+  separate ``.npy`` files. The directory is created if it doesn't exist.
+
+  :param obj: the object to save
+  :param path: (string) checkpoint directory
+  :param minSize: (int) size in bytes from which the arrays, sparse matrices
+         and strings are saved as separate files
+  :param base: (string) directory of a previous checkpoint written with
+         ``indexBlocks``, usually of the same object. If given, the arrays are
+         saved as deltas of the arrays of ``base``: only their blocks of rows
+         that changed are written, and the arrays and strings that didn't
+         change are not written at all. The base must be kept as long as the
+         checkpoint is used. If ``base`` is not an indexed checkpoint, the
+         checkpoint is written in full.
+  :param indexBlocks: (bool) if True, the digests of the blocks of the arrays
+         are saved so that the checkpoint can be the base of other
+         checkpoints. Implied by ``base``.
+  :param blockSize: (int) size in bytes of the blocks of rows compared with
+         the base
+  :returns: (list) names of the files written, the manifest and the index
+            excluded
+  """
+  path = makeDirectoryFromAbsolutePath(os.path.abspath(path))
+  baseIndex = None
+  if base is not None:
+    indexBlocks = True
+    base = os.path.abspath(base)
+    baseIndex = _readIndex(base)
+
+  writer = _ArrayWriter(path, minSize, indexBlocks, blockSize)
+  if baseIndex is not None:
+    writer.setBase(os.path.relpath(base, path), baseIndex)
+
+  with open(os.path.join(path, MANIFEST_FILE_NAME), "wb") as f:
+    pickler = pickle.Pickler(f, pickle.HIGHEST_PROTOCOL)
+    pickler.persistent_id = writer.persistentId
+    pickler.dump((ARRAY_CHECKPOINT_VERSION, obj))
+
+  indexPath = os.path.join(path, INDEX_FILE_NAME)
+  if writer.index is not None:
+    with open(indexPath, "wb") as f:
+      pickle.dump(writer.index, f, pickle.HIGHEST_PROTOCOL)
+  elif os.path.exists(indexPath):
+    # Left by a previous checkpoint in the same directory
+    os.remove(indexPath)
+
+  return writer.fileNames
+
+
+
+def readArrayCheckpoint(path, mmap=DEFAULT_MMAP):
+  """
+  Read an object saved with :func:`writeArrayCheckpoint`.
+
+  :param path: (string) checkpoint directory
+  :param mmap: (bool) if True, the numpy arrays are memory-mapped
+         copy-on-write instead of being read. The files must not be modified
+         in place while the arrays are in use, but they can be deleted or
+         replaced except on Windows. Defaults to :const:`DEFAULT_MMAP`.
+  :returns: the object
+  """
+  path = os.path.abspath(path)
+  reader = _ArrayReader(path, mmap)
+  with open(os.path.join(path, MANIFEST_FILE_NAME), "rb") as f:
+    unpickler = pickle.Unpickler(f)
+    unpickler.persistent_load = reader.persistentLoad
+    version, obj = unpickler.load()
+
+  if version != ARRAY_CHECKPOINT_VERSION:
+    raise ValueError("Unsupported array checkpoint version %r in %s" %
+                     (version, path))
+
+  return obj
+
+
+
+def _readIndex(path):
+  """
+  :returns: (list) the index of the checkpoint in ``path``, None if it has no
+            index
+  """
+  indexPath = os.path.join(path, INDEX_FILE_NAME)
+  if not os.path.isfile(indexPath):
+    return None
+  with open(indexPath, "rb") as f:
+    return pickle.load(f)
+
+
+
+def _asRows(array, rowAxis):
+  """
+  :returns: a view of a C-contiguous array as a list of rows, by flattening
+            its axes before ``rowAxis``
+  """
+  numRows = int(numpy.prod(array.shape[:rowAxis]))
+  return array.reshape((numRows,) + array.shape[rowAxis:])
+
+
+
+def _getBlockDigests(array, blockSize, layout=None):
+  """
+  Split a C-contiguous array in blocks of rows of about ``blockSize`` bytes.
+  The rows are its sub-arrays along its first axes, the smallest ones that
+  are not larger than ``blockSize`` if possible.
+
+  :param layout: (tuple) the number of axes flattened into rows and the number
+         of rows per block, overrides ``blockSize``
+  :returns: (tuple) the layout of the blocks and the array of their digests
+  """
+  if array.ndim == 0:
+    return (0, 1), numpy.array([hashlib.md5(array.tostring()).digest()])
+
+  if layout is None:
+    rowAxis = 1
+    while (rowAxis < array.ndim and
+           array.itemsize * numpy.prod(array.shape[rowAxis:]) > blockSize):
+      rowAxis += 1
+    rowSize = array.itemsize * int(numpy.prod(array.shape[rowAxis:]))
+    layout = (rowAxis, max(1, blockSize // max(1, rowSize)))
+
+  rowAxis, blockRows = layout
+  rows = _asRows(array, rowAxis)
+  digests = [hashlib.md5(rows[i:i + blockRows].data).digest()
+             for i in xrange(0, len(rows), blockRows)]
+  return layout, numpy.array(digests, dtype="S16")
+
+
+
+def _getBlockRows(blocks, layout, numRows):
+  """
+  :returns: (numpy.ndarray) the indices of the rows of the given blocks
+  """
+  blockRows = layout[1]
+  rows = (numpy.asarray(blocks, dtype="int64")[:, numpy.newaxis] * blockRows +
+          numpy.arange(blockRows)).ravel()
+  return rows[rows < numRows]
+
+
+
+def _getGrownSlices(baseShape, shape):
+  """
+  :returns: (list) the indices of the parts of an array of shape ``shape``
+            that are out of the array of shape ``baseShape`` it grew from,
+            one per axis along which it grew
+  """
+  return [tuple(slice(0, n) for n in baseShape[:axis]) +
+          (slice(baseShape[axis], None),)
+          for axis in xrange(len(shape)) if shape[axis] > baseShape[axis]]
+
+
+
+class _ArrayWriter(object):
+  """
+  Saves the large objects met by the pickler in separate files, and gives the
+  pickler their persistent ids.
+
+  If ``indexBlocks`` is True, the entries of the index of the checkpoint are
+  built in ``index``: one per array or string saved, in the order they are
+  saved, with their persistent id and their digests. The entry with the same
+  position in the index of the base checkpoint is the one they are compared
+  with.
+  """
+
+
+  def __init__(self, path, minSize, indexBlocks=False,
+               blockSize=DEFAULT_BLOCK_SIZE):
+    self.path = path
+    self.minSize = minSize
+    self.blockSize = blockSize
+    self.fileNames = []
+    self.index = [] if indexBlocks else None
+    # Path of the base checkpoint relative to this one, and its index
+    self._basePath = None
+    self._baseIndex = []
+    # Persistent ids of the objects already saved, by object id. The objects
+    # are kept so that their ids can't be reused.
+    self._savedIds = dict()
+    self._savedObjects = []
+
+
+  def setBase(self, basePath, baseIndex):
+    """
+    Save the arrays as deltas of the arrays of a base checkpoint.
+
+    :param basePath: (string) path of the base checkpoint relative to this one
+    :param baseIndex: (list) index of the base checkpoint
+    """
+    self._basePath = basePath
+    self._baseIndex = baseIndex
+
+
+  def persistentId(self, obj):
+    """
+    :returns: the persistent id of ``obj`` if it is saved in separate files,
+              None if it must be pickled in the manifest.
+    """
+    objType = type(obj)
+    if objType is str:
+      if len(obj) < self.minSize:
+        return None
+    elif objType is numpy.ndarray or objType is numpy.memmap:
+      if obj.nbytes < self.minSize or obj.dtype.hasobject:
+        return None
+    elif isinstance(obj, (SM32, SM_01_32_32)):
+      if obj.nNonZeros() * 12 < self.minSize:
+        return None
+    else:
+      return None
+
+    key = id(obj)
+    if key not in self._savedIds:
+      self._savedIds[key] = self._save(obj)
+      self._savedObjects.append(obj)
+    return self._savedIds[key]
+
+
+  def _save(self, obj):
+    if type(obj) is str:
+      return self._saveBytes(obj)
+
+    if isinstance(obj, (SM32, SM_01_32_32)):
+      nonZeros = [self._saveArray(a) for a in obj.getAllNonZeros(True)]
+      return ("sparse", type(obj), obj.nRows(), obj.nCols()) + tuple(nonZeros)
+
+    return self._saveArray(obj)
+
+
+  def _saveBytes(self, data):
+    if self.index is None:
+      return ("bytes", self._writeBytes(data))
+
+    entry = dict(kind="bytes", digest=hashlib.md5(data).digest())
+    baseEntry = self._getBaseEntry()
+    if baseEntry.get("digest") == entry["digest"]:
+      entry["pid"] = ("ref", self._basePath, len(self.index))
+    else:
+      entry["pid"] = ("bytes", self._writeBytes(data))
+
+    self.index.append(entry)
+    return entry["pid"]
+
+
+  def _saveArray(self, array):
+    if self.index is None:
+      return ("array", self._writeArray(array))
+
+    array = numpy.require(array, requirements="C")
+    layout, digests = _getBlockDigests(array, self.blockSize)
+    entry = dict(kind="array", dtype=array.dtype.str, shape=array.shape,
+                 layout=layout, digests=digests)
+    baseEntry = self._getBaseEntry()
+    patch = self._getPatch(array, entry, baseEntry)
+
+    if patch is None:
+      entry["pid"] = ("array", self._writeArray(array))
+    else:
+      blocks, data, slabs = patch
+      if not len(blocks) and array.shape == baseEntry["shape"]:
+        entry["pid"] = ("ref", self._basePath, len(self.index))
+      else:
+        blocksFileName = dataFileName = None
+        if len(blocks):
+          blocksFileName = self._writeArray(blocks)
+          dataFileName = self._writeArray(data)
+        entry["pid"] = ("patch", self._basePath, len(self.index), array.shape,
+                        baseEntry["layout"], blocksFileName, dataFileName,
+                        tuple(self._writeArray(slab) for slab in slabs))
+
+    self.index.append(entry)
+    return entry["pid"]
+
+
+  def _getPatch(self, array, entry, baseEntry):
+    """
+    Compare an array with the array of the base checkpoint it replaces, which
+    has the same shape or is smaller along some axes.
+
+    :param entry: (dict) index entry of the array
+    :param baseEntry: (dict) index entry of the base array
+    :returns: (tuple) the indices of the blocks of rows of the base array
+              that changed (see :func:`_getBlockDigests`), their rows
+              restricted to the shape of the base array, and the parts of the
+              array out of the base array (see :func:`_getGrownSlices`). None
+              if the whole array must be saved.
+    """
+    baseShape = baseEntry.get("shape")
+    if (baseEntry.get("kind") != "array" or
+        baseEntry["dtype"] != entry["dtype"] or
+        array.ndim == 0 or len(baseShape) != array.ndim or
+        any(n < baseN for n, baseN in zip(array.shape, baseShape))):
+      return None
+
+    layout = baseEntry["layout"]
+    if array.shape == baseShape and entry["layout"] == layout:
+      common = array
+      digests = entry["digests"]
+    else:
+      common = numpy.ascontiguousarray(
+        array[tuple(slice(0, n) for n in baseShape)])
+      _, digests = _getBlockDigests(common, self.blockSize, layout)
+
+    blocks = numpy.flatnonzero(digests != baseEntry["digests"])
+    common = _asRows(common, layout[0])
+    data = common[_getBlockRows(blocks, layout, len(common))]
+    slabs = [array[index]
+             for index in _getGrownSlices(baseShape, array.shape)]
+
+    if (data.nbytes + sum(slab.nbytes for slab in slabs)) * 2 > array.nbytes:
+      # Saving the whole array is about as small, and faster to read
+      return None
+    return blocks, data, slabs
+
+
+  def _getBaseEntry(self):
+    """
+    :returns: (dict) the entry of the base index for the next array or string
+              saved, empty if there is none
+    """
+    if len(self.index) < len(self._baseIndex):
+      return self._baseIndex[len(self.index)]
+    return dict()
+
+
+  def _writeBytes(self, data):
+    fileName = self._newFileName("bin")
+    with open(os.path.join(self.path, fileName), "wb") as f:
+      f.write(data)
+    return fileName
+
+
+  def _writeArray(self, array):
+    fileName = self._newFileName("npy")
+    numpy.save(os.path.join(self.path, fileName), array)
+    return fileName
+
+
+  def _newFileName(self, extension):
+    fileName = "%d.%s" % (len(self.fileNames), extension)
+    self.fileNames.append(fileName)
+    return fileName
+
+
+
+class _ArrayReader(object):
+  """
+  Loads the objects saved by :class:`_ArrayWriter` from their persistent ids.
+  """
+
+
+  def __init__(self, path, mmap):
+    self.path = path
+    self.mmap = mmap
+    # Objects already loaded, by persistent id, so that objects shared in the
+    # saved object are still shared
+    self._loaded = dict()
+    # Readers of the base checkpoints, by relative path
+    self._baseReaders = dict()
+
+
+  def persistentLoad(self, pid):
+    if pid not in self._loaded:
+      self._loaded[pid] = self._load(pid)
+    return self._loaded[pid]
+
+
+  def _load(self, pid):
+    kind = pid[0]
+    if kind == "array":
+      return self._loadArray(pid[1])
+
+    if kind == "bytes":
+      with open(os.path.join(self.path, pid[1]), "rb") as f:
+        return f.read()
+
+    if kind == "sparse":
+      cls, nRows, nCols = pid[1:4]
+      nonZeros = [self.persistentLoad(arrayPid) for arrayPid in pid[4:]]
+      matrix = (SM32 if issubclass(cls, SM32) else SM_01_32_32)(nRows, nCols)
+      matrix.setAllNonZeros(nRows, nCols, *nonZeros)
+      # The cortical column adapters of the spatial pooler only add methods
+      matrix.__class__ = cls
+      return matrix
+
+    if kind == "ref":
+      basePath, key = pid[1:]
+      return self._loadBaseEntry(basePath, key)
+
+    if kind == "patch":
+      (basePath, key, shape, layout, blocksFileName, dataFileName,
+       slabFileNames) = pid[1:]
+      # The base array is only used here, so it can be changed in place
+      array = self._loadBaseEntry(basePath, key)
+      if blocksFileName is not None:
+        rows = _asRows(array, layout[0])
+        rows[_getBlockRows(self._loadArray(blocksFileName), layout,
+                           len(rows))] = self._loadArray(dataFileName)
+
+      if shape != array.shape:
+        baseArray = array
+        array = numpy.zeros(shape, dtype=baseArray.dtype)
+        array[tuple(slice(0, n) for n in baseArray.shape)] = baseArray
+        for index, fileName in zip(_getGrownSlices(baseArray.shape, shape),
+                                   slabFileNames):
+          array[index] = self._loadArray(fileName)
+      return array
+
+    raise pickle.UnpicklingError("Unknown persistent id %r" % (pid,))
+
+
+  def _loadBaseEntry(self, basePath, key):
+    if basePath not in self._baseReaders:
+      path = os.path.normpath(os.path.join(self.path, basePath))
+      index = _readIndex(path)
+      if index is None:
+        raise pickle.UnpicklingError("Missing base checkpoint %s" % path)
+      self._baseReaders[basePath] = (_ArrayReader(path, self.mmap), index)
+
+    reader, index = self._baseReaders[basePath]
+    return reader.persistentLoad(index[key]["pid"])
+
+
+  def _loadArray(self, fileName):
+    array = numpy.load(os.path.join(self.path, fileName),
+                       mmap_mode="c" if self.mmap else None)
+    # A plain view pickles and behaves like the arrays it replaces
+    return array.view(numpy.ndarray)
+
+
+
+class ArrayCheckpointRegionMixin(object):
+  """
+  Mixin for Python regions whose state can be saved as an array checkpoint
+  by :func:`writeNetworkArrayCheckpoint`.
+
+  When the network is saved, the region is only pickled as a placeholder, and
+  its state (as returned by ``__getstate__``) is written with
+  :func:`writeArrayCheckpoint` in ``serializeExtraData``. When the network is
+  loaded, ``deSerializeExtraData`` reads the state back and restores it with
+  ``__setstate__``. Otherwise, the region is pickled as usual.
+
+  Regions overriding ``serializeExtraData`` or ``deSerializeExtraData`` must
+  call the mixin's methods when :meth:`_usesArrayCheckpoint` is True.
+  """
+
+
+  def _usesArrayCheckpoint(self):
+    """
+    :returns: (bool) True while the region is saved to or loaded from an array
+              checkpoint
+    """
+    return self.__dict__.get(_ARRAY_CHECKPOINT_ATTR, False)
+
+
+  def __reduce_ex__(self, protocol):
+    if self._usesArrayCheckpoint():
+      return (_newArrayCheckpointRegion, (self.__class__,))
+    return super(ArrayCheckpointRegionMixin, self).__reduce_ex__(protocol)
+
+
+  def serializeExtraData(self, filePath):
+    """
+    Overrides :meth:`~nupic.bindings.regions.PyRegion.PyRegion.serializeExtraData`.
+    """
+    if self._usesArrayCheckpoint():
+      if hasattr(self, "__getstate__"):
+        state = self.__getstate__()
+      else:
+        state = self.__dict__.copy()
+      if isinstance(state, dict):
+        state.pop(_ARRAY_CHECKPOINT_ATTR, None)
+        state.pop(_ARRAY_CHECKPOINT_ARGS_ATTR, None)
+
+      kwargs = dict(self.__dict__.get(_ARRAY_CHECKPOINT_ARGS_ATTR, {}))
+      if kwargs.get("base") is not None:
+        # The state of the region in the base network
+        kwargs["base"] = os.path.join(kwargs["base"],
+                                      os.path.basename(filePath))
+      writeArrayCheckpoint(state, filePath, **kwargs)
+
+
+  def deSerializeExtraData(self, filePath):
+    """
+    Overrides :meth:`~nupic.bindings.regions.PyRegion.PyRegion.deSerializeExtraData`.
+    """
+    if self._usesArrayCheckpoint():
+      state = readArrayCheckpoint(filePath)
+      del self.__dict__[_ARRAY_CHECKPOINT_ATTR]
+      if hasattr(self, "__setstate__"):
+        self.__setstate__(state)
+      else:
+        self.__dict__.update(state)
+
+
+
+def _newArrayCheckpointRegion(cls):
+  """
+  Create the placeholder of a region saved as an array checkpoint. Its state
+  is restored by ``deSerializeExtraData``.
+  """
+  region = cls.__new__(cls)
+  region.__dict__[_ARRAY_CHECKPOINT_ATTR] = True
+  return region
+
+
+
+def writeNetworkArrayCheckpoint(network, path, base=None, indexBlocks=False):
+  """
+  Save a network like ``network.save(path)``, but the Python regions that
+  inherit :class:`ArrayCheckpointRegionMixin` are saved as array checkpoints.
+  The network is loaded back with ``Network(path)``.
+
+  :param network: (:class:`nupic.engine.Network`) the network to save
+  :param path: (string) path of the saved network
+  :param base: (string) path of a network previously saved with
+         ``indexBlocks``. If given, the regions are saved as deltas of their
+         state in this network (see :func:`writeArrayCheckpoint`).
+  :param indexBlocks: (bool) if True, the network can be the base of other
+         saved networks
+  """
+  regions = [region.getSelf() for region in network.regions.values()]
+  regions = [region for region in regions
+             if isinstance(region, ArrayCheckpointRegionMixin)]
+  kwargs = dict(indexBlocks=indexBlocks)
+  if base is not None:
+    kwargs["base"] = os.path.abspath(base)
+
+  for region in regions:
+    region.__dict__[_ARRAY_CHECKPOINT_ATTR] = True
+    region.__dict__[_ARRAY_CHECKPOINT_ARGS_ATTR] = kwargs
+  try:
+    network.save(path)
+  finally:
+    for region in regions:
+      del region.__dict__[_ARRAY_CHECKPOINT_ATTR]
+      del region.__dict__[_ARRAY_CHECKPOINT_ARGS_ATTR]
@@ -38,6 +38,7 @@ import unittest2 as unittest
 
 from nupic.algorithms.backtracking_tm import BacktrackingTM
 from nupic.algorithms.backtracking_tm_cpp import BacktrackingTMCPP
+from nupic.algorithms.backtracking_tm_dense import BacktrackingTMDense
 from nupic.support.unittesthelpers import testcasebase
 
 SEED = 42
@@ -76,7 +77,8 @@ def _buildLikelihoodTrainingSet(numOnes=5, relativeFrequencies=None):
 
   return (trainingSequences, relativeFrequencies, allPatterns)
 
-def _createTMs(numCols, cellsPerColumn=4, checkSynapseConsistency=True):
+def _createTMs(numCols, cellsPerColumn=4, checkSynapseConsistency=True,
+               pyTMClass=BacktrackingTM):
   """Create TM and BacktrackingTMCPP instances with identical parameters. """
 
   # Keep these fixed for both TM's:
@@ -105,14 +107,14 @@ def _createTMs(numCols, cellsPerColumn=4, checkSynapseConsistency=True):
   if VERBOSITY > 1:
     print "Creating PY TM instance"
 
-  pyTm = BacktrackingTM(numberOfCols=numCols, cellsPerColumn=cellsPerColumn,
-                        initialPerm=initialPerm, connectedPerm=connectedPerm,
-                        minThreshold=minThreshold, newSynapseCount=newSynapseCount,
-                        permanenceInc=permanenceInc, permanenceDec=permanenceDec,
-                        activationThreshold=activationThreshold,
-                        globalDecay=globalDecay, burnIn=1,
-                        seed=SEED, verbosity=VERBOSITY,
-                        pamLength=1000)
+  pyTm = pyTMClass(numberOfCols=numCols, cellsPerColumn=cellsPerColumn,
+                   initialPerm=initialPerm, connectedPerm=connectedPerm,
+                   minThreshold=minThreshold, newSynapseCount=newSynapseCount,
+                   permanenceInc=permanenceInc, permanenceDec=permanenceDec,
+                   activationThreshold=activationThreshold,
+                   globalDecay=globalDecay, burnIn=1,
+                   seed=SEED, verbosity=VERBOSITY,
+                   pamLength=1000)
 
   return cppTm, pyTm
 
@@ -207,6 +209,9 @@ def _createDataset(numSequences, originalSequences, relativeFrequencies):
 
 class TMLikelihoodTest(testcasebase.TestCaseBase):
 
+  # Class of the Python TM
+  pyTMClass = BacktrackingTM
+
   def _testSequence(self,
                     trainingSet,
                     nSequencePresentations=1,
@@ -356,7 +361,8 @@ class TMLikelihoodTest(testcasebase.TestCaseBase):
 
     trainingSet = _buildLikelihoodTrainingSet(numOnes, relativeFrequencies)
     cppTm, pyTm = _createTMs(numCols=trainingSet[0][0][0].size,
-                             checkSynapseConsistency=checkSynapseConsistency)
+                             checkSynapseConsistency=checkSynapseConsistency,
+                             pyTMClass=self.pyTMClass)
 
     # Test both TM's. Currently the CPP TM has faster confidence estimation
     self._testSequence(trainingSet, nSequencePresentations=200, tm=cppTm,
@@ -373,7 +379,8 @@ class TMLikelihoodTest(testcasebase.TestCaseBase):
     trainingSet = _buildLikelihoodTrainingSet(numOnes, relativeFrequencies)
 
     cppTm, pyTm = _createTMs(numCols=trainingSet[0][0][0].size,
-                             checkSynapseConsistency=checkSynapseConsistency)
+                             checkSynapseConsistency=checkSynapseConsistency,
+                             pyTMClass=self.pyTMClass)
 
     # Test both TM's
     for tm in [cppTm, pyTm]:
@@ -413,5 +420,12 @@ class TMLikelihoodTest(testcasebase.TestCaseBase):
     self._likelihoodTest2(numOnes=5, relativeFrequencies=[0.1, 0.5, 0.4])
 
 
+
+class TMLikelihoodDenseTest(TMLikelihoodTest):
+  """Runs the same tests with BacktrackingTMDense."""
+
+  pyTMClass = BacktrackingTMDense
+
+
 if __name__ == "__main__":
   unittest.main()
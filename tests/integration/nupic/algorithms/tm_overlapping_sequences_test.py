@@ -37,6 +37,7 @@ from optparse import OptionParser
 from nupic.algorithms import fdrutilities as fdrutils
 from nupic.algorithms.backtracking_tm import BacktrackingTM
 from nupic.algorithms.backtracking_tm_cpp import BacktrackingTMCPP
+from nupic.algorithms.backtracking_tm_dense import BacktrackingTMDense
 from nupic.support.unittesthelpers import testcasebase
 
 VERBOSITY = 0         # how chatty the unit tests should be
@@ -234,6 +235,7 @@ def createTMs(includeCPP = True,
               checkSynapseConsistency = True,
               maxInfBacktrack = 0,
               maxLrnBacktrack = 0,
+              pyTMClass = BacktrackingTM,
               **kwargs
               ):
 
@@ -242,6 +244,7 @@ def createTMs(includeCPP = True,
 
   Parameters:
   ------------------------------------------------------------------
+  pyTMClass: class of the Python TM instance
   retval:   tms - dict of TM instances
   """
 
@@ -278,18 +281,18 @@ def createTMs(includeCPP = True,
     if VERBOSITY >= 2:
       print "Creating PY TM instance"
 
-    py_tm = BacktrackingTM(numberOfCols = numCols, cellsPerColumn = cellsPerCol,
-                           initialPerm = initialPerm, connectedPerm = connectedPerm,
-                           minThreshold = minThreshold, newSynapseCount = newSynapseCount,
-                           permanenceInc = permanenceInc, permanenceDec = permanenceDec,
-                           activationThreshold = activationThreshold,
-                           globalDecay = globalDecay, burnIn = 1,
-                           seed=SEED, verbosity=VERBOSITY,
-                           collectStats = True,
-                           pamLength = pamLength,
-                           maxInfBacktrack = maxInfBacktrack,
-                           maxLrnBacktrack = maxLrnBacktrack,
-                           )
+    py_tm = pyTMClass(numberOfCols = numCols, cellsPerColumn = cellsPerCol,
+                      initialPerm = initialPerm, connectedPerm = connectedPerm,
+                      minThreshold = minThreshold, newSynapseCount = newSynapseCount,
+                      permanenceInc = permanenceInc, permanenceDec = permanenceDec,
+                      activationThreshold = activationThreshold,
+                      globalDecay = globalDecay, burnIn = 1,
+                      seed=SEED, verbosity=VERBOSITY,
+                      collectStats = True,
+                      pamLength = pamLength,
+                      maxInfBacktrack = maxInfBacktrack,
+                      maxLrnBacktrack = maxLrnBacktrack,
+                      )
 
 
     tms['PY '] = py_tm
@@ -632,6 +635,10 @@ def _testConfig(baseParams, expMissingMin=0, expMissingMax=0, **mods):
 
 class TMOverlappingSeqsTest(testcasebase.TestCaseBase):
 
+  # Class of the Python TM that is checked against the CPP TM
+  pyTMClass = BacktrackingTM
+
+
   def testFastLearning(self):
     """
     Test with fast learning, make sure PAM allows us to train with fewer
@@ -652,6 +659,7 @@ class TMOverlappingSeqsTest(testcasebase.TestCaseBase):
 
         # TM construction
         includeCPP = INCLUDE_CPP_TM,
+        pyTMClass = self.pyTMClass,
         numCols = None,   # filled in based on generated sequences
         activationThreshold = numOnBitsPerPattern,
         minThreshold = numOnBitsPerPattern,
@@ -702,6 +710,7 @@ class TMOverlappingSeqsTest(testcasebase.TestCaseBase):
 
         # TM construction
         includeCPP = INCLUDE_CPP_TM,
+        pyTMClass = self.pyTMClass,
         numCols = None,   # filled in based on generated sequences
         activationThreshold = numOnBitsPerPattern,
         minThreshold = numOnBitsPerPattern,
@@ -759,6 +768,7 @@ class TMOverlappingSeqsTest(testcasebase.TestCaseBase):
 
                     # TM construction
                     includeCPP = INCLUDE_CPP_TM,
+                    pyTMClass = self.pyTMClass,
                     numCols = None,   # filled in based on generated sequences
                     activationThreshold = int(0.8 * numOnBitsPerPattern),
                     minThreshold = int(0.8 * numOnBitsPerPattern),
@@ -817,6 +827,7 @@ class TMOverlappingSeqsTest(testcasebase.TestCaseBase):
 
         # TM construction
         includeCPP = INCLUDE_CPP_TM,
+        pyTMClass = self.pyTMClass,
         numCols = None,   # filled in based on generated sequences
         activationThreshold = int(0.8 * numOnBitsPerPattern),
         minThreshold = int(0.8 * numOnBitsPerPattern),
@@ -866,6 +877,14 @@ class TMOverlappingSeqsTest(testcasebase.TestCaseBase):
                                 nTrainRepetitions=8))
 
 
+
+class TMOverlappingSeqsDenseTest(TMOverlappingSeqsTest):
+  """Runs the same tests with BacktrackingTMDense, which must not differ from
+  the CPP TM."""
+
+  pyTMClass = BacktrackingTMDense
+
+
 if __name__=="__main__":
   # Process command line arguments
   parser = OptionParser()
@@ -159,68 +159,45 @@ class AnomalyLikelihoodClassTest(TestCaseBase):
     self.assertEqual(len(l._historicalScores), 3)
 
 
-  def testdWindowSizeImpactOnEstimateAnomalyLikelihoodsArgs(self):
-
-    # Verify that AnomalyLikelihood's historicWindowSize plays nice with args
-    # passed to estimateAnomalyLikelihoods"""
-
-    originalEstimateAnomalyLikelihoods = an.estimateAnomalyLikelihoods
-
-    estimationArgs = []
-
-    def estimateAnomalyLikelihoodsWrap(anomalyScores,
-                                       averagingWindow=10,
-                                       skipRecords=0,
-                                       verbosity=0):
-      estimationArgs.append((tuple(anomalyScores), skipRecords))
-
-      return originalEstimateAnomalyLikelihoods(anomalyScores,
-                                                averagingWindow=averagingWindow,
-                                                skipRecords=skipRecords,
-                                                verbosity=verbosity)
-
-
-    estimateAnomalyLikelihoodsPatch = mock.patch(
-      "nupic.algorithms.anomaly_likelihood.estimateAnomalyLikelihoods",
-      side_effect=estimateAnomalyLikelihoodsWrap, autospec=True)
-    with estimateAnomalyLikelihoodsPatch as estimateAnomalyLikelihoodsMock:
-      l = an.AnomalyLikelihood(claLearningPeriod=2,
+  def testEstimateDistributionMatchesEstimateAnomalyLikelihoods(self):
+    """
+    The streamed estimate matches estimateAnomalyLikelihoods on the sliding
+    window of historical scores, before and after records are evicted from it.
+    """
+    rng = numpy.random.RandomState(42)
+    for (learningPeriod, historicWindowSize) in [(2, 3), (20, 50), (30, 25)]:
+      l = an.AnomalyLikelihood(learningPeriod=learningPeriod,
                                estimationSamples=2,
-                               historicWindowSize=3)
-
-      l.anomalyProbability(10, 0.1, timestamp=1)
-      self.assertEqual(estimateAnomalyLikelihoodsMock.call_count, 0)
-
-      l.anomalyProbability(20, 0.2, timestamp=2)
-      self.assertEqual(estimateAnomalyLikelihoodsMock.call_count, 0)
-
-      l.anomalyProbability(30, 0.3, timestamp=3)
-      self.assertEqual(estimateAnomalyLikelihoodsMock.call_count, 0)
-
-      l.anomalyProbability(40, 0.4, timestamp=4)
-      self.assertEqual(estimateAnomalyLikelihoodsMock.call_count, 0)
-
-      # Estimation should kick in after claLearningPeriod + estimationSamples
-      # samples have been ingested
-      l.anomalyProbability(50, 0.5, timestamp=5)
-      self.assertEqual(estimateAnomalyLikelihoodsMock.call_count, 1)
-      # NOTE: we cannot use mock's assert_called_with, because the sliding
-      # window container changes in-place after estimateAnomalyLikelihoods is
-      # called
-      scores, numSkip = estimationArgs.pop()
-      self.assertEqual(scores, ((2, 20, 0.2), (3, 30, 0.3), (4, 40, 0.4)))
-      self.assertEqual(numSkip, 1)
+                               historicWindowSize=historicWindowSize)
+      for i in xrange(120):
+        # Flat metric values for a while to hit the constant metric check
+        value = 7.0 if 40 <= i < 80 else rng.uniform(0, 100)
+        l.anomalyProbability(value, rng.uniform() ** 4, timestamp=i)
+
+        numSkip = l._calcSkipRecords(numIngested=l._iteration,
+                                     windowSize=historicWindowSize,
+                                     learningPeriod=learningPeriod)
+        expected = an.estimateAnomalyLikelihoods(l._historicalScores,
+                                                 skipRecords=numSkip)[2]
+        params = l._estimateDistribution()
+
+        for key in ("mean", "variance", "stdev"):
+          self.assertAlmostEqual(expected["distribution"][key],
+                                 params["distribution"][key], places=10)
+        self.assertEqual(expected["movingAverage"]["historicalValues"],
+                         params["movingAverage"]["historicalValues"])
+        self.assertAlmostEqual(expected["movingAverage"]["total"],
+                               params["movingAverage"]["total"], places=10)
+        numpy.testing.assert_allclose(expected["historicalLikelihoods"],
+                                      params["historicalLikelihoods"],
+                                      rtol=1e-10)
 
 
   def testReestimationPeriodArg(self):
-    estimateAnomalyLikelihoodsWrap = mock.Mock(
-      wraps=an.estimateAnomalyLikelihoods,
-      autospec=True)
-
-    estimateAnomalyLikelihoodsPatch = mock.patch(
-      "nupic.algorithms.anomaly_likelihood.estimateAnomalyLikelihoods",
-      side_effect=estimateAnomalyLikelihoodsWrap, autospec=True)
-    with estimateAnomalyLikelihoodsPatch:
+    estimateDistributionPatch = mock.patch.object(
+      an.AnomalyLikelihood, "_estimateDistribution",
+      side_effect=an.AnomalyLikelihood._estimateDistribution, autospec=True)
+    with estimateDistributionPatch as estimateDistributionMock:
       l = an.AnomalyLikelihood(claLearningPeriod=2,
                                estimationSamples=2,
                                historicWindowSize=3,
@@ -231,16 +208,16 @@ class AnomalyLikelihoodClassTest(TestCaseBase):
       l.anomalyProbability(10, 0.1, timestamp=2)
       l.anomalyProbability(10, 0.1, timestamp=3)
       l.anomalyProbability(10, 0.1, timestamp=4)
-      self.assertEqual(estimateAnomalyLikelihoodsWrap.call_count, 0)
+      self.assertEqual(estimateDistributionMock.call_count, 0)
 
       l.anomalyProbability(10, 0.1, timestamp=5)
-      self.assertEqual(estimateAnomalyLikelihoodsWrap.call_count, 1)
+      self.assertEqual(estimateDistributionMock.call_count, 1)
       l.anomalyProbability(10, 0.1, timestamp=6)
-      self.assertEqual(estimateAnomalyLikelihoodsWrap.call_count, 1)
+      self.assertEqual(estimateDistributionMock.call_count, 1)
       l.anomalyProbability(10, 0.1, timestamp=7)
-      self.assertEqual(estimateAnomalyLikelihoodsWrap.call_count, 2)
+      self.assertEqual(estimateDistributionMock.call_count, 2)
       l.anomalyProbability(10, 0.1, timestamp=8)
-      self.assertEqual(estimateAnomalyLikelihoodsWrap.call_count, 2)
+      self.assertEqual(estimateDistributionMock.call_count, 2)
 
 
   def testAnomalyProbabilityResultsDuringProbationaryPeriod(self):
@@ -736,6 +713,83 @@ class AnomalyLikelihoodAlgorithmTest(TestCaseBase):
       an.updateAnomalyLikelihoods(data1, 42.0)
 
 
+  def testFromArraysMatchesRecordFunctions(self):
+    """
+    The array functions give the results of the record based functions, and
+    updating in small and large batches agrees.
+    """
+    data = _generateSampleData(mean=0.2)
+    scores = numpy.array([r[2] for r in data])
+    values = numpy.array([r[1] for r in data])
+
+    likelihoods, avgRecordList, params = an.estimateAnomalyLikelihoods(
+      data[:1000], skipRecords=20)
+    likelihoods2, averagedScores, params2 = (
+      an.estimateAnomalyLikelihoodsFromArrays(scores[:1000],
+                                              metricValues=values[:1000],
+                                              skipRecords=20))
+    numpy.testing.assert_array_equal(likelihoods, likelihoods2)
+    numpy.testing.assert_array_equal([r[2] for r in avgRecordList],
+                                     averagedScores)
+    self.assertEqual(params, params2)
+
+    # Record by record moving averages
+    historicalValues = []
+    total = 0.0
+    for i, score in enumerate(scores[:1000]):
+      expected, historicalValues, total = an.MovingAverage.compute(
+        historicalValues, total, score, 10)
+      self.assertAlmostEqual(expected, averagedScores[i], places=12)
+
+    likelihoods, averagedScores, params = (
+      an.updateAnomalyLikelihoodsFromArrays(scores[1000:], params2))
+    for i in xrange(1000, len(data), 3):
+      likelihoods3, averagedScores3, params2 = an.updateAnomalyLikelihoods(
+        data[i:i + 3], params2)
+      numpy.testing.assert_allclose(likelihoods[i - 1000:i - 997],
+                                    likelihoods3, rtol=1e-9)
+      numpy.testing.assert_allclose(averagedScores[i - 1000:i - 997],
+                                    averagedScores3, rtol=1e-9)
+    self.assertEqual(params["movingAverage"]["historicalValues"],
+                     params2["movingAverage"]["historicalValues"])
+    numpy.testing.assert_allclose(params["historicalLikelihoods"],
+                                  params2["historicalLikelihoods"],
+                                  rtol=1e-9)
+
+
+  def testTailProbabilities(self):
+    p = {"mean": 0.3, "name": "normal", "stdev": 0.2, "variance": 0.04}
+    for x in (numpy.array([0.1]), numpy.linspace(-1.0, 2.0, 101)):
+      self.assertEqual([an.tailProbability(v, p) for v in x],
+                       list(an.tailProbabilities(x, p)))
+
+
+  def testUpdateAnomalyLikelihoodsFromArraysEmptyHistory(self):
+    """
+    Without historical likelihoods, every new likelihood is returned, and the
+    first one is left unfiltered.
+    """
+    params = {
+      "distribution": {"name": "normal", "mean": 0.2, "variance": 0.0004,
+                       "stdev": 0.02},
+      "movingAverage": {"historicalValues": [], "total": 0.0,
+                        "windowSize": 1},
+      "historicalLikelihoods": [],
+    }
+    scores = numpy.array([1.0, 1.0, 0.2])
+
+    likelihoods, averagedScores, newParams = (
+      an.updateAnomalyLikelihoodsFromArrays(scores, params))
+
+    self.assertEqual(3, len(likelihoods))
+    self.assertEqual(3, len(averagedScores))
+    # Both red, so only the second is filtered to yellow
+    self.assertAlmostEqual(0.0, likelihoods[0])
+    self.assertAlmostEqual(0.001, likelihoods[1])
+    self.assertAlmostEqual(0.5, likelihoods[2])
+    numpy.testing.assert_allclose([0.5], newParams["historicalLikelihoods"])
+
+
   def testFilterLikelihodsInputType(self):
     """
     Calls _filterLikelihoods with both input types -- numpy array of floats and
@@ -819,6 +873,19 @@ class AnomalyLikelihoodAlgorithmTest(TestCaseBase):
                      msg="Failure in case (iii), list 3")
 
 
+  def testFilterLikelihoodsLongInput(self):
+    """
+    Long inputs are filtered like short ones.
+    """
+    likelihoods = numpy.random.RandomState(42).choice(
+      [0.5, 0.01, 1e-6, 1e-7], size=200)
+    filtered = an._filterLikelihoods(likelihoods)
+    for i in xrange(1, 200):
+      self.assertEqual(filtered[i],
+                       an._filterLikelihoods(likelihoods[i - 1:i + 1])[1])
+    self.assertEqual(filtered[0], likelihoods[0])
+
+
 
 if __name__ == "__main__":
   unittest.main()
@@ -0,0 +1,195 @@
+# Copyright 2017 Numenta Inc.
+#
+# Copyright may exist in Contributors' modifications
+# and/or contributions to the work.
+#
+# Use of this source code is governed by the MIT
+# license that can be found in the LICENSE file or at
+# https://opensource.org/licenses/MIT.
+
+"""Tests for the array-backed implementation of the backtracking TM."""
+
+import copy
+import cPickle as pickle
+import numpy
+import unittest2 as unittest
+
+try:
+  import capnp
+except ImportError:
+  capnp = None
+
+from nupic.algorithms.backtracking_tm import BacktrackingTM
+from nupic.algorithms.backtracking_tm_dense import (BacktrackingTMDense,
+                                                    DenseSegment)
+
+NUM_COLS = 60
+
+PARAMS = dict(numberOfCols=NUM_COLS, cellsPerColumn=4, initialPerm=0.5,
+              connectedPerm=0.5, minThreshold=3, newSynapseCount=6,
+              permanenceInc=0.1, permanenceDec=0.05, activationThreshold=5,
+              globalDecay=0.0, burnIn=1, seed=42, maxAge=0, pamLength=1)
+
+
+
+class BacktrackingTMDenseTest(unittest.TestCase):
+  """Checks that BacktrackingTMDense behaves exactly like BacktrackingTM."""
+
+
+  def setUp(self):
+    rgen = numpy.random.RandomState(42)
+    patterns = (rgen.rand(24, NUM_COLS) < 0.12).astype("float32")
+    self.sequences = [patterns[rgen.randint(len(patterns), size=8)]
+                      for _ in xrange(6)]
+    self.noise = (rgen.rand(20, NUM_COLS) < 0.12).astype("float32")
+
+
+  def assertSameTMs(self, tm1, tm2):
+    for name in ("infActiveState", "infPredictedState", "lrnActiveState",
+                 "lrnPredictedState", "cellConfidence", "colConfidence"):
+      states1 = getattr(tm1, name)
+      states2 = getattr(tm2, name)
+      for key in states1:
+        self.assertTrue(numpy.array_equal(states1[key], states2[key]),
+                        "%s[%s] differ" % (name, key))
+
+    for c in xrange(tm1.numberOfCols):
+      for i in xrange(tm1.cellsPerColumn):
+        self.assertEqual(len(tm1.cells[c][i]), len(tm2.cells[c][i]))
+        for seg1, seg2 in zip(tm1.cells[c][i], tm2.cells[c][i]):
+          self.assertEqual(seg1, seg2)
+          # The permanences must be the same, not only close
+          self.assertEqual([(syn[0], syn[1], float(syn[2]),
+                             isinstance(syn[2], numpy.float32))
+                            for syn in seg1.syns],
+                           [(syn[0], syn[1], float(syn[2]),
+                             isinstance(syn[2], numpy.float32))
+                            for syn in seg2.syns])
+
+    self.assertEqual(tm1._random.getState(), tm2._random.getState())
+
+
+  def runTMs(self, tm1, tm2, numRepetitions=2):
+    for _ in xrange(numRepetitions):
+      for sequence in self.sequences:
+        tm1.reset()
+        tm2.reset()
+        for x in sequence:
+          self.assertTrue(numpy.array_equal(tm1.learn(x), tm2.learn(x)))
+        self.assertSameTMs(tm1, tm2)
+
+    for x in numpy.vstack(self.sequences[:2] + [self.noise]):
+      self.assertTrue(numpy.array_equal(tm1.infer(x), tm2.infer(x)))
+      self.assertSameTMs(tm1, tm2)
+
+
+  def checkSameAsBacktrackingTM(self, **kwargs):
+    params = dict(PARAMS, **kwargs)
+    tm1 = BacktrackingTM(**params)
+    tm2 = BacktrackingTMDense(**params)
+    self.runTMs(tm1, tm2)
+    self.assertGreater(tm2.getNumSegments(), 0)
+    return tm1, tm2
+
+
+  def testSameAsBacktrackingTM(self):
+    self.checkSameAsBacktrackingTM()
+
+
+  def testSameAsBacktrackingTMWithPooling(self):
+    self.checkSameAsBacktrackingTM(doPooling=True, segUpdateValidDuration=5,
+                                   pamLength=3)
+
+
+  def testSameAsBacktrackingTMWithGlobalDecay(self):
+    self.checkSameAsBacktrackingTM(globalDecay=0.02, maxAge=1,
+                                   permanenceDec=0.0)
+
+
+  def testSameAsBacktrackingTMWithFixedResources(self):
+    self.checkSameAsBacktrackingTM(maxSegmentsPerCell=2,
+                                   maxSynapsesPerSegment=7,
+                                   permanenceDec=0.1)
+
+
+  def testSameAsBacktrackingTMWithBacktracking(self):
+    self.checkSameAsBacktrackingTM(permanenceMax=0.7, permanenceInc=0.3,
+                                   permanenceDec=0.3, maxInfBacktrack=5,
+                                   maxLrnBacktrack=5)
+
+
+  def testTrimSegments(self):
+    tm1, tm2 = self.checkSameAsBacktrackingTM()
+    numSynapses = tm2.getNumSynapses()
+
+    self.assertEqual(tm1.trimSegments(minPermanence=0.52, minNumSyns=4),
+                     tm2.trimSegments(minPermanence=0.52, minNumSyns=4))
+    self.assertSameTMs(tm1, tm2)
+
+    # The rows of the removed synapses are reused
+    self.assertEqual(numSynapses - tm2.getNumSynapses(),
+                     len(tm2._freeSynSlots))
+    self.runTMs(tm1, tm2, numRepetitions=1)
+
+
+  def testSegmentSynapses(self):
+    tm = BacktrackingTMDense(**PARAMS)
+    tm.lrnIterationIdx = 1
+    segment = tm._createSegment(isSequenceSeg=True)
+    segment.addSynapse(3, 1, 0.5)
+    segment.addSynapse(7, 2, 0.25)
+    self.assertEqual([[3, 1, 0.5], [7, 2, 0.25]], segment.syns)
+
+    tm.cells[5][1].append(segment)
+    self.assertIsInstance(segment, DenseSegment)
+    self.assertEqual([[3, 1, 0.5], [7, 2, 0.25]], segment.syns)
+    self.assertEqual(2, tm.getNumSynapses())
+
+    # Changes made through the synapse lists are written to the tables
+    segment.syns[0][2] = numpy.float32(0.25)
+    segment.syns[1][2] = numpy.float32(0.75)
+    activeState = numpy.zeros((NUM_COLS, 4), dtype="int8")
+    activeState[3, 1] = activeState[7, 2] = 1
+    self.assertEqual(2, tm._getSegmentActivityLevel(segment, activeState))
+    self.assertEqual(1, tm._getSegmentActivityLevel(
+      segment, activeState, connectedSynapsesOnly=True))
+
+    self.assertTrue(segment.updateSynapses([0, 1], -numpy.float32(0.5)))
+    self.assertEqual([[3, 1, 0], [7, 2, 0.25]], segment.syns)
+    self.assertIsInstance(segment.syns[1][2], numpy.float32)
+    segment.syns.remove(segment.syns[0])
+    self.assertEqual([[7, 2, 0.25]], segment.syns)
+
+    # Removed segments keep their synapses
+    tm.cells[5][1].remove(segment)
+    self.assertEqual([[7, 2, 0.25]], segment.syns)
+    self.assertEqual(0, tm.getNumSynapses())
+
+
+  def testPickle(self):
+    tm1, tm2 = self.checkSameAsBacktrackingTM()
+
+    tm3 = pickle.loads(pickle.dumps(tm2, pickle.HIGHEST_PROTOCOL))
+    tm4 = copy.deepcopy(tm2)
+    self.assertEqual(tm2, tm3, tm2.diff(tm3))
+    self.assertEqual(tm2, tm4, tm2.diff(tm4))
+
+    # The synapse tables are rebuilt
+    self.runTMs(tm1, tm3, numRepetitions=1)
+
+
+  @unittest.skipUnless(capnp, "pycapnp not installed")
+  def testWriteRead(self):
+    tm1, tm2 = self.checkSameAsBacktrackingTM()
+
+    proto = BacktrackingTMDense.getSchema().new_message()
+    tm2.write(proto)
+    tm3 = BacktrackingTMDense.read(proto)
+    self.assertSameTMs(tm2, tm3)
+
+    self.runTMs(tm1, tm3, numRepetitions=1)
+
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -25,7 +25,7 @@ except ImportError:
   capnp = None
 from pkg_resources import resource_filename
 
-from nupic.algorithms import fdrutilities
+from nupic.algorithms import backtracking_tm, fdrutilities
 from nupic.algorithms.backtracking_tm import BacktrackingTM
 
 COL_SET = set(range(500))
@@ -34,6 +34,20 @@ VERBOSITY = 0
 
 
 
+class _UncachedBacktrackingTM(backtracking_tm.BacktrackingTM):
+  """BacktrackingTM that reuses nothing while backtracking."""
+
+
+  def _packInfActiveState(self):
+    # No two states compare equal
+    return object()
+
+
+  def _inferPhase2Cached(self, cache, state):
+    return self._inferPhase2()
+
+
+
 class BacktrackingTMTest(unittest.TestCase):
   """Unit tests for the TM class."""
 
@@ -327,6 +341,82 @@ class BacktrackingTMTest(unittest.TestCase):
     self.assertTMsEqual(tm2, tm4)
 
 
+  def testInfBacktrackStats(self):
+    random.seed(42)
+    sequence, noise = self.generateNoisySequence()
+    tm = self.trainBacktrackingTM(backtracking_tm.BacktrackingTM, sequence)
+
+    tm.resetStats()
+    for noisyInput in noise:
+      tm.infer(noisyInput)
+      for bottomUpInput in sequence:
+        tm.infer(bottomUpInput)
+
+    stats = tm.getInfBacktrackStats()
+    self.assertGreater(stats['nInfBacktracks'], 0)
+    self.assertGreaterEqual(stats['nInfBacktrackSteps'],
+                            stats['nInfBacktracks'])
+    self.assertGreater(stats['nInfBacktrackShortcuts'], 0)
+    self.assertLess(stats['nInfBacktrackFailures'], stats['nInfBacktracks'])
+    self.assertDictContainsSubset(stats, tm.getStats())
+
+    tm.resetStats()
+    self.assertEqual(0, sum(tm.getInfBacktrackStats().values()))
+
+
+  def testInfBacktrackReuseKeepsOutputs(self):
+    random.seed(42)
+    sequence, noise = self.generateNoisySequence()
+    tm = self.trainBacktrackingTM(backtracking_tm.BacktrackingTM, sequence)
+    uncachedTM = self.trainBacktrackingTM(_UncachedBacktrackingTM, sequence)
+
+    tm.resetStats()
+    uncachedTM.resetStats()
+    for noisyInput in noise:
+      for bottomUpInput in [noisyInput] + sequence:
+        output = tm.infer(bottomUpInput)
+        uncachedOutput = uncachedTM.infer(bottomUpInput)
+        self.assertTrue(numpy.array_equal(output, uncachedOutput))
+        for name in ('infActiveState', 'infPredictedState', 'cellConfidence',
+                     'colConfidence'):
+          self.assertTrue(numpy.array_equal(getattr(tm, name)['t'],
+                                            getattr(uncachedTM, name)['t']))
+
+    # The shortcuts were taken, and saved replayed steps
+    stats = tm.getInfBacktrackStats()
+    uncachedStats = uncachedTM.getInfBacktrackStats()
+    self.assertGreater(stats['nInfBacktrackShortcuts'], 0)
+    self.assertEqual(0, uncachedStats['nInfBacktrackShortcuts'])
+    self.assertLess(stats['nInfBacktrackSteps'],
+                    uncachedStats['nInfBacktrackSteps'])
+    self.assertEqual(stats['nInfBacktrackFailures'],
+                     uncachedStats['nInfBacktrackFailures'])
+
+
+  def trainBacktrackingTM(self, tmClass, sequence):
+    """Trains a TM with few cells per column, so that backtracking often
+    reaches the same state from different starting points.
+
+    BacktrackingTMCPP backtracks in C++, so the Python TM is always used.
+    """
+    tm = tmClass(numberOfCols=100, cellsPerColumn=2, initialPerm=0.5,
+                 connectedPerm=0.5, activationThreshold=8, minThreshold=8,
+                 newSynapseCount=15, collectStats=True, seed=42,
+                 verbosity=VERBOSITY)
+    for _ in xrange(5):
+      tm.reset()
+      for bottomUpInput in sequence:
+        tm.learn(bottomUpInput)
+    return tm
+
+
+  def generateNoisySequence(self):
+    """Generates a sequence of 6 patterns and 10 noise patterns."""
+    sequence = self.generateSequence(n=6)[1:]
+    noise = [self.generatePattern() for _ in xrange(10)]
+    return sequence, noise
+
+
   def assertTMsEqual(self, tm1, tm2):
     """Asserts that two TM instances are the same.
 
@@ -0,0 +1,108 @@
+# Copyright 2017 Numenta Inc.
+#
+# Copyright may exist in Contributors' modifications
+# and/or contributions to the work.
+#
+# Use of this source code is governed by the MIT
+# license that can be found in the LICENSE file or at
+# https://opensource.org/licenses/MIT.
+
+import random
+import unittest
+
+from mock import patch
+
+from nupic.algorithms.batch_temporal_memory import BatchTemporalMemory
+from nupic.algorithms.connections import Connections
+from nupic.algorithms.temporal_memory import TemporalMemory
+
+
+
+PARAMS = dict(columnDimensions=[64],
+              cellsPerColumn=4,
+              activationThreshold=4,
+              initialPermanence=.21,
+              connectedPermanence=.5,
+              minThreshold=3,
+              maxNewSynapseCount=6,
+              permanenceIncrement=.1,
+              permanenceDecrement=.02,
+              predictedSegmentDecrement=.05,
+              maxSegmentsPerCell=3,
+              maxSynapsesPerSegment=5)
+
+
+
+class BatchTemporalMemoryTest(unittest.TestCase):
+
+  def testInitInvalidParams(self):
+    self.assertRaises(ValueError, BatchTemporalMemory, 0)
+    self.assertRaises(ValueError, BatchTemporalMemory, 2, seed=[1, 2, 3])
+    self.assertRaises(ValueError, BatchTemporalMemory, 2, cellsPerColumn=0)
+
+
+  def testComputeBatchRequiresOneInputPerStream(self):
+    tm = BatchTemporalMemory(3, **PARAMS)
+    self.assertRaises(ValueError, tm.computeBatch, [[1, 2], [3, 4]])
+
+
+  def testSameOutputAsStandaloneTemporalMemory(self):
+    """ Every stream produces exactly what a standalone TemporalMemory
+    produces on the same input.
+    """
+    seeds = [42, 7, 1956]
+    batchTM = BatchTemporalMemory(len(seeds), seed=seeds, **PARAMS)
+    tms = [TemporalMemory(seed=seed, **PARAMS) for seed in seeds]
+
+    rng = random.Random(42)
+    sequences = []
+    for _ in seeds:
+      patterns = [rng.sample(xrange(64), 6) for _ in xrange(8)]
+      sequences.append([patterns[i % 8] for i in xrange(200)] +
+                       [rng.sample(xrange(64), 6) for _ in xrange(40)])
+
+    numPredicted = [0] * len(seeds)
+    for t in xrange(240):
+      learn = t < 220
+      inputs = [sequence[t] for sequence in sequences]
+      if t % 50 == 0:
+        batchTM.reset(1)
+        tms[1].reset()
+
+      batchTM.computeBatch(inputs, learn=learn)
+      for stream, tm in enumerate(tms):
+        tm.compute(inputs[stream], learn=learn)
+
+        self.assertEqual(tm.getActiveCells(), batchTM.getActiveCells(stream))
+        self.assertEqual(tm.getWinnerCells(), batchTM.getWinnerCells(stream))
+        self.assertEqual(tm.getPredictiveCells(),
+                         batchTM.getPredictiveCells(stream))
+        numPredicted[stream] += len(tm.getPredictiveCells())
+
+    for stream, tm in enumerate(tms):
+      self.assertEqual(tm.connections.numSegments(),
+                       batchTM.numSegments(stream))
+      self.assertGreater(numPredicted[stream], 0)
+
+
+  def testAdaptsSegmentsOfAllStreamsInOneCall(self):
+    tm = BatchTemporalMemory(2, **PARAMS)
+    tm.computeBatch([[0, 1, 2, 3], [0, 1, 2, 3]])
+    tm.computeBatch([[4, 5, 6, 7], [4, 5, 6, 7]])
+    tm.computeBatch([[0, 1, 2, 3], [0, 1, 2, 3]])
+
+    with patch.object(Connections, "adaptSegments",
+                      autospec=True,
+                      side_effect=Connections.adaptSegments) as adaptSegments:
+      tm.computeBatch([[4, 5, 6, 7], [4, 5, 6, 7]])
+
+    self.assertEqual(1, adaptSegments.call_count)
+    segments = adaptSegments.call_args[0][1]
+    numCells = tm.numberOfCells()
+    self.assertEqual(set([0, 1]),
+                     set(segment.cell // numCells for segment in segments))
+
+
+
+if __name__ == "__main__":
+  unittest.main()
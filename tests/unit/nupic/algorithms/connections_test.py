@@ -9,6 +9,8 @@
 import tempfile
 import unittest
 
+import numpy
+
 try:
   import capnp
 except ImportError:
@@ -21,8 +23,10 @@ from nupic.algorithms.connections import Connections
 
 class ConnectionsTest(unittest.TestCase):
 
+  connectionsClass = Connections
+
   def testCreateSegment(self):
-    connections = Connections(1024)
+    connections = self.connectionsClass(1024)
 
     segment1 = connections.createSegment(10)
     self.assertEqual(segment1.cell, 10)
@@ -38,7 +42,7 @@ class ConnectionsTest(unittest.TestCase):
     """ Creates a segment, destroys it, and makes sure it got destroyed along
         with all of its synapses.
     """
-    connections = Connections(1024)
+    connections = self.connectionsClass(1024)
 
     connections.createSegment(10)
     segment2 = connections.createSegment(20)
@@ -68,7 +72,7 @@ class ConnectionsTest(unittest.TestCase):
     """ Creates a segment, creates a number of synapses on it, destroys a
         synapse, and makes sure it got destroyed.
     """
-    connections = Connections(1024)
+    connections = self.connectionsClass(1024)
 
     segment = connections.createSegment(20)
     synapse1 = connections.createSynapse(segment, 80, .85)
@@ -94,7 +98,7 @@ class ConnectionsTest(unittest.TestCase):
         either side of them and verifies that existing Segment and Synapse
         instances still point to the same segment / synapse as before.
     """
-    connections = Connections(1024)
+    connections = self.connectionsClass(1024)
     segment1 = connections.createSegment(11)
     connections.createSegment(12)
     segment3 = connections.createSegment(13)
@@ -126,7 +130,7 @@ class ConnectionsTest(unittest.TestCase):
     """ Destroy a segment that has a destroyed synapse and a non-destroyed
         synapse. Make sure nothing gets double-destroyed.
     """
-    connections = Connections(1024)
+    connections = self.connectionsClass(1024)
 
     segment1 = connections.createSegment(11)
     segment2 = connections.createSegment(12)
@@ -153,7 +157,7 @@ class ConnectionsTest(unittest.TestCase):
         synapse. Create a new segment in the same place. Make sure its synapse
         count is correct.
     """
-    connections = Connections(1024)
+    connections = self.connectionsClass(1024)
 
     segment = connections.createSegment(11)
 
@@ -176,7 +180,7 @@ class ConnectionsTest(unittest.TestCase):
     """ Creates a synapse and updates its permanence, and makes sure that its
         data was correctly updated.
     """
-    connections = Connections(1024)
+    connections = self.connectionsClass(1024)
     segment = connections.createSegment(10)
     synapse = connections.createSynapse(segment, 50, .34)
 
@@ -191,7 +195,7 @@ class ConnectionsTest(unittest.TestCase):
         activity for a collection of cells with no activity returns the right
         activity data.
     """
-    connections = Connections(1024)
+    connections = self.connectionsClass(1024)
 
     # Cell with 1 segment.
     # Segment with:
@@ -222,10 +226,95 @@ class ConnectionsTest(unittest.TestCase):
     self.assertEqual(3, numActivePotential[segment2a.flatIdx])
 
 
+  def testComputeActivityWithExternalPresynapticCells(self):
+    """ Presynaptic cells are not required to be cells of this collection, e.g.
+        when segments receive input from another layer.
+    """
+    connections = self.connectionsClass(16)
+
+    segment = connections.createSegment(10)
+    connections.createSynapse(segment, 1000, .85)
+    synapse = connections.createSynapse(segment, 2000, .85)
+    connections.createSynapse(segment, 3000, .15)
+
+    (numActiveConnected,
+     numActivePotential) = connections.computeActivity([1000, 2000, 3000], .5)
+
+    self.assertEqual(2, numActiveConnected[segment.flatIdx])
+    self.assertEqual(3, numActivePotential[segment.flatIdx])
+
+    connections.destroySynapse(synapse)
+
+    (numActiveConnected,
+     numActivePotential) = connections.computeActivity([1000, 2000, 3000], .5)
+
+    self.assertEqual(1, numActiveConnected[segment.flatIdx])
+    self.assertEqual(2, numActivePotential[segment.flatIdx])
+
+
+  def testAdaptSegment(self):
+    """ Synapses to active cells are strengthened, others weakened, results are
+        clipped to [0, 1] and synapses that reach zero are destroyed.
+    """
+    connections = self.connectionsClass(1024)
+
+    segment = connections.createSegment(10)
+    connections.createSynapse(segment, 23, .6)
+    connections.createSynapse(segment, 37, .95)
+    connections.createSynapse(segment, 477, .5)
+    connections.createSynapse(segment, 900, .05)
+
+    connections.adaptSegment(segment, numpy.array([23, 37, 500]), .1, .08)
+
+    permanences = dict((synapse.presynapticCell, synapse.permanence)
+                       for synapse in connections.synapsesForSegment(segment))
+    self.assertEqual([23, 37, 477], sorted(permanences))
+    self.assertAlmostEqual(.7, permanences[23])
+    self.assertAlmostEqual(1.0, permanences[37])
+    self.assertAlmostEqual(.42, permanences[477])
+    self.assertEqual(3, connections.numSynapses())
+    self.assertEqual([23, 37, 477],
+                     sorted(connections.presynapticCellsForSegment(segment)))
+
+    (numActiveConnected,
+     numActivePotential) = connections.computeActivity([23, 37, 477, 900], .5)
+    self.assertEqual(2, numActiveConnected[segment.flatIdx])
+    self.assertEqual(3, numActivePotential[segment.flatIdx])
+
+
+  def testSortSegmentFlatIdxs(self):
+    """ Sorting flatIdxs matches segmentPositionSortKey as segments are
+        created, destroyed and recycled.
+    """
+    connections = self.connectionsClass(1024)
+
+    def assertSorted():
+      segments = [segment
+                  for cell in xrange(1024)
+                  for segment in connections.segmentsForCell(cell)]
+      expected = sorted(segments, key=connections.segmentPositionSortKey)
+      flatIdxs = numpy.array([segment.flatIdx for segment in segments[::-1]])
+      self.assertEqual([segment.flatIdx for segment in expected],
+                       list(connections.sortSegmentFlatIdxs(flatIdxs)))
+
+    segment1 = connections.createSegment(10)
+    connections.createSegment(20)
+    connections.createSegment(5)
+    assertSorted()
+
+    connections.createSegment(10)
+    connections.destroySegment(segment1)
+    assertSorted()
+
+    # Recycles segment1's flatIdx, which must now sort after the other
+    # segment on cell 10.
+    connections.createSegment(10)
+    assertSorted()
+
   @unittest.skipUnless(
     capnp, "pycapnp is not installed, skipping serialization test.")
   def testWriteRead(self):
-    c1 = Connections(1024)
+    c1 = self.connectionsClass(1024)
 
     # Add data before serializing
     s1 = c1.createSegment(0)
@@ -255,7 +344,7 @@ class ConnectionsTest(unittest.TestCase):
       proto2 = ConnectionsProto_capnp.ConnectionsProto.read(f)
 
     # Load the deserialized proto
-    c2 = Connections.read(proto2)
+    c2 = self.connectionsClass.read(proto2)
 
     # Check that the two connections objects are functionally equal
     self.assertEqual(c1, c2)
@@ -0,0 +1,179 @@
+# Copyright 2017 Numenta Inc.
+#
+# Copyright may exist in Contributors' modifications
+# and/or contributions to the work.
+#
+# Use of this source code is governed by the MIT
+# license that can be found in the LICENSE file or at
+# https://opensource.org/licenses/MIT.
+
+"""Tests for the array-backed Connections implementation."""
+
+import random
+import tempfile
+import unittest
+
+try:
+  import capnp
+except ImportError:
+  capnp = None
+if capnp:
+  from nupic.proto import TemporalMemoryProto_capnp
+
+from nupic.algorithms.flat_connections import FlatConnections
+from nupic.algorithms.temporal_memory import TemporalMemory
+from tests.unit.nupic.algorithms import connections_test
+
+
+
+class FlatConnectionsTest(connections_test.ConnectionsTest):
+  """ Run the Connections tests against FlatConnections. """
+
+  connectionsClass = FlatConnections
+
+
+  def testSynapseTablesGrow(self):
+    connections = FlatConnections(2048)
+
+    segments = [connections.createSegment(cell) for cell in xrange(100)]
+    for segment in segments:
+      for presynapticCell in xrange(30):
+        connections.createSynapse(segment, presynapticCell, .3)
+
+    self.assertEqual(3000, connections.numSynapses())
+    for segment in segments:
+      self.assertEqual(30, connections.numSynapses(segment))
+
+    (numActiveConnected,
+     numActivePotential) = connections.computeActivity([0, 1, 2], .5)
+    self.assertEqual([0] * 100, list(numActiveConnected))
+    self.assertEqual([3] * 100, list(numActivePotential))
+
+
+  def testFreedSynapsesAreRecycled(self):
+    connections = FlatConnections(1024)
+
+    segment = connections.createSegment(10)
+    synapse1 = connections.createSynapse(segment, 80, .85)
+    connections.createSynapse(segment, 81, .85)
+    capacity = len(connections._synapseSegment)
+
+    for _ in xrange(10 * capacity):
+      connections.destroySynapse(synapse1)
+      synapse1 = connections.createSynapse(segment, 80, .85)
+
+    self.assertEqual(capacity, len(connections._synapseSegment))
+    self.assertEqual(2, connections.numSynapses(segment))
+    self.assertEqual([80, 81],
+                     sorted(s.presynapticCell
+                            for s in connections.synapsesForSegment(segment)))
+
+
+
+class FlatTemporalMemory(TemporalMemory):
+  connectionsClass = FlatConnections
+
+
+
+class FlatTemporalMemoryTest(unittest.TestCase):
+
+  params = dict(columnDimensions=[128],
+                cellsPerColumn=8,
+                activationThreshold=5,
+                initialPermanence=.21,
+                connectedPermanence=.5,
+                minThreshold=3,
+                maxNewSynapseCount=8,
+                permanenceIncrement=.1,
+                permanenceDecrement=.02,
+                predictedSegmentDecrement=.05,
+                maxSegmentsPerCell=4,
+                maxSynapsesPerSegment=6,
+                seed=42)
+
+
+  def testSameOutputAsConnections(self):
+    """ A TemporalMemory using FlatConnections behaves exactly like one using
+    the default Connections.
+    """
+    tm = TemporalMemory(**self.params)
+    flatTM = FlatTemporalMemory(**self.params)
+    self.assertIsInstance(flatTM.connections, FlatConnections)
+
+    rng = random.Random(42)
+    patterns = [rng.sample(xrange(128), 8) for _ in xrange(10)]
+    sequence = [patterns[i % 10] for i in xrange(300)]
+    sequence += [rng.sample(xrange(128), 8) for _ in xrange(50)]
+
+    for activeColumns in sequence:
+      tm.compute(activeColumns, learn=True)
+      flatTM.compute(activeColumns, learn=True)
+
+      self.assertEqual(tm.getActiveCells(), flatTM.getActiveCells())
+      self.assertEqual(tm.getWinnerCells(), flatTM.getWinnerCells())
+      self.assertEqual(tm.getPredictiveCells(), flatTM.getPredictiveCells())
+
+    self.assertEqual(tm.connections.numSegments(),
+                     flatTM.connections.numSegments())
+    self.assertEqual(tm.connections.numSynapses(),
+                     flatTM.connections.numSynapses())
+
+
+  def testSamePermanencesAfterLongRun(self):
+    """ The permanences of both implementations are still identical after
+    thousands of small increments and decrements.
+    """
+    tm = TemporalMemory(**self.params)
+    flatTM = FlatTemporalMemory(**self.params)
+
+    rng = random.Random(7)
+    patterns = [rng.sample(xrange(128), 8) for _ in xrange(20)]
+    for i in xrange(3000):
+      if i % 7 == 0:
+        activeColumns = rng.sample(xrange(128), 8)
+      else:
+        activeColumns = patterns[i % 20]
+      tm.compute(activeColumns, learn=True)
+      flatTM.compute(activeColumns, learn=True)
+
+    self.assertEqual(tm.getActiveCells(), flatTM.getActiveCells())
+    for cell in xrange(tm.numberOfCells()):
+      segments = tm.connections.segmentsForCell(cell)
+      flatSegments = flatTM.connections.segmentsForCell(cell)
+      self.assertEqual(len(segments), len(flatSegments))
+      for segment, flatSegment in zip(segments, flatSegments):
+        synapses = sorted(
+          (s.presynapticCell, s.permanence)
+          for s in tm.connections.synapsesForSegment(segment))
+        flatSynapses = sorted(
+          (s.presynapticCell, s.permanence)
+          for s in flatTM.connections.synapsesForSegment(flatSegment))
+        # Exact comparison: the permanences must not drift apart
+        self.assertEqual(synapses, flatSynapses)
+
+
+  @unittest.skipUnless(
+    capnp, "pycapnp is not installed, skipping serialization test.")
+  def testWriteReadKeepsConnectionsClass(self):
+    flatTM = FlatTemporalMemory(**self.params)
+    for _ in xrange(20):
+      flatTM.compute(range(8), learn=True)
+      flatTM.compute(range(8, 16), learn=True)
+
+    proto1 = TemporalMemoryProto_capnp.TemporalMemoryProto.new_message()
+    flatTM.write(proto1)
+    with tempfile.TemporaryFile() as f:
+      proto1.write(f)
+      f.seek(0)
+      proto2 = TemporalMemoryProto_capnp.TemporalMemoryProto.read(f)
+
+    flatTM2 = FlatTemporalMemory.read(proto2)
+
+    self.assertIsInstance(flatTM2.connections, FlatConnections)
+    self.assertEqual(flatTM.connections.numSynapses(),
+                     flatTM2.connections.numSynapses())
+
+
+
+if __name__ == '__main__':
+  unittest.main()
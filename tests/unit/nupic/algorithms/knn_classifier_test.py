@@ -7,6 +7,7 @@
 # license that can be found in the LICENSE file or at
 # https://opensource.org/licenses/MIT.
 
+import cPickle as pickle
 import numpy as np
 import tempfile
 import unittest
@@ -494,6 +495,191 @@ class KNNClassifierTest(unittest.TestCase):
     self.assertEquals(cat, 1)
 
 
+  def testInvertedIndexMatchesFullScan(self):
+    """ With the inverted index, distances are unchanged and the k nearest
+    neighbors are the nearest prototypes, earliest learned first among equal
+    distances, through learning, removals and pickling.
+    """
+    dimensionality = 200
+    rng = np.random.RandomState(42)
+
+    def randomPattern():
+      return np.sort(rng.choice(dimensionality, 10, replace=False))
+
+    def checkInfer(classifier, indexedClassifier):
+      for _ in xrange(20):
+        pattern = np.zeros(dimensionality)
+        pattern[randomPattern()] = 1.0
+        _, inferenceResult, dist, categoryDist = classifier.infer(pattern)
+        (_, indexedInferenceResult,
+         indexedDist, indexedCategoryDist) = indexedClassifier.infer(pattern)
+
+        self.assertEqual(dist.dtype, indexedDist.dtype)
+        self.assertTrue(np.array_equal(dist, indexedDist))
+        self.assertTrue(np.array_equal(categoryDist, indexedCategoryDist))
+
+        expected = np.zeros(len(inferenceResult))
+        for row in np.argsort(dist, kind="mergesort")[:3]:
+          expected[indexedClassifier._categoryList[row]] += 1.0
+        expected /= expected.sum()
+        self.assertTrue(np.array_equal(expected, indexedInferenceResult))
+
+    for distanceMethod in ("rawOverlap", "pctOverlapOfInput",
+                           "pctOverlapOfProto", "pctOverlapOfLarger"):
+      params = dict(k=3, distanceMethod=distanceMethod, maxStoredPatterns=150)
+      classifier = KNNClassifier(**params)
+      indexedClassifier = KNNClassifier(useInvertedIndex=True, **params)
+
+      for rowID in xrange(200):
+        pattern = randomPattern()
+        category = rowID % 7
+        if rowID % 3:
+          classifier.learn(pattern, category, isSparse=dimensionality,
+                           rowID=rowID)
+          indexedClassifier.learn(pattern, category, isSparse=dimensionality,
+                                  rowID=rowID)
+        else:
+          densePattern = np.zeros(dimensionality)
+          densePattern[pattern] = 1.0
+          classifier.learn(densePattern, category, rowID=rowID)
+          indexedClassifier.learn(densePattern, category, rowID=rowID)
+        if rowID == 100:
+          checkInfer(classifier, indexedClassifier)
+      checkInfer(classifier, indexedClassifier)
+
+      classifier.removeCategory(3)
+      indexedClassifier.removeCategory(3)
+      checkInfer(classifier, indexedClassifier)
+
+      classifier.removeIds(range(100, 200, 2))
+      indexedClassifier.removeIds(range(100, 200, 2))
+      checkInfer(classifier, indexedClassifier)
+
+      checkInfer(classifier, pickle.loads(pickle.dumps(indexedClassifier)))
+
+
+  def testInvertedIndexInvalidParams(self):
+    self.assertRaises(AssertionError, KNNClassifier, useInvertedIndex=True)
+    self.assertRaises(AssertionError, KNNClassifier, useInvertedIndex=True,
+                      distanceMethod="rawOverlap", useSparseMemory=False)
+
+
+  def testInferBatchMatchesInfer(self):
+    """ inferBatch returns what infer returns for each pattern, including
+    partition ids, insufficient sparsity and non-binary input.
+    """
+    dimensionality = 100
+    rng = np.random.RandomState(42)
+
+    for params in (dict(distanceMethod="rawOverlap", k=3),
+                   dict(distanceMethod="pctOverlapOfInput", k=5),
+                   dict(distanceMethod="pctOverlapOfProto", k=1, exact=True),
+                   dict(distanceMethod="pctOverlapOfLarger", k=3,
+                        useInvertedIndex=True),
+                   dict(distanceMethod="norm", k=2, minSparsity=0.05),
+                   dict(distanceMethod="norm", k=3, relativeThreshold=True,
+                        sparseThreshold=0.1)):
+      classifier = KNNClassifier(**params)
+      for i in xrange(60):
+        pattern = np.sort(rng.choice(dimensionality, 8, replace=False))
+        classifier.learn(pattern, rng.randint(5), partitionId=i % 4,
+                         isSparse=dimensionality)
+
+      patterns = np.zeros((20, dimensionality))
+      for row in patterns:
+        row[rng.choice(dimensionality, 8, replace=False)] = 1.0
+      patterns[3] = 0.0
+      patterns[3, :2] = 1.0
+      patterns[5] *= rng.uniform(0.5, 1.0, dimensionality)
+      partitionIds = [None] * 10 + [i % 4 for i in xrange(10)]
+
+      winners, inferenceResult, dist, categoryDist = classifier.inferBatch(
+        patterns, partitionIds)
+
+      for i, pattern in enumerate(patterns):
+        expected = classifier.infer(pattern, partitionId=partitionIds[i])
+        if expected[0] is None:
+          self.assertEqual(-1, winners[i])
+          self.assertFalse(inferenceResult[i].any())
+        else:
+          self.assertEqual(expected[0], winners[i])
+          self.assertTrue(np.array_equal(expected[1], inferenceResult[i]))
+        if len(expected[2]) == 1:
+          self.assertTrue((dist[i] == 1.0).all())
+          self.assertTrue((categoryDist[i] == 1.0).all())
+        else:
+          self.assertTrue(np.array_equal(expected[2], dist[i]))
+          self.assertTrue(np.array_equal(expected[3], categoryDist[i]))
+
+
+  def testInferBatchWithSVD(self):
+    """ With SVD, inferBatch projects all patterns with one matrix product,
+    so distances match infer up to rounding.
+    """
+    rng = np.random.RandomState(42)
+    classifier = KNNClassifier(distanceMethod="norm", k=3, numSVDDims=6)
+    for _ in xrange(60):
+      classifier.learn(np.sort(rng.choice(100, 8, replace=False)),
+                       rng.randint(5), isSparse=100)
+
+    patterns = np.zeros((20, 100))
+    for row in patterns:
+      row[rng.choice(100, 8, replace=False)] = 1.0
+
+    winners, _, dist, _ = classifier.inferBatch(patterns)
+
+    for i, pattern in enumerate(patterns):
+      expected = classifier.infer(pattern)
+      self.assertEqual(expected[0], winners[i])
+      np.testing.assert_allclose(expected[2], dist[i], rtol=1e-12, atol=1e-12)
+
+
+  def testGetNearestPrototypesMatchesInfer(self):
+    """ getNearestPrototypes returns the nearest eligible prototype with the
+    distance infer computes, for dense and sparse patterns alike.
+    """
+    dimensionality = 100
+    rng = np.random.RandomState(42)
+
+    for params in (dict(distanceMethod="rawOverlap"),
+                   dict(distanceMethod="pctOverlapOfInput"),
+                   dict(distanceMethod="pctOverlapOfLarger",
+                        useInvertedIndex=True),
+                   dict(distanceMethod="norm", minSparsity=0.05)):
+      classifier = KNNClassifier(**params)
+      for _ in xrange(40):
+        classifier.learn(np.sort(rng.choice(dimensionality, 8, replace=False)),
+                         rng.randint(5), isSparse=dimensionality)
+
+      sparsePatterns = [np.sort(rng.choice(dimensionality, 8, replace=False))
+                        for _ in xrange(10)]
+      sparsePatterns[3] = np.arange(2)
+      sparsePatterns[4] = np.array([], dtype=int)
+      patterns = np.zeros((10, dimensionality))
+      for row, bits in zip(patterns, sparsePatterns):
+        row[bits] = 1.0
+      eligible = rng.uniform(size=(10, 40)) < 0.5
+      eligible[6] = False
+
+      rows, distances = classifier.getNearestPrototypes(patterns, eligible)
+      sparseRows, sparseDistances = classifier.getNearestPrototypes(
+        sparsePatterns, eligible, isSparse=dimensionality)
+
+      self.assertTrue(np.array_equal(rows, sparseRows))
+      np.testing.assert_allclose(distances, sparseDistances, rtol=1e-6)
+      self.assertEqual(-1, rows[6])
+      self.assertEqual(np.inf, distances[6])
+      for i, pattern in enumerate(patterns):
+        if i == 6:
+          continue
+        dist = classifier.infer(pattern)[2]
+        if len(dist) == 1:
+          dist = np.ones(40)
+        dist = np.where(eligible[i], dist, np.inf)
+        self.assertEqual(dist.argmin(), rows[i])
+        self.assertAlmostEqual(dist.min(), distances[i], places=6)
+
+
   @unittest.skipUnless(
       capnp, "pycapnp is not installed, skipping serialization test.")
   def testWriteRead(self):
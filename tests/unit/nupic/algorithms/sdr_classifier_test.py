@@ -19,7 +19,7 @@ import unittest2 as unittest
 
 import numpy
 
-from nupic.algorithms.sdr_classifier import SDRClassifier
+from nupic.algorithms.sdr_classifier import SDRClassifier, packPatternNZs
 
 try:
   import capnp
@@ -292,6 +292,30 @@ class SDRClassifierTest(unittest.TestCase):
     self.assertAlmostEqual(result[1][5], 0.770004, places=5)
 
 
+  def testPreallocatedWeights(self):
+    """ Declaring the input width and number of buckets only preallocates
+    the weights. Results are the same, and indices beyond the declared sizes
+    still grow the weight matrices.
+    """
+    c1 = self._classifier([1, 2], 0.1, 0.1, 0)
+    c2 = self._classifier([1, 2], 0.1, 0.1, 0, inputWidth=20, numBuckets=8)
+
+    for recordNum in xrange(30):
+      pattern = [recordNum % 7, 10 + recordNum % 5, 5 * (recordNum % 6)]
+      bucket = recordNum % 11
+      result1 = self._compute(c1, recordNum, pattern, bucket, bucket)
+      result2 = self._compute(c2, recordNum, pattern, bucket, bucket)
+
+      self.assertEqual(result1["actualValues"], result2["actualValues"])
+      for step in (1, 2):
+        self.assertTrue(numpy.array_equal(result1[step], result2[step]))
+
+    for step in (1, 2):
+      self.assertEqual((26, 11), c2._weightMatrix[step].shape)
+      self.assertTrue(numpy.array_equal(c1._weightMatrix[step],
+                                        c2._weightMatrix[step]))
+
+
   def testOverlapPattern(self):
     classifier = self._classifier(alpha=10.0)
 
@@ -312,6 +336,21 @@ class SDRClassifierTest(unittest.TestCase):
     self.assertGreater(retval[1][2], retval[1][9])
 
 
+  def testRepeatedBits(self):
+    """ A bit that appears twice in a pattern is learned twice, like it is
+    counted twice during inference.
+    """
+    classifier = self._classifier(steps=[1], alpha=0.1)
+
+    self._compute(classifier, recordNum=0, pattern=[2, 2, 7], bucket=3,
+                  value=3)
+    self._compute(classifier, recordNum=1, pattern=[4], bucket=1, value=1)
+
+    weights = classifier._weightMatrix[1]
+    self.assertTrue(numpy.any(weights[7] != 0))
+    self.assertTrue(numpy.array_equal(2 * weights[7], weights[2]))
+
+
   def testMultistepSingleValue(self):
     classifier = self._classifier(steps=[1, 2])
 
@@ -787,6 +826,120 @@ class SDRClassifierTest(unittest.TestCase):
     self.assertFalse(numpy.isnan(res), "SoftMax overflow")
 
 
+  def testFitBatchMatchesCompute(self):
+    """
+    fitBatch learns what compute learns record by record, up to rounding,
+    including missing records and records without a bucket.
+    """
+    rng = random.Random(42)
+    recordNums = [0, 1, 2, 4, 5, 6, 7, 10, 11, 12]
+    patternNZs = [rng.sample(xrange(40), rng.randint(1, 8))
+                  for _ in recordNums]
+    bucketIdxs = [rng.randint(0, 6) for _ in recordNums]
+    bucketIdxs[3] = None
+    actValues = [1.5 * b if b is not None else None for b in bucketIdxs]
+
+    c1 = SDRClassifier([1, 2], 0.1, 0.1, 0)
+    for recordNum, patternNZ, bucketIdx, actValue in zip(
+        recordNums, patternNZs, bucketIdxs, actValues):
+      c1.compute(recordNum, patternNZ,
+                 {"bucketIdx": bucketIdx, "actValue": actValue},
+                 learn=True, infer=False)
+
+    # Learn the stream in two halves to cover continuing a stream
+    c2 = SDRClassifier([1, 2], 0.1, 0.1, 0)
+    c2.fitBatch(recordNums[:4], packPatternNZs(patternNZs[:4]),
+                bucketIdxs[:4], actValues[:4])
+    c2.fitBatch(recordNums[4:], packPatternNZs(patternNZs[4:]),
+                bucketIdxs[4:], actValues[4:])
+
+    for step in (1, 2):
+      numpy.testing.assert_allclose(c1._weightMatrix[step],
+                                    c2._weightMatrix[step],
+                                    rtol=1e-12, atol=1e-15)
+    self.assertEqual(c1._actualValues, c2._actualValues)
+    self.assertEqual(list(c1._patternNZHistory), list(c2._patternNZHistory))
+
+
+  def testFitBatchRepeatedBits(self):
+    patternNZs = [[3, 3, 9], [1, 4], [3, 9, 9, 9], [4, 1]]
+    bucketIdxs = [0, 1, 2, 1]
+
+    c1 = SDRClassifier([1], 0.1, 0.1, 0)
+    for recordNum, (patternNZ, bucketIdx) in enumerate(zip(patternNZs,
+                                                           bucketIdxs)):
+      c1.compute(recordNum, patternNZ,
+                 {"bucketIdx": bucketIdx, "actValue": bucketIdx},
+                 learn=True, infer=False)
+
+    c2 = SDRClassifier([1], 0.1, 0.1, 0)
+    c2.fitBatch(range(4), packPatternNZs(patternNZs), bucketIdxs,
+                bucketIdxs)
+
+    numpy.testing.assert_allclose(c1._weightMatrix[1], c2._weightMatrix[1],
+                                  rtol=1e-12, atol=1e-15)
+
+
+  def testInferBatchMatchesCompute(self):
+    c = SDRClassifier([1, 2], 0.1, 0.1, 0)
+    rng = random.Random(42)
+    for recordNum in xrange(20):
+      bucketIdx = recordNum % 5
+      c.compute(recordNum, rng.sample(xrange(40), 5),
+                {"bucketIdx": bucketIdx, "actValue": 2.0 * bucketIdx},
+                learn=True, infer=False)
+
+    patternNZs = [rng.sample(xrange(60), rng.randint(1, 10))
+                  for _ in xrange(12)]
+    result = c.inferBatch(packPatternNZs(patternNZs))
+
+    for i, patternNZ in enumerate(patternNZs):
+      expected = c.compute(20 + i, patternNZ, None, learn=False, infer=True)
+      for step in (1, 2):
+        numpy.testing.assert_allclose(expected[step], result[step][i],
+                                      rtol=1e-12)
+      self.assertEqual(expected["actualValues"], result["actualValues"])
+
+
+  def testInferBatchEmptyPatterns(self):
+    c = SDRClassifier([1], 0.1, 0.1, 0)
+    for recordNum in xrange(10):
+      bucketIdx = recordNum % 4
+      c.compute(recordNum, [bucketIdx, 10 + bucketIdx],
+                {"bucketIdx": bucketIdx, "actValue": bucketIdx},
+                learn=True, infer=False)
+
+    result = c.inferBatch(packPatternNZs([[], [1, 11], [], [2], []]))
+
+    uniform = c.inferSingleStep([], c._weightMatrix[1])
+    for i in (0, 2, 4):
+      numpy.testing.assert_array_equal(uniform, result[1][i])
+    numpy.testing.assert_allclose(
+      c.inferSingleStep([1, 11], c._weightMatrix[1]), result[1][1],
+      rtol=1e-12)
+    numpy.testing.assert_allclose(
+      c.inferSingleStep([2], c._weightMatrix[1]), result[1][3], rtol=1e-12)
+
+    result = c.inferBatch(packPatternNZs([[], []]))
+    self.assertEqual((2, 4), result[1].shape)
+
+
+  def testBatchInvalidPatterns(self):
+    c = SDRClassifier([1], 0.1, 0.1, 0)
+    # Offsets have to cover the indices
+    self.assertRaises(ValueError, c.inferBatch, ([1, 2, 3], [0, 2]))
+    self.assertRaises(ValueError, c.inferBatch, ([1, 2], [0, 2, 1, 2]))
+    # Patterns cannot be empty when learning
+    self.assertRaises(ValueError, c.fitBatch, [0, 1],
+                      ([1, 2], [0, 2, 2]), [0, 1], [0.0, 1.0])
+    # One pattern per record
+    self.assertRaises(ValueError, c.fitBatch, [0, 1],
+                      packPatternNZs([[1, 2]]), [0, 1], [0.0, 1.0])
+    # Record numbers have to increase monotonically
+    self.assertRaises(ValueError, c.fitBatch, [1, 0],
+                      packPatternNZs([[1], [2]]), [0, 1], [0.0, 1.0])
+
+
   def _doWriteReadChecks(self, computeBeforeSerializing):
     c1 = SDRClassifier([0], 0.1, 0.1, 0)
 
@@ -15,7 +15,7 @@ import numpy
 import tempfile
 import unittest
 from copy import copy
-from mock import Mock
+from mock import Mock, patch
 from nupic.bindings.math import GetNTAReal, Random
 
 from nupic.algorithms.spatial_pooler import (BinaryCorticalColumns,
@@ -1090,6 +1090,48 @@ class SpatialPoolerTest(unittest.TestCase):
         self.assertAlmostEqual(truePermanences[i][j], perm[j])
 
 
+  def testAdaptSynapsesMatchesUpdatePermanencesForColumn(self):
+    """ Adapting all active columns at once gives the same permanences,
+    connected synapses and connected counts as updating each column with
+    _updatePermanencesForColumn, including columns that need their
+    permanences raised to reach the stimulus threshold.
+    """
+    params = dict(inputDimensions=[60],
+                  columnDimensions=[30],
+                  potentialRadius=60,
+                  potentialPct=0.3,
+                  stimulusThreshold=5,
+                  synPermInactiveDec=0.15,
+                  synPermConnected=0.3,
+                  seed=3)
+    sp1 = SpatialPooler(**params)
+    sp2 = SpatialPooler(**params)
+
+    rng = numpy.random.RandomState(42)
+    for _ in xrange(20):
+      inputVector = (rng.rand(60) < 0.05).astype(realDType)
+      activeColumns = numpy.sort(rng.choice(30, 8, replace=False))
+
+      sp1._adaptSynapses(inputVector, activeColumns)
+
+      for columnIndex in activeColumns:
+        perm = sp2._permanences[columnIndex]
+        maskPotential = numpy.where(sp2._potentialPools[columnIndex] > 0)[0]
+        permChanges = numpy.where(inputVector > 0, sp2._synPermActiveInc,
+                                  -sp2._synPermInactiveDec).astype(realDType)
+        perm[maskPotential] += permChanges[maskPotential]
+        sp2._updatePermanencesForColumn(perm, columnIndex, raisePerm=True)
+
+      self.assertTrue(numpy.array_equal(sp1._permanences.toDense(),
+                                        sp2._permanences.toDense()))
+      self.assertTrue(numpy.array_equal(sp1._connectedSynapses.toDense(),
+                                        sp2._connectedSynapses.toDense()))
+      self.assertTrue(numpy.array_equal(sp1._connectedCounts,
+                                        sp2._connectedCounts))
+
+    self.assertEqual(5, sp1._connectedCounts.min())
+
+
   def testRaisePermanenceThreshold(self):
     sp = self._sp
     sp._inputDimensions=numpy.array([5])
@@ -1439,6 +1481,51 @@ class SpatialPoolerTest(unittest.TestCase):
     self.assertListEqual(trueActive, sorted(active))
 
 
+  def testInhibitColumnsLocalMatchesColumnByColumn(self):
+    """ Local inhibition selects exactly the columns that selecting one column
+    at a time, in index order, selects. Integer overlaps produce many ties.
+    """
+    def inhibitColumnByColumn(sp, overlaps, density):
+      activeArray = numpy.zeros(sp._numColumns, dtype="bool")
+      for column, overlap in enumerate(overlaps):
+        if overlap >= sp._stimulusThreshold:
+          neighborhood = sp._getColumnNeighborhood(column)
+          numBigger = numpy.count_nonzero(overlaps[neighborhood] > overlap)
+          tiedNeighbors = neighborhood[overlaps[neighborhood] == overlap]
+          numTiesLost = numpy.count_nonzero(activeArray[tiedNeighbors])
+          numActive = int(0.5 + density * len(neighborhood))
+          if numBigger + numTiesLost < numActive:
+            activeArray[column] = True
+      return list(activeArray.nonzero()[0])
+
+    rng = numpy.random.RandomState(42)
+    for columnDimensions in ([50], [7, 9], [3, 4, 5]):
+      sp = SpatialPooler(inputDimensions=columnDimensions,
+                         columnDimensions=columnDimensions,
+                         potentialRadius=1,
+                         stimulusThreshold=1)
+      for _ in xrange(30):
+        sp._inhibitionRadius = rng.randint(max(columnDimensions) + 1)
+        sp._wrapAround = bool(rng.randint(2))
+        density = rng.uniform(0.02, 0.5)
+        overlaps = rng.randint(0, 4, sp._numColumns).astype(realDType)
+
+        expected = inhibitColumnByColumn(sp, overlaps, density)
+        self.assertListEqual(expected,
+                             list(sp._inhibitColumnsLocal(overlaps, density)))
+        _, neighbors, offsets, _ = sp._columnNeighborhoodTable[1]
+        self.assertEqual(numpy.int32, neighbors.dtype)
+        self.assertEqual(numpy.int32, offsets.dtype)
+
+        # Neighborhoods too big to cache are built in blocks on every call.
+        with patch("nupic.algorithms.spatial_pooler."
+                   "MAX_NEIGHBORHOOD_TABLE_SIZE", 10):
+          sp._columnNeighborhoodTable = None
+          self.assertListEqual(expected,
+                               list(sp._inhibitColumnsLocal(overlaps, density)))
+          self.assertIsNone(sp._columnNeighborhoodTable)
+
+
   @unittest.skipUnless(
       capnp, "pycapnp is not installed, skipping serialization test.")
   def testWriteRead(self):
@@ -1477,7 +1564,8 @@ class SpatialPoolerTest(unittest.TestCase):
     # Load the deserialized proto
     sp2 = SpatialPooler.read(proto2)
 
-    ephemeral = set(["_boostedOverlaps", "_overlaps"])
+    ephemeral = set(["_boostedOverlaps", "_overlaps",
+                     "_columnNeighborhoodTable"])
 
     # Check that the two spatial poolers have the same attributes
     self.assertSetEqual(set(sp1.__dict__.keys()), set(sp2.__dict__.keys()))
@@ -1560,5 +1648,53 @@ class SpatialPoolerTest(unittest.TestCase):
       self.assertEqual(sum(activeArray), numActive)
 
 
+  def testComputeSparseMatchesCompute(self):
+    """
+    computeSparse produces the same active columns and the same learning as
+    compute, for global and local inhibition.
+    """
+    for globalInhibition in (True, False):
+      params = dict(inputDimensions=[200],
+                    columnDimensions=[128],
+                    potentialRadius=50,
+                    potentialPct=0.5,
+                    globalInhibition=globalInhibition,
+                    numActiveColumnsPerInhArea=10,
+                    stimulusThreshold=1,
+                    dutyCyclePeriod=20,
+                    boostStrength=2.0,
+                    seed=42)
+      sp = SpatialPooler(**params)
+      sparseSP = SpatialPooler(**params)
+
+      rng = numpy.random.RandomState(42)
+      activeArray = numpy.zeros(sp.getNumColumns(), dtype=uintDType)
+      for i in xrange(100):
+        learn = i < 80
+        activeInputs = rng.choice(200, 20, replace=False)
+        inputVector = numpy.zeros(200, dtype=uintDType)
+        inputVector[activeInputs] = 1
+
+        sp.compute(inputVector, learn, activeArray)
+        activeColumns = sparseSP.computeSparse(activeInputs, learn)
+
+        self.assertListEqual(list(activeArray.nonzero()[0]),
+                             list(activeColumns))
+        self.assertListEqual(list(sp.getOverlaps()),
+                             list(sparseSP.getOverlaps()))
+
+      perm = numpy.zeros(200, dtype=realDType)
+      sparsePerm = numpy.zeros(200, dtype=realDType)
+      for column in xrange(sp.getNumColumns()):
+        sp.getPermanence(column, perm)
+        sparseSP.getPermanence(column, sparsePerm)
+        self.assertListEqual(list(perm), list(sparsePerm))
+
+
+  def testComputeSparseInvalidInput(self):
+    sp = SpatialPooler(inputDimensions=[10], columnDimensions=[5])
+    self.assertRaises(ValueError, sp.computeSparse, [3, 10], True)
+
+
 if __name__ == "__main__":
   unittest.main()
@@ -0,0 +1,209 @@
+# Copyright 2017 Numenta Inc.
+#
+# Copyright may exist in Contributors' modifications
+# and/or contributions to the work.
+#
+# Use of this source code is governed by the MIT
+# license that can be found in the LICENSE file or at
+# https://opensource.org/licenses/MIT.
+
+import cPickle as pickle
+import os
+import shutil
+import tempfile
+import unittest
+
+from datetime import datetime
+from nupic.data import SENTINEL_VALUE_FOR_MISSING_DATA
+from nupic.data.columnar_record_stream import (ColumnarRecordStream,
+                                               convertFromCsv)
+from nupic.data.field_meta import FieldMetaInfo, FieldMetaType, FieldMetaSpecial
+from nupic.data.file_record_stream import FileRecordStream
+from nupic.data.stream_reader import StreamReader
+
+
+
+FIELDS = [FieldMetaInfo('name', FieldMetaType.string,
+                        FieldMetaSpecial.none),
+          FieldMetaInfo('timestamp', FieldMetaType.datetime,
+                        FieldMetaSpecial.timestamp),
+          FieldMetaInfo('integer', FieldMetaType.integer,
+                        FieldMetaSpecial.none),
+          FieldMetaInfo('real', FieldMetaType.float,
+                        FieldMetaSpecial.none),
+          FieldMetaInfo('flag', FieldMetaType.boolean,
+                        FieldMetaSpecial.none),
+          FieldMetaInfo('reset', FieldMetaType.integer,
+                        FieldMetaSpecial.reset),
+          FieldMetaInfo('sid', FieldMetaType.string,
+                        FieldMetaSpecial.sequence),
+          FieldMetaInfo('categories', FieldMetaType.list,
+                        FieldMetaSpecial.category),
+          FieldMetaInfo('pattern', FieldMetaType.sdr,
+                        FieldMetaSpecial.none)]
+
+RECORDS = [
+  ['rec_1', datetime(2010, 3, 1), 5, 6.5, True, 1, 'seq-1', [0, 1, 2],
+   [0, 1, 1]],
+  ['', datetime(2010, 3, 2, 4, 5, 6, 7), 8, 7.5, False, 0, 'seq-1', [3],
+   [1, 0, 0]],
+  ['rec,3', datetime(2010, 3, 3), None, 8.5, True, 0, 'seq-1', [],
+   [0, 0, 0]],
+  ['rec_4', None, 12, None, False, 1, 'seq-2', [4, 5], [1, 1, 1]],
+  ['rec_5', datetime(2010, 3, 5), -87657496599, 0.25, True, 0, 'seq-2',
+   [6, 7, 8], [0, 1, 0]]]
+
+EXPECTED_RECORDS = [
+  [SENTINEL_VALUE_FOR_MISSING_DATA if value == '' else value
+   for value in record]
+  for record in RECORDS]
+
+
+
+class ColumnarRecordStreamTest(unittest.TestCase):
+
+
+  def setUp(self):
+    self._tmpDir = tempfile.mkdtemp()
+    self._path = os.path.join(self._tmpDir, 'dataset')
+
+
+  def tearDown(self):
+    shutil.rmtree(self._tmpDir)
+
+
+  def _readAll(self, stream):
+    records = []
+    while True:
+      record = stream.getNextRecord()
+      if record is None:
+        return records
+      records.append(record)
+
+
+  def testWriteRead(self):
+    with ColumnarRecordStream(self._path, write=True, fields=FIELDS,
+                              chunkSize=2) as s:
+      self.assertEqual(0, s.getDataRowCount())
+      self.assertIsNone(s.getBookmark())
+      s.appendRecords(RECORDS[:3])
+      self.assertEqual(3, s.getDataRowCount())
+      s.appendRecord(RECORDS[3])
+      s.appendRecord(RECORDS[4])
+      self.assertEqual(5, s.getDataRowCount())
+
+    self.assertTrue(ColumnarRecordStream.isColumnarDataset(self._path))
+
+    with ColumnarRecordStream(self._path, chunkSize=2) as s:
+      self.assertEqual(FIELDS, s.getFields())
+      self.assertEqual([f.name for f in FIELDS], s.getFieldNames())
+      self.assertEqual(5, s.getDataRowCount())
+      self.assertEqual(0, s.getNextRecordIdx())
+      self.assertEqual(1, s.getTimestampFieldIdx())
+      self.assertEqual(EXPECTED_RECORDS, self._readAll(s))
+      self.assertEqual(5, s.getNextRecordIdx())
+      self.assertFalse(s.recordsExistAfter(None))
+
+      self.assertEqual({'min': [None, None, -87657496599, 0.25, None, 0, None,
+                                None, None],
+                        'max': [None, None, 12, 8.5, None, 1, None, None,
+                                None]},
+                       s.getStats())
+
+      s.rewind()
+      self.assertEqual(EXPECTED_RECORDS, list(s))
+
+    # Fields without missing values don't store a missing mask
+    self.assertTrue(os.path.exists(os.path.join(self._path, '0.missing')))
+    self.assertFalse(os.path.exists(os.path.join(self._path, '4.missing')))
+
+
+  def testConvertFromCsv(self):
+    csvPath = os.path.join(self._tmpDir, 'dataset.csv')
+    # The csv format can't store missing timestamps
+    records = [list(record) for record in RECORDS]
+    records[3][1] = datetime(2010, 3, 4)
+    with FileRecordStream(csvPath, write=True, fields=FIELDS) as s:
+      s.appendRecords(records)
+
+    self.assertEqual(5, convertFromCsv(csvPath, self._path, chunkSize=3))
+
+    with FileRecordStream(csvPath) as csvStream:
+      with ColumnarRecordStream(self._path) as stream:
+        self.assertEqual(csvStream.getFields(), stream.getFields())
+        self.assertEqual(self._readAll(csvStream), self._readAll(stream))
+        self.assertEqual(csvStream.getStats(), stream.getStats())
+
+
+  def testBookmarks(self):
+    with ColumnarRecordStream(self._path, write=True, fields=FIELDS) as s:
+      s.appendRecords(RECORDS)
+
+    with ColumnarRecordStream(self._path, firstRecord=1) as s:
+      self.assertEqual(EXPECTED_RECORDS[1], s.getNextRecord())
+      bookmark = s.getBookmark()
+      self.assertEqual(EXPECTED_RECORDS[3], s.seekFromEnd(2) and
+                       s.getNextRecord())
+
+    with ColumnarRecordStream(self._path, bookmark=bookmark) as s:
+      self.assertEqual(2, s.getNextRecordIdx())
+      self.assertEqual(EXPECTED_RECORDS[2:], self._readAll(s))
+
+    with self.assertRaises(RuntimeError):
+      ColumnarRecordStream(self._path, bookmark=bookmark, firstRecord=1)
+
+
+  def testAutoRewind(self):
+    with ColumnarRecordStream(self._path, write=True, fields=FIELDS) as s:
+      s.appendRecords(RECORDS[:2])
+
+    with ColumnarRecordStream(self._path) as s:
+      s.setAutoRewind(True)
+      self.assertEqual(EXPECTED_RECORDS[:2] * 2,
+                       [s.getNextRecord() for _ in xrange(4)])
+
+
+  def testPickle(self):
+    with ColumnarRecordStream(self._path, write=True, fields=FIELDS) as s:
+      s.appendRecords(RECORDS)
+
+    with ColumnarRecordStream(self._path) as s:
+      s.getNextRecord()
+      restored = pickle.loads(pickle.dumps(s))
+      self.assertEqual(EXPECTED_RECORDS, self._readAll(restored))
+      restored.close()
+
+
+  def testEmptyDataset(self):
+    with ColumnarRecordStream(self._path, write=True, fields=FIELDS):
+      pass
+
+    with ColumnarRecordStream(self._path) as s:
+      self.assertEqual(0, s.getDataRowCount())
+      self.assertIsNone(s.getNextRecord())
+      s.setAutoRewind(True)
+      self.assertRaises(Exception, s.getNextRecord)
+
+
+  def testStreamReader(self):
+    with ColumnarRecordStream(self._path, write=True, fields=FIELDS) as s:
+      s.appendRecords(RECORDS)
+
+    streamDef = dict(
+      version=1,
+      info='columnar dataset',
+      streams=[dict(source='file://%s' % self._path,
+                    info='columnar dataset',
+                    columns=['name', 'integer'],
+                    first_record=1,
+                    last_record=4)])
+    reader = StreamReader(streamDef)
+    self.assertIsInstance(reader._recordStore, ColumnarRecordStream)
+    self.assertEqual([[None, 8], ['rec,3', None], ['rec_4', 12]],
+                     self._readAll(reader))
+    reader.close()
+
+
+
+if __name__ == '__main__':
+  unittest.main()
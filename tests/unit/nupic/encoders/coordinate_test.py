@@ -7,6 +7,7 @@
 # license that can be found in the LICENSE file or at
 # https://opensource.org/licenses/MIT.
 
+import cPickle as pickle
 import numpy as np
 import tempfile
 import unittest
@@ -266,6 +267,56 @@ class CoordinateEncoderTest(unittest.TestCase):
       print "Average: {0}".format(np.average(allOverlaps))
 
 
+  def testCachedEncodingMatchesUncached(self):
+    uncached = CoordinateEncoder(n=999, w=25, cacheSize=0)
+    # Smaller than a neighborhood, so that every encoding evicts entries.
+    cached = CoordinateEncoder(n=999, w=25, cacheSize=300)
+
+    for i in range(20):
+      coordinate = np.array([100 + i, 200 - 2 * i])
+      radius = 10 - i % 3
+      self.assertTrue(np.array_equal(encode(uncached, coordinate, radius),
+                                     encode(cached, coordinate, radius)))
+      self.assertLessEqual(len(cached._cache), 441)
+
+
+  def testVectorizedHash(self):
+    encoder = CoordinateEncoder(n=999, w=25, vectorizedHash=True)
+    coordinate = np.array([100, 200])
+
+    output1 = encode(encoder, coordinate, 10)
+    # Up to a few chance hash collisions
+    self.assertGreater(np.sum(output1), 20)
+    self.assertLessEqual(np.sum(output1), 25)
+    self.assertTrue(np.array_equal(encode(encoder, coordinate, 10), output1))
+
+    orders = encoder._ordersForHashes(
+      encoder._hashCoordinates(encoder._neighbors(coordinate, 10)))
+    self.assertTrue(np.all((orders >= 0) & (orders < 1)))
+    self.assertEqual(len(np.unique(orders)), len(orders))
+
+    overlaps = overlapsForRelativeAreas(999, 51, np.array([100, 200]), 10,
+                                        dPosition=np.array([2, 2]),
+                                        num=5, vectorizedHash=True)
+    self.assertDecreasingOverlaps(overlaps)
+
+    overlaps = overlapsForUnrelatedAreas(999, 25, 10, vectorizedHash=True)
+    self.assertLess(np.max(overlaps), 0.17)
+    self.assertLess(np.average(overlaps), 0.3)
+
+
+  def testPickleDropsCache(self):
+    encoder = CoordinateEncoder(n=999, w=25)
+    output1 = encode(encoder, np.array([100, 200]), 5)
+    self.assertEqual(len(encoder._cache), 121)
+
+    encoder2 = pickle.loads(pickle.dumps(encoder))
+    self.assertEqual(len(encoder2._cache), 0)
+    self.assertEqual(encoder2.cacheSize, encoder.cacheSize)
+    self.assertTrue(np.array_equal(encode(encoder2, np.array([100, 200]), 5),
+                                   output1))
+
+
   def assertDecreasingOverlaps(self, overlaps):
     self.assertEqual((np.diff(overlaps) > 0).sum(), 0)
 
@@ -293,6 +344,8 @@ class CoordinateEncoderTest(unittest.TestCase):
     self.assertEqual(encoder.n, self.encoder.n)
     self.assertEqual(encoder.name, self.encoder.name)
     self.assertEqual(encoder.verbosity, self.encoder.verbosity)
+    self.assertEqual(encoder.cacheSize, self.encoder.cacheSize)
+    self.assertEqual(encoder.vectorizedHash, self.encoder.vectorizedHash)
 
     coordinate = np.array([100, 200])
     radius = 5
@@ -313,7 +366,8 @@ def overlap(sdr1, sdr2):
 
 
 def overlapsForRelativeAreas(n, w, initPosition, initRadius, dPosition=None,
-                             dRadius=0, num=100, verbose=False):
+                             dRadius=0, num=100, verbose=False,
+                             vectorizedHash=False):
   """
   Return overlaps between an encoding and other encodings relative to it
 
@@ -325,8 +379,10 @@ def overlapsForRelativeAreas(n, w, initPosition, initRadius, dPosition=None,
   :param dRadius: the offset to apply to each subsequent radius
   :param num: the number of encodings to generate
   :param verbose: whether to print verbose output
+  :param vectorizedHash: whether the encoder uses the vectorized hash
   """
-  encoder = CoordinateEncoder(name="coordinate", n=n, w=w)
+  encoder = CoordinateEncoder(name="coordinate", n=n, w=w,
+                              vectorizedHash=vectorizedHash)
 
   overlaps = np.empty(num)
   outputA = encode(encoder, np.array(initPosition), initRadius)
@@ -350,13 +406,15 @@ def overlapsForRelativeAreas(n, w, initPosition, initRadius, dPosition=None,
   return overlaps
 
 
-def overlapsForUnrelatedAreas(n, w, radius, repetitions=100, verbose=False):
+def overlapsForUnrelatedAreas(n, w, radius, repetitions=100, verbose=False,
+                              vectorizedHash=False):
   """
   Return overlaps between an encoding and other, unrelated encodings
   """
   return overlapsForRelativeAreas(n, w, np.array([0, 0]), radius,
                                   dPosition=np.array([0, radius * 10]),
-                                  num=repetitions, verbose=verbose)
+                                  num=repetitions, verbose=verbose,
+                                  vectorizedHash=vectorizedHash)
 
 
 
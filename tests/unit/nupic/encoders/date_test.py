@@ -185,6 +185,41 @@ class DateEncoderTest(unittest.TestCase):
         self.assertNotEqual(d.weekday(), 0)
 
 
+  def testLookupTables(self):
+    """lookup tables give the same encodings, including holiday ramps"""
+    params = dict(season=5, dayOfWeek=3, weekend=3, holiday=5, timeOfDay=5,
+                  customDays=(3, ["sat", "mon"]), forced=True,
+                  holidays=[(12, 25), (2016, 7, 4), (1, 1)])
+    e = DateEncoder(**params)
+    lookup = DateEncoder(useLookupTables=True, **params)
+
+    d = datetime.datetime(2015, 12, 20, 0, 7)
+    for _ in range(2000):
+      d += datetime.timedelta(minutes=257, seconds=13)
+      self.assertTrue(numpy.array_equal(e.encode(d), lookup.encode(d)))
+
+    self.assertEqual(sorted(lookup._holidayDatesByYear), [2015, 2016])
+    self.assertEqual(sum(lookup.encode(SENTINEL_VALUE_FOR_MISSING_DATA)), 0)
+
+
+  def testEncodeColumn(self):
+    """encoding a datetime64 column matches encoding each date"""
+    e = DateEncoder(season=5, dayOfWeek=3, weekend=3, holiday=5, timeOfDay=5,
+                    customDays=(3, "fri"), forced=True)
+    start = datetime.datetime(2011, 12, 23, 22, 30)
+    dates = [start + datetime.timedelta(minutes=29 * i) for i in range(500)]
+    values = numpy.array(dates, dtype="datetime64[us]")
+    values[7] = numpy.datetime64("NaT")
+
+    output = numpy.ones((len(values), e.getWidth()), dtype=defaultDtype)
+    e.encodeColumn(values, output)
+
+    for i, d in enumerate(dates):
+      expected = (e.encode(SENTINEL_VALUE_FOR_MISSING_DATA) if i == 7
+                  else e.encode(d))
+      self.assertTrue(numpy.array_equal(output[i], expected))
+
+
   @unittest.skipUnless(
       capnp, "pycapnp is not installed, skipping serialization test.")
   def testReadWrite(self):
@@ -208,6 +243,7 @@ class DateEncoderTest(unittest.TestCase):
     self.assertEqual(encoder.timeOfDayOffset, self._e.timeOfDayOffset)
     self.assertEqual(encoder.seasonOffset, self._e.seasonOffset)
     self.assertEqual(encoder.dayOfWeekOffset, self._e.dayOfWeekOffset)
+    self.assertEqual(encoder.useLookupTables, self._e.useLookupTables)
     self.assertIsInstance(encoder.customDaysEncoder,
                           self._e.customDaysEncoder.__class__)
     self.assertIsInstance(encoder.dayOfWeekEncoder,
@@ -86,6 +86,34 @@ class DeltaEncoderTest(unittest.TestCase):
       self.assertTrue(np.array_equal(delencode[0], aseencode[0]))
 
 
+  def testEncodeBatch(self):
+    """encodeBatch computes the same deltas and state as encoding each value"""
+    feedIn = [1, 10, 4, 7, 9, 6, 3, 1]
+    for lockAt in (None, 3):
+      dencoder = DeltaEncoder(w=21, n=100, forced=True)
+      expected = np.zeros((len(feedIn), 100))
+      for i, value in enumerate(feedIn):
+        if i == lockAt:
+          dencoder.setStateLock(True)
+        dencoder.encodeIntoArray(value, expected[i], learn=True)
+
+      batchEncoder = DeltaEncoder(w=21, n=100, forced=True)
+      output = np.zeros((len(feedIn), 100))
+      if lockAt is None:
+        batchEncoder.encodeBatch(feedIn, output)
+      else:
+        batchEncoder.encodeBatch(feedIn[:lockAt], output[:lockAt])
+        batchEncoder.setStateLock(True)
+        batchEncoder.encodeBatch(feedIn[lockAt:], output[lockAt:])
+
+      self.assertTrue(np.array_equal(output, expected))
+      self.assertEqual(batchEncoder._prevAbsolute, dencoder._prevAbsolute)
+      self.assertEqual(batchEncoder._prevDelta, dencoder._prevDelta)
+
+    with self.assertRaises(TypeError):
+      batchEncoder.encodeBatch([1, None], np.zeros((2, 100)))
+
+
   def testEncodeInvalidInputType(self):
     try:
       self._dencoder.encode("String")
@@ -173,6 +173,19 @@ class LogEncoderTest(unittest.TestCase):
     self.assertTrue(numpy.array_equal(ranges[0], [10000, 10000]))
 
 
+  def testEncodeBatch(self):
+    """encodeBatch matches encoding each value, including clipped values"""
+    le = LogEncoder(w=5, resolution=0.1, minval=1, maxval=10000,
+                    name="amount", forced=True)
+    values = [0.5, 1, 10, 99.9, 123.456, 10000, 20000,
+              SENTINEL_VALUE_FOR_MISSING_DATA, float("nan")]
+
+    output = numpy.ones((len(values), le.getWidth()), dtype="uint8")
+    le.encodeBatch(values, output)
+    for value, row in zip(values, output):
+      self.assertTrue(numpy.array_equal(row, le.encode(value)))
+
+
   def testGetBucketValues(self):
     """
     Verify that the values of buckets are as expected for given
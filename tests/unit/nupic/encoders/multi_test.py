@@ -79,6 +79,33 @@ class MultiEncoderTest(unittest.TestCase):
 
 
 
+  def testEncodeBatch(self):
+    """Encoding a block of records column-wise matches encoding each record"""
+    def createEncoder():
+      e = MultiEncoder()
+      e.addEncoder("dow",
+                   ScalarEncoder(w=3, resolution=1, minval=1, maxval=8,
+                                 periodic=True, name="day of week",
+                                 forced=True))
+      e.addEncoder("myval",
+                   AdaptiveScalarEncoder(n=14, w=5, minval=1, maxval=10,
+                                         name="aux", forced=True))
+      e.addEncoder("myCat",
+                   SDRCategoryEncoder(n=7, w=3, name="myCat", forced=True))
+      return e
+
+    records = [DictObj(dow=i % 7 + 1, myval=i * 0.7,
+                       myCat=["run", "pass", "kick"][i % 3])
+               for i in xrange(20)]
+
+    e1 = createEncoder()
+    e2 = createEncoder()
+    output = numpy.ones((len(records), e2.getWidth()), dtype="uint8")
+    e2.encodeBatch(records, output)
+    for record, row in zip(records, output):
+      self.assertTrue(numpy.array_equal(row, e1.encode(record)))
+
+
   @unittest.skipUnless(
       capnp, "pycapnp is not installed, skipping serialization test.")
   def testReadWrite(self):
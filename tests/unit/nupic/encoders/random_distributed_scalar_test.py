@@ -111,6 +111,36 @@ class RandomDistributedScalarEncoderTest(unittest.TestCase):
 
 
 
+  def testEncodeBatch(self):
+    """
+    Test that encodeBatch gives the same encodings and creates the same
+    buckets as encoding the values one at a time, including halfway values,
+    which round away from zero.
+    """
+    values = [0.0, 3.5, -2.5, 0.5, SENTINEL_VALUE_FOR_MISSING_DATA, 40.0,
+              -0.5, float("nan"), 1.5, 17.2, -30.0, 3.4]
+    encoder1 = RandomDistributedScalarEncoder(name="encoder", resolution=1.0,
+                                              offset=0.0)
+    encoder2 = RandomDistributedScalarEncoder(name="encoder", resolution=1.0,
+                                              offset=0.0)
+
+    output = numpy.ones((len(values), encoder2.n), dtype=defaultDtype)
+    encoder2.encodeBatch(values, output)
+    for value, row in zip(values, output):
+      self.assertTrue(numpy.array_equal(row, encoder1.encode(value)))
+
+    self.assertEqual(sorted(encoder1.bucketMap), sorted(encoder2.bucketMap))
+    for index in encoder1.bucketMap:
+      self.assertTrue(numpy.array_equal(encoder1.bucketMap[index],
+                                        encoder2.bucketMap[index]))
+
+    # The offset is taken from the first value that is not missing
+    encoder = RandomDistributedScalarEncoder(name="encoder", resolution=1.0)
+    encoder.encodeBatch([SENTINEL_VALUE_FOR_MISSING_DATA, 7.0],
+                        numpy.zeros((2, encoder.n)))
+    self.assertEqual(encoder._offset, 7.0)
+
+
   def testMissingValues(self):
     """
     Test that missing values and NaN return all zero's.
@@ -232,6 +262,27 @@ class RandomDistributedScalarEncoderTest(unittest.TestCase):
                     "Illegal overlap encountered in encoder")
 
 
+  def testPrebuildBuckets(self):
+    """
+    Test that prebuilding creates valid representations for all buckets, and
+    that encoding then creates no buckets.
+    """
+    encoder = RandomDistributedScalarEncoder(resolution=1.0, w=11, n=150,
+                                             offset=0.0, prebuildBuckets=True)
+    self.assertEqual(sorted(encoder.bucketMap), range(encoder._maxBuckets))
+    self.assertTrue(validateEncoder(encoder, subsampling=7),
+                    "Illegal overlap encountered in encoder")
+
+    bucketMap = dict(encoder.bucketMap)
+    numTries = encoder.numTries
+    output = numpy.zeros((3, encoder.n), dtype=defaultDtype)
+    encoder.encodeBatch([-600.0, 12.0, 600.0], output)
+    self.assertTrue(numpy.array_equal(output[1], encoder.encode(12.0)))
+    self.assertEqual(encoder.numTries, numTries)
+    for index, representation in bucketMap.iteritems():
+      self.assertIs(encoder.bucketMap[index], representation)
+
+
   def testGetMethods(self):
     """
     Test that the getWidth, getDescription, and getDecoderOutputFieldTypes
@@ -479,6 +530,10 @@ class RandomDistributedScalarEncoderTest(unittest.TestCase):
     for key, value in original.bucketMap.items():
       self.assertTrue(numpy.array_equal(value, encoder.bucketMap[key]))
 
+    # Both create the same new buckets
+    self.assertTrue(numpy.array_equal(original.encode(-40.0),
+                                      encoder.encode(-40.0)))
+
 
 
 if __name__ == "__main__":
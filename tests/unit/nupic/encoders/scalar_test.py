@@ -56,6 +56,32 @@ class ScalarEncoderTest(unittest.TestCase):
     self.assertEqual(empty.sum(), 0)
 
 
+  def testEncodeBatch(self):
+    """encodeBatch matches encoding each value, including clipped, periodic
+    and missing values"""
+    encoders = [
+      ScalarEncoder(n=14, w=3, minval=1, maxval=8, periodic=True, forced=True),
+      ScalarEncoder(n=14, w=3, minval=1, maxval=8, clipInput=True,
+                    forced=True)]
+    values = [1, 2.5, 3, 7.99, SENTINEL_VALUE_FOR_MISSING_DATA, float("nan"),
+              4.49, 4.5, 5]
+    for encoder in encoders:
+      output = numpy.ones((len(values) + 1, 20), dtype=defaultDtype)
+      encoder.encodeBatch(values + [0 if encoder.clipInput else 1], output)
+      for value, row in zip(values, output):
+        self.assertTrue(numpy.array_equal(row[:14], encoder.encode(value)))
+        self.assertTrue(numpy.all(row[14:] == 1))
+
+    # Out of range values are rejected unless clipped
+    with self.assertRaises(Exception):
+      encoders[0].encodeBatch([1, 8], numpy.zeros((2, 14)))
+
+    clipped = numpy.zeros((2, 14), dtype=defaultDtype)
+    encoders[1].encodeBatch([-3, 20], clipped)
+    self.assertTrue(numpy.array_equal(clipped[0], encoders[1].encode(1)))
+    self.assertTrue(numpy.array_equal(clipped[1], encoders[1].encode(8)))
+
+
   def testBottomUpEncodingPeriodicEncoder(self):
     """Test bottom-up encoding for a Periodic encoder"""
     l = ScalarEncoder(n=14, w=3, minval=1, maxval=8, periodic=True,
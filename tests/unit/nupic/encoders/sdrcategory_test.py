@@ -195,6 +195,27 @@ class SDRCategoryEncoderTest(unittest.TestCase):
     # -----------------------------------------------------------------------
 
 
+  def testEncodeBatch(self):
+    """encodeBatch learns new categories in order, like encoding each value"""
+    values = ["cat%d" % (i % 23) for i in xrange(60)]
+    values[5] = SENTINEL_VALUE_FOR_MISSING_DATA
+    encoder1 = SDRCategoryEncoder(n=100, w=21)
+    encoder2 = SDRCategoryEncoder(n=100, w=21)
+
+    output = numpy.ones((len(values), 100), dtype="uint8")
+    encoder2.encodeBatch(values, output)
+    for value, row in zip(values, output):
+      self.assertTrue(numpy.array_equal(row, encoder1.encode(value)))
+    self.assertEqual(encoder1.categories, encoder2.categories)
+
+    # Unknown categories are category 0 when not learning
+    encoder = SDRCategoryEncoder(n=100, w=21, categoryList=["a", "b"])
+    output = numpy.zeros((3, 100), dtype="uint8")
+    encoder.encodeBatch(["b", "z", "a"], output)
+    self.assertTrue(numpy.array_equal(output[1], encoder.sdrs[0]))
+    self.assertEqual(encoder.ncategories, 3)
+
+
   def testAutogrow(self):
     """testing auto-grow"""
     fieldWidth = 100
@@ -9,13 +9,55 @@
 
 """Unit tests for the htm_prediction_model module."""
 
+import copy
 import datetime
+import os
+import shutil
+import tempfile
 import unittest2 as unittest
 
+from mock import patch
+
 from nupic.frameworks.opf.htm_prediction_model import HTMPredictionModel
+from nupic.frameworks.opf.model import Model
 from nupic.frameworks.opf.model_factory import ModelFactory
 from nupic.frameworks.opf.opf_utils import ModelResult
 
+# Small model with the Python implementations of the algorithms
+SMALL_MODEL_CONFIG = {
+  "model": "HTMPrediction",
+  "version": 1,
+  "predictAheadTime": None,
+  "modelParams": {
+    "inferenceType": "TemporalMultiStep",
+    "sensorParams": {
+      "verbosity": 0,
+      "encoders": {
+        "c1": {"fieldname": "c1", "name": "c1", "type": "ScalarEncoder",
+               "n": 100, "w": 21, "minval": 0, "maxval": 20}},
+      "sensorAutoReset": None},
+    "spEnable": True,
+    "spParams": {"spatialImp": "py", "columnCount": 256,
+                 "inputWidth": 0, "numActiveColumnsPerInhArea": 10,
+                 "globalInhibition": 1, "potentialPct": 0.8,
+                 "synPermConnected": 0.1, "synPermActiveInc": 0.05,
+                 "synPermInactiveDec": 0.01, "boostStrength": 0.0,
+                 "seed": 1956, "spVerbosity": 0},
+    "tmEnable": True,
+    "tmParams": {"temporalImp": "py", "columnCount": 256,
+                 "inputWidth": 256, "cellsPerColumn": 4,
+                 "newSynapseCount": 10, "initialPerm": 0.21,
+                 "permanenceInc": 0.1, "permanenceDec": 0.1,
+                 "globalDecay": 0.0, "maxAge": 0, "minThreshold": 5,
+                 "activationThreshold": 8, "pamLength": 1,
+                 "maxSegmentsPerCell": 32, "maxSynapsesPerSegment": 32,
+                 "outputType": "normal", "seed": 1960, "verbosity": 0},
+    "clEnable": True,
+    "clParams": {"regionName": "SDRClassifierRegion",
+                 "implementation": "py", "alpha": 0.1, "steps": "1",
+                 "verbosity": 0},
+    "trainSPNetOnlyIfRequested": False}}
+
 
 
 class HTMPredictionModelTest(unittest.TestCase):
@@ -179,5 +221,182 @@ class HTMPredictionModelTest(unittest.TestCase):
       self.assertIsInstance(result, ModelResult)
 
 
+  def testSaveLoadArrayCheckpoint(self):
+    records = [{"c1": float(i % 10)} for i in xrange(40)]
+
+    model = ModelFactory.create(modelConfig=SMALL_MODEL_CONFIG)
+    model.enableInference({"predictedField": "c1"})
+    for record in records[:30]:
+      model.run(record)
+
+    saveDir = tempfile.mkdtemp()
+    try:
+      checkpointDir = os.path.join(saveDir, "checkpoint")
+      model.save(checkpointDir, arrayCheckpoint=True)
+      model2 = Model.load(checkpointDir)
+
+      for record in records[30:]:
+        self.assertEqual(model.run(copy.copy(record)).inferences,
+                         model2.run(copy.copy(record)).inferences)
+
+      # The checkpoint can be replaced by a regular one
+      model2.save(checkpointDir)
+      model3 = Model.load(checkpointDir)
+      self.assertEqual(model.run(records[0]).inferences,
+                       model3.run(records[0]).inferences)
+    finally:
+      shutil.rmtree(saveDir)
+
+
+  def testSaveOverLoadedArrayCheckpoint(self):
+    records = [{"c1": float(i % 10)} for i in xrange(40)]
+
+    model = ModelFactory.create(modelConfig=SMALL_MODEL_CONFIG)
+    model.enableInference({"predictedField": "c1"})
+    for record in records[:20]:
+      model.run(record)
+
+    saveDir = tempfile.mkdtemp()
+    try:
+      checkpointDir = os.path.join(saveDir, "checkpoint")
+      model.save(checkpointDir, arrayCheckpoint=True)
+      model2 = Model.load(checkpointDir)
+      for record in records[20:30]:
+        self.assertEqual(model.run(copy.copy(record)).inferences,
+                         model2.run(copy.copy(record)).inferences)
+
+      # The loaded model, whose arrays may be mapped from the checkpoint, is
+      # saved back to it
+      model2.save(checkpointDir, arrayCheckpoint=True)
+      model3 = Model.load(checkpointDir)
+
+      # A failed save leaves the checkpoint as it was
+      with patch.object(HTMPredictionModel, "_serializeExtraDataArrays",
+                        side_effect=IOError("Disk full")):
+        with self.assertRaises(IOError):
+          model2.save(checkpointDir, arrayCheckpoint=True)
+      self.assertEqual(["checkpoint"], os.listdir(saveDir))
+      model4 = Model.load(checkpointDir)
+
+      for record in records[30:]:
+        inferences = model.run(copy.copy(record)).inferences
+        for otherModel in (model2, model3, model4):
+          self.assertEqual(inferences,
+                           otherModel.run(copy.copy(record)).inferences)
+    finally:
+      shutil.rmtree(saveDir)
+
+
+  def testFailedSwapKeepsCheckpoint(self):
+    records = [{"c1": float(i % 10)} for i in xrange(30)]
+
+    model = ModelFactory.create(modelConfig=SMALL_MODEL_CONFIG)
+    model.enableInference({"predictedField": "c1"})
+    for record in records[:10]:
+      model.run(record)
+
+    saveDir = tempfile.mkdtemp()
+    try:
+      checkpointDir = os.path.join(saveDir, "checkpoint")
+      model.save(checkpointDir)
+      model2 = Model.load(checkpointDir)
+      for record in records[10:20]:
+        model.run(record)
+
+      # Moving the new checkpoint in place fails after the old one was moved
+      # away
+      rename = os.rename
+      renames = []
+      def failSecondRename(src, dst):
+        renames.append((src, dst))
+        if len(renames) == 2:
+          raise OSError("Rename failed")
+        rename(src, dst)
+
+      with patch.object(os, "rename", side_effect=failSecondRename):
+        with self.assertRaises(OSError):
+          model.save(checkpointDir)
+      self.assertEqual(["checkpoint"], os.listdir(saveDir))
+      model3 = Model.load(checkpointDir)
+
+      for record in records[20:]:
+        self.assertEqual(model2.run(copy.copy(record)).inferences,
+                         model3.run(copy.copy(record)).inferences)
+    finally:
+      shutil.rmtree(saveDir)
+
+
+  def testSaveDelta(self):
+    records = [{"c1": float(i % 10)} for i in xrange(60)]
+
+    model = ModelFactory.create(modelConfig=SMALL_MODEL_CONFIG)
+    model.enableInference({"predictedField": "c1"})
+
+    saveDir = tempfile.mkdtemp()
+    try:
+      logDir = os.path.join(saveDir, "log")
+      checkpoints = []
+      for i in xrange(4):
+        for record in records[i * 10:(i + 1) * 10]:
+          model.run(record)
+        model.saveDelta(logDir, maxDeltas=2)
+        checkpoints.append(sorted(os.listdir(logDir)))
+
+      # The log is compacted after two deltas
+      self.assertEqual([["000000-base"],
+                        ["000000-base", "000001-delta"],
+                        ["000000-base", "000001-delta", "000002-delta"],
+                        ["000003-base"]], checkpoints)
+
+      model.saveDelta(logDir, maxDeltas=2)
+      model2 = Model.load(logDir)
+      for record in records[40:]:
+        self.assertEqual(model.run(copy.copy(record)).inferences,
+                         model2.run(copy.copy(record)).inferences)
+
+      # A regular model checkpoint is not replaced by a log
+      checkpointDir = os.path.join(saveDir, "checkpoint")
+      model.save(checkpointDir)
+      with self.assertRaises(Exception):
+        model.saveDelta(checkpointDir)
+    finally:
+      shutil.rmtree(saveDir)
+
+
+  @unittest.skipUnless(hasattr(os, "fork"), "os.fork is not available")
+  def testSnapshot(self):
+    records = [{"c1": float(i % 10)} for i in xrange(40)]
+
+    model = ModelFactory.create(modelConfig=SMALL_MODEL_CONFIG)
+    model.enableInference({"predictedField": "c1"})
+    for record in records[:20]:
+      model.run(record)
+
+    saveDir = tempfile.mkdtemp()
+    try:
+      snapshotDir = os.path.join(saveDir, "snapshot")
+      checkpointDir = os.path.join(saveDir, "checkpoint")
+      snapshot = model.snapshot(snapshotDir, method="saveDelta")
+      model.save(checkpointDir)
+
+      # The model keeps running while the snapshot is written
+      for record in records[20:30]:
+        model.run(record)
+      snapshot.result()
+      self.assertIsNotNone(snapshot.progress())
+
+      # The snapshot is the state of the model when it was taken
+      model2 = Model.load(snapshotDir)
+      model3 = Model.load(checkpointDir)
+      for record in records[30:]:
+        self.assertEqual(model2.run(copy.copy(record)).inferences,
+                         model3.run(copy.copy(record)).inferences)
+
+      with self.assertRaises(ValueError):
+        model.snapshot(snapshotDir, method="run")
+    finally:
+      shutil.rmtree(saveDir)
+
+
 if __name__ == "__main__":
   unittest.main()
@@ -0,0 +1,187 @@
+# Copyright 2017 Numenta Inc.
+#
+# Copyright may exist in Contributors' modifications
+# and/or contributions to the work.
+#
+# Use of this source code is governed by the MIT
+# license that can be found in the LICENSE file or at
+# https://opensource.org/licenses/MIT.
+
+"""Unit tests for the model_snapshot module."""
+
+import errno
+import logging
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import time
+import unittest2 as unittest
+
+from mock import Mock, patch
+
+from nupic.frameworks.opf import model_snapshot
+from nupic.frameworks.opf.model_snapshot import ModelSnapshot, SnapshotError
+
+
+
+class ModelSnapshotTest(unittest.TestCase):
+  """ModelSnapshot unit tests."""
+
+
+  def setUp(self):
+    self.path = tempfile.mkdtemp()
+
+
+  def tearDown(self):
+    shutil.rmtree(self.path)
+
+
+  @unittest.skipUnless(hasattr(os, "fork"), "os.fork is not available")
+  def testResult(self):
+    state = ["before"]
+    filePath = os.path.join(self.path, "snapshot.txt")
+
+    def save():
+      logging.getLogger("com.numenta.test").debug("Writing %s", state[0])
+      with open(filePath, "w") as f:
+        f.write(state[0])
+
+    snapshot = ModelSnapshot(save)
+    # The snapshot has its own copy of the state
+    state[0] = "after"
+
+    self.assertIsNone(snapshot.result())
+    self.assertTrue(snapshot.done())
+    self.assertFalse(snapshot.running())
+    self.assertIsNone(snapshot.exception())
+    self.assertEqual("Writing before", snapshot.progress())
+    self.assertGreaterEqual(snapshot.endTime, snapshot.startTime)
+    with open(filePath) as f:
+      self.assertEqual("before", f.read())
+
+
+  @unittest.skipUnless(hasattr(os, "fork"), "os.fork is not available")
+  def testError(self):
+    def save():
+      raise ValueError("Cannot save")
+
+    snapshot = ModelSnapshot(save)
+    with self.assertRaises(SnapshotError) as context:
+      snapshot.result()
+    self.assertIn("ValueError: Cannot save", str(context.exception))
+    self.assertIs(context.exception, snapshot.exception())
+
+
+  @unittest.skipUnless(hasattr(os, "fork"), "os.fork is not available")
+  def testTimeout(self):
+    snapshot = ModelSnapshot(lambda: time.sleep(0.5))
+
+    self.assertFalse(snapshot.wait(0))
+    self.assertTrue(snapshot.running())
+    with self.assertRaises(RuntimeError):
+      snapshot.result(timeout=0.01)
+
+    self.assertTrue(snapshot.wait())
+    self.assertIsNone(snapshot.result(timeout=0))
+
+
+  def testWithoutFork(self):
+    with patch.object(model_snapshot, "os", Mock(spec=[])):
+      with self.assertRaises(NotImplementedError):
+        ModelSnapshot(lambda: None)
+
+
+  @unittest.skipUnless(hasattr(os, "fork"), "os.fork is not available")
+  def testAbandoned(self):
+    filePath = os.path.join(self.path, "snapshot.txt")
+
+    def save():
+      logging.getLogger("com.numenta.test").debug("Writing")
+      time.sleep(0.2)
+      with open(filePath, "w") as f:
+        f.write("done")
+
+    snapshot = ModelSnapshot(save)
+    pid = snapshot._pid
+    del snapshot
+    self.assertIn(pid, model_snapshot._abandonedPids)
+
+    # The abandoned snapshot is still written, and its process is reaped by
+    # the next snapshot
+    self.waitForFile(filePath)
+    time.sleep(0.1)
+    ModelSnapshot(lambda: None).result()
+    self.assertNotIn(pid, model_snapshot._abandonedPids)
+    with self.assertRaises(OSError) as context:
+      os.waitpid(pid, os.WNOHANG)
+    self.assertEqual(errno.ECHILD, context.exception.errno)
+    with open(filePath) as f:
+      self.assertEqual("done", f.read())
+
+
+  @unittest.skipUnless(hasattr(os, "fork"), "os.fork is not available")
+  def testProgressNotRead(self):
+    filePath = os.path.join(self.path, "snapshot.txt")
+
+    def save():
+      logger = logging.getLogger("com.numenta.test")
+      # Much more than the pipe holds
+      for i in xrange(1000):
+        logger.debug("Step %d %s", i, "x" * 1000)
+      # An error in a log message doesn't fail the snapshot
+      logging.raiseExceptions = False
+      logger.debug("Step %d", "not a number")
+      with open(filePath, "w") as f:
+        f.write("done")
+
+    snapshot = ModelSnapshot(save)
+    # The messages that don't fit in the pipe are dropped
+    self.waitForFile(filePath)
+    self.assertIsNone(snapshot.result(timeout=10))
+    self.assertTrue(snapshot.progress().startswith("Step "))
+
+
+  @unittest.skipUnless(hasattr(os, "fork"), "os.fork is not available")
+  def testLoggingLockHeldByOtherThread(self):
+    locked = threading.Event()
+    release = threading.Event()
+
+    def holdLock():
+      logging._acquireLock()
+      try:
+        locked.set()
+        release.wait()
+      finally:
+        logging._releaseLock()
+
+    thread = threading.Thread(target=holdLock)
+    thread.start()
+    try:
+      locked.wait()
+      # Getting a new logger takes the lock of the logging module
+      snapshot = ModelSnapshot(lambda: logging.getLogger(
+        "com.numenta.test.snapshot").debug("Writing"))
+      try:
+        self.assertIsNone(snapshot.result(timeout=10))
+      finally:
+        if not snapshot.done():
+          os.kill(snapshot._pid, signal.SIGKILL)
+          snapshot.wait()
+    finally:
+      release.set()
+      thread.join()
+    self.assertEqual("Writing", snapshot.progress())
+
+
+  @staticmethod
+  def waitForFile(filePath, timeout=10):
+    deadline = time.time() + timeout
+    while not os.path.exists(filePath) and time.time() < deadline:
+      time.sleep(0.01)
+
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -11,6 +11,7 @@
 
 import sys
 import copy
+import cPickle as pickle
 from datetime import datetime
 import unittest2 as unittest
 import random
@@ -22,10 +23,13 @@ from mock import Mock, patch, ANY, call
 from nupic.support.unittesthelpers.testcasebase import (unittest,
                                                         TestOptionParser)
 from nupic.frameworks.opf.opf_utils import InferenceType
+from nupic.frameworks.opf import (
+    htm_prediction_model_classifier_helper as classifier_helper)
 
 from nupic.regions.knn_anomaly_classifier_region import (
     KNNAnomalyClassifierRegion,
-    _CLAClassificationRecord)
+    _CLAClassificationRecord,
+    _RecordsCache)
 
 from nupic.frameworks.opf.opf_utils import InferenceType
 
@@ -144,8 +148,8 @@ class KNNAnomalyClassifierRegionTest(unittest.TestCase):
 
   @patch.object(KNNAnomalyClassifierRegion, '_getStateAnomalyVector')
   @patch.object(KNNAnomalyClassifierRegion, '_constructClassificationRecord')
-  @patch.object(KNNAnomalyClassifierRegion, '_classifyState')
-  def testAddLabel(self, classifyState, constructVector, getVector):
+  @patch.object(KNNAnomalyClassifierRegion, '_classifyStates')
+  def testAddLabel(self, classifyStates, constructVector, getVector):
     # Setup Mocks
     getVector.return_value = numpy.array([0, 0, 0, 1, 0, 0, 1])
     knn = self.helper._knnclassifier._knn
@@ -184,12 +188,12 @@ class KNNAnomalyClassifierRegionTest(unittest.TestCase):
     knn.learn.assert_called_once_with(ANY, ANY, rowID=11)
 
     # Verifies records after added label is recomputed
-    classifyState.assert_called_once_with(self.helper._recordsCache[2])
+    classifyStates.assert_called_once_with(2)
 
 
   @patch.object(KNNAnomalyClassifierRegion, '_constructClassificationRecord')
-  @patch.object(KNNAnomalyClassifierRegion, '_classifyState')
-  def testRemoveLabel(self, classifyState, constructClassificationRecord):
+  @patch.object(KNNAnomalyClassifierRegion, '_classifyStates')
+  def testRemoveLabel(self, classifyStates, constructClassificationRecord):
     knn = self.helper._knnclassifier._knn
     knn._numPatterns = 3
     knn._categoryRecencyList = [10, 11, 12]
@@ -226,12 +230,12 @@ class KNNAnomalyClassifierRegionTest(unittest.TestCase):
     self.assertEqual(knn.removeIds.mock_calls, [call([11]), call([])])
 
     # Verifies records after removed record are updated
-    classifyState.assert_called_once_with(self.helper._recordsCache[2])
+    classifyStates.assert_called_once_with(2)
 
 
   @patch.object(KNNAnomalyClassifierRegion, '_constructClassificationRecord')
-  @patch.object(KNNAnomalyClassifierRegion, '_classifyState')
-  def testRemoveLabelNoFilter(self, classifyState,
+  @patch.object(KNNAnomalyClassifierRegion, '_classifyStates')
+  def testRemoveLabelNoFilter(self, classifyStates,
       constructClassificationRecord):
     knn = self.helper._knnclassifier._knn
     knn._numPatterns = 3
@@ -252,18 +256,17 @@ class KNNAnomalyClassifierRegionTest(unittest.TestCase):
     self.assertEqual(knn.removeIds.mock_calls, [call([11]), call([])])
 
     # Verifies records after removed record are updated
-    classifyState.assert_called_once_with(self.helper._recordsCache[2])
+    classifyStates.assert_called_once_with(2)
 
 
-  @patch.object(KNNAnomalyClassifierRegion, '_classifyState')
-  def testSetGetThreshold(self, classifyState):
+  @patch.object(KNNAnomalyClassifierRegion, '_classifyStates')
+  def testSetGetThreshold(self, classifyStates):
     self.helper._recordsCache = [Mock(), Mock(), Mock()]
 
     self.helper.setParameter('anomalyThreshold', None, 1.0)
 
     self.assertAlmostEqual(self.helper.anomalyThreshold, 1.0)
-    self.assertEqual(len(classifyState.mock_calls),
-        len(self.helper._recordsCache))
+    classifyStates.assert_called_once_with()
 
     self.assertAlmostEqual(self.helper.getParameter('anomalyThreshold'), 1.0)
 
@@ -271,8 +274,8 @@ class KNNAnomalyClassifierRegionTest(unittest.TestCase):
         'anomalyThreshold', None, 'invalid')
 
 
-  @patch.object(KNNAnomalyClassifierRegion, '_classifyState')
-  def testSetGetWaitRecords(self, classifyState):
+  @patch.object(KNNAnomalyClassifierRegion, '_classifyStates')
+  def testSetGetWaitRecords(self, classifyStates):
     self.helper._recordsCache = [
       Mock(ROWID=10, anomalyLabel=["Test"], setByUser=False),
       Mock(ROWID=11, anomalyLabel=["Test"], setByUser=False),
@@ -281,8 +284,7 @@ class KNNAnomalyClassifierRegionTest(unittest.TestCase):
     self.helper.setParameter('trainRecords', None, 20)
 
     self.assertEqual(self.helper.trainRecords, 20)
-    self.assertEqual(len(classifyState.mock_calls),
-        len(self.helper._recordsCache))
+    classifyStates.assert_called_once_with()
 
     self.assertEqual(self.helper.getParameter('trainRecords'), 20)
 
@@ -349,6 +351,59 @@ class KNNAnomalyClassifierRegionTest(unittest.TestCase):
         "trainRecords")
 
 
+  def testClassifyStatesMatchesClassifyState(self):
+    """
+    _classifyStates only recomputes the records whose nearest prototype may
+    have changed, which must give the same labels and classifier contents as
+    reclassifying every record with _classifyState.
+    """
+    rng = numpy.random.RandomState(42)
+    bases = [rng.choice(100, 20, replace=False) for _ in xrange(5)]
+
+    for distanceMethod, maxDist in (("pctOverlapOfInput", 0.5),
+                                    ("pctOverlapOfLarger", 0.5),
+                                    ("rawOverlap", 8),
+                                    ("norm", 3.0)):
+      params = dict(self.params, distanceMethod=distanceMethod,
+                    classificationMaxDist=maxDist, maxStoredPatterns=15)
+      region = KNNAnomalyClassifierRegion(**params)
+      region._anomalyVectorLength = 100
+      for rowID in xrange(60):
+        bits = set(bases[rng.randint(5)][rng.rand(20) > 0.3])
+        bits.update(rng.choice(100, 4).tolist())
+        region._recordsCache.append(_CLAClassificationRecord(
+          ROWID=rowID, anomalyScore=rng.rand(),
+          anomalyVector=sorted(bits), anomalyLabel=[]))
+
+      expected = pickle.loads(pickle.dumps(region))
+      def classifyStates(start=0):
+        for state in expected._recordsCache[start:]:
+          expected._classifyState(state)
+      expected._classifyStates = classifyStates
+
+      for name, args in (("addLabel", (12, 15, "A")),
+                         ("setParameter", ("anomalyThreshold", None, 0.7)),
+                         ("addLabel", (30, 32, "B")),
+                         ("removeLabels", (12, 14, "A")),
+                         ("setParameter", ("classificationMaxDist", None,
+                                           maxDist / 2)),
+                         ("setParameter", ("trainRecords", None, 20)),
+                         ("setParameter", ("anomalyThreshold", None, 0.9))):
+        getattr(region, name)(*args)
+        getattr(expected, name)(*args)
+
+        self.assertEqual([r.anomalyLabel for r in region._recordsCache],
+                         [r.anomalyLabel for r in expected._recordsCache],
+                         "%s after %s" % (distanceMethod, name))
+        self.assertEqual(
+          region._knnclassifier.getParameter("categoryRecencyList"),
+          expected._knnclassifier.getParameter("categoryRecencyList"),
+          "%s after %s" % (distanceMethod, name))
+        self.assertEqual(region._knnclassifier.getCategoryList(),
+                         expected._knnclassifier.getCategoryList(),
+                         "%s after %s" % (distanceMethod, name))
+
+
   @patch.object(KNNAnomalyClassifierRegion, '_addRecordToKNN')
   @patch.object(KNNAnomalyClassifierRegion, '_deleteRecordsFromKNN')
   @patch.object(KNNAnomalyClassifierRegion, '_recomputeRecordFromKNN')
@@ -811,6 +866,63 @@ class KNNAnomalyClassifierRegionTest(unittest.TestCase):
     self.assertEqual(state.setByUser, record['setByUser'])
 
 
+  def testRecordsCache(self):
+    records = [_CLAClassificationRecord(ROWID=i, anomalyScore=i / 10.0,
+                                        anomalyVector=range(i),
+                                        anomalyLabel=["Label"] * (i % 2))
+               for i in xrange(10)]
+    cache = _RecordsCache(records[:4])
+    for record in records[4:]:
+      cache.append(record)
+      newest = cache[-1]
+      cache.pop(0)
+
+    # Popped records were dropped from the columns while the last view
+    # was held.
+    self.assertGreater(cache._offset, 0)
+    self.assertEqual(newest, records[9])
+    self.assertEqual(len(cache), 4)
+    self.assertEqual(list(cache), records[6:])
+    self.assertEqual(cache[-1], records[9])
+    self.assertEqual(cache[1:3], records[7:9])
+    self.assertEqual(cache[0].__getstate__(), records[6].__getstate__())
+    self.assertRaises(IndexError, cache.__getitem__, 4)
+    self.assertRaises(IndexError, cache.pop, 1)
+
+    # Records are views of the cache.
+    cache[0].anomalyLabel.append("Added")
+    cache[1].setByUser = True
+    cache[1].anomalyLabel = ["User"]
+    self.assertEqual(cache[0].anomalyLabel, ["Added"])
+    self.assertTrue(cache[1].setByUser)
+    self.assertEqual(cache[1].anomalyLabel, ["User"])
+
+    cache = pickle.loads(pickle.dumps(cache))
+    self.assertEqual(cache[1].anomalyLabel, ["User"])
+    self.assertEqual(cache.pop(0).anomalyVector, range(6))
+    self.assertEqual([r.ROWID for r in cache], [7, 8, 9])
+
+
+  @patch.object(KNNAnomalyClassifierRegion, '_classifyState')
+  @patch.object(KNNAnomalyClassifierRegion, '_constructClassificationRecord')
+  def testRecordsCacheFromClassifierHelper(self, constructRecord,
+                                           classifyState):
+    # Models restored from the classifier helper hand over its records as a
+    # plain list
+    self.helper._recordsCache = [classifier_helper._CLAClassificationRecord(
+                                   ROWID=i, anomalyScore=0.5,
+                                   anomalyVector=[i, i + 3], anomalyLabel=[])
+                                 for i in xrange(3)]
+    constructRecord.return_value = _CLAClassificationRecord(
+      ROWID=3, anomalyScore=0.5, anomalyVector=[3, 6], anomalyLabel=[])
+    self.helper.compute(dict(), dict())
+
+    cache = self.helper._recordsCache
+    self.assertIsInstance(cache, _RecordsCache)
+    self.assertEqual([r.ROWID for r in cache], [0, 1, 2, 3])
+    self.assertEqual(cache[2].anomalyVector, [2, 5])
+
+
 
 
   def mockRemoveIds(self, ids):
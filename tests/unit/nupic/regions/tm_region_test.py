@@ -18,6 +18,7 @@ except ImportError:
   capnp = None
 import numpy as np
 
+from nupic.algorithms.backtracking_tm_dense import BacktrackingTMDense
 from nupic.regions.tm_region import TMRegion
 if capnp:
   from nupic.regions.tm_region_capnp import TMRegionProto
@@ -96,6 +97,18 @@ class TMRegionTest(unittest.TestCase):
     self.checkTMRegionImpl("py")
 
 
+  @unittest.skipUnless(
+    capnp, "pycapnp is not installed, skipping serialization test.")
+  def testWriteReadPyDense(self):
+    self.checkTMRegionImpl("py_dense")
+
+
+  def testPyDenseImpl(self):
+    region = TMRegion(10, 10, 4, temporalImp="py_dense")
+    region.initialize()
+    self.assertIsInstance(region._tfdr, BacktrackingTMDense)
+
+
   @unittest.skipUnless(
     capnp, "pycapnp is not installed, skipping serialization test.")
   def testWriteReadCpp(self):
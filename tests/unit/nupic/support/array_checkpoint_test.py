@@ -0,0 +1,148 @@
+# Copyright 2017 Numenta Inc.
+#
+# Copyright may exist in Contributors' modifications
+# and/or contributions to the work.
+#
+# Use of this source code is governed by the MIT
+# license that can be found in the LICENSE file or at
+# https://opensource.org/licenses/MIT.
+
+"""Unit tests for the array checkpoints."""
+
+import os
+import shutil
+import tempfile
+import unittest2 as unittest
+
+import numpy
+
+from nupic.algorithms.spatial_pooler import BinaryCorticalColumns
+from nupic.bindings.math import SM32
+from nupic.support.array_checkpoint import (isArrayCheckpoint,
+                                            readArrayCheckpoint,
+                                            writeArrayCheckpoint)
+
+
+
+class ArrayCheckpointTest(unittest.TestCase):
+
+
+  def setUp(self):
+    self.path = tempfile.mkdtemp()
+
+
+  def tearDown(self):
+    shutil.rmtree(self.path)
+
+
+  def testArrays(self):
+    big = numpy.arange(100000, dtype="float32").reshape(1000, 100)
+    small = numpy.arange(10, dtype="int32")
+    obj = {"big": big, "small": small, "same": big, "list": [1, "a"]}
+
+    fileNames = writeArrayCheckpoint(obj, self.path, minSize=1024)
+    self.assertEqual(["0.npy"], fileNames)
+    self.assertTrue(isArrayCheckpoint(self.path))
+    self.assertFalse(isArrayCheckpoint(os.path.join(self.path, "0.npy")))
+
+    obj2 = readArrayCheckpoint(self.path)
+    self.assertEqual([1, "a"], obj2["list"])
+    self.assertIs(type(obj2["big"]), numpy.ndarray)
+    self.assertTrue(numpy.array_equal(big, obj2["big"]))
+    self.assertEqual(big.dtype, obj2["big"].dtype)
+    self.assertTrue(numpy.array_equal(small, obj2["small"]))
+    # Shared arrays are still shared
+    self.assertIs(obj2["big"], obj2["same"])
+
+    # The memory-mapped arrays are copy-on-write
+    obj2["big"][0, 0] = -1
+    obj3 = readArrayCheckpoint(self.path, mmap=False)
+    self.assertEqual(0, obj3["big"][0, 0])
+
+
+  def testStringsAndSparseMatrices(self):
+    state = "x" * 5000
+    sm = SM32(numpy.eye(50, dtype="float32") * 0.5)
+    columns = BinaryCorticalColumns(numpy.eye(200, dtype="float32"))
+
+    fileNames = writeArrayCheckpoint((state, sm, columns), self.path,
+                                     minSize=1024)
+    # The binary matrix is saved as the rows and columns of its non-zeros
+    self.assertEqual(["0.bin", "1.npy", "2.npy"], fileNames)
+
+    state2, sm2, columns2 = readArrayCheckpoint(self.path)
+    self.assertEqual(state, state2)
+    # The small matrix is pickled in the manifest
+    self.assertTrue(numpy.array_equal(sm.toDense(), sm2.toDense()))
+    self.assertIsInstance(columns2, BinaryCorticalColumns)
+    self.assertEqual(columns.nRows(), columns2.nRows())
+    self.assertEqual(columns.nCols(), columns2.nCols())
+    self.assertTrue(numpy.array_equal(columns.toDense(), columns2.toDense()))
+    self.assertEqual(list(columns[3].nonzero()[0]),
+                     list(columns2[3].nonzero()[0]))
+
+
+  def testDelta(self):
+    rgen = numpy.random.RandomState(42)
+    weights = rgen.rand(2, 300, 40)
+    permanences = rgen.rand(500, 64).astype("float32")
+    unchanged = rgen.rand(5000)
+    obj = [weights, permanences, unchanged, "x" * 5000, "y" * 5000]
+    basePath = os.path.join(self.path, "base")
+    writeArrayCheckpoint(obj, basePath, minSize=1024, indexBlocks=True)
+
+    weights = weights.copy()
+    weights[1, 7, 3] = 2.0
+    permanences = permanences.copy()
+    permanences[[3, 300]] = 0.5
+    # Grown along two axes
+    permanences = numpy.pad(permanences, ((0, 10), (0, 3)), "constant")
+    obj = [weights, permanences, unchanged, "x" * 5000, "z" * 5000]
+    deltaPath = os.path.join(self.path, "delta")
+    fileNames = writeArrayCheckpoint(obj, deltaPath, minSize=1024,
+                                     base=basePath)
+    # The changed blocks of both arrays, the two parts out of the base
+    # permanences, and the changed string
+    self.assertEqual(["0.npy", "1.npy", "2.npy", "3.npy", "4.npy", "5.npy",
+                      "6.bin"], fileNames)
+    self.assertLess(os.path.getsize(os.path.join(deltaPath, "1.npy")),
+                    weights.nbytes / 10)
+
+    # A delta of the delta
+    weights = weights.copy()
+    weights[0, 299, 39] = 3.0
+    obj = [weights, permanences, unchanged, "x" * 5000, "z" * 5000]
+    delta2Path = os.path.join(self.path, "delta2")
+    writeArrayCheckpoint(obj, delta2Path, minSize=1024, base=deltaPath)
+
+    for mmap in (True, False):
+      obj2 = readArrayCheckpoint(delta2Path, mmap=mmap)
+      for array, array2 in zip(obj[:3], obj2[:3]):
+        self.assertEqual(array.dtype, array2.dtype)
+        self.assertTrue(numpy.array_equal(array, array2))
+      self.assertEqual(obj[3:], obj2[3:])
+
+    # The base checkpoints are not changed
+    self.assertFalse(numpy.array_equal(
+      weights, readArrayCheckpoint(deltaPath)[0]))
+    self.assertEqual((500, 64), readArrayCheckpoint(basePath)[1].shape)
+
+
+  def testDeltaWithoutIndexedBase(self):
+    obj = [numpy.arange(1000)]
+    basePath = os.path.join(self.path, "base")
+    writeArrayCheckpoint(obj, basePath, minSize=1024)
+
+    # The checkpoint is written in full
+    deltaPath = os.path.join(self.path, "delta")
+    self.assertEqual(["0.npy"],
+                     writeArrayCheckpoint(obj, deltaPath, minSize=1024,
+                                          base=basePath))
+    shutil.rmtree(basePath)
+    self.assertTrue(numpy.array_equal(obj[0],
+                                      readArrayCheckpoint(deltaPath)[0]))
+
+
+
+if __name__ == "__main__":
+  unittest.main()